@@ -23,7 +23,10 @@ from twisted.internet.protocol import Factory
 from twisted.protocols.basic import LineReceiver
 
 from twistedcaldav.config import config
+from twistedcaldav.memcacher import Memcacher
 
+from txdav.caldav.datastore.componentcache import componentCache
+from txdav.common.datastore.modifiedcoalescer import modifiedCoalescer
 from txdav.common.datastore.work.load_work import TestWork
 from txdav.dps.client import DirectoryService as DirectoryProxyClientService
 from txdav.who.cache import CachingDirectoryService
@@ -192,6 +195,29 @@ class DashboardProtocol (LineReceiver):
         except (AttributeError, ConnectError):
             return succeed({})
 
+    def data_memcacher(self):
+        """
+        Return a summary of this process' in-memory caches: the caches used
+        in place of memcached when its client is disabled, the L1 caches in
+        front of memcached, the parsed calendar data cache, and the recently
+        bumped homes and collections.
+
+        @return: the JSON result.
+        @rtype: L{str}
+        """
+        results = {}
+        for name, stats in Memcacher.memoryCacheStats().items():
+            results["memory-{}".format(name)] = stats
+        for name, stats in Memcacher.l1Stats().items():
+            results["l1-{}".format(name)] = stats
+        cache = componentCache()
+        if cache is not None:
+            results["components"] = cache.stats()
+        coalescer = modifiedCoalescer()
+        if coalescer is not None:
+            results["modified"] = coalescer.stats()
+        return succeed(results)
+
 
 class DashboardServer(Factory):
 
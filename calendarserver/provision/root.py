@@ -376,7 +376,7 @@ class RootResource(
 
         if (
             config.EnableResponseCache and
-            request.method == "PROPFIND" and
+            request.method in ("PROPFIND", "REPORT") and
             not getattr(request, "notInCache", False) and
             len(segments) > 1
         ):
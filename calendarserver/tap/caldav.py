@@ -93,6 +93,8 @@ from txdav.common.datastore.upgrade.sql.upgrade import (
     UpgradeDatabaseNotificationDataStep
 )
 from txdav.common.datastore.work.inbox_cleanup import InboxCleanupWork
+from txdav.common.datastore.work.index_extension import CalendarIndexExtensionWork
+from txdav.common.datastore.work.quota_journal import CalendarQuotaJournalWork
 from txdav.common.datastore.work.revision_cleanup import FindMinValidRevisionWork
 from txdav.who.groups import GroupCacher
 
@@ -120,7 +122,7 @@ from calendarserver.tap.util import (
     pgServiceFromConfig, getDBPool, MemoryLimitService,
     storeFromConfig, getSSLPassphrase, preFlightChecks,
     storeFromConfigWithDPSClient, storeFromConfigWithoutDPS,
-    serverRootLocation, AlertPoster
+    serverRootLocation, AlertPoster, L1CacheInvalidator
 )
 try:
     from calendarserver.version import version
@@ -632,6 +634,14 @@ class WorkSchedulingService(Service):
             self.store,
             int(config.LogID) if config.LogID else 5
         )
+        yield CalendarIndexExtensionWork.initialSchedule(
+            self.store,
+            int(config.LogID) if config.LogID else 5
+        )
+        yield CalendarQuotaJournalWork.initialSchedule(
+            self.store,
+            int(config.LogID) if config.LogID else 5
+        )
         yield APNPurgingWork.initialSchedule(
             self.store,
             int(config.LogID) if config.LogID else 5
@@ -982,6 +992,10 @@ class CalDAVServiceMaker (object):
         # Allow worker to post alerts to master
         AlertPoster.setupForWorker(controlSocketClient)
 
+        # Allow worker to send and receive L1 cache invalidations
+        if config.Memcached.L1Cache.Enabled:
+            L1CacheInvalidator.setupForWorker(controlSocketClient)
+
         def decorateTransaction(txn):
             txn._pushDistributor = pushDistributor
             txn._rootResource = result.rootResource
@@ -1751,6 +1765,10 @@ class CalDAVServiceMaker (object):
         # Allow master to receive alert posts from workers
         AlertPoster.setupForMaster(controlSocket)
 
+        # Allow master to relay L1 cache invalidations between workers
+        if config.Memcached.L1Cache.Enabled:
+            L1CacheInvalidator.setupForMaster(controlSocket)
+
         # Optionally set up AMPPushMaster
         if (
             config.Notifications.Enabled and
@@ -17,7 +17,8 @@
 from calendarserver.tap.util import (
     MemoryLimitService, Stepper, verifyTLSCertificate, memoryForPID,
     AlertPoster, AMPAlertProtocol,
-    AMPAlertSender
+    AMPAlertSender, L1CacheInvalidator, L1CacheInvalidationProtocol,
+    L1CacheInvalidationRelayFactory
 )
 
 from twisted.internet.defer import succeed, inlineCallbacks
@@ -27,6 +28,7 @@ from twisted.python.filepath import FilePath
 from twisted.test.testutils import returnConnected
 
 from twistedcaldav.config import ConfigDict
+from twistedcaldav.memcacher import Memcacher
 from twistedcaldav.test.util import TestCase
 from twistedcaldav.util import computeProcessCount
 
@@ -341,3 +343,48 @@ class AlertTestCase(TestCase):
         self.assertEquals(self.alertType, "alertType")
         self.assertEquals(self.ignoreWithinSeconds, 0)
         self.assertEquals(self.args, ["arg1", "arg2"])
+
+
+class L1CacheInvalidatorTestCase(TestCase):
+
+    def stubInvalidateL1(self, namespace, keys):
+        self.invalidated.append((namespace, keys,))
+
+    def test_relay(self):
+        """
+        Invalidations sent by one worker are relayed by the master to the other
+        workers, but not back to the sender.
+        """
+        self.invalidated = []
+        self.patch(Memcacher, "invalidateL1", self.stubInvalidateL1)
+
+        relay = L1CacheInvalidationRelayFactory()
+        workers = []
+        pumps = []
+        for _ignore in range(3):
+            worker = L1CacheInvalidationProtocol()
+            pumps.append(returnConnected(relay.buildProtocol(None), worker))
+            workers.append(worker)
+        self.assertEquals(len(relay.protocols), 3)
+
+        invalidator = L1CacheInvalidator(protocol=workers[0])
+        invalidator.invalidate("ns", ["ns:key1", "ns:key2"])
+        for _ignore in range(2):
+            for pump in pumps:
+                pump.flush()
+
+        self.assertEquals(
+            self.invalidated,
+            [("ns", ["ns:key1", "ns:key2"]), ("ns", ["ns:key1", "ns:key2"])]
+        )
+
+    def test_batches(self):
+        """
+        Long key lists are split into batches that fit in an AMP value.
+        """
+        self.patch(L1CacheInvalidator, "MAX_BATCH_SIZE", 20)
+        self.assertEquals(list(L1CacheInvalidator.batches([])), [[]])
+        self.assertEquals(
+            list(L1CacheInvalidator.batches(["a" * 8, "b" * 8, "c" * 8])),
+            [["a" * 8, "b" * 8], ["c" * 8]]
+        )
@@ -73,6 +73,7 @@ from twistedcaldav.directory.calendar import DirectoryCalendarHomeProvisioningRe
 from twistedcaldav.directory.digest import QopDigestCredentialFactory
 from twistedcaldav.directory.principal import DirectoryPrincipalProvisioningResource
 from twistedcaldav.directorybackedaddressbook import DirectoryBackedAddressBookResource
+from twistedcaldav.memcacher import Memcacher
 from twistedcaldav.resource import AuthenticationWrapper
 from twistedcaldav.serverinfo import ServerInfoResource
 from twistedcaldav.simpleresource import SimpleResource, SimpleRedirectResource, \
@@ -1663,6 +1664,160 @@ class AMPAlertProtocol(amp.AMP):
         }
 
 
+class L1CacheInvalidator(object):
+    """
+    Keeps the in-process L1 caches of L{Memcacher} consistent between the
+    processes of a server. Workers should call setupForWorker( ), after which
+    keys changed by a worker are sent over AMP to the master. The master should
+    call setupForMaster( ), and then relays those keys to every other worker,
+    which drops them from its L1 cache.
+    """
+
+    # Control socket message-routing constants
+    L1CACHE_ROUTE = "l1cache"
+
+    # Limit the size of the key list in each message, as AMP values must be
+    # less than 64K
+    MAX_BATCH_SIZE = 32 * 1024
+
+    @classmethod
+    def setupForMaster(cls, controlSocket):
+        controlSocket.addFactory(
+            cls.L1CACHE_ROUTE, L1CacheInvalidationRelayFactory()
+        )
+
+    @classmethod
+    def setupForWorker(cls, controlSocket):
+        Memcacher.l1Invalidator = cls(controlSocket)
+
+    def __init__(self, controlSocket=None, protocol=None):
+        self.protocol = protocol
+        if controlSocket is not None:
+            controlSocket.addFactory(
+                self.L1CACHE_ROUTE, L1CacheInvalidationWorkerFactory(self)
+            )
+
+    @classmethod
+    def batches(cls, keys):
+        """
+        Split keys into lists small enough to send in one AMP message.
+
+        @param keys: the keys
+        @type keys: L{list} of L{str}
+
+        @return: the lists of keys - at least one, possibly empty
+        @rtype: iterator of L{list} of L{str}
+        """
+        batch = []
+        size = 0
+        for key in keys:
+            # Each string in an AMP ListOf has a two byte length prefix
+            if batch and size + len(key) + 2 > cls.MAX_BATCH_SIZE:
+                yield batch
+                batch = []
+                size = 0
+            batch.append(key)
+            size += len(key) + 2
+        yield batch
+
+    def invalidate(self, namespace, keys):
+        """
+        Send keys to drop from the L1 caches of the other workers.
+
+        @param namespace: the L{Memcacher} namespace, or an empty string for all
+            namespaces
+        @type namespace: L{str}
+        @param keys: the namespaced keys, or an empty list for all keys
+        @type keys: L{list} of L{str}
+        """
+        if self.protocol is None:
+            return
+        for batch in self.batches(keys):
+            self.protocol.callRemote(
+                InvalidateL1CacheKeys, namespace=namespace, keys=batch
+            ).addErrback(
+                lambda f: log.error("Could not send L1 cache invalidation: {f}", f=f)
+            )
+
+
+class L1CacheInvalidationWorkerFactory(Factory):
+
+    def __init__(self, invalidator):
+        self.invalidator = invalidator
+
+    def buildProtocol(self, addr):
+        protocol = L1CacheInvalidationProtocol()
+        self.invalidator.protocol = protocol
+        return protocol
+
+
+class L1CacheInvalidationRelayFactory(Factory):
+    """
+    Runs in the master, tracks the connection to each worker and relays
+    invalidations from one worker to all the others.
+    """
+
+    def __init__(self):
+        self.protocols = set()
+
+    def buildProtocol(self, addr):
+        return L1CacheInvalidationProtocol(self)
+
+    def relay(self, sender, namespace, keys):
+        for protocol in self.protocols:
+            if protocol is not sender:
+                protocol.callRemote(
+                    InvalidateL1CacheKeys, namespace=namespace, keys=keys
+                ).addErrback(
+                    lambda f: log.error("Could not relay L1 cache invalidation: {f}", f=f)
+                )
+
+
+class InvalidateL1CacheKeys(amp.Command):
+    arguments = [
+        ('namespace', amp.String()),
+        ('keys', amp.ListOf(amp.String())),
+    ]
+    response = [
+        ('status', amp.String()),
+    ]
+
+
+class L1CacheInvalidationProtocol(amp.AMP):
+    """
+    Defines the AMP protocol for sending L1 cache invalidations between the
+    workers and the master. In the master, C{relay} is the
+    L{L1CacheInvalidationRelayFactory} that forwards them to other workers.
+    """
+
+    def __init__(self, relay=None):
+        super(L1CacheInvalidationProtocol, self).__init__()
+        self.relay = relay
+
+    def startReceivingBoxes(self, boxSender):
+        super(L1CacheInvalidationProtocol, self).startReceivingBoxes(boxSender)
+        if self.relay is not None:
+            self.relay.protocols.add(self)
+
+    def stopReceivingBoxes(self, reason):
+        super(L1CacheInvalidationProtocol, self).stopReceivingBoxes(reason)
+        if self.relay is not None:
+            self.relay.protocols.discard(self)
+
+    @InvalidateL1CacheKeys.responder
+    def invalidateL1CacheKeys(self, namespace, keys):
+        """
+        The "InvalidateL1CacheKeys" handler in the master and the workers
+        """
+        if self.relay is not None:
+            self.relay.relay(self, namespace, keys)
+        else:
+            Memcacher.invalidateL1(namespace, keys)
+        return {
+            "status": "OK"
+        }
+
+
 def serverRootLocation():
     """
     Return the ServerRoot value from the OS X preferences plist.  If plist not
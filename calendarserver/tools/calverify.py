@@ -3068,6 +3068,32 @@ class UpgradeDataService(CalVerifyService):
 
         self.printSummary()
 
+    @inlineCallbacks
+    def fastUpgrade(self, calendarObj):
+        """
+        Upgrade the calendar user addresses in a calendar object's data
+        without reading it through the store.
+        """
+
+        # Read data from calendar object and manually upgrade the calendar user
+        # addresses only
+        text = yield calendarObj._text()
+        component = Component.fromString(text)
+
+        for subcomponent in component.subcomponents(ignore=True):
+            for prop in itertools.chain(
+                subcomponent.properties("ORGANIZER"),
+                subcomponent.properties("ATTENDEE"),
+            ):
+                cuaddr = prop.value()
+                if cuaddr.startswith(UpgradeDataService.OLD_CUADDR_PREFIX):
+                    prop.setValue(cuaddr.replace(UpgradeDataService.OLD_CUADDR_PREFIX, UpgradeDataService.NEW_CUADDR_PREFIX))
+
+        # Do the update right now (also suppress instance indexing)
+        calendarObj._dataversion = calendarObj._currentDataVersion
+        component.noInstanceIndexing = True
+        yield calendarObj.updateDatabase(component)
+
     @inlineCallbacks
     def calendarDataUpgrade(self, rows):
         """
@@ -3090,28 +3116,16 @@ class UpgradeDataService(CalVerifyService):
             try:
                 calendarObj = yield CalendarStoreFeatures(self.txn._store).calendarObjectWithID(self.txn, resid)
                 if calendarObj._dataversion < calendarObj._currentDataVersion:
-                    upgradelen += 1
-
                     if UpgradeDataService.USE_FAST_MODE:
-                        # Read data from calendar object and manually upgrade the calendar user
-                        # addresses only
-                        text = yield calendarObj._text()
-                        component = Component.fromString(text)
-
-                        for subcomponent in component.subcomponents(ignore=True):
-                            for prop in itertools.chain(
-                                subcomponent.properties("ORGANIZER"),
-                                subcomponent.properties("ATTENDEE"),
-                            ):
-                                cuaddr = prop.value()
-                                if cuaddr.startswith(UpgradeDataService.OLD_CUADDR_PREFIX):
-                                    prop.setValue(cuaddr.replace(UpgradeDataService.OLD_CUADDR_PREFIX, UpgradeDataService.NEW_CUADDR_PREFIX))
-
-                        # Do the update right now (also suppress instance indexing)
-                        calendarObj._dataversion = calendarObj._currentDataVersion
-                        component.noInstanceIndexing = True
-                        yield calendarObj.updateDatabase(component)
+                        # Data that only needs validating is left to be
+                        # upgraded when it is next read, which only rewrites
+                        # it if it needed fixing
+                        if calendarObj._dataversion < 1:
+                            upgradelen += 1
+                            yield self.fastUpgrade(calendarObj)
                     else:
+                        upgradelen += 1
+
                         # Read component and force and update if needed
                         yield calendarObj.component(doUpdate=True)
 
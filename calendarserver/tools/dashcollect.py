@@ -233,6 +233,7 @@ class Pod(object):
             server.addItem("job_assignments")
             server.addItem("jobcount")
             server.addItem("directory")
+            server.addItem("memcacher")
 
             # Only read this once as otherwise too much load
             if ctr == 0:
@@ -572,6 +572,18 @@ class Aggregator(object):
 
         return results
 
+    @staticmethod
+    def aggregator_memcacher(serversdata):
+        results = OrderedDict()
+        for server_data in serversdata:
+            for cache_name, cache_stats in server_data.items():
+                if cache_name not in results:
+                    results[cache_name] = cache_stats
+                else:
+                    results[cache_name] = Aggregator.dictValueSums((results[cache_name], cache_stats,))
+
+        return results
+
     @staticmethod
     def aggregator_job_assignments(serversdata):
 
@@ -1464,6 +1476,55 @@ class DirectoryStatsWindow(BaseWindow):
         self.window.refresh()
 
 
+class MemoryCacheWindow(BaseWindow):
+    """
+    Displays the status of the server's in-memory caches
+    """
+
+    help = "Memory Caches"
+    clientItem = "memcacher"
+
+    windowTitle = "Memory Caches"
+    formatWidth = 101
+    additionalRows = 4
+
+    def updateRowCount(self):
+        self.rowCount = len(defaultIfNone(self.clientData(), {}))
+
+    def update(self):
+        records = defaultIfNone(self.clientData(), {})
+        if len(records) != self.rowCount:
+            self.needsReset = True
+            return
+
+        self.iter += 1
+
+        s1 = " {:<24}{:>10}{:>10}{:>12}{:>8}{:>12}{:>12}{:>12} ".format(
+            "Cache", "Entries", "Size", "Hits", "Hit", "Misses", "Evicted", "Expired"
+        )
+        s2 = " {:<24}{:>10}{:>10}{:>12}{:>8}{:>12}{:>12}{:>12} ".format(
+            "", "", "(KB)", "", "(%)", "", "", ""
+        )
+        pt = self.tableHeader((s1, s2,), len(records))
+
+        for cacheName, stats in sorted(records.items(), key=lambda x: x[0]):
+            s = " {:<24}{:>10d}{:>10d}{:>12d}{:>7.1f}%{:>12d}{:>12d}{:>12d} ".format(
+                cacheName[:24],
+                stats["entries"],
+                stats["bytes"] / 1024,
+                stats["hits"],
+                safeDivision(stats["hits"], stats["hits"] + stats["misses"], 100.0),
+                stats["misses"],
+                stats["evictions"],
+                stats["expirations"],
+            )
+            self.tableRow(s, pt)
+
+        self.window.refresh()
+
+        self.lastResult = records
+
+
 Dashboard.registerWindow(HelpWindow, "h")
 Dashboard.registerWindow(SystemWindow, "s")
 Dashboard.registerWindow(RequestStatsWindow, "r")
@@ -1472,6 +1533,7 @@ Dashboard.registerWindow(MethodsWindow, "m")
 Dashboard.registerWindow(AssignmentsWindow, "w")
 Dashboard.registerWindow(JobsWindow, "j")
 Dashboard.registerWindow(DirectoryStatsWindow, "d")
+Dashboard.registerWindow(MemoryCacheWindow, "k")
 
 Dashboard.registerWindowSet(SystemWindow, "H")
 Dashboard.registerWindowSet(RequestStatsWindow, "H")
@@ -41,6 +41,7 @@ from twext.python.log import Logger
 from twisted.internet.defer import inlineCallbacks, returnValue
 
 from twistedcaldav import memcachepool
+from twistedcaldav.memcachering import serversForPool
 from txdav.base.propertystore.base import PropertyName
 from txdav.xml import element
 from pycalendar.datetime import DateTime, Timezone
@@ -95,14 +96,16 @@ def autoDisableMemcached(config):
     for pool in config.Memcached.Pools.itervalues():
         if pool.ClientEnabled:
             try:
-                if pool.get("MemcacheSocket"):
-                    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-                    s.connect(pool.MemcacheSocket)
-                    s.close()
-                else:
-                    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    s.connect((pool.BindAddress, pool.Port))
-                    s.close()
+                for server, _ignore_weight in serversForPool(pool):
+                    if server.startswith("unix:"):
+                        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                        s.connect(server[len("unix:"):])
+                        s.close()
+                    else:
+                        host, port = server.rsplit(":", 1)
+                        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                        s.connect((host, int(port)))
+                        s.close()
 
             except socket.error:
                 pool.ClientEnabled = False
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Microbenchmark comparing the encode/decode time and encoded size of response
+cache and property cache entries in the L{twistedcaldav.cacheformat} format
+against the pickle format previously used for them.
+"""
+
+from __future__ import print_function
+
+from getopt import getopt, GetoptError
+import cPickle
+import os
+import sys
+import timeit
+
+from twistedcaldav import cacheformat
+
+
+def usage(e=None):
+    name = os.path.basename(sys.argv[0])
+    print("usage: %s [options]" % (name,))
+    print("")
+    print("options:")
+    print("  -h --help: print this help and exit")
+    print("  -n: number of iterations [1000]")
+    print("")
+    print("This tool compares cache entry formats.")
+
+    if e:
+        sys.exit(64)
+    else:
+        sys.exit(0)
+
+
+def responseEntry(children):
+    """
+    A response cache entry for a Depth:1 PROPFIND of a calendar home with
+    C{children} calendars.
+    """
+    home = "/calendars/__uids__/10000000-0000-0000-0000-000000000001/"
+    body = "".join([
+        """<response><href>{home}calendar-{i}/</href><propstat><prop>"""
+        """<displayname>Calendar {i}</displayname><getctag>"""
+        """"1234567890-{i}"</getctag><resourcetype><collection/><calendar """
+        """xmlns="urn:ietf:params:xml:ns:caldav"/></resourcetype></prop>"""
+        """<status>HTTP/1.1 200 OK</status></propstat></response>""".format(
+            home=home, i=i,
+        )
+        for i in range(children)
+    ])
+    return (
+        "c5e3ab36-d2c8-4a5b-8c0f-4ee0c5e3ab36",
+        "1f6a2c3bb2c8e1c0b8e6d3a4a5b6c7d8",
+        "a8d3a2b1-5e6f-4d2a-9c1b-3e4f5a6b7c8d",
+        dict([
+            ("{}calendar-{}/".format(home, i), "token-{}".format(i))
+            for i in range(children)
+        ]),
+        (
+            207,
+            {
+                "content-type": ["text/xml; charset=utf-8"],
+                "dav": ["1, access-control, calendar-access"],
+            },
+            """<?xml version="1.0" encoding="utf-8" ?>"""
+            """<multistatus xmlns="DAV:">{}</multistatus>""".format(body),
+        ),
+    )
+
+
+def propertyRows(count):
+    """
+    A property cache entry with C{count} properties.
+    """
+    return [
+        [
+            "{{http://apple.com/ns/ical/}}calendar-color-{}".format(i),
+            """<?xml version="1.0" encoding="utf-8"?>\r\n"""
+            """<calendar-color xmlns="http://apple.com/ns/ical/">#882F{:02X}FF</calendar-color>""".format(i),
+        ]
+        for i in range(count)
+    ]
+
+
+def measure(value, dumps, loads, number):
+    data = dumps(value)
+    encode = timeit.timeit(lambda: dumps(value), number=number) / number
+    decode = timeit.timeit(lambda: loads(data), number=number) / number
+    return len(data), encode * 1000000, decode * 1000000
+
+
+def main():
+    try:
+        (optargs, _ignore_args) = getopt(
+            sys.argv[1:], "hn:", [
+                "help",
+            ],
+        )
+    except GetoptError, e:
+        usage(e)
+
+    number = 1000
+    for opt, arg in optargs:
+        if opt in ("-h", "--help"):
+            usage()
+
+        elif opt in ("-n"):
+            number = int(arg)
+
+        else:
+            raise NotImplementedError(opt)
+
+    formats = (
+        # Memcacher and the response cache used the default pickle protocol
+        ("pickle", cPickle.dumps, cPickle.loads),
+        ("pickle-2", lambda value: cPickle.dumps(value, 2), cPickle.loads),
+        ("cacheformat", cacheformat.dumps, cacheformat.loads),
+    )
+    entries = (
+        ("response, 1 child", responseEntry(1)),
+        ("response, 20 children", responseEntry(20)),
+        ("response, 200 children", responseEntry(200)),
+        ("properties, 2 rows", propertyRows(2)),
+        ("properties, 20 rows", propertyRows(20)),
+    )
+
+    print("{:<25}{:<14}{:>10}{:>14}{:>14}".format(
+        "Entry", "Format", "Bytes", "Encode (us)", "Decode (us)"
+    ))
+    for entryName, value in entries:
+        for formatName, dumps, loads in formats:
+            size, encode, decode = measure(value, dumps, loads, number)
+            print("{:<25}{:<14}{:>10d}{:>14.1f}{:>14.1f}".format(
+                entryName, formatName, size, encode, decode
+            ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Microbenchmark measuring repeated L{Component.getText} calls on a large
+event, as a single PUT makes several of them, with and without the cached
+text of the unchanged component.
+"""
+
+from __future__ import print_function
+
+from getopt import getopt, GetoptError
+import os
+import sys
+import timeit
+
+from twistedcaldav.ical import Component
+
+
+def usage(e=None):
+    name = os.path.basename(sys.argv[0])
+    print("usage: %s [options]" % (name,))
+    print("")
+    print("options:")
+    print("  -h --help: print this help and exit")
+    print("  -n: number of iterations [20]")
+    print("  -a: number of attendees [500]")
+    print("  -c: number of getText calls per iteration [4]")
+    print("")
+    print("This tool measures calendar data serialization.")
+
+    if e:
+        sys.exit(64)
+    else:
+        sys.exit(0)
+
+
+def largeEvent(attendees):
+    """
+    A recurring meeting with many attendees and some overridden instances.
+    """
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN",
+    ]
+    for day in range(1, 6):
+        lines.extend([
+            "BEGIN:VEVENT",
+            "UID:large-event",
+        ])
+        if day > 1:
+            lines.append("RECURRENCE-ID:2017010{day}T120000Z".format(day=day))
+        lines.extend([
+            "DTSTART:2017010{day}T120000Z".format(day=day),
+            "DURATION:PT1H",
+            "DTSTAMP:20170101T000000Z",
+            "SUMMARY:Large meeting",
+            "ORGANIZER:mailto:organizer@example.com",
+        ])
+        if day == 1:
+            lines.append("RRULE:FREQ=DAILY")
+        lines.extend([
+            "ATTENDEE;CN=Attendee {i};PARTSTAT=NEEDS-ACTION:mailto:attendee{i}@example.com".format(i=i)
+            for i in range(attendees)
+        ])
+        lines.append("END:VEVENT")
+    lines.append("END:VCALENDAR")
+    return Component.fromString("\r\n".join(lines) + "\r\n")
+
+
+def main():
+    try:
+        (optargs, _ignore_args) = getopt(
+            sys.argv[1:], "hn:a:c:", [
+                "help",
+            ],
+        )
+    except GetoptError, e:
+        usage(e)
+
+    number = 20
+    attendees = 500
+    calls = 4
+    for opt, arg in optargs:
+        if opt in ("-h", "--help"):
+            usage()
+
+        elif opt in ("-n"):
+            number = int(arg)
+
+        elif opt in ("-a"):
+            attendees = int(arg)
+
+        elif opt in ("-c"):
+            calls = int(arg)
+
+        else:
+            raise NotImplementedError(opt)
+
+    component = largeEvent(attendees)
+
+    def uncached():
+        for _ignore in range(calls):
+            component._markAsDirty()
+            component.getText()
+
+    def cached():
+        component._markAsDirty()
+        for _ignore in range(calls):
+            component.getText()
+
+    print("{:<12}{:>12}{:>16}".format("Text", "Bytes", "getText (ms)"))
+    size = len(component.getText())
+    for name, func in (("uncached", uncached), ("cached", cached),):
+        elapsed = timeit.timeit(func, number=number) / number
+        print("{:<12}{:>12d}{:>16.2f}".format(name, size, elapsed * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Microbenchmark measuring the time to expand a year of a busy calendar's
+recurring events into an L{InstanceList}, and the memory used by the
+L{Instance} objects, comparing the slotted L{Instance} with an equivalent
+that keeps its attributes in a C{__dict__} as it previously did.
+"""
+
+from __future__ import print_function
+
+from getopt import getopt, GetoptError
+import os
+import sys
+import timeit
+
+from pycalendar.datetime import DateTime
+from pycalendar.timezone import Timezone
+
+from twistedcaldav import instance
+from twistedcaldav.config import config
+from twistedcaldav.ical import Component
+
+
+def usage(e=None):
+    name = os.path.basename(sys.argv[0])
+    print("usage: %s [options]" % (name,))
+    print("")
+    print("options:")
+    print("  -h --help: print this help and exit")
+    print("  -n: number of iterations [5]")
+    print("  -s: number of recurring events [100]")
+    print("")
+    print("This tool measures recurrence expansion.")
+
+    if e:
+        sys.exit(64)
+    else:
+        sys.exit(0)
+
+
+class DictInstance(instance.Instance):
+    """
+    An L{instance.Instance} with a C{__dict__}, as it was before it used
+    slots.
+    """
+
+
+RULES = (
+    "FREQ=DAILY",
+    "FREQ=DAILY;BYDAY=MO,TU,WE,TH,FR",
+    "FREQ=WEEKLY",
+    "FREQ=WEEKLY;BYDAY=MO,WE,FR",
+    "FREQ=MONTHLY;BYDAY=1MO",
+)
+
+
+def busyCalendar(series, year):
+    """
+    The recurring events of a busy calendar, with a few overridden instances
+    of each.
+    """
+    components = []
+    for i in range(series):
+        hour = 8 + i % 10
+        components.append(Component.fromString("""BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:series-{i}
+DTSTART:{year}0102T{hour:02d}0000Z
+DURATION:PT30M
+DTSTAMP:{year}0101T000000Z
+RRULE:{rule}
+SUMMARY:Series {i}
+END:VEVENT
+BEGIN:VEVENT
+UID:series-{i}
+RECURRENCE-ID:{year}0102T{hour:02d}0000Z
+DTSTART:{year}0102T{hour:02d}3000Z
+DURATION:PT30M
+DTSTAMP:{year}0101T000000Z
+SUMMARY:Series {i} moved
+END:VEVENT
+END:VCALENDAR
+""".replace("\n", "\r\n").format(i=i, year=year, hour=hour, rule=RULES[i % len(RULES)])))
+    return components
+
+
+def expandAll(components, limit):
+    return [component.expandTimeRanges(limit) for component in components]
+
+
+def instanceSize(inst):
+    """
+    The memory used by an L{instance.Instance} itself, not including the
+    objects it refers to, as those are the same for either kind.
+    """
+    size = sys.getsizeof(inst)
+    if hasattr(inst, "__dict__"):
+        size += sys.getsizeof(inst.__dict__)
+    return size
+
+
+def main():
+    try:
+        (optargs, _ignore_args) = getopt(
+            sys.argv[1:], "hn:s:", [
+                "help",
+            ],
+        )
+    except GetoptError, e:
+        usage(e)
+
+    number = 5
+    series = 100
+    for opt, arg in optargs:
+        if opt in ("-h", "--help"):
+            usage()
+
+        elif opt in ("-n"):
+            number = int(arg)
+
+        elif opt in ("-s"):
+            series = int(arg)
+
+        else:
+            raise NotImplementedError(opt)
+
+    config.MaxAllowedInstances = 0
+    year = DateTime.getToday().getYear()
+    limit = DateTime(year + 1, 1, 1, 0, 0, 0, tzid=Timezone.UTCTimezone)
+    components = busyCalendar(series, year)
+
+    print("{:<12}{:>12}{:>14}{:>16}".format(
+        "Instance", "Instances", "Bytes each", "Expand (ms)"
+    ))
+    slotted = instance.Instance
+    for name, cls in (("dict", DictInstance), ("slots", slotted),):
+        instance.Instance = cls
+        try:
+            expanded = expandAll(components, limit)
+            elapsed = timeit.timeit(lambda: expandAll(components, limit), number=number) / number
+        finally:
+            instance.Instance = slotted
+
+        instances = [inst for instances in expanded for inst in instances.instances.itervalues()]
+        size = sum(instanceSize(inst) for inst in instances)
+        print("{:<12}{:>12d}{:>14.1f}{:>16.1f}".format(
+            name, len(instances), float(size) / len(instances), elapsed * 1000
+        ))
+
+
+if __name__ == "__main__":
+    main()
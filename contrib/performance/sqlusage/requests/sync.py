@@ -56,22 +56,26 @@ END:VCALENDAR
 
 class SyncTest(HTTPTestBase):
     """
-    A sync operation
+    A sync operation on the calendar, or on the whole calendar home
     """
 
-    def __init__(self, label, sessions, logFilePath, logFilePrefix, full, count):
+    def __init__(self, label, sessions, logFilePath, logFilePrefix, full, count, home=False):
         super(SyncTest, self).__init__(label, sessions, logFilePath, logFilePrefix)
         self.full = full
         self.count = count
+        self.home = home
         self.synctoken = ""
 
+    def syncHref(self):
+        return self.sessions[0].homeHref if self.home else self.sessions[0].calendarHref
+
     def prepare(self):
         """
         Do some setup prior to the real request.
         """
         if not self.full:
             # Get current sync token
-            results, _ignore_bad = self.sessions[0].getProperties(URL(path=self.sessions[0].calendarHref), (davxml.sync_token,))
+            results, _ignore_bad = self.sessions[0].getProperties(URL(path=self.syncHref()), (davxml.sync_token,))
             self.synctoken = results[davxml.sync_token]
 
             # Add resources to create required number of changes
@@ -90,7 +94,7 @@ class SyncTest(HTTPTestBase):
         )
 
         # Run sync collection
-        self.sessions[0].syncCollection(URL(path=self.sessions[0].calendarHref), self.synctoken, props)
+        self.sessions[0].syncCollection(URL(path=self.syncHref()), self.synctoken, props)
 
     def cleanup(self):
         """
@@ -45,6 +45,7 @@ with calendar size can be plotted.
 
 EVENT_COUNTS = (0, 1, 5, 10, 50, 100, 500, 1000,)
 SHAREE_COUNTS = (0, 1, 5, 10, 50, 100,)
+SHARE_COUNTS = (0, 1, 5, 10, 50, 100,)
 
 ICAL = """BEGIN:VCALENDAR
 CALSCALE:GREGORIAN
@@ -291,6 +292,104 @@ class SharerSQLUsage(object):
         self.currentCount = n
 
 
+class ShareeHomeSQLUsage(object):
+    """
+    Measure calendar home requests as the number of calendars shared into the
+    home grows - as for a delegate with many shared calendars.
+    """
+
+    def __init__(self, server, port, users, pswds, logFilePath, compact):
+        self.server = server
+        self.port = port
+        self.users = users
+        self.pswds = pswds
+        self.logFilePath = logFilePath
+        self.compact = compact
+        self.requestLabels = []
+        self.results = {}
+        self.currentCount = 0
+
+    def runLoop(self, share_counts):
+
+        # Make the sessions
+        sessions = [
+            SQLUsageSession(self.server, self.port, user=user, pswd=pswd, root="/")
+            for user, pswd in itertools.izip(self.users, self.pswds)
+        ]
+        sessions = sessions[0:1]
+
+        # Set of requests to execute
+        requests = [
+            SyncTest("s-home-full" if self.compact else "sync-home-full", sessions, self.logFilePath, "sharee", True, 0, home=True),
+            SyncTest("s-home-1" if self.compact else "sync-home-1", sessions, self.logFilePath, "sharee", False, 1, home=True),
+        ]
+        self.requestLabels = [request.label for request in requests]
+
+        # Warm-up server by doing calendar home propfinds
+        props = (davxml.resourcetype,)
+        for session in sessions:
+            session.getPropertiesOnHierarchy(URL(path=session.homeHref), props)
+
+        # Now loop over sets of shares
+        for count in share_counts:
+            print("Testing count = %d" % (count,))
+            self.ensureShares(sessions[0], count)
+            result = {}
+            for request in requests:
+                print("  Test = %s" % (request.label,))
+                result[request.label] = request.execute(count)
+            self.results[count] = result
+
+    def report(self):
+
+        self._printReport("SQL Statement Count", "count", "%d")
+        self._printReport("SQL Rows Returned", "rows", "%d")
+        self._printReport("SQL Time", "timing", "%.1f")
+
+    def _printReport(self, title, attr, colFormat):
+        table = tables.Table()
+
+        print(title)
+        headers = ["Shares"] + self.requestLabels
+        table.addHeader(headers)
+        formats = [tables.Table.ColumnFormat("%d", tables.Table.ColumnFormat.RIGHT_JUSTIFY)] + \
+            [tables.Table.ColumnFormat(colFormat, tables.Table.ColumnFormat.RIGHT_JUSTIFY)] * len(self.requestLabels)
+        table.setDefaultColumnFormats(formats)
+        for k in sorted(self.results.keys()):
+            row = [k] + [getattr(self.results[k][item], attr) for item in self.requestLabels]
+            table.addRow(row)
+        os = StringIO()
+        table.printTable(os=os)
+        print(os.getvalue())
+        print("")
+
+    def ensureShares(self, session, n):
+        """
+        Make sure the required number of calendars are shared into the home of
+        the session's user, each one by a different user.
+
+        @param n: number of shared calendars
+        @type n: C{int}
+        """
+
+        uid = "urn:x-uid:10000000-0000-0000-0000-000000000%03d" % (int(session.user[4:]),)
+        for i in range(n - self.currentCount):
+            index = self.currentCount + i + 2
+            user = "user%02d" % (index,)
+            sharer = SQLUsageSession(self.server, self.port, user=user, pswd=user, root="/", calendar="sharedin")
+            sharer.makeCalendar(URL(path=sharer.calendarHref))
+            sharer.addInvitees(URL(path=sharer.calendarHref), [uid], True)
+
+        # Now accept them all
+        if n > self.currentCount:
+            notifications = session.getNotifications(URL(path=session.notificationHref))
+            principal = principalCache.getPrincipal(session, session.principalPath)
+            for notification in notifications:
+                session.processNotification(principal, notification, True)
+
+        self.currentCount = n
+
+
 def usage(error_msg=None):
     if error_msg:
         print(error_msg)
@@ -304,8 +403,10 @@ Options:
     --pswd         Password
     --event        Do event scaling
     --share        Do sharee sclaing
+    --sharee-home  Do scaling of calendars shared into one home
     --event-counts       Comma-separated list of event counts to test
     --sharee-counts      Comma-separated list of sharee counts to test
+    --share-counts       Comma-separated list of shared-in calendar counts to test
     --compact      Make printed tables as thin as possible
 
 Arguments:
@@ -329,11 +430,13 @@ if __name__ == '__main__':
     file = "sqlstats.logs"
     event_counts = EVENT_COUNTS
     sharee_counts = SHAREE_COUNTS
+    share_counts = SHARE_COUNTS
     compact = False
 
     do_all = True
     do_event = False
     do_share = False
+    do_sharee_home = False
 
     options, args = getopt.getopt(
         sys.argv[1:],
@@ -342,8 +445,8 @@ if __name__ == '__main__':
             "server=", "port=",
             "user=", "pswd=",
             "compact",
-            "event", "share",
-            "event-counts=", "sharee-counts=",
+            "event", "share", "sharee-home",
+            "event-counts=", "sharee-counts=", "share-counts=",
         ]
     )
 
@@ -366,10 +469,15 @@ if __name__ == '__main__':
         elif option == "--share":
             do_all = False
             do_share = True
+        elif option == "--sharee-home":
+            do_all = False
+            do_sharee_home = True
         elif option == "--event-counts":
             event_counts = [int(i) for i in value.split(",")]
         elif option == "--sharee-counts":
             sharee_counts = [int(i) for i in value.split(",")]
+        elif option == "--share-counts":
+            share_counts = [int(i) for i in value.split(",")]
         else:
             usage("Unrecognized option: %s" % (option,))
 
@@ -388,3 +496,8 @@ if __name__ == '__main__':
         sql = SharerSQLUsage(server, port, users, pswds, file, compact)
         sql.runLoop(sharee_counts)
         sql.report()
+
+    if do_all or do_sharee_home:
+        sql = ShareeHomeSQLUsage(server, port, users, pswds, file, compact)
+        sql.runLoop(share_counts)
+        sql.report()
@@ -15,13 +15,17 @@
 ##
 
 from twext.python.log import Logger
+from txweb2 import responsecode
 from txweb2.dav.util import allDataFromStream
 from txweb2.http import Response
 from txweb2.iweb import IResource
 from txweb2.stream import MemoryStream
 
-from twisted.internet.defer import succeed, inlineCallbacks, returnValue
+from twisted.internet.defer import succeed, inlineCallbacks, returnValue, \
+    gatherResults
 
+from twistedcaldav import cacheformat
+from twistedcaldav.cacheformat import CacheFormatError
 from twistedcaldav.config import config
 from twistedcaldav.memcachepool import CachePoolUserMixIn, defaultCachePool
 
@@ -29,7 +33,7 @@ from txdav.idav import IStoreNotifierFactory, IStoreNotifier
 
 from zope.interface import implements
 
-import cPickle
+import collections
 import hashlib
 import urllib
 import uuid
@@ -84,6 +88,9 @@ class DisabledCache(object):
     def getResponseForRequest(self, request):
         return succeed(None)
 
+    def getTokensForRequest(self, request):
+        return succeed(None)
+
     def cacheResponseForRequest(self, request, response):
         return succeed(response)
 
@@ -261,6 +268,11 @@ class BaseResponseCache(object):
                             request.headers.getHeader('depth'),
                             hash(requestBody))
 
+        # These headers change the content of multistatus responses
+        for header in ("prefer", "brief"):
+            if request.headers.hasHeader(header):
+                request.cacheKey += (header, tuple(request.headers.getRawHeaders(header)),)
+
         returnValue(request.cacheKey)
 
     def _getResponseBody(self, key, response):
@@ -270,60 +282,152 @@ class BaseResponseCache(object):
 
 
 class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
+    """
+    A response cache backed by memcached.
+
+    @ivar _hits: the number of requests served from the cache.
+    @type _hits: L{int}
+    @ivar _misses: the number of requests not served from the cache, keyed by
+        the reason for the miss: "entry" (no cache entry), "uri-not-found", or
+        the token that did not match ("principal", "directory", "uri" or
+        "child").
+    @type _misses: L{dict}
+    """
 
     def __init__(self, docroot, cachePool=None):
         self._docroot = docroot
         self._cachePool = cachePool
+        self._hits = 0
+        self._misses = collections.defaultdict(int)
+
+    def _recordHit(self):
+        self._hits += 1
+
+    def _recordMiss(self, reason):
+        self._misses[reason] += 1
+
+    def stats(self):
+        """
+        Return the cache hit and miss counts.
+
+        @return: the statistics
+        @rtype: L{dict}
+        """
+        return {
+            "hits": self._hits,
+            "misses": dict(self._misses),
+        }
+
+    def _cachePoolForHandle(self, cachePoolHandle=None):
+        """
+        Get the cache pool used for tokens with the specified handle.
+        """
+        if cachePoolHandle:
+            return defaultCachePool(cachePoolHandle)
+        else:
+            return self.getCachePool()
 
     @inlineCallbacks
     def _tokenForURI(self, uri, cachePoolHandle=None):
         """
         Get the current token for a particular URI.
         """
-        if isinstance(uri, unicode):
-            uri = uri.encode("utf-8")
-        if cachePoolHandle:
-            result = (yield defaultCachePool(cachePoolHandle).get('cacheToken:%s' % (uri,)))
-        else:
-            result = (yield self.getCachePool().get('cacheToken:%s' % (uri,)))
-        if result is not None:
-            _ignore_flags, result = result
-        returnValue(result)
+        result = (yield self._tokensForURIs(((uri, cachePoolHandle),)))
+        returnValue(result[0])
 
     @inlineCallbacks
-    def _tokenForRecord(self, uri, request):
+    def _tokensForURIs(self, uris):
         """
-        Get the current token for a particular principal URI's directory record.
+        Get the current tokens for a set of URIs. URIs whose tokens live in the
+        same cache pool are fetched with a single multi-key get, so the number of
+        memcached round trips does not depend on the number of URIs.
+
+        @param uris: the URIs and the cache pool handle (or C{None} for the
+            default pool) for each token
+        @type uris: L{list} of L{tuple} of (L{str}, L{str})
+
+        @return: the tokens, in the same order as C{uris}
+        @rtype: L{list}
         """
+        pools = []
+        keysByPool = {}
+        lookups = []
+        for uri, cachePoolHandle in uris:
+            if isinstance(uri, unicode):
+                uri = uri.encode("utf-8")
+            key = "cacheToken:%s" % (uri,)
+
+            pool = self._cachePoolForHandle(cachePoolHandle)
+            if pool not in keysByPool:
+                pools.append(pool)
+                keysByPool[pool] = set()
+            keysByPool[pool].add(key)
+            lookups.append((pools.index(pool), key,))
+
+        results = (yield gatherResults([
+            cachePool.getMulti(list(keysByPool[cachePool])) for cachePool in pools
+        ]))
 
-        record = (yield self._getRecordForURI(uri, request))
-        returnValue(record.cacheToken())
+        tokens = []
+        for index, key in lookups:
+            _ignore_flags, token = results[index].get(key, (0, None))
+            tokens.append(token)
+        returnValue(tokens)
 
     @inlineCallbacks
-    def _tokensForChildren(self, rURI, request):
+    def _tokenForRecord(self, uri, request):
         """
-        Create a dict of child resource tokens for any "recorded" during this request in the childCacheURIs attribute.
+        Get the current token for a particular principal URI's directory record.
         """
 
-        if hasattr(request, "childCacheURIs"):
-            tokens = dict([(uri, (yield self._tokenForURI(uri)),) for uri in request.childCacheURIs])
-            returnValue(tokens)
-        else:
-            returnValue({})
+        record = (yield self._getRecordForURI(uri, request))
+        returnValue(record.cacheToken())
 
     @inlineCallbacks
-    def _getTokens(self, request):
+    def _getTokens(self, request, childURIs=None):
         """
         Tokens are a principal token, directory record token, resource token and list
         of child resource tokens. A change to any one of those will cause cache invalidation.
+
+        The principal, resource and child tokens are all fetched together in one
+        batch (see L{_tokensForURIs}).
+
+        @param childURIs: the child resource URIs to get tokens for, or C{None}
+            to use any "recorded" during this request in the childCacheURIs
+            attribute
+        @type childURIs: iterable of L{str}
         """
-        tokens = []
+        if childURIs is None:
+            childURIs = getattr(request, "childCacheURIs", ())
+        childURIs = list(childURIs)
+
         pURI, rURI = (yield self._getURIs(request))
-        tokens.append((yield self._tokenForURI(pURI, "PrincipalToken")))
-        tokens.append((yield self._tokenForRecord(pURI, request)))
-        tokens.append((yield self._tokenForURI(rURI)))
-        tokens.append((yield self._tokensForChildren(rURI, request)))
-        returnValue(tokens)
+        uriTokens = (yield self._tokensForURIs(
+            [(pURI, "PrincipalToken"), (rURI, None)] +
+            [(uri, None) for uri in childURIs]
+        ))
+        directoryToken = (yield self._tokenForRecord(pURI, request))
+
+        returnValue([
+            uriTokens[0],
+            directoryToken,
+            uriTokens[1],
+            dict(zip(childURIs, uriTokens[2:])),
+        ])
+
+    def getTokensForRequest(self, request):
+        """
+        Get the current tokens that a cache entry for the response to a request
+        would be validated against. A handler can get these before generating
+        its response and store them as the request's C{cacheTokens} attribute,
+        to be used in place of the tokens current when the response is cached;
+        any change made while the response is being generated then invalidates
+        the cache entry.
+
+        @return: the tokens
+        @rtype: L{list}
+        """
+        return self._getTokens(request)
 
     @inlineCallbacks
     def _hashedRequestKey(self, request):
@@ -352,9 +456,16 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
 
             if value is None:
                 self.log.debug("Not in cache: {key!r}", key=key)
+                self._recordMiss("entry")
                 returnValue(None)
 
-            (principalToken, directoryToken, uriToken, childTokens, (code, headers, body)) = cPickle.loads(value)
+            try:
+                (principalToken, directoryToken, uriToken, childTokens, (code, headers, body)) = cacheformat.loads(value)
+            except CacheFormatError as e:
+                # e.g. an entry written in an older format
+                self.log.debug("Invalid cache entry for {key!r}: {ex}", key=key, ex=e)
+                self._recordMiss("format")
+                returnValue(None)
             self.log.debug(
                 "Found in cache: {key!r} = {value!r}",
                 key=key,
@@ -366,7 +477,7 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
                 )
             )
 
-            currentTokens = (yield self._getTokens(request))
+            currentTokens = (yield self._getTokens(request, childTokens.keys()))
 
             if currentTokens[0] != principalToken:
                 self.log.debug(
@@ -375,6 +486,7 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
                     currentToken=currentTokens[0],
                     principalToken=principalToken,
                 )
+                self._recordMiss("principal")
                 returnValue(None)
 
             if currentTokens[1] != directoryToken:
@@ -384,6 +496,7 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
                     currentToken=currentTokens[1],
                     directoryToken=directoryToken,
                 )
+                self._recordMiss("directory")
                 returnValue(None)
 
             if currentTokens[2] != uriToken:
@@ -393,10 +506,11 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
                     currentToken=currentTokens[2],
                     uriToken=uriToken,
                 )
+                self._recordMiss("uri")
                 returnValue(None)
 
             for childuri, token in childTokens.items():
-                currentToken = (yield self._tokenForURI(childuri))
+                currentToken = currentTokens[3][childuri]
                 if currentToken != token:
                     self.log.debug(
                         "Child {uri} token doesn't match for {key!r}: {currentToken!r} != {token!r}",
@@ -405,9 +519,11 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
                         currentToken=currentToken,
                         token=token,
                     )
+                    self._recordMiss("child")
                     returnValue(None)
 
             self.log.debug("Response cache matched")
+            self._recordHit()
             r = Response(code, stream=MemoryStream(body))
 
             for key, value in headers.iteritems():
@@ -417,6 +533,7 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
 
         except URINotFoundException, e:
             self.log.debug("Could not locate URI: {e!r}", e=e)
+            self._recordMiss("uri-not-found")
             returnValue(None)
 
     @inlineCallbacks
@@ -436,9 +553,12 @@ class MemcacheResponseCache(BaseResponseCache, CachePoolUserMixIn):
 
             response.headers.removeHeader('date')
             response.stream = MemoryStream(responseBody)
-            pToken, dToken, uToken, cTokens = (yield self._getTokens(request))
+            tokens = getattr(request, "cacheTokens", None)
+            if tokens is None:
+                tokens = (yield self._getTokens(request))
+            pToken, dToken, uToken, cTokens = tokens
 
-            cacheEntry = cPickle.dumps((
+            cacheEntry = cacheformat.dumps((
                 pToken,
                 dToken,
                 uToken,
@@ -505,6 +625,60 @@ class PropfindCacheMixin(object):
         returnValue(response)
 
 
+class ReportCacheMixin(object):
+    """
+    A mixin that allows a collection's REPORT responses to be cached. Report
+    handlers call L{prepareResponseCache} when their response can be cached:
+    it records the collection's current cache tokens, and the response is then
+    cached by L{renderHTTP}. As well as the request URI, the cache entry is
+    validated against the token of the collection (the sharer's collection for
+    a shared one), which changes whenever a child resource changes, and the
+    token of the home it was accessed through, which changes when the
+    collection is removed or unshared.
+    """
+
+    @inlineCallbacks
+    def renderHTTP(self, request):
+        response = (yield super(ReportCacheMixin, self).renderHTTP(request))
+
+        if (
+            request.method == "REPORT" and
+            getattr(request, "cacheTokens", None) is not None and
+            response.code == responsecode.MULTI_STATUS
+        ):
+            resource = (yield request.locateResource("/"))
+            yield resource.responseCache.cacheResponseForRequest(request, response)
+
+        returnValue(response)
+
+    @inlineCallbacks
+    def prepareResponseCache(self, request):
+        """
+        Allow the response to a REPORT request to be cached. This must be called
+        before the report reads any data, so that a change made while the report
+        is being generated invalidates the cache entry.
+        """
+        if not config.EnableResponseCache:
+            returnValue(None)
+
+        ownerURL = self.owner_url()
+        if not ownerURL:
+            returnValue(None)
+
+        resource = (yield request.locateResource("/"))
+
+        # responseCache might not be present during unit tests
+        if hasattr(resource, "responseCache"):
+            request.childCacheURIs = [ownerURL, self.parentResource().url()]
+            request.cacheTokens = (yield resource.responseCache.getTokensForRequest(request))
+
+    def discardResponseCache(self, request):
+        """
+        Prevent the response to a REPORT request from being cached.
+        """
+        request.cacheTokens = None
+
+
 class CacheStoreNotifierFactory(CachePoolUserMixIn):
     """
     A notifier factory specifically for store object notifications. This is handed of to
@@ -0,0 +1,119 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+A compact, versioned binary format for cache entries.
+
+Only the simple types that cache entries are built from are supported:
+C{None}, L{bool}, L{int}/L{long}, L{float}, L{str}, L{unicode}, L{tuple},
+L{list}, L{set}/L{frozenset} and L{dict}. Unlike pickle, the format does not
+depend on the layout of any Python class, and it is cheap to decode.
+
+An encoded value is a two byte header - the format version and a flags byte -
+followed by the value in version 2 of the L{marshal} format, in which each
+value is a one byte type tag followed by its data, with strings and containers
+prefixed by their length. Values larger than C{compressThreshold} bytes are
+compressed with zlib, which is noted in the flags.
+"""
+
+import marshal
+import struct
+import zlib
+
+__all__ = [
+    "CacheFormatError",
+    "dumps",
+    "loads",
+]
+
+FORMAT_VERSION = 1
+
+FLAG_COMPRESSED = 0x01
+
+# Encoded values larger than this are compressed
+COMPRESS_THRESHOLD = 4096
+
+# Favor speed over size - cache entries are written on the request path
+COMPRESS_LEVEL = 1
+
+_MARSHAL_VERSION = 2
+
+_header = struct.Struct(">BB")
+
+
+class CacheFormatError(ValueError):
+    """
+    The data is not a value encoded in a supported version of the format.
+    """
+
+
+def dumps(value, compressThreshold=COMPRESS_THRESHOLD):
+    """
+    Encode a value.
+
+    @param value: the value to encode
+    @param compressThreshold: compress the encoded value if it is larger than
+        this many bytes, or never compress it if C{None}
+    @type compressThreshold: L{int}
+
+    @return: the encoded value
+    @rtype: L{str}
+
+    @raise TypeError: if the value, or a value it contains, has an unsupported
+        type
+    """
+    try:
+        data = marshal.dumps(value, _MARSHAL_VERSION)
+    except ValueError:
+        raise TypeError("Cannot encode {!r} in a cache entry".format(value))
+
+    flags = 0
+    if compressThreshold is not None and len(data) > compressThreshold:
+        compressed = zlib.compress(data, COMPRESS_LEVEL)
+        if len(compressed) < len(data):
+            data = compressed
+            flags |= FLAG_COMPRESSED
+
+    return _header.pack(FORMAT_VERSION, flags) + data
+
+
+def loads(data):
+    """
+    Decode a value.
+
+    @param data: the encoded value
+    @type data: L{str}
+
+    @return: the value; L{tuple}s, L{list}s, L{set}s and L{dict}s are decoded
+        as the same type they were encoded as
+
+    @raise CacheFormatError: if the data is not a valid encoded value
+    """
+    try:
+        version, flags = _header.unpack_from(data)
+    except struct.error as e:
+        raise CacheFormatError("Invalid cache data: {}".format(e))
+    if version != FORMAT_VERSION:
+        raise CacheFormatError("Unsupported cache format version: {}".format(version))
+
+    try:
+        if flags & FLAG_COMPRESSED:
+            data = zlib.decompress(buffer(data, _header.size))
+        else:
+            data = data[_header.size:]
+        return marshal.loads(data)
+    except (zlib.error, EOFError, TypeError, ValueError) as e:
+        raise CacheFormatError("Invalid cache data: {}".format(e))
@@ -37,6 +37,8 @@ import dateutil.tz
 
 import calendar
 
+from twistedcaldav.timezones import adjustToUTC
+
 
 def normalizeForIndex(dt):
     """
@@ -57,8 +59,7 @@ def normalizeForIndex(dt):
     elif dt.floating():
         return dt
     else:
-        dt.adjustToUTC()
-        return dt
+        return adjustToUTC(dt)
 
 
 def normalizeToUTC(dt):
@@ -78,8 +79,7 @@ def normalizeToUTC(dt):
         dt.setTimezoneUTC(True)
         return dt
     else:
-        dt.adjustToUTC()
-        return dt
+        return adjustToUTC(dt)
 
 
 def normalizeForExpand(dt):
@@ -96,8 +96,7 @@ def normalizeForExpand(dt):
     if dt.isDateOnly() or dt.floating():
         return dt
     else:
-        dt.adjustToUTC()
-        return dt
+        return adjustToUTC(dt)
 
 
 def floatoffset(dt, pytz):
@@ -25,6 +25,7 @@ __all__ = [
     "allowedComponents",
     "Property",
     "Component",
+    "ComponentStreamParser",
     "tzexpand",
 ]
 
@@ -387,6 +388,13 @@ class Component (object):
 
     allowedTypesList = None
 
+    # Shares recurrence expansions of unchanged data, see L{setExpansionCache}
+    _expansionCache = None
+
+    # Serialized text for each (format, includeTimezones), see
+    # L{_getTextWithTimezones}
+    _cachedText = None
+
     @classmethod
     def allowedTypes(cls):
         if cls.allowedTypesList is None:
@@ -471,17 +479,159 @@ class Component (object):
         Construct a L{Component} from a stream.
         @param stream: an L{IStream} containing iCalendar data.
         @return: a deferred returning a L{Component} representing the first
-            component described by C{stream}.
+            component described by C{stream}, or C{None} if the stream is
+            empty.
         """
-        #
-        # FIXME:
-        #   This reads the request body into a string and then parses it.
-        #   A better solution would parse directly and incrementally from the
-        #   request stream.
-        #
-        def parse(data):
-            return clazz.fromString(data, format)
-        return allDataFromStream(IStream(stream), parse)
+        if format not in (None, "text/calendar"):
+            def parse(data):
+                return clazz.fromString(data, format)
+            return allDataFromStream(IStream(stream), parse)
+
+        # Parse each component as it is read, and move it into the first
+        # one's calendar, so the raw text is never held as a whole
+        result = []
+
+        def gotComponent(calendar):
+            if not result:
+                result.append(calendar)
+            else:
+                for component in tuple(calendar.subcomponents()):
+                    calendar.removeComponent(component)
+                    result[0].addComponent(component)
+
+        def gotAll(started):
+            return result[0] if started else None
+
+        return clazz._parseIStream(stream, gotComponent).addCallback(gotAll)
+
+    @classmethod
+    @inlineCallbacks
+    def componentsFromIStream(cls, stream, callback):
+        """
+        Split iCalendar data in an L{IStream} into separate VCALENDARs based on
+        UID with the appropriate VTIMEZONEs included, as L{componentsFromData}
+        does, without reading all the data first. Each VCALENDAR is passed to
+        C{callback} as soon as the next UID starts, and the stream is not read
+        any further until the L{Deferred} C{callback} returns has fired. So
+        only one resource's worth of data is held at any time for
+        non-recurring events.
+
+        A VCALENDAR is held back until the end of the data if any of its
+        components is recurring or an override, since more overrides for that
+        UID may follow other UIDs, or if a VTIMEZONE it refers to has not been
+        read yet.
+
+        @param stream: an L{IStream} containing iCalendar data.
+        @param callback: a callable taking the L{int} index of the UID's
+            first appearance in the data, the same as its position in the
+            result of L{componentsFromData}, and a VCALENDAR L{Component},
+            and returning a L{Deferred}.
+        @raise InvalidICalendarDataError: if the data is not valid. Any
+            VCALENDARs before the error will already have been passed to
+            C{callback}.
+        """
+
+        timezones = {}
+        pending = collections.OrderedDict()
+        indexes = {}
+        nextIndex = itertools.count()
+        current = []
+        prodid = []
+
+        def ready(components):
+            tzids = set()
+            for component in components:
+                if component.isRecurring():
+                    return False
+                tzids.update(component.timezoneIDs())
+            return tzids.issubset(timezones)
+
+        def combine(components):
+            vcal = cls("VCALENDAR")
+            vcal.addProperty(Property("VERSION", "2.0"))
+            vcal.addProperty(Property("PRODID", prodid[0]))
+            tzids = set()
+            for component in components:
+                tzids.update(component.timezoneIDs())
+            for tzid in tzids:
+                if tzid in timezones:
+                    vcal.addComponent(timezones[tzid].duplicate())
+            for component in components:
+                vcal.addComponent(component)
+            return vcal
+
+        def completed(flush=False):
+            # The current UID is complete, send it and any held back UIDs
+            # that can be now
+            if current:
+                uid = current[0].propertyValue("UID")
+                pending.setdefault(uid, []).extend(current)
+                del current[:]
+            results = []
+            for uid, components in pending.items():
+                if flush or ready(components):
+                    results.append((indexes.pop(uid), combine(components),))
+                    del pending[uid]
+            return results
+
+        def gotComponent(calendar):
+            if not prodid:
+                prodid.append(calendar.propertyValue("PRODID"))
+            results = []
+            for component in tuple(calendar.subcomponents()):
+                calendar.removeComponent(component)
+                if component.name() == "VTIMEZONE":
+                    timezones[component.propertyValue("TZID")] = component
+                    continue
+                uid = component.propertyValue("UID")
+                if current and uid != current[0].propertyValue("UID"):
+                    results.extend(completed())
+                if uid not in indexes:
+                    # A UID seen again after it was sent gets a new index
+                    indexes[uid] = next(nextIndex)
+                if uid in pending:
+                    pending[uid].append(component)
+                else:
+                    current.append(component)
+            return results
+
+        @inlineCallbacks
+        def gotComponentCallback(calendar):
+            for index, vcal in gotComponent(calendar):
+                yield callback(index, vcal)
+
+        started = (yield cls._parseIStream(stream, gotComponentCallback))
+        if not started:
+            raise InvalidICalendarDataError("No calendar data")
+        for index, vcal in sorted(completed(flush=True), key=lambda x: x[0]):
+            yield callback(index, vcal)
+
+    @classmethod
+    @inlineCallbacks
+    def _parseIStream(cls, stream, callback):
+        """
+        Read an L{IStream} of iCalendar data into a L{ComponentStreamParser},
+        passing each parsed component to C{callback}, and reading no more of
+        the stream until any L{Deferred} it returns has fired.
+
+        @return: a L{Deferred} firing with C{True}, or C{False} if the stream
+            is empty.
+        """
+        stream = IStream(stream)
+        parser = ComponentStreamParser()
+        started = False
+        while True:
+            data = yield stream.read()
+            if data is None:
+                break
+            data = str(data)
+            started = started or bool(data)
+            for calendar in parser.feed(data):
+                yield callback(calendar)
+        if started:
+            for calendar in parser.finish():
+                yield callback(calendar)
+        returnValue(started)
 
     @classmethod
     def componentsFromData(cls, data, format):
@@ -604,9 +754,12 @@ class Component (object):
 
     def _markAsDirty(self):
         """
-        Invalidate the cached copy of serialized icalendar data
+        Invalidate the cached copies of serialized icalendar data, and stop
+        sharing expansions as the data no longer matches them
         """
         self._cachedCopy = None
+        self._cachedText = None
+        self._expansionCache = None
         parent = getattr(self, "_parent", None)
         if parent is not None:
             parent._markAsDirty()
@@ -650,12 +803,20 @@ class Component (object):
     def _getTextWithTimezones(self, includeTimezones, format=None):
         """
         Return text representation and include timezones if the option is on.
+        The text is cached until something in this component changes.
         """
         assert self.name() == "VCALENDAR", "Must be a VCALENDAR: {0!r}".format(self,)
 
+        key = (format, includeTimezones,)
+        if self._cachedText is not None and key in self._cachedText:
+            return self._cachedText[key]
+
         result = self._pycalendar.getText(includeTimezones=includeTimezones, format=format)
         if result is None:
             raise ValueError("Unknown format requested for calendar data.")
+        if self._cachedText is None:
+            self._cachedText = {}
+        self._cachedText[key] = result
         return result
 
     # FIXME: Should this not be in __eq__?
@@ -768,6 +929,11 @@ class Component (object):
         result = Component(None, pycalendar=self._pycalendar.duplicate())
         if hasattr(self, "noInstanceIndexing"):
             result.noInstanceIndexing = self.noInstanceIndexing
+
+        # The duplicate serializes the same way until it is changed
+        result._cachedCopy = getattr(self, "_cachedCopy", None)
+        if self._cachedText is not None:
+            result._cachedText = self._cachedText.copy()
         return result
 
     def subcomponents(self, ignore=False):
@@ -1425,7 +1591,11 @@ class Component (object):
                 # so return cached instances
                 return self.cachedInstances
 
+        # Expand to the start of a month, so that expansions for nearby limits
+        # are the same and can be shared
         lookAheadLimit = limit + Duration(days=365)
+        lookAheadLimit = DateTime(lookAheadLimit.getYear(), lookAheadLimit.getMonth(), 1, 0, 0, 0, tzid=Timezone.UTCTimezone)
+        lookAheadLimit.offsetMonth(1)
         self.cachedInstances = self.expandTimeRanges(
             lookAheadLimit,
             ignoreInvalidInstances=ignoreInvalidInstances
@@ -1443,8 +1613,59 @@ class Component (object):
         @return: a set of Instances for each recurrence in the set.
         """
 
-        componentSet = self.subcomponents()
-        return self.expandSetTimeRanges(componentSet, limit, lowerLimit=lowerLimit, ignoreInvalidInstances=ignoreInvalidInstances, normalizeFunction=normalizeFunction)
+        componentSet = list(self.subcomponents())
+
+        # Use an expansion of the same data shared by another request
+        cache = self._expansionCache
+        rangeKey = None
+        if cache is not None and normalizeFunction is normalizeForIndex:
+            rangeKey = self._expansionRangeKey(limit, lowerLimit, ignoreInvalidInstances)
+            if rangeKey is not None:
+                data = cache.get(rangeKey)
+                if data is not None:
+                    return InstanceList.deserialize(data, componentSet, ignoreInvalidInstances=ignoreInvalidInstances, normalizeFunction=normalizeFunction)
+
+        instances = self.expandSetTimeRanges(componentSet, limit, lowerLimit=lowerLimit, ignoreInvalidInstances=ignoreInvalidInstances, normalizeFunction=normalizeFunction)
+
+        # Expansion can fix up the data, in which case it is no longer shared
+        if rangeKey is not None and self._expansionCache is cache:
+            cache.set(rangeKey, instances.serialize(componentSet))
+
+        return instances
+
+    def setExpansionCache(self, cache):
+        """
+        Share the recurrence expansions of this component with other requests
+        for the same data. L{expandTimeRanges} will look up and add
+        expansions in the supplied cache until this component is changed.
+
+        @param cache: an object with C{get(rangeKey)} and C{set(rangeKey,
+            data)} methods that look up and add the L{InstanceList.serialize}
+            data for an expansion of this component's data
+        """
+        self._expansionCache = cache
+
+    def expansionCache(self):
+        """
+        The cache set by L{setExpansionCache}, or C{None} if there is none or
+        this component has been changed since.
+        """
+        return self._expansionCache
+
+    @staticmethod
+    def _expansionRangeKey(limit, lowerLimit, ignoreInvalidInstances):
+        """
+        A key for an expansion range, or C{None} if the limits are in a time
+        zone, as expansions are only shared for UTC or floating limits.
+        """
+        for dt in (limit, lowerLimit,):
+            if dt is not None and not dt.floating() and not str(dt).endswith("Z"):
+                return None
+        return "{}|{}|{}".format(
+            limit,
+            lowerLimit if lowerLimit is not None else "",
+            "i" if ignoreInvalidInstances else "",
+        )
 
     def expandSetTimeRanges(self, componentSet, limit, lowerLimit=None, ignoreInvalidInstances=False, normalizeFunction=normalizeForIndex):
         """
@@ -1576,6 +1797,9 @@ class Component (object):
                             master.removeProperty(exdate)
                         didCancel = True
 
+                        # The EXDATE value list was changed in place
+                        master._markAsDirty()
+
                         # We changed the instance set so remove any instance cache
                         if hasattr(self, "cachedInstances"):
                             delattr(self, "cachedInstances")
@@ -1736,6 +1960,7 @@ class Component (object):
                     exdateProp.value().remove(exdateValue)
                     if len(exdateProp.value()) == 0:
                         self.removeProperty(exdateProp)
+                    self._markAsDirty()
 
     def resourceUID(self):
         """
@@ -1795,7 +2020,9 @@ class Component (object):
         """
         Remove timezones that this server knows about
         """
-        return self._pycalendar.stripStandardTimezones()
+        result = self._pycalendar.stripStandardTimezones()
+        self._markAsDirty()
+        return result
 
     def validCalendarData(self, doFix=True, doRaise=True, validateRecurrences=False):
         """
@@ -1812,6 +2039,8 @@ class Component (object):
 
         # Do underlying iCalendar library validation with data fix
         fixed, unfixed = self._pycalendar.validate(doFix=doFix)
+        if fixed:
+            self._markAsDirty()
 
         # Detect invalid occurrences and fix by adding RDATEs for them
         if validateRecurrences:
@@ -3665,6 +3894,142 @@ END:VCALENDAR
         else:
             return len(tuple(self.properties("ATTACH")))
 
+
+class ComponentStreamParser(object):
+    """
+    Incrementally parses iCalendar text that arrives in arbitrary chunks, so
+    that a request body can be parsed as it is read. Only the raw text of the
+    top-level component (e.g. a VEVENT) that is currently being read is held:
+    each one is parsed as soon as its END line arrives.
+
+    L{feed} and L{finish} return the components completed so far, each as a
+    VCALENDAR L{Component} containing the calendar properties and that one
+    component. Calendar properties must precede the components, as the
+    iCalendar grammar requires.
+    """
+    def __init__(self):
+        self._partial = ""      # Incomplete physical line
+        self._logical = []      # Physical lines of the current (folded) logical line
+        self._depth = 0         # Component nesting depth, 1 inside the VCALENDAR
+        self._header = []       # Physical lines of the VCALENDAR properties
+        self._lines = []        # Physical lines of the top-level component being read
+        self._ended = False
+        self._started = False
+        self._emitted = False
+
+    def feed(self, data):
+        """
+        Parse another chunk of data.
+
+        @param data: the next chunk of iCalendar text
+        @type data: L{str} or L{unicode}
+        @return: the components completed by this chunk
+        @rtype: L{list} of L{Component}
+        @raise InvalidICalendarDataError: if the data is not valid iCalendar
+        """
+        if type(data) is unicode:
+            data = data.encode("utf-8")
+        if not self._started:
+            if not data:
+                return []
+            self._started = True
+            if data[:3] == codecs.BOM_UTF8:
+                data = data[3:]
+
+        results = []
+        lines = (self._partial + data).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._physicalLine(line + "\n", results)
+        return results
+
+    def finish(self):
+        """
+        Parse any remaining data at the end of the stream.
+
+        @return: the remaining components
+        @rtype: L{list} of L{Component}
+        @raise InvalidICalendarDataError: if the data is incomplete or is not
+            valid iCalendar
+        """
+        results = []
+        if self._partial:
+            self._physicalLine(self._partial, results)
+            self._partial = ""
+        self._logicalLine(results)
+        if not self._ended:
+            raise InvalidICalendarDataError("Incomplete calendar data")
+        return results
+
+    def _physicalLine(self, line, results):
+        if line[:1] in (" ", "\t"):
+            if not self._logical:
+                raise InvalidICalendarDataError("Continuation line without a preceding line: {0!r}".format(line,))
+            self._logical.append(line)
+        else:
+            self._logicalLine(results)
+            self._logical.append(line)
+
+    def _logicalLine(self, results):
+        """
+        Process the completed logical line held in C{self._logical}.
+        """
+        if not self._logical:
+            return
+        physical = self._logical
+        self._logical = []
+        line = "".join([physical[0]] + [l[1:] for l in physical[1:]])
+        line = line.replace("\r", "").replace("\n", "")
+        name, _ignore_sep, value = line.partition(":")
+        name = name.upper()
+        value = value.upper()
+
+        if self._ended or self._depth == 0:
+            if not line.strip():
+                return
+            if self._ended or name != "BEGIN" or value != "VCALENDAR":
+                raise InvalidICalendarDataError("Data outside of a VCALENDAR: {0!r}".format(line,))
+            self._depth = 1
+            return
+
+        if self._depth == 1:
+            if name == "END" and value == "VCALENDAR":
+                self._depth = 0
+                self._ended = True
+                if not self._emitted:
+                    # A calendar with no components still has its properties
+                    results.append(self._parse([]))
+            elif name == "BEGIN":
+                self._depth = 2
+                self._lines = list(physical)
+            elif name == "END":
+                raise InvalidICalendarDataError("Mismatched END: {0!r}".format(line,))
+            elif self._emitted:
+                raise InvalidICalendarDataError("VCALENDAR properties must precede its components: {0!r}".format(line,))
+            else:
+                self._header.extend(physical)
+            return
+
+        self._lines.extend(physical)
+        if name == "BEGIN":
+            self._depth += 1
+        elif name == "END":
+            self._depth -= 1
+            if self._depth == 1:
+                lines = self._lines
+                self._lines = []
+                results.append(self._parse(lines))
+                self._emitted = True
+
+    def _parse(self, lines):
+        """
+        Parse one top-level component, wrapped in a VCALENDAR with the
+        calendar properties.
+        """
+        data = "".join(["BEGIN:VCALENDAR\r\n"] + self._header + lines + ["END:VCALENDAR\r\n"])
+        return Component.fromString(data)
+
+
 # #
 # Timezones
 # #
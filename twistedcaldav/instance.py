@@ -19,7 +19,8 @@ iCalendar Recurrence Expansion Utilities
 """
 
 from twistedcaldav.config import config
-from twistedcaldav.dateops import normalizeForIndex, differenceDateTime
+from twistedcaldav.dateops import normalizeForIndex, differenceDateTime, \
+    tupleFromDateTime, tupleToDateTime
 
 from pycalendar.datetime import DateTime
 from pycalendar.duration import Duration
@@ -53,7 +54,33 @@ class InvalidOverriddenInstanceError(Exception):
         return "<%s invalid:%s>" % (self.__class__.__name__, self.rid)
 
 
+def _instanceTuple(dt):
+    """
+    Convert a UTC or floating instance date-time to a L{tuple}.
+    """
+    return tupleFromDateTime(dt) + (not dt.floating(),)
+
+
+def _instanceDateTime(tp):
+    """
+    Convert a L{tuple} produced by L{_instanceTuple} to a L{DateTime}.
+    """
+    return tupleToDateTime(tp, withTimezone=Timezone.UTCTimezone if tp[6] else None)
+
+
 class Instance(object):
+    """
+    One instance of a recurrence set. Expanding long-running recurrences
+    creates a great many of these, so slots are used to keep them small.
+
+    C{partstat}, C{free} and C{active} are not set here: auto-accept
+    processing stores its per-instance state in them.
+    """
+
+    __slots__ = (
+        "component", "start", "end", "rid", "overridden", "future",
+        "partstat", "free", "active",
+    )
 
     def __init__(self, component, start=None, end=None, rid=None, overridden=False, future=False):
         self.component = component
@@ -115,6 +142,63 @@ class InstanceList(object):
     def __getitem__(self, key):
         return self.instances[key]
 
+    def serialize(self, componentSet):
+        """
+        Get the expanded instances as simple values that can be cached. Each
+        instance's component is recorded as its position in the set of
+        components that was expanded. The expansion must have been done with
+        L{normalizeForIndex}, so that all instance date-times are UTC or
+        floating.
+
+        @param componentSet: the components that were expanded
+        @type componentSet: L{list} of L{Component}
+
+        @return: the limits and instances
+        @rtype: L{tuple}
+        """
+        positions = dict([(id(component), position) for position, component in enumerate(componentSet)])
+        return (
+            str(self.limit) if self.limit is not None else None,
+            str(self.lowerLimit) if self.lowerLimit is not None else None,
+            tuple([
+                (
+                    positions[id(instance.component)],
+                    _instanceTuple(instance.start),
+                    _instanceTuple(instance.end),
+                    _instanceTuple(instance.rid) if instance.rid is not instance.start else None,
+                    instance.overridden,
+                    instance.future,
+                )
+                for instance in self.instances.itervalues()
+            ]),
+        )
+
+    @classmethod
+    def deserialize(cls, data, componentSet, ignoreInvalidInstances=False, normalizeFunction=normalizeForIndex):
+        """
+        Create an L{InstanceList} from the values returned by L{serialize}.
+
+        @param data: the limits and instances
+        @type data: L{tuple}
+        @param componentSet: the components that were expanded, in the same
+            order as when the instances were serialized
+        @type componentSet: L{list} of L{Component}
+
+        @return: the instances
+        @rtype: L{InstanceList}
+        """
+        limit, lowerLimit, instances = data
+        result = cls(ignoreInvalidInstances=ignoreInvalidInstances, normalizeFunction=normalizeFunction)
+        result.limit = DateTime.parseText(limit) if limit is not None else None
+        result.lowerLimit = DateTime.parseText(lowerLimit) if lowerLimit is not None else None
+        for position, start, end, rid, overridden, future in instances:
+            start = _instanceDateTime(start)
+            rid = _instanceDateTime(rid) if rid is not None else start
+            result.instances[str(rid)] = Instance(
+                componentSet[position], start, _instanceDateTime(end), rid, overridden, future
+            )
+        return result
+
     def expandTimeRanges(self, componentSet, limit, lowerLimit=None):
         """
         Expand the set of recurrence instances up to the specified date limit.
@@ -0,0 +1,232 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+A bounded in-process cache with least-recently-used eviction and expiry.
+"""
+
+from collections import OrderedDict
+import time
+
+__all__ = [
+    "LRUCache",
+]
+
+
+class LRUCache(object):
+    """
+    A cache holding at most C{maxEntries} items and, optionally, at most
+    C{maxBytes} bytes of items. When full, the least recently used items are
+    evicted to make room. Items may also expire a fixed time after they were
+    set; expired items are dropped when next looked up, or by L{sweep}.
+
+    @ivar _entries: the cached items, least recently used first, each mapped to
+        a L{tuple} of (value, expiry time or C{None}, size)
+    @type _entries: L{OrderedDict}
+    """
+
+    def __init__(self, maxEntries, expireSeconds=0, clock=None, maxBytes=0, sizeOf=None):
+        """
+        @param maxEntries: the maximum number of items to hold
+        @type maxEntries: L{int}
+        @param expireSeconds: the default time in seconds after which an item
+            expires, or zero for no expiry
+        @type expireSeconds: L{int}
+        @param clock: a callable returning the current time in seconds, used
+            instead of L{time.time} (for tests)
+        @type clock: callable
+        @param maxBytes: the maximum total size of the items to hold, or zero
+            for no limit
+        @type maxBytes: L{int}
+        @param sizeOf: a callable taking a key and value and returning the size
+            of the item, used instead of the length of the key plus the length
+            of the value
+        @type sizeOf: callable
+        """
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.expireSeconds = expireSeconds
+        self._clock = clock if clock is not None else time.time
+        self._sizeOf = sizeOf if sizeOf is not None else (lambda key, value: len(key) + len(value))
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self._lookup(key) is not None
+
+    def _lookup(self, key):
+        """
+        Find an item, dropping it if it has expired.
+
+        @return: the item's (value, expiry, size) L{tuple}, or C{None} if not
+            cached
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= self._clock():
+            self._remove(key)
+            self.expirations += 1
+            entry = None
+        return entry
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[2]
+        return entry
+
+    def get(self, key, default=None):
+        """
+        Get an item and mark it as most recently used.
+
+        @param key: the key of the item
+        @param default: the value to return if the item is not cached
+
+        @return: the cached value, or C{default}
+        """
+        entry = self._lookup(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        # Move to the most recently used end
+        del self._entries[key]
+        self._entries[key] = entry
+        self.hits += 1
+        return entry[0]
+
+    def peek(self, key, default=None):
+        """
+        Get an item without marking it as recently used or counting a hit or
+        miss.
+
+        @param key: the key of the item
+        @param default: the value to return if the item is not cached
+
+        @return: the cached value, or C{default}
+        """
+        entry = self._lookup(key)
+        return default if entry is None else entry[0]
+
+    def set(self, key, value, expireSeconds=None):
+        """
+        Cache an item as the most recently used, evicting the least recently
+        used items if the cache is full.
+
+        @param key: the key of the item
+        @param value: the value of the item
+        @param expireSeconds: the time in seconds after which the item
+            expires, C{None} to use the cache's default, or zero for no expiry
+        @type expireSeconds: L{int}
+        """
+        if expireSeconds is None:
+            expireSeconds = self.expireSeconds
+        expires = self._clock() + expireSeconds if expireSeconds else None
+        self._store(key, value, expires)
+
+    def update(self, key, value):
+        """
+        Replace the value of an item without changing its expiry time or
+        marking it as recently used.
+
+        @param key: the key of the item
+        @param value: the new value of the item
+
+        @return: C{True} if the item was cached and has been replaced
+        @rtype: L{bool}
+        """
+        entry = self._lookup(key)
+        if entry is None:
+            return False
+        self._store(key, value, entry[1], touch=False)
+        return True
+
+    def _store(self, key, value, expires, touch=True):
+        size = self._sizeOf(key, value)
+        if key in self._entries:
+            oldSize = self._entries[key][2]
+            if touch:
+                del self._entries[key]
+            self._bytes -= oldSize
+        self._entries[key] = (value, expires, size,)
+        self._bytes += size
+
+        while len(self._entries) > self.maxEntries or (self.maxBytes and self._bytes > self.maxBytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def delete(self, key):
+        """
+        Remove an item.
+
+        @param key: the key of the item
+
+        @return: C{True} if the item was cached
+        @rtype: L{bool}
+        """
+        if key in self._entries:
+            self._remove(key)
+            return True
+        else:
+            return False
+
+    def sweep(self):
+        """
+        Remove all expired items.
+
+        @return: the number of items removed
+        @rtype: L{int}
+        """
+        now = self._clock()
+        expired = [
+            key for key, entry in self._entries.iteritems()
+            if entry[1] is not None and entry[1] <= now
+        ]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+        return len(expired)
+
+    def clear(self):
+        """
+        Remove all items.
+        """
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self):
+        """
+        Return the cache statistics.
+
+        @rtype: L{dict}
+        """
+        return {
+            "entries": len(self._entries),
+            "maxEntries": self.maxEntries,
+            "bytes": self._bytes,
+            "maxBytes": self.maxBytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
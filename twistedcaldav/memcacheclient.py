@@ -54,6 +54,7 @@ import types
 from twext.python.log import Logger
 
 from twistedcaldav.config import config
+from twistedcaldav.memcachering import HashRing
 
 log = Logger()
 
@@ -78,9 +79,6 @@ try:
 except ImportError:
     from StringIO import StringIO
 
-from binascii import crc32   # zlib version is not cross-platform
-serverHashFunction = crc32
-
 __author__ = "Evan Martin <martine@danga.com>"
 __version__ = "1.44"
 __copyright__ = "Copyright (C) 2003 Danga Interactive"
@@ -326,23 +324,26 @@ class Client(local):
             s.deaduntil = 0
 
     def _init_buckets(self):
-        self.buckets = []
+        self.buckets = {}
         for server in self.servers:
-            for _ignroe_i in range(server.weight):
-                self.buckets.append(server)
+            self.buckets[server.name] = server
+        self.ring = HashRing([(server.name, server.weight) for server in self.servers])
 
     def _get_server(self, key):
         if isinstance(key, tuple):
             serverhash, key = key
         else:
-            serverhash = serverHashFunction(key)
+            serverhash = HashRing.keyHash(key)
 
-        for i in range(Client._SERVER_RETRIES):
-            server = self.buckets[serverhash % len(self.buckets)]
+        # Walk the ring from the key's position so that a dead server's keys
+        # fall back to the next server rather than being spread over all
+        for i, name in enumerate(self.ring.iterNodesForHash(serverhash)):
+            if i >= Client._SERVER_RETRIES:
+                break
+            server = self.buckets[name]
             if server.connect():
                 # print("(using server %s)" % server, end="")
                 return server, key
-            serverhash = serverHashFunction(str(serverhash) + str(i))
         log.error("Memcacheclient _get_server( ) failed to connect")
         return None, None
 
@@ -1165,10 +1166,11 @@ class _Host:
     _SOCKET_TIMEOUT = 3  # number of seconds before sockets timeout.
 
     def __init__(self, host, debugfunc=None):
-        if isinstance(host, types.TupleType):
+        if isinstance(host, (types.TupleType, types.ListType)):
             host, self.weight = host
         else:
             self.weight = 1
+        self.name = host
 
         #  parse the connection string
         m = re.match(r'^(?P<proto>unix):(?P<path>.*)$', host)
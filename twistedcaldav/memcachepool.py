@@ -16,7 +16,7 @@
 
 from twisted.python.failure import Failure
 
-from twisted.internet.defer import Deferred, fail
+from twisted.internet.defer import Deferred, fail, gatherResults, FirstError
 from twisted.internet.protocol import ReconnectingClientFactory
 from twisted.protocols.memcache import MemCacheProtocol, NoSuchCommand
 
@@ -25,6 +25,8 @@ from twext.internet.gaiendpoint import GAIEndpoint
 from twext.internet.adaptendpoint import connect
 from twisted.internet.endpoints import UNIXClientEndpoint
 
+from twistedcaldav.memcachering import HashRing, serversForPool
+
 
 class PooledMemCacheProtocol(MemCacheProtocol):
     """
@@ -45,6 +47,60 @@ class PooledMemCacheProtocol(MemCacheProtocol):
             self.factory.deferred.callback(self)
             self.factory.deferred = None
 
+    def _pipeline(self, keys, commands):
+        """
+        Collect the results of commands that have been sent back-to-back on
+        this connection.
+
+        @param keys: the keys the commands were sent for
+        @type keys: L{list} of L{str}
+        @param commands: the L{Deferred}s for each command, in the same order
+            as C{keys}
+        @type commands: L{list} of L{Deferred}
+
+        @return: A L{Deferred} that fires with a C{dict} mapping each key to
+            the result of its command.
+        """
+        def _unwrapFailure(failure):
+            failure.trap(FirstError)
+            return failure.value.subFailure
+
+        d = gatherResults(commands, consumeErrors=True)
+        d.addCallbacks(lambda results: dict(zip(keys, results)), _unwrapFailure)
+        return d
+
+    def setMultiple(self, values, flags=0, expireTime=0):
+        """
+        Set several keys. The memcached text protocol has no multi-key set, so
+        one C{set} per key is pipelined on this connection without waiting for
+        the previous reply.
+
+        @param values: the values to set, keyed by key
+        @type values: C{dict}
+
+        @return: A L{Deferred} that fires with a C{dict} mapping each key to
+            the result of its C{set}.
+        """
+        keys = values.keys()
+        return self._pipeline(keys, [
+            self.set(key, values[key], flags=flags, expireTime=expireTime)
+            for key in keys
+        ])
+
+    def deleteMultiple(self, keys):
+        """
+        Delete several keys, pipelining one C{delete} per key on this
+        connection.
+
+        @param keys: the keys to delete
+        @type keys: iterable of C{str}
+
+        @return: A L{Deferred} that fires with a C{dict} mapping each key to
+            the result of its C{delete}.
+        """
+        keys = list(keys)
+        return self._pipeline(keys, [self.delete(key) for key in keys])
+
 
 class MemCacheClientFactory(ReconnectingClientFactory):
     """
@@ -237,7 +293,7 @@ class MemCachePool(object):
                 "Memcache error: {ex}; request: {cmd} {args}",
                 ex=failure.value,
                 cmd=command,
-                args=" ".join(args)[:self.REQUEST_LOGGING_SIZE],
+                args=" ".join([str(arg) for arg in args])[:self.REQUEST_LOGGING_SIZE],
             )
             self.clientFree(client)
 
@@ -371,6 +427,15 @@ class MemCachePool(object):
     def get(self, *args, **kwargs):
         return self.performRequest('get', *args, **kwargs)
 
+    def getMulti(self, *args, **kwargs):
+        return self.performRequest('getMultiple', *args, **kwargs)
+
+    def setMulti(self, *args, **kwargs):
+        return self.performRequest('setMultiple', *args, **kwargs)
+
+    def deleteMulti(self, *args, **kwargs):
+        return self.performRequest('deleteMultiple', *args, **kwargs)
+
     def set(self, *args, **kwargs):
         return self.performRequest('set', *args, **kwargs)
 
@@ -393,6 +458,109 @@ class MemCachePool(object):
         return self.performRequest('flushAll', *args, **kwargs)
 
 
+class ShardedMemCachePool(object):
+    """
+    A set of L{MemCachePool}s, one per memcached server, with keys spread
+    across them using a consistent-hash ring (see L{HashRing}). Multi-key
+    requests are split by server and issued to each server in parallel.
+
+    @ivar _pools: the pool for each server, keyed by server name
+    @type _pools: C{dict}
+
+    @ivar _ring: the ring mapping keys to server names
+    @type _ring: L{HashRing}
+    """
+
+    def __init__(self, pools, weights=None):
+        """
+        @param pools: the pool for each server, keyed by server name
+        @type pools: C{dict}
+
+        @param weights: the weight of each server, keyed by server name.
+            Servers not listed have a weight of 1.
+        @type weights: C{dict}
+        """
+        if weights is None:
+            weights = {}
+        self._pools = pools
+        self._ring = HashRing([
+            (name, weights.get(name, 1)) for name in sorted(pools.keys())
+        ])
+
+    def _poolForKey(self, key):
+        return self._pools[self._ring.nodeForKey(key)]
+
+    def _groupByPool(self, keys):
+        pools = {}
+        for key in keys:
+            pools.setdefault(self._poolForKey(key), []).append(key)
+        return pools
+
+    def _mergeResults(self, results):
+        merged = {}
+        for result in results:
+            merged.update(result)
+        return merged
+
+    def get(self, key, *args, **kwargs):
+        return self._poolForKey(key).get(key, *args, **kwargs)
+
+    def getMulti(self, keys, *args, **kwargs):
+        d = gatherResults([
+            pool.getMulti(poolKeys, *args, **kwargs)
+            for pool, poolKeys in self._groupByPool(keys).items()
+        ])
+        d.addCallback(self._mergeResults)
+        return d
+
+    def set(self, key, *args, **kwargs):
+        return self._poolForKey(key).set(key, *args, **kwargs)
+
+    def setMulti(self, values, *args, **kwargs):
+        d = gatherResults([
+            pool.setMulti(
+                dict([(key, values[key],) for key in poolKeys]), *args, **kwargs
+            )
+            for pool, poolKeys in self._groupByPool(values.keys()).items()
+        ])
+        d.addCallback(self._mergeResults)
+        return d
+
+    def checkAndSet(self, key, *args, **kwargs):
+        return self._poolForKey(key).checkAndSet(key, *args, **kwargs)
+
+    def delete(self, key, *args, **kwargs):
+        return self._poolForKey(key).delete(key, *args, **kwargs)
+
+    def deleteMulti(self, keys, *args, **kwargs):
+        d = gatherResults([
+            pool.deleteMulti(poolKeys, *args, **kwargs)
+            for pool, poolKeys in self._groupByPool(keys).items()
+        ])
+        d.addCallback(self._mergeResults)
+        return d
+
+    def add(self, key, *args, **kwargs):
+        return self._poolForKey(key).add(key, *args, **kwargs)
+
+    def incr(self, key, *args, **kwargs):
+        return self._poolForKey(key).incr(key, *args, **kwargs)
+
+    def decr(self, key, *args, **kwargs):
+        return self._poolForKey(key).decr(key, *args, **kwargs)
+
+    def flushAll(self, *args, **kwargs):
+        d = gatherResults([
+            pool.flushAll(*args, **kwargs) for pool in self._pools.values()
+        ])
+        d.addCallback(all)
+        return d
+
+    def suggestMaxClients(self, maxClients):
+        for pool in self._pools.values():
+            pool.suggestMaxClients(maxClients)
+
+
 class CachePoolUserMixIn(object):
     """
     A mixin that returns a saved cache pool or fetches the default cache pool.
@@ -413,23 +581,42 @@ _memCachePools = {}         # Maps a name to a pool object
 _memCachePoolHandler = {}   # Maps a handler id to a named pool
 
 
+def _endpointForServer(reactor, server):
+    """
+    Create an endpoint for a server returned by L{serversForPool}.
+    """
+    if server.startswith("unix:"):
+        return UNIXClientEndpoint(reactor, server[len("unix:"):])
+    else:
+        host, port = server.rsplit(":", 1)
+        return GAIEndpoint(reactor, host, int(port))
+
+
 def installPools(pools, maxClients=5, reactor=None):
     if reactor is None:
         from twisted.internet import reactor
     for name, pool in pools.items():
         if pool["ClientEnabled"]:
-            if pool.get("MemcacheSocket"):
-                ep = UNIXClientEndpoint(reactor, pool["MemcacheSocket"])
+            servers = serversForPool(pool)
+            if len(servers) == 1:
+                _installPool(
+                    name,
+                    pool["HandleCacheTypes"],
+                    _endpointForServer(reactor, servers[0][0]),
+                    maxClients,
+                    reactor,
+                )
             else:
-                ep = GAIEndpoint(reactor, pool["BindAddress"], pool["Port"])
-
-            _installPool(
-                name,
-                pool["HandleCacheTypes"],
-                ep,
-                maxClients,
-                reactor,
-            )
+                _installShardedPool(
+                    name,
+                    pool["HandleCacheTypes"],
+                    [
+                        (server, _endpointForServer(reactor, server), weight,)
+                        for server, weight in servers
+                    ],
+                    maxClients,
+                    reactor,
+                )
 
 
 def _installPool(
@@ -442,6 +629,28 @@ def _installPool(
         _memCachePoolHandler[handle] = pool
 
 
+def _installShardedPool(
+    name, handleTypes, servers, maxClients=5, reactor=None
+):
+    """
+    Install a pool that shards keys across several servers.
+
+    @param servers: the name, endpoint and weight of each server
+    @type servers: C{list} of C{tuple}
+    """
+    pool = ShardedMemCachePool(
+        dict([
+            (server, MemCachePool(endpoint, maxClients=maxClients, reactor=None),)
+            for server, endpoint, _ignore_weight in servers
+        ]),
+        dict([(server, weight,) for server, _ignore_endpoint, weight in servers]),
+    )
+    _memCachePools[name] = pool
+
+    for handle in handleTypes:
+        _memCachePoolHandler[handle] = pool
+
+
 def defaultCachePool(name):
     if name not in _memCachePoolHandler:
         name = "Default"
@@ -42,6 +42,7 @@ from txdav.xml.base import encodeXMLName
 from twistedcaldav.config import config
 from twistedcaldav.memcacheclient import ClientFactory
 from twistedcaldav.memcacheclient import MemcacheError, TokenMismatchError
+from twistedcaldav.memcachering import serversForPool
 
 
 NoValue = ""
@@ -64,9 +65,7 @@ class MemcachePropertyCollection (object):
             cls.log.info("Instantiating memcache connection for MemcachePropertyCollection")
 
             MemcachePropertyCollection._memcacheClient = ClientFactory.getClient(
-                [
-                    "%s:%s" % (config.Memcached.Pools.Default.BindAddress, config.Memcached.Pools.Default.Port)
-                ],
+                serversForPool(config.Memcached.Pools.Default),
                 debug=0,
                 pickleProtocol=2,
             )
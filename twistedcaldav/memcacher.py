@@ -17,11 +17,13 @@
 import hashlib
 import cPickle
 import string
+import time
 
 from twisted.internet.defer import succeed
 
 from twext.python.log import Logger
 
+from twistedcaldav.lrucache import LRUCache
 from twistedcaldav.memcachepool import CachePoolUserMixIn
 from twistedcaldav.config import config
 
@@ -44,18 +46,61 @@ class Memcacher(CachePoolUserMixIn):
         False: None,
     }
 
+    # In-process L1 caches in front of memcached, keyed by namespace. Entries
+    # hold the raw (pickled) memcached value so each get returns a new copy.
+    l1Caches = {}
+
+    # Tells sibling processes which keys to drop from their L1 caches - an
+    # object with an invalidate(namespace, keys) method, or None if there are
+    # no siblings
+    l1Invalidator = None
+
+    # Bumped on every L1 invalidation, which happens once a change to memcached
+    # has completed, so that a memcached read that was in flight when its key
+    # was invalidated does not re-populate the L1 cache with the old value
+    l1Generation = 0
+
     class memoryCacher():
         """
         A class implementing the memcache client API we care about but
-        using a dict to store the results in memory. This can be used
+        using an in-memory LRU cache to store the results. This can be used
         for caching on a single instance server, and for tests, where
-        memcached may not be running.
+        memcached may not be running. The size of the cache is bounded by the
+        C{Memcached.MemoryCache} config; least recently used entries are
+        evicted when it is full, and expired entries are removed when looked
+        up as well as by a sweep of the whole cache every C{SweepSeconds}.
         """
 
-        def __init__(self, pickle=False):
-            self._cache = {}  # (value, expireTime, check-and-set identifier)
+        def __init__(self, pickle=False, maxEntries=None, maxBytes=None, sweepSeconds=None):
+            cacheConfig = config.Memcached.MemoryCache
+            # Each entry is (value, check-and-set identifier)
+            self._cache = LRUCache(
+                maxEntries if maxEntries is not None else cacheConfig.MaxEntries,
+                clock=self._now,
+                maxBytes=maxBytes if maxBytes is not None else cacheConfig.MaxBytes,
+                sizeOf=self._sizeOf,
+            )
             self._clock = 0
             self._pickle = pickle
+            self._sweepSeconds = sweepSeconds if sweepSeconds is not None else cacheConfig.SweepSeconds
+            self._nextSweep = self._now() + self._sweepSeconds
+
+        def _now(self):
+            return time.time() + self._clock
+
+        @staticmethod
+        def _sizeOf(key, entry):
+            value = entry[0]
+            return len(key) + len(value if isinstance(value, str) else str(value))
+
+        def _sweep(self):
+            """
+            Remove all expired entries if it is time for a periodic sweep.
+            """
+            now = self._now()
+            if now >= self._nextSweep:
+                self._cache.sweep()
+                self._nextSweep = now + self._sweepSeconds
 
         def _check_key(self, key):
             if not isinstance(key, str):
@@ -72,9 +117,8 @@ class Memcacher(CachePoolUserMixIn):
             if len(key) > Memcacher.MEMCACHE_KEY_LIMIT or len(str(value)) > Memcacher.MEMCACHE_VALUE_LIMIT:
                 return succeed(False)
             if key not in self._cache:
-                if not expireTime:
-                    expireTime = 99999
-                self._cache[key] = (value, self._clock + expireTime, 0)
+                self._sweep()
+                self._cache.set(key, (value, 0), expireTime)
                 return succeed(True)
             else:
                 return succeed(False)
@@ -82,18 +126,25 @@ class Memcacher(CachePoolUserMixIn):
         def set(self, key, value, expireTime=0):
             self._check_key(key)
             self._check_value(value)
-
+            return succeed(self._set(key, value, expireTime))
+
+        def setMulti(self, values, expireTime=0):
+            for key, value in values.iteritems():
+                self._check_key(key)
+                self._check_value(value)
+            return succeed(dict([
+                (key, self._set(key, value, expireTime),)
+                for key, value in values.iteritems()
+            ]))
+
+        def _set(self, key, value, expireTime):
             if len(key) > Memcacher.MEMCACHE_KEY_LIMIT or len(str(value)) > Memcacher.MEMCACHE_VALUE_LIMIT:
-                return succeed(False)
-            if not expireTime:
-                expireTime = 99999
-            if key in self._cache:
-                identifier = self._cache[key][2]
-                identifier += 1
-            else:
-                identifier = 0
-            self._cache[key] = (value, self._clock + expireTime, identifier)
-            return succeed(True)
+                return False
+            self._sweep()
+            entry = self._cache.peek(key)
+            identifier = entry[1] + 1 if entry is not None else 0
+            self._cache.set(key, (value, identifier), expireTime)
+            return True
 
         def checkAndSet(self, key, value, cas, flags=0, expireTime=0):
             self._check_key(key)
@@ -101,88 +152,90 @@ class Memcacher(CachePoolUserMixIn):
 
             if len(key) > Memcacher.MEMCACHE_KEY_LIMIT or len(str(value)) > Memcacher.MEMCACHE_VALUE_LIMIT:
                 return succeed(False)
-            if not expireTime:
-                expireTime = 99999
-            if key in self._cache:
-                identifier = self._cache[key][2]
-                if cas != str(identifier):
-                    return succeed(False)
-                identifier += 1
-            else:
+            entry = self._cache.peek(key)
+            if entry is None or cas != str(entry[1]):
                 return succeed(False)
-            self._cache[key] = (value, self._clock + expireTime, identifier)
+            self._sweep()
+            self._cache.set(key, (value, entry[1] + 1), expireTime)
             return succeed(True)
 
         def get(self, key, withIdentifier=False):
             self._check_key(key)
+            return succeed(self._get(key, withIdentifier))
+
+        def getMulti(self, keys, withIdentifier=False):
+            for key in keys:
+                self._check_key(key)
+            return succeed(dict([
+                (key, self._get(key, withIdentifier),) for key in keys
+            ]))
 
+        def _get(self, key, withIdentifier):
             if len(key) > Memcacher.MEMCACHE_KEY_LIMIT:
-                value, expires, identifier = (None, 0, "")
+                value, identifier = (None, "")
             else:
-                value, expires, identifier = self._cache.get(key, (None, 0, ""))
-                if self._clock >= expires:
-                    value = None
-                    identifier = ""
+                value, identifier = self._cache.get(key, (None, ""))
 
             if withIdentifier:
-                return succeed((0, value, str(identifier)))
+                return (0, value, str(identifier))
             else:
-                return succeed((0, value,))
+                return (0, value,)
 
         def delete(self, key):
             self._check_key(key)
+            return succeed(self._delete(key))
+
+        def deleteMulti(self, keys):
+            for key in keys:
+                self._check_key(key)
+            return succeed(dict([
+                (key, self._delete(key),) for key in keys
+            ]))
 
+        def _delete(self, key):
             if len(key) > Memcacher.MEMCACHE_KEY_LIMIT:
-                return succeed(False)
-            try:
-                del self._cache[key]
-                return succeed(True)
-            except KeyError:
-                return succeed(False)
+                return False
+            return self._cache.delete(key)
 
         def incr(self, key, delta=1):
-            self._check_key(key)
-
-            if len(key) > Memcacher.MEMCACHE_KEY_LIMIT:
-                return succeed(False)
-            value = self._cache.get(key, None)
-            if value is not None:
-                value, expire, identifier = value
-                try:
-                    value = int(value)
-                except ValueError:
-                    value = None
-                else:
-                    value += delta
-                    self._cache[key] = (str(value), expire, identifier,)
-            return succeed(value)
+            return self._incr(key, delta)
 
         def decr(self, key, delta=1):
+            return self._incr(key, -delta)
+
+        def _incr(self, key, delta):
             self._check_key(key)
 
             if len(key) > Memcacher.MEMCACHE_KEY_LIMIT:
                 return succeed(False)
-            value = self._cache.get(key, None)
-            if value is not None:
-                value, expire, identifier = value
+            entry = self._cache.peek(key)
+            value = None
+            if entry is not None:
+                value, identifier = entry
                 try:
                     value = int(value)
                 except ValueError:
                     value = None
                 else:
-                    value -= delta
-                    if value < 0:
-                        value = 0
-                    self._cache[key] = (str(value), expire, identifier,)
+                    value = max(value + delta, 0)
+                    self._cache.update(key, (str(value), identifier,))
             return succeed(value)
 
         def flushAll(self):
-            self._cache = {}
+            self._cache.clear()
             return succeed(True)
 
         def advanceClock(self, seconds):
             self._clock += seconds
 
+        def stats(self):
+            """
+            Return the cache statistics.
+
+            @rtype: L{dict}
+            """
+            return self._cache.stats()
+
     # TODO: an sqlite based cacher that can be used for multiple instance servers
     # in the absence of memcached. This is not ideal and we may want to not implement
     # this, but it is being documented for completeness.
@@ -203,12 +256,21 @@ class Memcacher(CachePoolUserMixIn):
         def checkAndSet(self, key, value, cas, flags=0, expireTime=0):
             return succeed(True)
 
+        def setMulti(self, values, expireTime=0):
+            return succeed(dict([(key, True,) for key in values]))
+
         def get(self, key, withIdentifier=False):
             return succeed((0, None,))
 
+        def getMulti(self, keys, withIdentifier=False):
+            return succeed(dict([(key, (0, None,),) for key in keys]))
+
         def delete(self, key):
             return succeed(True)
 
+        def deleteMulti(self, keys):
+            return succeed(dict([(key, True,) for key in keys]))
+
         def incr(self, key, delta=1):
             return succeed(None)
 
@@ -218,7 +280,7 @@ class Memcacher(CachePoolUserMixIn):
         def flushAll(self):
             return succeed(True)
 
-    def __init__(self, namespace, pickle=False, no_invalidation=False, key_normalization=True):
+    def __init__(self, namespace, pickle=False, no_invalidation=False, key_normalization=True, serializer=None):
         """
         @param namespace: a unique namespace for this cache's keys
         @type namespace: C{str}
@@ -233,6 +295,10 @@ class Memcacher(CachePoolUserMixIn):
         @param key_normalization: if C{True} the key is assumed to possibly be longer than the Memcache key size and so additional
             work is done to truncate and append a hash.
         @type key_normalization: C{bool}
+        @param serializer: the module or object whose C{dumps} and C{loads}
+            are used to encode and decode values when C{pickle} is C{True}, in
+            place of L{cPickle}. C{loads} raising L{ValueError} is treated as a
+            cache miss, e.g. for entries written in an older format.
         """
 
         assert len(namespace) <= Memcacher.NAMESPACE_MAX_LENGTH, "Memcacher namespace must be less than or equal to %s characters long" % (Memcacher.NAMESPACE_MAX_LENGTH,)
@@ -242,6 +308,112 @@ class Memcacher(CachePoolUserMixIn):
         self._pickle = pickle
         self._noInvalidation = no_invalidation
         self._key_normalization = key_normalization
+        self._serializer = serializer if serializer is not None else cPickle
+
+    def _getL1Cache(self):
+        """
+        Get the in-process L1 cache for this namespace. An L1 cache is only used
+        in front of memcached, and only for namespaces listed in the
+        C{Memcached.L1Cache.Namespaces} config.
+
+        @return: the L1 cache or C{None}
+        @rtype: L{LRUCache}
+        """
+        if self._namespace in Memcacher.l1Caches:
+            return Memcacher.l1Caches[self._namespace]
+
+        l1Config = config.Memcached.L1Cache
+        if (
+            not l1Config.Enabled or
+            self._namespace not in l1Config.Namespaces or
+            isinstance(self._getMemcacheProtocol(), (Memcacher.memoryCacher, Memcacher.nullCacher,))
+        ):
+            return None
+
+        namespaceConfig = l1Config.Namespaces[self._namespace]
+        l1Cache = LRUCache(
+            namespaceConfig.get("MaxEntries", l1Config.MaxEntries),
+            namespaceConfig.get("ExpireSeconds", l1Config.ExpireSeconds),
+        )
+        Memcacher.l1Caches[self._namespace] = l1Cache
+        return l1Cache
+
+    def _invalidateL1(self, cacheKeys, d):
+        """
+        Drop keys that are being changed from this process' L1 cache and from
+        those of sibling processes once the change to memcached has completed.
+        Dropping them any earlier would let a read that starts before the
+        change lands put the old value back.
+
+        @param cacheKeys: the namespaced keys
+        @type cacheKeys: L{list} of L{str}
+        @param d: the L{Deferred} for the change to memcached
+
+        @return: C{d}
+        """
+        if self._getL1Cache() is None:
+            return d
+
+        def _changed(result):
+            Memcacher.invalidateL1(self._namespace, cacheKeys)
+            if Memcacher.l1Invalidator is not None:
+                Memcacher.l1Invalidator.invalidate(self._namespace, cacheKeys)
+            return result
+
+        return d.addBoth(_changed)
+
+    @classmethod
+    def invalidateL1(cls, namespace, cacheKeys):
+        """
+        Drop keys from this process' L1 cache for a namespace.
+
+        @param namespace: the namespace, or an empty string to drop all
+            entries of all namespaces
+        @type namespace: L{str}
+        @param cacheKeys: the namespaced keys, or an empty list to drop all
+            entries of the namespace
+        @type cacheKeys: L{list} of L{str}
+        """
+        cls.l1Generation += 1
+        if not namespace:
+            for l1Cache in cls.l1Caches.values():
+                l1Cache.clear()
+        elif namespace in cls.l1Caches:
+            l1Cache = cls.l1Caches[namespace]
+            if cacheKeys:
+                for cacheKey in cacheKeys:
+                    l1Cache.delete(cacheKey)
+            else:
+                l1Cache.clear()
+
+    @classmethod
+    def l1Stats(cls):
+        """
+        Return the statistics of each L1 cache.
+
+        @return: the statistics keyed by namespace
+        @rtype: L{dict}
+        """
+        return dict([
+            (namespace, l1Cache.stats(),)
+            for namespace, l1Cache in cls.l1Caches.items()
+        ])
+
+    @classmethod
+    def memoryCacheStats(cls):
+        """
+        Return the statistics of the in-memory caches used when the memcached
+        client is disabled.
+
+        @return: the statistics of the caches for pickled values ("pickle")
+            and for str values ("str"), for those that are in use
+        @rtype: L{dict}
+        """
+        return dict([
+            ("pickle" if pickle else "str", cacher.stats(),)
+            for pickle, cacher in cls.memoryCacheInstance.items()
+            if cacher is not None
+        ])
 
     def _getMemcacheProtocol(self):
         if self._memcacheProtocol is not None:
@@ -277,15 +449,21 @@ class Memcacher(CachePoolUserMixIn):
         else:
             return key
 
+    def _namespacedKey(self, key):
+        return "%s:%s" % (self._namespace, self._normalizeKey(key),)
+
     def add(self, key, value, expireTime=0):
 
         proto = self._getMemcacheProtocol()
 
         my_value = value
         if self._pickle:
-            my_value = cPickle.dumps(value)
+            my_value = self._serializer.dumps(value)
         self.log.debug("Adding Cache Token for {k!r}", k=key)
-        return proto.add('%s:%s' % (self._namespace, self._normalizeKey(key)), my_value, expireTime=expireTime)
+        return self._invalidateL1(
+            [self._namespacedKey(key)],
+            proto.add(self._namespacedKey(key), my_value, expireTime=expireTime),
+        )
 
     def set(self, key, value, expireTime=0):
 
@@ -293,9 +471,12 @@ class Memcacher(CachePoolUserMixIn):
 
         my_value = value
         if self._pickle:
-            my_value = cPickle.dumps(value)
+            my_value = self._serializer.dumps(value)
         self.log.debug("Setting Cache Token for {k!r}", k=key)
-        return proto.set('%s:%s' % (self._namespace, self._normalizeKey(key)), my_value, expireTime=expireTime)
+        return self._invalidateL1(
+            [self._namespacedKey(key)],
+            proto.set(self._namespacedKey(key), my_value, expireTime=expireTime),
+        )
 
     def checkAndSet(self, key, value, cas, flags=0, expireTime=0):
 
@@ -303,46 +484,183 @@ class Memcacher(CachePoolUserMixIn):
 
         my_value = value
         if self._pickle:
-            my_value = cPickle.dumps(value)
+            my_value = self._serializer.dumps(value)
         self.log.debug("Setting Cache Token for {k!r}", k=key)
-        return proto.checkAndSet('%s:%s' % (self._namespace, self._normalizeKey(key)), my_value, cas, expireTime=expireTime)
+        return self._invalidateL1(
+            [self._namespacedKey(key)],
+            proto.checkAndSet(self._namespacedKey(key), my_value, cas, expireTime=expireTime),
+        )
+
+    def _loads(self, value):
+        try:
+            return self._serializer.loads(value)
+        except ValueError as e:
+            self.log.debug("Ignoring cache value that cannot be decoded: {ex}", ex=e)
+            return None
 
     def get(self, key, withIdentifier=False):
+        cacheKey = self._namespacedKey(key)
+        l1Cache = None if withIdentifier else self._getL1Cache()
+        if l1Cache is not None:
+            value = l1Cache.get(cacheKey)
+            if value is not None:
+                return succeed(self._loads(value) if self._pickle else value)
+            generation = Memcacher.l1Generation
+
         def _gotit(result, withIdentifier):
             if withIdentifier:
                 _ignore_flags, identifier, value = result
             else:
                 _ignore_flags, value = result
+            if l1Cache is not None and value is not None and generation == Memcacher.l1Generation:
+                l1Cache.set(cacheKey, value)
             if self._pickle and value is not None:
-                value = cPickle.loads(value)
+                value = self._loads(value)
             if withIdentifier:
                 value = (identifier, value)
             return value
 
         self.log.debug("Getting Cache Token for {k!r}", k=key)
-        d = self._getMemcacheProtocol().get('%s:%s' % (self._namespace, self._normalizeKey(key)), withIdentifier=withIdentifier)
+        d = self._getMemcacheProtocol().get(cacheKey, withIdentifier=withIdentifier)
         d.addCallback(_gotit, withIdentifier)
         return d
 
+    def getMulti(self, keys):
+        """
+        Get the values of several keys with a single request to the cache.
+
+        @param keys: the keys to get
+        @type keys: iterable of L{str}
+
+        @return: a L{Deferred} that fires with a L{dict} mapping each key to
+            its value, or C{None} if the key is not in the cache
+        """
+        keys = list(keys)
+        if not keys:
+            return succeed({})
+        cacheKeys = [self._namespacedKey(key) for key in keys]
+
+        # Use any values in the L1 cache, and only ask memcached for the rest
+        cached = {}
+        l1Cache = self._getL1Cache()
+        if l1Cache is not None:
+            for cacheKey in cacheKeys:
+                value = l1Cache.get(cacheKey)
+                if value is not None:
+                    cached[cacheKey] = (0, value,)
+            generation = Memcacher.l1Generation
+
+        def _gotthem(results):
+            values = {}
+            for key, cacheKey in zip(keys, cacheKeys):
+                if cacheKey in cached:
+                    _ignore_flags, value = cached[cacheKey]
+                else:
+                    _ignore_flags, value = results.get(cacheKey, (0, None,))
+                    if l1Cache is not None and value is not None and generation == Memcacher.l1Generation:
+                        l1Cache.set(cacheKey, value)
+                if self._pickle and value is not None:
+                    value = self._loads(value)
+                values[key] = value
+            return values
+
+        missing = [cacheKey for cacheKey in cacheKeys if cacheKey not in cached]
+        if missing:
+            self.log.debug("Getting Cache Tokens for {k!r}", k=keys)
+            d = self._getMemcacheProtocol().getMulti(missing)
+        else:
+            d = succeed({})
+        d.addCallback(_gotthem)
+        return d
+
+    def setMulti(self, values, expireTime=0):
+        """
+        Set the values of several keys with a single request to the cache.
+
+        @param values: the values to set, keyed by key
+        @type values: L{dict}
+
+        @return: a L{Deferred} that fires with a L{dict} mapping each key to
+            the result of setting it
+        """
+        if not values:
+            return succeed({})
+
+        proto = self._getMemcacheProtocol()
+
+        cacheKeys = {}
+        cacheValues = {}
+        for key, value in values.iteritems():
+            cacheKey = self._namespacedKey(key)
+            cacheKeys[cacheKey] = key
+            cacheValues[cacheKey] = self._serializer.dumps(value) if self._pickle else value
+
+        self.log.debug("Setting Cache Tokens for {k!r}", k=values.keys())
+        d = self._invalidateL1(cacheKeys.keys(), proto.setMulti(cacheValues, expireTime=expireTime))
+        d.addCallback(lambda results: dict([
+            (cacheKeys[cacheKey], result,) for cacheKey, result in results.iteritems()
+        ]))
+        return d
+
+    def deleteMulti(self, keys):
+        """
+        Delete several keys with a single request to the cache.
+
+        @param keys: the keys to delete
+        @type keys: iterable of L{str}
+
+        @return: a L{Deferred} that fires with a L{dict} mapping each key to
+            the result of deleting it
+        """
+        keys = list(keys)
+        if not keys:
+            return succeed({})
+        cacheKeys = dict([(self._namespacedKey(key), key,) for key in keys])
+
+        self.log.debug("Deleting Cache Tokens for {k!r}", k=keys)
+        d = self._invalidateL1(cacheKeys.keys(), self._getMemcacheProtocol().deleteMulti(cacheKeys.keys()))
+        d.addCallback(lambda results: dict([
+            (cacheKeys[cacheKey], result,) for cacheKey, result in results.iteritems()
+        ]))
+        return d
+
     def delete(self, key):
         self.log.debug("Deleting Cache Token for {k!r}", k=key)
-        return self._getMemcacheProtocol().delete('%s:%s' % (self._namespace, self._normalizeKey(key)))
+        return self._invalidateL1(
+            [self._namespacedKey(key)],
+            self._getMemcacheProtocol().delete(self._namespacedKey(key)),
+        )
 
     def incr(self, key, delta=1):
         self.log.debug("Incrementing Cache Token for {k!r}", k=key)
-        return self._getMemcacheProtocol().incr('%s:%s' % (self._namespace, self._normalizeKey(key)), delta)
+        return self._invalidateL1(
+            [self._namespacedKey(key)],
+            self._getMemcacheProtocol().incr(self._namespacedKey(key), delta),
+        )
 
     def decr(self, key, delta=1):
         self.log.debug("Decrementing Cache Token for {k!r}", k=key)
-        return self._getMemcacheProtocol().incr('%s:%s' % (self._namespace, self._normalizeKey(key)), delta)
+        return self._invalidateL1(
+            [self._namespacedKey(key)],
+            self._getMemcacheProtocol().incr(self._namespacedKey(key), delta),
+        )
 
     def flushAll(self):
         self.log.debug("Flushing All Cache Tokens")
-        return self._getMemcacheProtocol().flushAll()
+        d = self._getMemcacheProtocol().flushAll()
+
+        def _flushed(result):
+            Memcacher.invalidateL1("", [])
+            if Memcacher.l1Invalidator is not None:
+                Memcacher.l1Invalidator.invalidate("", [])
+            return result
+
+        return d.addBoth(_flushed)
 
     @classmethod
     def reset(cls):
         """
-        Reset the memory cachers
+        Reset the memory cachers and L1 caches
         """
         cls.memoryCacheInstance = {True: None, False: None}
+        cls.l1Caches = {}
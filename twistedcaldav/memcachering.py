@@ -0,0 +1,174 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Consistent hashing of memcached keys onto a set of servers.
+
+Each server is placed on a ring of 32-bit hash values at a number of points
+(virtual nodes) proportional to its weight, following the "ketama" scheme
+used by other memcached clients. A key is stored on the server owning the
+first point at or after the key's hash. Adding or removing one of N servers
+therefore only remaps about 1/N of the keys, rather than almost all of them
+as happens with C{hash % N}.
+"""
+
+from bisect import bisect_left
+import hashlib
+import struct
+
+__all__ = [
+    "HashRing",
+    "serversForPool",
+]
+
+
+class HashRing(object):
+    """
+    A ketama-style consistent hash ring.
+
+    @ivar _hashes: the sorted ring points
+    @type _hashes: L{list} of L{int}
+    @ivar _nodes: the node name owning the ring point at the same index in
+        C{_hashes}
+    @type _nodes: L{list} of L{str}
+    """
+
+    # Each md5 digest yields four ring points
+    DIGESTS_PER_WEIGHT = 40
+
+    def __init__(self, nodes):
+        """
+        @param nodes: the node names and their integer weights
+        @type nodes: iterable of L{tuple} of (L{str}, L{int})
+        """
+        points = []
+        self.weights = {}
+        for name, weight in nodes:
+            self.weights[name] = weight
+            for i in range(self.DIGESTS_PER_WEIGHT * weight):
+                digest = hashlib.md5("%s-%d" % (name, i,)).digest()
+                for point in struct.unpack("<4I", digest):
+                    points.append((point, name,))
+
+        # Sort on the point, then the name, so that colliding points are
+        # always resolved the same way in every process
+        points.sort()
+        self._hashes = [point for point, _ignore_name in points]
+        self._nodes = [name for _ignore_point, name in points]
+
+    def __len__(self):
+        return len(self.weights)
+
+    @staticmethod
+    def keyHash(key):
+        """
+        Map a key onto the ring.
+
+        @param key: the key
+        @type key: L{str}
+
+        @return: the 32-bit ring position of the key
+        @rtype: L{int}
+        """
+        if isinstance(key, unicode):
+            key = key.encode("utf-8")
+        return struct.unpack("<I", hashlib.md5(key).digest()[:4])[0]
+
+    def _index(self, keyHash):
+        index = bisect_left(self._hashes, keyHash & 0xFFFFFFFF)
+        return 0 if index == len(self._hashes) else index
+
+    def nodeForHash(self, keyHash):
+        """
+        Find the node owning a ring position.
+
+        @param keyHash: the ring position
+        @type keyHash: L{int}
+
+        @return: the node name, or C{None} if the ring is empty
+        @rtype: L{str}
+        """
+        if not self._hashes:
+            return None
+        return self._nodes[self._index(keyHash)]
+
+    def nodeForKey(self, key):
+        """
+        Find the node a key is stored on.
+
+        @param key: the key
+        @type key: L{str}
+
+        @return: the node name, or C{None} if the ring is empty
+        @rtype: L{str}
+        """
+        return self.nodeForHash(self.keyHash(key))
+
+    def iterNodesForHash(self, keyHash):
+        """
+        Iterate over each distinct node in ring order, starting with the node
+        owning a ring position. This gives the order in which to fall back to
+        other nodes when the owning node is unavailable.
+
+        @param keyHash: the ring position
+        @type keyHash: L{int}
+
+        @return: the node names
+        @rtype: iterator of L{str}
+        """
+        if not self._hashes:
+            return
+        seen = set()
+        start = self._index(keyHash)
+        count = len(self._nodes)
+        for offset in xrange(count):
+            name = self._nodes[(start + offset) % count]
+            if name not in seen:
+                seen.add(name)
+                yield name
+                if len(seen) == len(self.weights):
+                    return
+
+
+def serversForPool(pool):
+    """
+    Get the memcached servers for a pool in the config's C{Memcached.Pools}.
+    A pool normally uses a single server given by C{MemcacheSocket} or
+    C{BindAddress}/C{Port}; if C{Servers} is not empty, keys are instead
+    sharded across each of the servers it lists.
+
+    @param pool: the pool config
+    @type pool: L{ConfigDict}
+
+    @return: the servers as "unix:path" or "host:port" strings paired with
+        their weight
+    @rtype: L{list} of L{tuple} of (L{str}, L{int})
+    """
+    servers = []
+    for server in pool.get("Servers", ()):
+        if isinstance(server, basestring):
+            servers.append((server, 1,))
+        else:
+            address, weight = server
+            servers.append((address, int(weight),))
+
+    if not servers:
+        if pool.get("MemcacheSocket"):
+            servers.append(("unix:{}".format(pool["MemcacheSocket"]), 1,))
+        else:
+            servers.append(("{}:{}".format(pool["BindAddress"], pool["Port"]), 1,))
+
+    return servers
@@ -41,6 +41,7 @@ from txdav.common.icommondatastore import IndexedSearchException, \
 from twistedcaldav.instance import TooManyInstancesError
 from twistedcaldav.method import report_common
 
+from txdav.caldav.datastore.expansioncache import EXPANSION_LOAD_BATCH, loadExpansionCaches
 from txdav.caldav.datastore.query.filter import Filter
 from txdav.caldav.icalendarstore import TimeRangeLowerLimit, TimeRangeUpperLimit
 from txdav.xml import element as davxml
@@ -228,16 +229,25 @@ def report_urn_ietf_params_xml_ns_caldav_calendar_query(self, request, calendar_
                     inherited_aces=filteredaces
                 )
 
-                for child, child_uri in ok_resources:
-                    child_uri_name = child_uri[child_uri.rfind("/") + 1:]
-
-                    if generate_calendar_data or not index_query_ok:
-                        calendar = (yield child.componentForUser())
-                        assert calendar is not None, "Calendar %s is missing from calendar collection %r" % (child_uri_name, self)
-                    else:
-                        calendar = None
-
-                    yield queryCalendarObjectResource(child, uri, child_uri_name, calendar, timezone, query_ok=index_query_ok, isowner=isowner)
+                for offset in range(0, len(ok_resources), EXPANSION_LOAD_BATCH):
+                    batch = []
+                    for child, child_uri in ok_resources[offset:offset + EXPANSION_LOAD_BATCH]:
+                        child_uri_name = child_uri[child_uri.rfind("/") + 1:]
+
+                        if generate_calendar_data or not index_query_ok:
+                            calendar = (yield child.componentForUser())
+                            assert calendar is not None, "Calendar %s is missing from calendar collection %r" % (child_uri_name, self)
+                        else:
+                            calendar = None
+                        batch.append((child, child_uri_name, calendar,))
+
+                    # Use expansions of the same data shared by other requests,
+                    # read for the whole batch at once
+                    if not index_query_ok:
+                        yield loadExpansionCaches([calendar for _ignore_child, _ignore_name, calendar in batch])
+
+                    for child, child_uri_name, calendar in batch:
+                        yield queryCalendarObjectResource(child, uri, child_uri_name, calendar, timezone, query_ok=index_query_ok, isowner=isowner)
         else:
             # Get the timezone property from the collection if one was not set in the query,
             # and store in the query object for later use
@@ -257,6 +267,10 @@ def report_urn_ietf_params_xml_ns_caldav_calendar_query(self, request, calendar_
             isowner = (yield calresource.isOwner(request))
 
             calendar = (yield calresource.componentForUser())
+
+            # Use expansions of the same data shared by other requests
+            yield loadExpansionCaches((calendar,))
+
             yield queryCalendarObjectResource(calresource, uri, None, calendar, timezone)
 
         returnValue(True)
@@ -23,6 +23,7 @@ __all__ = ["multiget_common"]
 from twext.python.log import Logger
 from twisted.internet.defer import inlineCallbacks, returnValue
 from twistedcaldav import carddavxml
+from twistedcaldav.cache import ReportCacheMixin
 from twistedcaldav.caldavxml import caldav_namespace
 from twistedcaldav.carddavxml import carddav_namespace
 from twistedcaldav.config import config
@@ -61,6 +62,10 @@ def multiget_common(self, request, multiget, collection_type):
                 log.error("addressbook-multiget report is not allowed on a resource outside of an address book collection {res}", res=self)
                 raise HTTPError(StatusResponse(responsecode.FORBIDDEN, "Must be address book resource"))
 
+    # The response for a collection can be cached
+    if isinstance(self, ReportCacheMixin):
+        yield self.prepareResponseCache(request)
+
     responses = []
 
     propertyreq = multiget.property
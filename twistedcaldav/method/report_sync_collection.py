@@ -24,6 +24,7 @@ from twext.python.log import Logger
 
 from twisted.internet.defer import inlineCallbacks, returnValue
 
+from twistedcaldav.cache import ReportCacheMixin
 from twistedcaldav.config import config
 from twistedcaldav.method.report_common import (
     _namedPropertiesForResource, responseForHref
@@ -60,13 +61,20 @@ def report_DAV__sync_collection(self, request, sync_collection):
 
     responses = []
 
-    # Do not support limit
-    if sync_collection.sync_limit is not None:
-        raise HTTPError(ErrorResponse(
-            responsecode.INSUFFICIENT_STORAGE_SPACE,
-            element.NumberOfMatchesWithinLimits(),
-            "Report limit not supported",
-        ))
+    # A limit is honored by truncating the results and returning a
+    # continuation token, which only some collections support
+    limit = sync_collection.sync_limit
+    if limit is not None:
+        if limit < 1:
+            raise HTTPError(StatusResponse(responsecode.BAD_REQUEST, "Invalid DAV:limit value"))
+        if not self.supportsSyncLimit():
+            raise HTTPError(ErrorResponse(
+                responsecode.INSUFFICIENT_STORAGE_SPACE,
+                element.NumberOfMatchesWithinLimits(),
+                "Report limit not supported",
+            ))
+    if config.MaxSyncReportResults and self.supportsSyncLimit():
+        limit = min(limit, config.MaxSyncReportResults) if limit is not None else config.MaxSyncReportResults
 
     # Process Depth and sync-level for backwards compatibility
     # Use sync-level if present and ignore Depth, else use Depth
@@ -89,7 +97,15 @@ def report_DAV__sync_collection(self, request, sync_collection):
     # the child resource loop and supply those to the checkPrivileges on each child.
     filteredaces = (yield self.inheritedACEsforChildren(request))
 
-    changed, removed, notallowed, newtoken, resourceChanged = yield self.whatchanged(sync_collection.sync_token, depth)
+    # An unchanged collection's response can be cached
+    cacheable = isinstance(self, ReportCacheMixin)
+    if cacheable:
+        yield self.prepareResponseCache(request)
+
+    changed, removed, notallowed, newtoken, resourceChanged, truncated = yield self.whatchanged(sync_collection.sync_token, depth, limit)
+
+    if cacheable and (changed or removed or notallowed or resourceChanged or truncated):
+        self.discardResponseCache(request)
 
     # Now determine which valid resources are readable and which are not
     ok_resources = []
@@ -160,6 +176,14 @@ def report_DAV__sync_collection(self, request, sync_collection):
         href = element.HRef.fromString(joinURL(request.uri, name))
         responses.append(element.StatusResponse(element.HRef.fromString(href), element.Status.fromResponseCode(responsecode.NOT_ALLOWED)))
 
+    if truncated:
+        # RFC 6578 section 3.6: truncated results are flagged with a 507 for the request-URI
+        responses.append(element.StatusResponse(
+            element.HRef.fromString(request.uri),
+            element.Status.fromResponseCode(responsecode.INSUFFICIENT_STORAGE_SPACE),
+            element.Error(element.NumberOfMatchesWithinLimits()),
+        ))
+
     if not hasattr(request, "extendedLogItems"):
         request.extendedLogItems = {}
     request.extendedLogItems["responses"] = len(responses)
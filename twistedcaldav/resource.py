@@ -1201,10 +1201,11 @@ class CalDAVResource (
     # Collection sync stuff
 
     @inlineCallbacks
-    def whatchanged(self, client_token, depth):
+    def whatchanged(self, client_token, depth, limit=None):
 
         client_data_token = None
         client_config_token = None
+        position = 0
 
         if client_token:
             if "/" in client_token:
@@ -1223,6 +1224,13 @@ class CalDAVResource (
                 if not client_data_token.startswith("data:,"):
                     raise ValueError
                 caluuid, revision = client_data_token[6:].split("_", 1)
+                if "_" in revision:
+                    # Continuation token from a truncated sync: the revision
+                    # plus the position to resume from
+                    revision, position = revision.split("_", 1)
+                    position = int(position)
+                    if position < 0:
+                        raise ValueError
                 revision = int(revision)
 
                 # Check client token validity
@@ -1239,8 +1247,12 @@ class CalDAVResource (
         else:
             revision = 0
 
+        resume = None
         try:
-            changed, removed, notallowed = yield self._indexWhatChanged(revision, depth)
+            if limit is not None or position:
+                changed, removed, notallowed, resume = yield self._indexWhatChangedLimited(revision, position, depth, limit)
+            else:
+                changed, removed, notallowed = yield self._indexWhatChanged(revision, depth)
         except SyncTokenValidException:
             raise HTTPError(ErrorResponse(
                 responsecode.FORBIDDEN,
@@ -1248,7 +1260,15 @@ class CalDAVResource (
                 "Sync token not recognized",
             ))
 
-        if config.EnableConfigSyncToken:
+        if resume is not None:
+            # Results were truncated - hand back a token to continue from,
+            # deferring any config change to the final page
+            current_token = "data:,%s_%d_%d" % (current_uuid, resume[0], resume[1],)
+            if config.EnableConfigSyncToken and client_config_token:
+                current_token = "{}/{}".format(current_token, client_config_token)
+            resourceChanged = False
+
+        elif config.EnableConfigSyncToken:
             # Append the app-level portion of sync token (e.g. derived from config)
             newConfigToken = config.syncToken()
             current_token = "{}/{}".format(current_token, newConfigToken)
@@ -1258,12 +1278,23 @@ class CalDAVResource (
         else:
             resourceChanged = False
 
-        returnValue((changed, removed, notallowed, current_token, resourceChanged))
+        returnValue((changed, removed, notallowed, current_token, resourceChanged, resume is not None))
 
     def _indexWhatChanged(self, revision, depth):
         # Now handled directly by newstore
         raise NotImplementedError
 
+    def supportsSyncLimit(self):
+        """
+        Whether a sync-collection REPORT on this resource can truncate its
+        results (RFC 6578 DAV:limit).
+        """
+        return False
+
+    def _indexWhatChangedLimited(self, revision, position, depth, limit):
+        # Only collections that support a limit issue continuation tokens
+        raise SyncTokenValidException
+
     @inlineCallbacks
     def getSyncToken(self):
         """
@@ -535,6 +535,7 @@ DEFAULT_CONFIG = {
     "EnableAddMember": True,  # POST ;add-member extension
     "EnableSyncReport": True,  # REPORT collection-sync
     "EnableSyncReportHome": True,  # REPORT collection-sync on home collections
+    "MaxSyncReportResults": 0,  # Truncate collection-sync results beyond this many (0 - no server limit)
     "EnableConfigSyncToken": True,  # Sync token includes config component
     "EnableWellKnown": True,  # /.well-known resource
     "EnableCalendarQueryExtended": True,  # Extended calendar-query REPORT
@@ -565,6 +566,7 @@ DEFAULT_CONFIG = {
                                      # secondary service MUST define its own writable path if
                                      # not None
         "PrettyPrintJSON": True,    # User friendly JSON output
+        "ResponseCacheSize": 5000,  # Generated responses kept in each process
 
         "SecondaryService": {
             # Only one of these should be used when a secondary service is used
@@ -576,6 +578,21 @@ DEFAULT_CONFIG = {
     },
 
     "EnableTimezonesByReference": True,  # Strip out VTIMEZONES that are known
+
+    # Per-process tables of the UTC offset transitions of each TZID over the
+    # instance index window, so that converting date-times to UTC for the
+    # index and free-busy is a binary search.
+    "TimezoneTransitions": {
+        "Enabled": True,
+    },
+
+    # Timezone data read from one memory-mapped, indexed file built from the
+    # zoneinfo directory, rather than a file per TZID, and the number of
+    # parsed VTIMEZONEs each process keeps.
+    "TimezoneCache": {
+        "Packed": True,
+        "MaxEntries": 500,
+    },
     "UsePackageTimezones": False,  # Use timezone data from twistedcaldav.zoneinfo - don't copy to Data directory
 
     "EnableBatchUpload": True,  # POST batch uploads
@@ -668,6 +685,13 @@ DEFAULT_CONFIG = {
         },
     },
 
+    "QuotaJournal": {
+        "Enabled": False,  # Journal quota changes instead of locking the home row on every change
+        "FoldIntervalSeconds": 60,  # Number of seconds between folding journaled quota changes into homes
+        "MaxHomesPerRun": 1000,  # Maximum number of homes folded by each run
+        "BatchSize": 500,  # Maximum number of journaled quota changes folded per home in each transaction
+    },
+
     "RevisionCleanup": {
         "Enabled": True,
         "SyncTokenLifetimeDays": 14.0,     # Number of days that a client sync report token is valid
@@ -1027,6 +1051,11 @@ DEFAULT_CONFIG = {
                 "ServerEnabled": True,
                 "BindAddress": "127.0.0.1",
                 "Port": 11311,
+                # Shard keys across several memcached instances using a
+                # consistent-hash ring. Each entry is a "host:port" or
+                # "unix:path" string, or a [server, weight] pair. When empty,
+                # only the MemcacheSocket or BindAddress/Port server is used.
+                "Servers": [],
                 "HandleCacheTypes": [  # Possible types:
                     # "OpenDirectoryBacker",
                     # "ImplicitUIDLock",
@@ -1058,6 +1087,31 @@ DEFAULT_CONFIG = {
         "MaxMemory": 0,  # Megabytes
         "Options": [],
         "ProxyDBKeyNormalization": True,
+
+        # An in-process cache in front of memcached for hot, rarely changed
+        # keys. Changes are sent to the other processes on this host over
+        # the control socket; changes made on other hosts are only seen once
+        # an entry expires, so keep ExpireSeconds short on multi-host pods.
+        "L1Cache": {
+            "Enabled": False,
+            "MaxEntries": 1000,  # Default per-namespace limits
+            "ExpireSeconds": 30,
+            "Namespaces": {  # Memcacher namespaces to cache, each with
+                             # optional MaxEntries and ExpireSeconds
+                "Default": {},  # Home and collection queries
+                "DelegatesDB": {},
+                "ProxyDB": {},
+                "ExpansionCache": {},
+            },
+        },
+
+        # Limits for the in-process cache used instead of memcached when the
+        # memcached client is disabled (e.g. single process servers).
+        "MemoryCache": {
+            "MaxEntries": 100000,
+            "MaxBytes": 64 * 1024 * 1024,  # 0 for no limit
+            "SweepSeconds": 60,  # How often to remove all expired entries
+        },
     },
 
     "Postgres": {
@@ -1136,11 +1190,44 @@ DEFAULT_CONFIG = {
     "FreeBusyCacheDaysBack": 7,
     "FreeBusyCacheDaysForward": 12 * 7,
 
+    # Per-process cache of parsed and validated calendar object data, so that
+    # frequently read events are not re-parsed in every request.
+    "ComponentCache": {
+        "Enabled": True,
+        "MaxEntries": 10000,
+        "MaxBytes": 16 * 1024 * 1024,  # Size of the cached iCalendar text, 0 for no limit
+    },
+
+    # Home and collection MODIFIED values bumped by this process within
+    # WindowSeconds are not bumped again (0 - bump once per transaction)
+    "ModifiedCoalescing": {
+        "WindowSeconds": 0,
+        "MaxEntries": 10000,  # Number of recently bumped homes and collections remembered
+    },
+
+    # Memcached cache of recurrence expansions of unchanged calendar object
+    # data, so that time-range queries and free-busy lookups of the same
+    # events do not each re-expand them.
+    "ExpansionCache": {
+        "Enabled": True,
+        "MaxRanges": 4,  # Expansion ranges cached per calendar object
+    },
+
     "FreeBusyIndexLowerLimitDays": 365,
     "FreeBusyIndexExpandAheadDays": 365,
     "FreeBusyIndexExpandMaxDays": 5 * 365,
     "FreeBusyIndexDelayedExpand": False,
     "FreeBusyIndexSmartUpdate": True,
+    "FreeBusyIndexIncrementalUpdate": True,  # Only re-write the index rows that change
+    "FreeBusyIndexExtension": {
+        "Enabled": True,
+        "IntervalHours": 24.0,           # Number of hours between checks for recurring events to re-expand
+        "ExtendDays": 30,                # Number of days beyond FreeBusyIndexExpandAheadDays to re-expand to
+        "MaxPerRun": 1000,               # Maximum number of events re-expanded by each check
+        "BatchSize": 20,                 # Number of events re-expanded in each transaction
+        "Concurrency": 2,                # Number of transactions re-expanding events at once
+        "ContinueDelaySeconds": 60,      # Number of seconds before the next check if events were left over
+    },
 
     # The RootResource uses a twext property store. Specify the class here
     "RootResourcePropStoreClass": "txweb2.dav.xattrprops.xattrPropertyStore",
@@ -27,6 +27,7 @@ from twisted.internet.defer import succeed, inlineCallbacks, returnValue, maybeD
 from twisted.internet.protocol import Protocol
 from twisted.python.util import FancyEqMixin
 from twistedcaldav import customxml, carddavxml, caldavxml, ical
+from twistedcaldav.cache import ReportCacheMixin
 from twistedcaldav.caldavxml import (
     caldav_namespace, MaxAttendeesPerInstance, MaxInstances, NoUIDConflict
 )
@@ -35,7 +36,7 @@ from twistedcaldav.config import config
 from twistedcaldav.customxml import calendarserver_namespace
 from twistedcaldav.ical import (
     Component as VCalendar, Property as VProperty,
-    iCalendarProductID, Component
+    iCalendarProductID, Component, InvalidICalendarDataError
 )
 from twistedcaldav.instance import (
     InvalidOverriddenInstanceError, TooManyInstancesError
@@ -365,6 +366,13 @@ class _CommonHomeChildCollectionMixin(_CommonStoreExceptionHandler):
             (yield self._newStoreObject.resourceNamesSinceToken(revision))
         )
 
+    def supportsSyncLimit(self):
+        return self._newStoreObject.supportsLimitedSync()
+
+    def _indexWhatChangedLimited(self, revision, position, depth, limit):
+        # The newstore implementation supports this directly
+        return self._newStoreObject.resourceNamesSinceRevisionLimited(revision, position, limit)
+
     @inlineCallbacks
     def makeChild(self, name):
         """
@@ -674,21 +682,13 @@ class _CommonHomeChildCollectionMixin(_CommonStoreExceptionHandler):
         # Look for return changed data option
         return_changed = self.checkReturnChanged(request)
 
-        # Read in all data
-        data = (yield allDataFromStream(request.stream))
-
         format = request.headers.getHeader("content-type")
         if format:
             format = "%s/%s" % (format.mediaType, format.mediaSubtype,)
-        components = self.componentsFromData(data, format)
-        if components is None:
+        xmlresponses = (yield self.bulkCreateFromStream(request, return_changed, format))
+        if xmlresponses is None:
             raise HTTPError(StatusResponse(BAD_REQUEST, "Could not parse valid data from request body"))
 
-        # Build response
-        xmlresponses = [None] * len(components)
-        indexedComponents = [idxComponent for idxComponent in enumerate(components)]
-        yield self.bulkCreate(indexedComponents, request, return_changed, xmlresponses, format)
-
         result = MultiStatusResponse(xmlresponses)
 
         newctag = (yield self.getInternalSyncToken())
@@ -702,6 +702,26 @@ class _CommonHomeChildCollectionMixin(_CommonStoreExceptionHandler):
 
         returnValue(result)
 
+    @inlineCallbacks
+    def bulkCreateFromStream(self, request, return_changed, format):
+        """
+        Do create from the components in the request body for
+        simpleBatchPOST. Subclasses may override to store each component
+        without reading all the data first.
+
+        @return: a L{Deferred} firing with the L{list} of responses, or
+            C{None} if the data could not be parsed
+        """
+        data = (yield allDataFromStream(request.stream))
+        components = self.componentsFromData(data, format)
+        if components is None:
+            returnValue(None)
+
+        xmlresponses = [None] * len(components)
+        indexedComponents = [idxComponent for idxComponent in enumerate(components)]
+        yield self.bulkCreate(indexedComponents, request, return_changed, xmlresponses, format)
+        returnValue(xmlresponses)
+
     @inlineCallbacks
     def bulkCreate(self, indexedComponents, request, return_changed, xmlresponses, format):
         """
@@ -873,30 +893,34 @@ class _CommonHomeChildCollectionMixin(_CommonStoreExceptionHandler):
             except HTTPError, e:
                 hasPrivilege = e
 
-            # get components
-            indexedComponents = []
-            for index, xmldata in crudCreateInfo:
-
+            def generateComponent(xmldata):
                 try:
-                    component = xmldata.generateComponent()
+                    return xmldata.generateComponent()
                 except:
-                    component = None
-                format = xmldata.content_type
+                    return None
 
-                if hasPrivilege is not True:
-                    e = hasPrivilege  # use same code pattern as exception
-                    code = e.response.code
-                    if isinstance(e.response, ErrorResponse):
-                        error = e.response.error
-                        error = (error.namespace, error.name,)
+            if hasPrivilege is not True:
+                e = hasPrivilege  # use same code pattern as exception
+                code = e.response.code
+                error = None
+                if isinstance(e.response, ErrorResponse):
+                    error = e.response.error
+                    error = (error.namespace, error.name,)
 
-                    xmlresponse = yield self.bulkCreateResponse(component, None, None, None, code, error, format)
+                for index, xmldata in crudCreateInfo:
+                    component = generateComponent(xmldata)
+                    xmlresponse = yield self.bulkCreateResponse(component, None, None, None, code, error, xmldata.content_type)
                     xmlresponses[index] = xmlresponse
 
-                else:
-                    indexedComponents.append((index, component,))
-
-            yield self.bulkCreate(indexedComponents, request, return_changed, xmlresponses, format)
+            else:
+                # Generate each component only as it is stored so that only
+                # one parsed component is held at a time
+                format = crudCreateInfo[-1][1].content_type
+                indexedComponents = (
+                    (index, generateComponent(xmldata),)
+                    for index, xmldata in crudCreateInfo
+                )
+                yield self.bulkCreate(indexedComponents, request, return_changed, xmlresponses, format)
 
     @inlineCallbacks
     def crudUpdate(self, crudUpdateInfo, request, xmlresponses, return_changed):
@@ -1088,7 +1112,7 @@ class _CalendarCollectionBehaviorMixin():
         return True
 
 
-class CalendarCollectionResource(DefaultAlarmPropertyMixin, _CalendarCollectionBehaviorMixin, _CommonHomeChildCollectionMixin, CalDAVResource):
+class CalendarCollectionResource(ReportCacheMixin, DefaultAlarmPropertyMixin, _CalendarCollectionBehaviorMixin, _CommonHomeChildCollectionMixin, CalDAVResource):
     """
     Wrapper around a L{txdav.caldav.icalendar.ICalendar}.
     """
@@ -1212,6 +1236,31 @@ class CalendarCollectionResource(DefaultAlarmPropertyMixin, _CalendarCollectionB
         """
         return Component.componentsFromData(data, format)
 
+    @inlineCallbacks
+    def bulkCreateFromStream(self, request, return_changed, format):
+        """
+        Parse iCalendar text incrementally and store each resource as soon as
+        it has been read, so that only one resource's data is held at a time.
+        Recurring resources are stored at the end, but their responses keep
+        the order of the data.
+        """
+        if format not in (None, "text/calendar"):
+            result = (yield super(CalendarCollectionResource, self).bulkCreateFromStream(request, return_changed, format))
+            returnValue(result)
+
+        xmlresponses = []
+
+        def storeComponent(index, component):
+            if index >= len(xmlresponses):
+                xmlresponses.extend([None] * (index + 1 - len(xmlresponses)))
+            return self.bulkCreate(((index, component,),), request, return_changed, xmlresponses, format)
+
+        try:
+            yield Component.componentsFromIStream(request.stream, storeComponent)
+        except InvalidICalendarDataError:
+            returnValue(None)
+        returnValue(xmlresponses)
+
     @classmethod
     def resourceSuffix(cls):
         return ".ics"
@@ -3108,7 +3157,7 @@ class CalendarObjectResource(_CalendarObjectMetaDataMixin, _CommonObjectResource
         returnValue(result)
 
 
-class AddressBookCollectionResource(_CommonHomeChildCollectionMixin, CalDAVResource):
+class AddressBookCollectionResource(ReportCacheMixin, _CommonHomeChildCollectionMixin, CalDAVResource):
     """
     Wrapper around a L{txdav.carddav.iaddressbook.IAddressBook}.
     """
@@ -3710,6 +3759,13 @@ class StoreNotificationCollectionResource(_NotificationChildHelper, Notification
             (yield self._newStoreNotifications.resourceNamesSinceToken(revision))
         )
 
+    def supportsSyncLimit(self):
+        return self._newStoreNotifications.supportsLimitedSync()
+
+    def _indexWhatChangedLimited(self, revision, position, depth, limit):
+        # The newstore implementation supports this directly
+        return self._newStoreNotifications.resourceNamesSinceRevisionLimited(revision, position, limit)
+
     def deleteNotification(self, request, record):
         return maybeDeferred(
             self._newStoreNotifications.removeNotificationObjectWithName,
@@ -18,6 +18,8 @@ from new import instancemethod
 import hashlib
 import cPickle
 
+from twistedcaldav import cacheformat
+
 from twisted.internet.defer import succeed, maybeDeferred, inlineCallbacks
 
 from txweb2.dav.util import allDataFromStream
@@ -26,7 +28,8 @@ from txweb2.http_headers import Headers
 
 from twistedcaldav.cache import MemcacheResponseCache, CacheStoreNotifier
 from twistedcaldav.cache import MemcacheChangeNotifier
-from twistedcaldav.cache import PropfindCacheMixin
+from twistedcaldav.cache import PropfindCacheMixin, ReportCacheMixin
+from twistedcaldav.config import config
 
 from twistedcaldav.test.util import InMemoryMemcacheProtocol
 from twistedcaldav.test.util import TestCase
@@ -362,6 +365,45 @@ class BaseCacheTestMixin(object):
         d.addCallback(_assertResponse)
         return d
 
+    @inlineCallbacks
+    def test_cacheTokensTakenBeforeResponse(self):
+        """
+        A change made while a response is being generated invalidates its
+        cache entry when the tokens were taken before the response was
+        generated.
+        """
+        request = lambda: StubRequest(
+            'REPORT',
+            '/calendars/__uids__/cdaboo/',
+            '/principals/__uids__/cdaboo/'
+        )
+        first = request()
+        first.childCacheURIs = ['/calendars/__uids__/cdaboo/calendars/']
+        first.cacheTokens = yield self.rc.getTokensForRequest(first)
+
+        self.tokens['/calendars/__uids__/cdaboo/calendars/'] = 'childToken1'
+        yield self.rc.cacheResponseForRequest(first, StubResponse(207, {}, "Foobar"))
+
+        response = yield self.rc.getResponseForRequest(request())
+        self.assertEqual(response, None)
+        self.assertEqual(self.rc.stats()["misses"], {"child": 1})
+
+    def test_preferHeaderInKey(self):
+        """
+        The Prefer and Brief headers are part of the request key.
+        """
+        keys = []
+        for headers in ({}, {"prefer": ["return=minimal"]}, {"brief": ["t"]}):
+            request = StubRequest(
+                'REPORT',
+                '/calendars/__uids__/cdaboo/calendars/',
+                '/principals/__uids__/cdaboo/'
+            )
+            for name, value in headers.items():
+                request.headers.setRawHeaders(name, value)
+            keys.append(self.successResultOf(self.rc._hashedRequestKey(request)))
+        self.assertEqual(len(set(keys)), 3)
+
     def test_recordHashChangeInvalidatesCache(self):
         StubRequest.resources[
             '/principals/__uids__/cdaboo/'].record = StubDirectoryRecord('cdaboo-changed')
@@ -390,10 +432,13 @@ class MemcacheResponseCacheTests(BaseCacheTestMixin, TestCase):
         self.tokens['/principals/__uids__/cdaboo/'] = 'principalToken0'
         self.tokens['/principals/__uids__/dreid/'] = 'principalTokenX'
 
-        def _getToken(uri, cachePoolHandle=None):
-            return succeed(self.tokens.get(uri))
+        self.tokenRequests = []
+
+        def _getTokens(uris):
+            self.tokenRequests.append(uris)
+            return succeed([self.tokens.get(uri) for uri, _ignore_handle in uris])
 
-        self.rc._tokenForURI = _getToken
+        self.rc._tokensForURIs = _getTokens
 
         self.expected_response = (200, Headers({}), "Foo")
 
@@ -407,7 +452,7 @@ class MemcacheResponseCacheTests(BaseCacheTestMixin, TestCase):
 
         memcacheStub._cache[expected_key] = (
             0,  # flags
-            cPickle.dumps((
+            cacheformat.dumps((
                 'principalToken0',
                 StubDirectoryRecord('cdaboo').cacheToken(),
                 'uriToken0',
@@ -426,6 +471,102 @@ class MemcacheResponseCacheTests(BaseCacheTestMixin, TestCase):
         for call in self.memcacheStub._timeouts.itervalues():
             call.cancel()
 
+    @inlineCallbacks
+    def test_tokensFetchedInOneBatch(self):
+        """
+        All the tokens needed to validate a cached response are requested
+        together, and the cache hit is counted.
+        """
+        response = yield self.rc.getResponseForRequest(StubRequest(
+            'PROPFIND',
+            '/calendars/__uids__/cdaboo/',
+            '/principals/__uids__/cdaboo/'
+        ))
+        yield self.assertResponse(response, self.expected_response)
+
+        self.assertEqual(len(self.tokenRequests), 1)
+        self.assertEqual(
+            sorted([uri for uri, _ignore_handle in self.tokenRequests[0]]),
+            [
+                '/calendars/__uids__/cdaboo/',
+                '/calendars/__uids__/cdaboo/calendars/',
+                '/principals/__uids__/cdaboo/',
+            ]
+        )
+        self.assertEqual(self.rc.stats(), {"hits": 1, "misses": {}})
+
+    @inlineCallbacks
+    def test_missStatistics(self):
+        """
+        Cache misses are counted by the token that caused them.
+        """
+        request = lambda: StubRequest(
+            'PROPFIND',
+            '/calendars/__uids__/cdaboo/',
+            '/principals/__uids__/cdaboo/'
+        )
+
+        self.tokens['/calendars/__uids__/cdaboo/calendars/'] = 'childToken1'
+        response = yield self.rc.getResponseForRequest(request())
+        self.assertEqual(response, None)
+
+        self.tokens['/calendars/__uids__/cdaboo/'] = 'uriToken1'
+        response = yield self.rc.getResponseForRequest(request())
+        self.assertEqual(response, None)
+
+        response = yield self.rc.getResponseForRequest(StubRequest(
+            'PROPFIND',
+            '/calendars/__uids__/dreid/',
+            '/principals/__uids__/dreid/'
+        ))
+        self.assertEqual(response, None)
+
+        self.assertEqual(
+            self.rc.stats(),
+            {"hits": 0, "misses": {"child": 1, "uri": 1, "entry": 1}}
+        )
+
+    @inlineCallbacks
+    def test_oldFormatEntryIsMiss(self):
+        """
+        A cache entry that is not in the current format is treated as a miss.
+        """
+        for key, (flags, value) in self.memcacheStub._cache.items():
+            self.memcacheStub._cache[key] = (flags, cPickle.dumps(cacheformat.loads(value)))
+
+        response = yield self.rc.getResponseForRequest(StubRequest(
+            'PROPFIND',
+            '/calendars/__uids__/cdaboo/',
+            '/principals/__uids__/cdaboo/'
+        ))
+        self.assertEqual(response, None)
+        self.assertEqual(self.rc.stats(), {"hits": 0, "misses": {"format": 1}})
+
+    @inlineCallbacks
+    def test_tokensForURIsMultiGet(self):
+        """
+        L{MemcacheResponseCache._tokensForURIs} returns tokens in request order
+        using a single multi-key get on the cache pool.
+        """
+        memcacheStub = InMemoryMemcacheProtocol()
+        rc = MemcacheResponseCache(None, cachePool=memcacheStub)
+        memcacheStub._cache['cacheToken:/a/'] = (0, 'tokenA')
+        memcacheStub._cache['cacheToken:/b/'] = (0, 'tokenB')
+
+        calls = []
+        getMulti = memcacheStub.getMulti
+
+        def _getMulti(keys):
+            calls.append(keys)
+            return getMulti(keys)
+        memcacheStub.getMulti = _getMulti
+
+        tokens = yield rc._tokensForURIs(
+            [('/b/', None), ('/c/', None), (u'/a/', None)]
+        )
+        self.assertEqual(tokens, ['tokenB', None, 'tokenA'])
+        self.assertEqual(len(calls), 1)
+
     def test_givenURIsForKeys(self):
         expected_response = (200, Headers({}), "Foobarbaz")
 
@@ -441,7 +582,7 @@ class MemcacheResponseCacheTests(BaseCacheTestMixin, TestCase):
 
         self.memcacheStub._cache[expected_key] = (
             0,  # flags
-            cPickle.dumps((
+            cacheformat.dumps((
                 'principalToken0',
                 StubDirectoryRecord('cdaboo').cacheToken(),
                 'uriToken0',
@@ -493,6 +634,26 @@ class TestCachingResource(PropfindCacheMixin, TestRenderMixin):
         self.response = response
 
 
+class TestReportCachingResource(ReportCacheMixin, TestRenderMixin):
+
+    def __init__(self, response, ownerURL='/calendars/__uids__/cdaboo/calendar/'):
+        self.response = response
+        self.ownerURL = ownerURL
+
+    def owner_url(self):
+        return self.ownerURL
+
+    def parentResource(self):
+        return StubURLResource('/calendars/__uids__/cdaboo/')
+
+
+class StubTokensResponseCacheResource(StubResponseCacheResource):
+
+    def getTokensForRequest(self, request):
+        self.tokensRequested = list(request.childCacheURIs)
+        return succeed(["tokens"])
+
+
 class TestCacheStoreNotifier(TestCase):
 
     @inlineCallbacks
@@ -577,3 +738,63 @@ class PropfindCacheMixinTests(TestCase):
         d.addCallback(_checkCache)
 
         return d
+
+
+class ReportCacheMixinTests(TestCase):
+    """
+    Test the ReportCacheMixin
+    """
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.resource = TestReportCachingResource(StubResponse(207, {}, "foobar"))
+        self.responseCache = StubTokensResponseCacheResource()
+        self.patch(config, "EnableResponseCache", True)
+
+    def request(self, method='REPORT'):
+        request = StubRequest(method, '/calendars/__uids__/cdaboo/calendar/', '/principals/__uids__/cdaboo/')
+        request.resources['/'] = self.responseCache
+        self.addCleanup(request.resources.clear)
+        return request
+
+    @inlineCallbacks
+    def test_cachedWhenPrepared(self):
+        request = self.request()
+        yield self.resource.prepareResponseCache(request)
+        self.assertEqual(
+            self.responseCache.tokensRequested,
+            ['/calendars/__uids__/cdaboo/calendar/', '/calendars/__uids__/cdaboo/']
+        )
+
+        response = yield self.resource.renderHTTP(request)
+        self.assertTrue(self.responseCache.cache[request] is response)
+
+    @inlineCallbacks
+    def test_notCachedUnlessPrepared(self):
+        request = self.request()
+        yield self.resource.renderHTTP(request)
+        self.assertEqual(self.responseCache.cache, {})
+
+    @inlineCallbacks
+    def test_notCachedWhenDiscarded(self):
+        request = self.request()
+        yield self.resource.prepareResponseCache(request)
+        self.resource.discardResponseCache(request)
+        yield self.resource.renderHTTP(request)
+        self.assertEqual(self.responseCache.cache, {})
+
+    @inlineCallbacks
+    def test_notCachedWhenError(self):
+        self.resource.response = StubResponse(403, {}, "")
+        request = self.request()
+        yield self.resource.prepareResponseCache(request)
+        yield self.resource.renderHTTP(request)
+        self.assertEqual(self.responseCache.cache, {})
+
+    @inlineCallbacks
+    def test_notCachedWithoutOwner(self):
+        self.resource.ownerURL = ""
+        request = self.request()
+        yield self.resource.prepareResponseCache(request)
+        yield self.resource.renderHTTP(request)
+        self.assertEqual(self.responseCache.cache, {})
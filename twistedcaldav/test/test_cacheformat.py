@@ -0,0 +1,81 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+import cPickle
+
+from twistedcaldav import cacheformat
+from twistedcaldav.cacheformat import CacheFormatError
+from twistedcaldav.test.util import TestCase
+
+
+class CacheFormatTests(TestCase):
+    """
+    Tests for L{cacheformat}.
+    """
+
+    def test_roundTrip(self):
+        values = (
+            None,
+            True,
+            False,
+            0,
+            -1,
+            2 ** 40,
+            "",
+            "abc\x00\xff",
+            u"caf\u00e9",
+            (),
+            ("a", 1, None),
+            ["a", ["b", ("c",)]],
+            set(("a", "b")),
+            {"a": ["1"], "b": {"c": None}},
+            (
+                "principalToken",
+                None,
+                "uriToken",
+                {"/calendars/__uids__/user01/calendar/": "childToken"},
+                (207, {"content-type": ["text/xml"]}, "<multistatus/>"),
+            ),
+        )
+        for value in values:
+            result = cacheformat.loads(cacheformat.dumps(value))
+            self.assertEqual(result, value)
+            self.assertEqual(type(result), type(value))
+
+    def test_compression(self):
+        body = "<response><href>/calendars/</href></response>" * 1000
+        data = cacheformat.dumps(body)
+        self.assertTrue(len(data) < len(body) / 10)
+        self.assertEqual(cacheformat.loads(data), body)
+
+        # Not compressed below the threshold, or when disabled
+        self.assertTrue(body[:100] in cacheformat.dumps(body[:100]))
+        self.assertTrue(body in cacheformat.dumps(body, compressThreshold=None))
+
+    def test_invalid(self):
+        data = cacheformat.dumps(("a", "b"))
+        for invalid in (
+            "",
+            data[:-1],
+            "\x00" + data[1:],
+            data[:2] + "?" + data[3:],
+            cPickle.dumps(("a", "b")),
+        ):
+            self.assertRaises(CacheFormatError, cacheformat.loads, invalid)
+
+    def test_unsupportedType(self):
+        self.assertRaises(TypeError, cacheformat.dumps, object())
+        self.assertRaises(TypeError, cacheformat.dumps, [Exception()])
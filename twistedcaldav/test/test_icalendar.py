@@ -24,12 +24,14 @@ from twisted.internet.defer import inlineCallbacks, succeed
 from twistedcaldav.config import config
 from twistedcaldav.dateops import normalizeForExpand
 from twistedcaldav.ical import Component, Property, InvalidICalendarDataError, \
-    normalizeCUAddress, normalize_iCalStr, diff_iCalStrs
+    normalizeCUAddress, normalize_iCalStr, diff_iCalStrs, ComponentStreamParser
 from twistedcaldav.ical import iCalendarProductID
 from twistedcaldav.instance import InvalidOverriddenInstanceError
 import twistedcaldav.test.util
 from twistedcaldav.timezones import TimezoneException
 
+from txweb2.stream import CompoundStream, MemoryStream
+
 from pycalendar.datetime import DateTime
 from pycalendar.timezone import Timezone
 from pycalendar.duration import Duration
@@ -8522,6 +8524,80 @@ END:VCALENDAR
         self.assertEquals(subComponent._parent, None)
         self.assertEquals(component._cachedCopy, None)  # cache is invalidated
 
+    def test_textCaching(self):
+        """
+        L{Component.getText} and its variants cache the text for each format
+        and timezone option until something in the component changes.
+        """
+
+        data = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:12345-67890
+DTSTART:20080601T120000Z
+DURATION:PT1H
+DTSTAMP:20080601T120000Z
+SUMMARY:Test
+BEGIN:VALARM
+ACTION:DISPLAY
+DESCRIPTION:Alarm
+TRIGGER:-PT10M
+END:VALARM
+END:VEVENT
+END:VCALENDAR
+"""
+
+        component = Component.fromString(data)
+        text = component.getText()
+        self.assertTrue(component.getText() is text)
+        self.assertTrue(component.getTextWithoutTimezones() is not text)
+        self.assertTrue(component.getTextWithoutTimezones() is component.getTextWithoutTimezones())
+
+        # A duplicate starts with the same cached text
+        duplicate = component.duplicate()
+        self.assertTrue(duplicate.getText() is text)
+
+        # A change anywhere below the component invalidates its text
+        for subcomponent in component.subcomponents():
+            for alarm in subcomponent.subcomponents():
+                alarm.getProperty("DESCRIPTION").setValue("Changed")
+        self.assertEqual(component._cachedText, None)
+        self.assertTrue("DESCRIPTION:Changed" in component.getText())
+        self.assertTrue("DESCRIPTION:Changed" not in duplicate.getText())
+
+    def test_textCachingExdate(self):
+        """
+        L{Component.getText} does not return cached text after an EXDATE
+        value is removed from a property that still has other values.
+        """
+
+        data = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:12345-67890
+DTSTART:20080601T120000Z
+DURATION:PT1H
+DTSTAMP:20080601T120000Z
+RRULE:FREQ=DAILY
+EXDATE:20080602T120000Z,20080603T120000Z,20080604T120000Z
+SUMMARY:Test
+END:VEVENT
+END:VCALENDAR
+"""
+
+        component = Component.fromString(data)
+        text = component.getText()
+        component.masterComponent().removeExdate(DateTime(2008, 6, 2, 12, 0, 0, tzid=Timezone.UTCTimezone))
+        self.assertTrue("20080602T120000Z" not in component.getText())
+        self.assertNotEqual(component.getText(), text)
+
+        text = component.getText()
+        self.assertTrue(component.deriveInstance(DateTime(2008, 6, 3, 12, 0, 0, tzid=Timezone.UTCTimezone), allowCancelled=True) is not None)
+        self.assertTrue("EXDATE:20080604T120000Z" in component.getText())
+        self.assertNotEqual(component.getText(), text)
+
     def test_hasDuplicateAlarms(self):
         """
         Test that L{Component.hasDuplicateAlarms} correctly detects, but does not fix, duplicate alarms.
@@ -12211,3 +12287,240 @@ END:VCALENDAR
             cal = Component.fromString(caldata)
             result = cal.maxAttachmentsPerInstance()
             self.assertEqual(result, count, msg=description)
+
+    def test_streamParser(self):
+        """
+        L{ComponentStreamParser} gives the same result whatever the chunks
+        the data arrives in, including folded lines split across chunks.
+        """
+
+        data = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VTIMEZONE
+TZID:US/Eastern
+BEGIN:STANDARD
+DTSTART:20071104T020000
+RRULE:FREQ=YEARLY;BYDAY=1SU;BYMONTH=11
+TZNAME:EST
+TZOFFSETFROM:-0400
+TZOFFSETTO:-0500
+END:STANDARD
+END:VTIMEZONE
+BEGIN:VEVENT
+UID:12345-67890
+DTSTART;TZID=US/Eastern:20080601T120000
+DURATION:PT1H
+DTSTAMP:20080601T120000Z
+SUMMARY:A long summary that is
+  folded
+BEGIN:VALARM
+ACTION:DISPLAY
+DESCRIPTION:Alarm
+TRIGGER:-PT10M
+END:VALARM
+END:VEVENT
+BEGIN:VEVENT
+UID:12345-67891
+DTSTART:20080602T120000Z
+DURATION:PT1H
+DTSTAMP:20080601T120000Z
+END:VEVENT
+END:VCALENDAR
+""".replace("\n", "\r\n")
+
+        expected = Component.fromString(data)
+        for size in (1, 7, 64, len(data)):
+            parser = ComponentStreamParser()
+            results = []
+            for offset in range(0, len(data), size):
+                results.extend(parser.feed(data[offset:offset + size]))
+            results.extend(parser.finish())
+
+            self.assertEqual(len(results), 3)
+            self.assertEqual([result.propertyValue("PRODID") for result in results], [iCalendarProductID] * 3)
+            self.assertEqual(
+                [str(tuple(result.subcomponents())[0]) for result in results],
+                [str(component) for component in expected.subcomponents()],
+            )
+
+    def test_streamParser_invalid(self):
+        """
+        L{ComponentStreamParser} rejects incomplete data and data outside of
+        the VCALENDAR.
+        """
+
+        data = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:12345-67890
+DTSTART:20080601T120000Z
+DURATION:PT1H
+DTSTAMP:20080601T120000Z
+END:VEVENT
+END:VCALENDAR
+"""
+
+        parser = ComponentStreamParser()
+        parser.feed(data[:-20])
+        self.assertRaises(InvalidICalendarDataError, parser.finish)
+
+        parser = ComponentStreamParser()
+        self.assertRaises(InvalidICalendarDataError, parser.feed, "SUMMARY:Test\n" + data)
+
+        parser = ComponentStreamParser()
+        self.assertRaises(InvalidICalendarDataError, parser.feed, data + data)
+
+    @inlineCallbacks
+    def test_fromIStream(self):
+        """
+        L{Component.fromIStream} parses data split over several chunks.
+        """
+
+        data = file(os.path.join(self.data_dir, "Holidays.ics")).read()
+        stream = CompoundStream([data[offset:offset + 1000] for offset in range(0, len(data), 1000)])
+        calendar = yield Component.fromIStream(stream)
+        self.assertEqual(calendar, Component.fromString(data))
+
+        calendar = yield Component.fromIStream(MemoryStream(""))
+        self.assertTrue(calendar is None)
+
+    def _componentsFromIStream(self, data):
+        """
+        Run L{Component.componentsFromIStream} over C{data} split before its
+        END:VCALENDAR line.
+
+        @return: a L{Deferred} firing with a L{list} of the index and
+            VCALENDAR passed to the callback, and the number of stream
+            chunks not read yet at that point.
+        """
+
+        split = data.index("END:VCALENDAR")
+        stream = CompoundStream([data[:split], data[split:]])
+        results = []
+
+        def gotComponent(index, calendar):
+            results.append((index, calendar, len(stream.buckets)))
+            return succeed(None)
+
+        d = Component.componentsFromIStream(stream, gotComponent)
+        d.addCallback(lambda _ignore: results)
+        return d
+
+    @inlineCallbacks
+    def test_componentsFromIStream(self):
+        """
+        L{Component.componentsFromIStream} splits data by UID as
+        L{Component.componentsFromData} does, passing each non-recurring
+        VCALENDAR on as soon as the next UID starts and recurring ones at the
+        end.
+        """
+
+        data = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VTIMEZONE
+TZID:US/Eastern
+BEGIN:STANDARD
+DTSTART:20071104T020000
+RRULE:FREQ=YEARLY;BYDAY=1SU;BYMONTH=11
+TZNAME:EST
+TZOFFSETFROM:-0400
+TZOFFSETTO:-0500
+END:STANDARD
+END:VTIMEZONE
+BEGIN:VEVENT
+UID:12345-67891
+DTSTART:20080602T120000Z
+DURATION:PT1H
+DTSTAMP:20080601T120000Z
+END:VEVENT
+BEGIN:VEVENT
+UID:12345-67890
+DTSTART;TZID=US/Eastern:20080601T120000
+DURATION:PT1H
+DTSTAMP:20080601T120000Z
+RRULE:FREQ=DAILY
+END:VEVENT
+BEGIN:VEVENT
+UID:12345-67890
+RECURRENCE-ID;TZID=US/Eastern:20080602T120000
+DTSTART;TZID=US/Eastern:20080602T130000
+DURATION:PT1H
+DTSTAMP:20080601T120000Z
+END:VEVENT
+END:VCALENDAR
+""".replace("\n", "\r\n")
+
+        results = yield self._componentsFromIStream(data)
+
+        # The first UID is complete once a component for the second one has
+        # been read, before the rest of the stream is
+        self.assertEqual([(index, remaining) for index, _ignore, remaining in results], [(0, 2), (1, 0)])
+        self.assertEqual(
+            [normalize_iCalStr(calendar) for _ignore, calendar, _ignore in results],
+            [normalize_iCalStr(calendar) for calendar in Component.componentsFromData(data, None)],
+        )
+
+    @inlineCallbacks
+    def test_componentsFromIStream_notAdjacent(self):
+        """
+        L{Component.componentsFromIStream} passes the components for a
+        recurring UID on as one VCALENDAR even when another UID comes between
+        them, with the index of the UID's first appearance.
+        """
+
+        data = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:12345-67890
+DTSTART:20080601T120000Z
+DURATION:PT1H
+DTSTAMP:20080601T120000Z
+RRULE:FREQ=DAILY
+END:VEVENT
+BEGIN:VEVENT
+UID:12345-67891
+DTSTART:20080602T120000Z
+DURATION:PT1H
+DTSTAMP:20080601T120000Z
+END:VEVENT
+BEGIN:VEVENT
+UID:12345-67890
+RECURRENCE-ID:20080602T120000Z
+DTSTART:20080602T130000Z
+DURATION:PT1H
+DTSTAMP:20080601T120000Z
+END:VEVENT
+END:VCALENDAR
+""".replace("\n", "\r\n")
+
+        results = yield self._componentsFromIStream(data)
+
+        self.assertEqual([(index, remaining) for index, _ignore, remaining in results], [(1, 2), (0, 0)])
+        expected = Component.componentsFromData(data, None)
+        self.assertEqual(len(expected), 2)
+        self.assertEqual(
+            sorted([(index, normalize_iCalStr(calendar)) for index, calendar, _ignore in results]),
+            [(index, normalize_iCalStr(calendar)) for index, calendar in enumerate(expected)],
+        )
+
+    @inlineCallbacks
+    def test_componentsFromIStream_invalid(self):
+        """
+        L{Component.componentsFromIStream} raises
+        L{InvalidICalendarDataError} for empty or invalid data.
+        """
+
+        def gotComponent(index, calendar):
+            return succeed(None)
+
+        for data in ("", "BEGIN:VCALENDAR\r\nBEGIN:VEVENT\r\n"):
+            try:
+                yield Component.componentsFromIStream(MemoryStream(data), gotComponent)
+            except InvalidICalendarDataError:
+                pass
+            else:
+                self.fail("InvalidICalendarDataError not raised for {0!r}".format(data,))
@@ -0,0 +1,138 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+from twisted.internet.task import Clock
+
+from twistedcaldav.lrucache import LRUCache
+from twistedcaldav.test.util import TestCase
+
+
+class LRUCacheTests(TestCase):
+    """
+    Tests for L{LRUCache}.
+    """
+
+    def test_setget(self):
+        cache = LRUCache(10)
+        cache.set("a", "1")
+        self.assertEquals(cache.get("a"), "1")
+        self.assertEquals(cache.get("b"), None)
+        self.assertEquals(cache.get("b", 2), 2)
+        self.assertTrue("a" in cache)
+        self.assertEquals(len(cache), 1)
+
+    def test_evictsLeastRecentlyUsed(self):
+        cache = LRUCache(2)
+        cache.set("a", "1")
+        cache.set("b", "2")
+
+        # Touch "a" so that "b" is the least recently used
+        cache.get("a")
+        cache.set("c", "3")
+
+        self.assertEquals(cache.get("a"), "1")
+        self.assertEquals(cache.get("b"), None)
+        self.assertEquals(cache.get("c"), "3")
+        self.assertEquals(cache.evictions, 1)
+
+    def test_expiry(self):
+        clock = Clock()
+        cache = LRUCache(10, expireSeconds=10, clock=clock.seconds)
+        cache.set("a", "1")
+        cache.set("b", "2", expireSeconds=20)
+        cache.set("c", "3", expireSeconds=0)
+
+        clock.advance(9)
+        self.assertEquals(cache.get("a"), "1")
+
+        clock.advance(1)
+        self.assertEquals(cache.get("a"), None)
+        self.assertEquals(cache.get("b"), "2")
+
+        clock.advance(1000)
+        self.assertEquals(cache.get("b"), None)
+        self.assertEquals(cache.get("c"), "3")
+
+    def test_maxBytes(self):
+        cache = LRUCache(10, maxBytes=10)
+        cache.set("a", "1234")
+        cache.set("b", "1234")
+        self.assertEquals(cache.stats()["bytes"], 10)
+
+        cache.set("c", "1")
+        self.assertEquals(cache.get("a"), None)
+        self.assertEquals(cache.get("b"), "1234")
+        self.assertEquals(cache.stats()["bytes"], 7)
+
+        # An item bigger than the limit is not cached
+        cache.set("d", "1234567890")
+        self.assertEquals(len(cache), 0)
+        self.assertEquals(cache.stats()["bytes"], 0)
+
+    def test_sweep(self):
+        clock = Clock()
+        cache = LRUCache(10, expireSeconds=10, clock=clock.seconds)
+        cache.set("a", "1")
+        cache.set("b", "2", expireSeconds=20)
+        cache.set("c", "3", expireSeconds=0)
+
+        clock.advance(15)
+        self.assertEquals(cache.sweep(), 1)
+        self.assertEquals(len(cache), 2)
+        self.assertEquals(cache.expirations, 1)
+
+    def test_updatePeek(self):
+        clock = Clock()
+        cache = LRUCache(2, expireSeconds=10, clock=clock.seconds)
+        cache.set("a", "1")
+        cache.set("b", "2")
+
+        # Neither changes the recency of "a"
+        self.assertEquals(cache.peek("a"), "1")
+        self.assertTrue(cache.update("a", "11"))
+        self.assertFalse(cache.update("c", "3"))
+        cache.set("c", "3")
+        self.assertEquals(cache.peek("a"), None)
+        self.assertEquals(cache.stats()["hits"], 0)
+
+        # The expiry time is kept
+        self.assertTrue(cache.update("b", "22"))
+        clock.advance(10)
+        self.assertEquals(cache.peek("b"), None)
+
+    def test_delete(self):
+        cache = LRUCache(10)
+        cache.set("a", "1")
+        self.assertTrue(cache.delete("a"))
+        self.assertFalse(cache.delete("a"))
+        self.assertEquals(cache.get("a"), None)
+
+    def test_stats(self):
+        cache = LRUCache(1)
+        cache.set("a", "1")
+        cache.get("a")
+        cache.get("b")
+        cache.set("b", "2")
+        self.assertEquals(cache.stats(), {
+            "entries": 1,
+            "maxEntries": 1,
+            "bytes": 2,
+            "maxBytes": 0,
+            "hits": 1,
+            "misses": 1,
+            "evictions": 1,
+            "expirations": 0,
+        })
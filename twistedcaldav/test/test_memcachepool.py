@@ -19,11 +19,13 @@ from zope.interface import implements
 from twisted.internet.interfaces import IConnector, IReactorTCP
 from twisted.internet.endpoints import TCP4ClientEndpoint
 from twisted.internet.address import IPv4Address
+from twisted.test.proto_helpers import StringTransport
 
 from twistedcaldav.test.util import InMemoryMemcacheProtocol
 from twistedcaldav.memcachepool import PooledMemCacheProtocol
 from twistedcaldav.memcachepool import MemCacheClientFactory
 from twistedcaldav.memcachepool import MemCachePool
+from twistedcaldav.memcachepool import ShardedMemCachePool
 
 from twistedcaldav.test.util import TestCase
 
@@ -119,6 +121,61 @@ class PooledMemCacheProtocolTests(TestCase):
         p.connectionMade()
         return d
 
+    def _connectedProtocol(self):
+        p = PooledMemCacheProtocol()
+        p.factory = MemCacheClientFactory()
+        p.factory.deferred = None
+        p.makeConnection(StringTransport())
+        return p
+
+    def test_getMultipleSingleCommand(self):
+        """
+        Test that L{PooledMemCacheProtocol.getMultiple} sends a single
+        multi-key C{get} command.
+        """
+        p = self._connectedProtocol()
+        d = p.getMultiple(["foo", "bar"])
+        self.assertEquals(p.transport.value(), "get foo bar\r\n")
+
+        p.dataReceived("VALUE foo 0 3\r\nabc\r\nEND\r\n")
+        d.addCallback(
+            self.assertEquals, {"foo": (0, "abc"), "bar": (0, None)}
+        )
+        return d
+
+    def test_setMultiplePipelined(self):
+        """
+        Test that L{PooledMemCacheProtocol.setMultiple} sends all the C{set}
+        commands before any reply is received.
+        """
+        p = self._connectedProtocol()
+        d = p.setMultiple({"foo": "abc", "bar": "de"})
+        self.assertEquals(
+            sorted(p.transport.value().split("\r\n")),
+            ["", "abc", "de", "set bar 0 0 2", "set foo 0 0 3"],
+        )
+
+        p.dataReceived("STORED\r\nNOT_STORED\r\n")
+        d.addCallback(lambda result: self.assertEquals(
+            sorted(result.values()), [False, True]
+        ))
+        return d
+
+    def test_deleteMultiplePipelined(self):
+        """
+        Test that L{PooledMemCacheProtocol.deleteMultiple} sends all the
+        C{delete} commands before any reply is received.
+        """
+        p = self._connectedProtocol()
+        d = p.deleteMultiple(["foo", "bar"])
+        self.assertEquals(
+            p.transport.value(), "delete foo\r\ndelete bar\r\n"
+        )
+
+        p.dataReceived("DELETED\r\nNOT_FOUND\r\n")
+        d.addCallback(self.assertEquals, {"foo": True, "bar": False})
+        return d
+
 
 class MemCacheClientFactoryTests(TestCase):
     """
@@ -380,3 +437,57 @@ class MemCachePoolTests(TestCase):
 
         self.pool.performRequest('get', 'bar')
         self.assertEquals(self.reactor.calls, [])
+
+
+class ShardedMemCachePoolTests(TestCase):
+    """
+    Tests for L{ShardedMemCachePool}.
+    """
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.servers = {
+            "a": InMemoryMemcacheProtocol(),
+            "b": InMemoryMemcacheProtocol(),
+            "c": InMemoryMemcacheProtocol(),
+        }
+        self.pool = ShardedMemCachePool(self.servers)
+        self.keys = ["key%d" % (i,) for i in range(30)]
+
+    def test_keysSpreadAcrossServers(self):
+        """
+        Each key is stored on exactly one server, and more than one server is
+        used.
+        """
+        for key in self.keys:
+            self.pool.set(key, "value-" + key)
+
+        used = 0
+        for server in self.servers.values():
+            if server._cache:
+                used += 1
+        self.assertTrue(used > 1)
+        self.assertEquals(
+            sum([len(server._cache) for server in self.servers.values()]),
+            len(self.keys)
+        )
+
+        results = []
+        for key in self.keys:
+            self.pool.get(key).addCallback(results.append)
+        self.assertEquals(
+            results, [(0, "value-" + key) for key in self.keys]
+        )
+
+    def test_getMulti(self):
+        """
+        L{ShardedMemCachePool.getMulti} merges the results from each server.
+        """
+        for key in self.keys:
+            self.pool.set(key, "value-" + key)
+
+        d = self.pool.getMulti(self.keys + ["missing"])
+        expected = dict([(key, (0, "value-" + key)) for key in self.keys])
+        expected["missing"] = (0, None)
+        d.addCallback(self.assertEquals, expected)
+        return d
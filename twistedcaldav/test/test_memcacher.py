@@ -5,13 +5,59 @@
 Test the memcacher cache abstraction.
 """
 
-from twisted.internet.defer import inlineCallbacks
+import cPickle
 
+from twisted.internet.defer import Deferred, inlineCallbacks
+
+from twistedcaldav import cacheformat
 from twistedcaldav.config import config
 from twistedcaldav.memcacher import Memcacher
 from twistedcaldav.test.util import TestCase
 
 
+class CountingMemcache(object):
+    """
+    A memcache protocol stand-in that counts the keys requested from it.
+    """
+
+    def __init__(self):
+        self._cacher = Memcacher.memoryCacher(pickle=True)
+        self.requested = []
+
+    def get(self, key, withIdentifier=False):
+        self.requested.append(key)
+        return self._cacher.get(key, withIdentifier)
+
+    def getMulti(self, keys, withIdentifier=False):
+        self.requested.extend(keys)
+        return self._cacher.getMulti(keys, withIdentifier)
+
+    def __getattr__(self, name):
+        return getattr(self._cacher, name)
+
+
+class SlowSetMemcache(CountingMemcache):
+    """
+    A memcache protocol stand-in whose sets only land when the test fires the
+    L{Deferred} they return.
+    """
+
+    def set(self, key, value, expireTime=0):
+        d = Deferred()
+        d.addCallback(lambda _ignore: self._cacher.set(key, value, expireTime=expireTime))
+        self.pending = d
+        return d
+
+
+class StubInvalidator(object):
+
+    def __init__(self):
+        self.invalidated = []
+
+    def invalidate(self, namespace, keys):
+        self.invalidated.append((namespace, keys,))
+
+
 class MemcacherTestCase(TestCase):
     """
     Test Memcacher abstract cache.
@@ -68,6 +114,34 @@ class MemcacherTestCase(TestCase):
             result = yield cacher.get("akey")
             self.assertEquals(None, result)
 
+    @inlineCallbacks
+    def test_multi(self):
+
+        for processType in ("Single", "Combined",):
+            config.ProcessType = processType
+
+            for pickle in (False, True,):
+                cacher = Memcacher("testing", pickle=pickle)
+
+                result = yield cacher.setMulti({"akey": "avalue", "bkey": "bvalue"})
+                self.assertEquals(result, {"akey": True, "bkey": True})
+
+                result = yield cacher.getMulti(("akey", "bkey", "ckey",))
+                if isinstance(cacher._memcacheProtocol, Memcacher.nullCacher):
+                    self.assertEquals(result, {"akey": None, "bkey": None, "ckey": None})
+                else:
+                    self.assertEquals(result, {"akey": "avalue", "bkey": "bvalue", "ckey": None})
+
+                result = yield cacher.deleteMulti(("akey", "bkey",))
+                self.assertTrue(result["akey"])
+                self.assertTrue(result["bkey"])
+
+                result = yield cacher.getMulti(("akey", "bkey",))
+                self.assertEquals(result, {"akey": None, "bkey": None})
+
+                result = yield cacher.getMulti(())
+                self.assertEquals(result, {})
+
     @inlineCallbacks
     def test_all_pickled(self):
 
@@ -203,3 +277,200 @@ class MemcacherTestCase(TestCase):
         # Value limits
         result = yield cacher.set("*", "*" * (Memcacher.MEMCACHE_VALUE_LIMIT + 10))
         self.assertFalse(result)
+
+    @inlineCallbacks
+    def test_serializer(self):
+
+        config.ProcessType = "Single"
+        cacher = Memcacher("testing", pickle=True, serializer=cacheformat)
+
+        result = yield cacher.set("akey", [("a", u"b")])
+        self.assertTrue(result)
+        result = yield cacher.get("akey")
+        self.assertEquals(result, [("a", u"b")])
+        result = yield cacher.getMulti(["akey"])
+        self.assertEquals(result, {"akey": [("a", u"b")]})
+
+        # A value in another format is a miss
+        yield cacher._getMemcacheProtocol().set(cacher._namespacedKey("akey"), cPickle.dumps("a"))
+        result = yield cacher.get("akey")
+        self.assertEquals(result, None)
+
+    @inlineCallbacks
+    def test_memoryCacheBounded(self):
+
+        memcache = Memcacher.memoryCacher(maxEntries=3, maxBytes=30)
+        for key in ("a", "b", "c"):
+            yield memcache.set(key, "12345")
+
+        # Touch "a" so that "b" is evicted first
+        yield memcache.get("a")
+        yield memcache.set("d", "12345")
+        self.assertEquals((yield memcache.get("b")), (0, None,))
+        self.assertEquals((yield memcache.get("a")), (0, "12345",))
+
+        # Byte limit
+        yield memcache.set("e", "1" * 19)
+        self.assertEquals((yield memcache.get("c")), (0, None,))
+        self.assertEquals((yield memcache.get("d")), (0, None,))
+        self.assertEquals((yield memcache.get("e")), (0, "1" * 19,))
+
+        stats = memcache.stats()
+        self.assertEquals(stats["entries"], 2)
+        self.assertEquals(stats["bytes"], 26)
+        self.assertEquals(stats["evictions"], 3)
+        self.assertEquals(stats["hits"], 3)
+        self.assertEquals(stats["misses"], 3)
+
+    @inlineCallbacks
+    def test_memoryCacheSweep(self):
+
+        memcache = Memcacher.memoryCacher(sweepSeconds=60)
+        yield memcache.set("a", "1", expireTime=10)
+        yield memcache.set("b", "2", expireTime=100)
+        yield memcache.set("c", "3")
+
+        # Nothing is swept until the sweep interval has passed
+        memcache.advanceClock(50)
+        yield memcache.set("d", "4")
+        self.assertEquals(memcache.stats()["entries"], 4)
+
+        memcache.advanceClock(10)
+        yield memcache.set("d", "4")
+        self.assertEquals(memcache.stats()["entries"], 3)
+        self.assertEquals(memcache.stats()["expirations"], 1)
+
+    @inlineCallbacks
+    def test_memoryCacheIncr(self):
+
+        memcache = Memcacher.memoryCacher()
+        yield memcache.set("a", "1", expireTime=10)
+        self.assertEquals((yield memcache.incr("a", 2)), 3)
+        self.assertEquals((yield memcache.decr("a", 5)), 0)
+
+        # Expiry is unchanged
+        memcache.advanceClock(10)
+        self.assertEquals((yield memcache.incr("a")), None)
+
+    def test_memoryCacheStats(self):
+
+        config.ProcessType = "Single"
+        Memcacher.reset()
+        self.addCleanup(Memcacher.reset)
+        Memcacher("testing", pickle=True)._getMemcacheProtocol()
+        self.assertEquals(Memcacher.memoryCacheStats().keys(), ["pickle"])
+
+
+class MemcacherL1TestCase(TestCase):
+    """
+    Test the in-process L1 cache tier of Memcacher.
+    """
+
+    def setUp(self):
+        super(MemcacherL1TestCase, self).setUp()
+        self.patch(config.Memcached.L1Cache, "Enabled", True)
+        self.patch(config.Memcached.L1Cache, "Namespaces", {"testing": {}})
+        self.invalidator = StubInvalidator()
+        self.patch(Memcacher, "l1Invalidator", self.invalidator)
+        Memcacher.reset()
+        self.addCleanup(Memcacher.reset)
+
+        self.memcache = CountingMemcache()
+        self.cacher = Memcacher("testing", pickle=True)
+        self.cacher._memcacheProtocol = self.memcache
+
+    @inlineCallbacks
+    def test_hitAvoidsMemcache(self):
+        yield self.cacher.set("akey", ["1", "2"])
+
+        result = yield self.cacher.get("akey")
+        self.assertEquals(result, ["1", "2"])
+        self.assertEquals(len(self.memcache.requested), 1)
+
+        # Each hit is a new copy of the value
+        result.append("3")
+        result = yield self.cacher.get("akey")
+        self.assertEquals(result, ["1", "2"])
+        self.assertEquals(len(self.memcache.requested), 1)
+
+        self.assertEquals(Memcacher.l1Stats()["testing"]["hits"], 1)
+
+    @inlineCallbacks
+    def test_getMultiUsesL1(self):
+        yield self.cacher.setMulti({"akey": "a", "bkey": "b"})
+        yield self.cacher.get("akey")
+        self.memcache.requested = []
+
+        result = yield self.cacher.getMulti(["akey", "bkey"])
+        self.assertEquals(result, {"akey": "a", "bkey": "b"})
+        self.assertEquals(
+            self.memcache.requested, [self.cacher._namespacedKey("bkey")]
+        )
+
+    @inlineCallbacks
+    def test_changesInvalidate(self):
+        yield self.cacher.set("akey", "a")
+        yield self.cacher.get("akey")
+
+        yield self.cacher.set("akey", "b")
+        result = yield self.cacher.get("akey")
+        self.assertEquals(result, "b")
+
+        yield self.cacher.delete("akey")
+        result = yield self.cacher.get("akey")
+        self.assertEquals(result, None)
+
+        cacheKey = self.cacher._namespacedKey("akey")
+        self.assertEquals(
+            self.invalidator.invalidated,
+            [("testing", [cacheKey])] * 3
+        )
+
+    @inlineCallbacks
+    def test_getWhileSetPending(self):
+        """
+        A value read from memcached while a set is still in progress is not
+        kept in the L1 cache once the set completes, and sibling processes are
+        only told about the change then.
+        """
+        yield self.cacher.set("akey", "a")
+
+        memcache = SlowSetMemcache()
+        memcache._cacher = self.memcache._cacher
+        self.cacher._memcacheProtocol = memcache
+        d = self.cacher.set("akey", "b")
+        self.assertEquals(len(self.invalidator.invalidated), 1)
+
+        result = yield self.cacher.get("akey")
+        self.assertEquals(result, "a")
+
+        memcache.pending.callback(None)
+        yield d
+        self.assertEquals(len(self.invalidator.invalidated), 2)
+        result = yield self.cacher.get("akey")
+        self.assertEquals(result, "b")
+
+    @inlineCallbacks
+    def test_siblingInvalidation(self):
+        yield self.cacher.set("akey", "a")
+        yield self.cacher.get("akey")
+
+        # Another process changes the value in memcached
+        cacheKey = self.cacher._namespacedKey("akey")
+        yield self.memcache._cacher.set(cacheKey, cPickle.dumps("b"))
+        result = yield self.cacher.get("akey")
+        self.assertEquals(result, "a")
+
+        Memcacher.invalidateL1("testing", [cacheKey])
+        result = yield self.cacher.get("akey")
+        self.assertEquals(result, "b")
+
+    @inlineCallbacks
+    def test_notForOtherNamespaces(self):
+        cacher = Memcacher("other", pickle=True)
+        cacher._memcacheProtocol = self.memcache
+        yield cacher.set("akey", "a")
+        yield cacher.get("akey")
+        yield cacher.get("akey")
+        self.assertEquals(len(self.memcache.requested), 2)
+        self.assertEquals(self.invalidator.invalidated, [])
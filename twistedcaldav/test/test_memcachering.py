@@ -0,0 +1,157 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+from twistedcaldav.config import ConfigDict
+from twistedcaldav.memcacheclient import Client
+from twistedcaldav.memcachering import HashRing, serversForPool
+from twistedcaldav.test.util import TestCase
+
+
+class HashRingTests(TestCase):
+    """
+    Tests for L{HashRing}.
+    """
+
+    keys = ["key-%d" % (i,) for i in range(10000)]
+
+    def distribution(self, ring):
+        counts = {}
+        for key in self.keys:
+            node = ring.nodeForKey(key)
+            counts[node] = counts.get(node, 0) + 1
+        return counts
+
+    def test_empty(self):
+        ring = HashRing([])
+        self.assertEquals(ring.nodeForKey("foo"), None)
+        self.assertEquals(list(ring.iterNodesForHash(0)), [])
+
+    def test_consistent(self):
+        """
+        The same key always maps to the same node, regardless of the order
+        the nodes are listed in.
+        """
+        ring1 = HashRing([("a", 1), ("b", 1), ("c", 1)])
+        ring2 = HashRing([("c", 1), ("a", 1), ("b", 1)])
+        for key in self.keys[:100]:
+            self.assertEquals(ring1.nodeForKey(key), ring2.nodeForKey(key))
+
+    def test_distribution(self):
+        """
+        Keys are spread roughly evenly over equally weighted nodes.
+        """
+        counts = self.distribution(HashRing([("a", 1), ("b", 1), ("c", 1), ("d", 1)]))
+        self.assertEquals(set(counts.keys()), set(("a", "b", "c", "d",)))
+        for count in counts.values():
+            self.assertTrue(1750 < count < 3250, counts)
+
+    def test_weights(self):
+        """
+        A node gets a share of the keys proportional to its weight.
+        """
+        counts = self.distribution(HashRing([("a", 1), ("b", 3)]))
+        self.assertTrue(2.0 < float(counts["b"]) / counts["a"] < 4.5, counts)
+
+    def test_addNodeRemapsFewKeys(self):
+        """
+        Adding a fifth node only moves keys onto that node, and only about a
+        fifth of them.
+        """
+        before = HashRing([("a", 1), ("b", 1), ("c", 1), ("d", 1)])
+        after = HashRing([("a", 1), ("b", 1), ("c", 1), ("d", 1), ("e", 1)])
+
+        moved = 0
+        for key in self.keys:
+            oldNode = before.nodeForKey(key)
+            newNode = after.nodeForKey(key)
+            if oldNode != newNode:
+                self.assertEquals(newNode, "e")
+                moved += 1
+        self.assertTrue(1000 < moved < 3000, moved)
+
+    def test_iterNodesForHash(self):
+        """
+        L{HashRing.iterNodesForHash} returns each node once, starting with the
+        owner of the hash.
+        """
+        ring = HashRing([("a", 1), ("b", 2), ("c", 1)])
+        for key in self.keys[:100]:
+            keyHash = HashRing.keyHash(key)
+            nodes = list(ring.iterNodesForHash(keyHash))
+            self.assertEquals(nodes[0], ring.nodeForHash(keyHash))
+            self.assertEquals(sorted(nodes), ["a", "b", "c"])
+
+
+class ServersForPoolTests(TestCase):
+    """
+    Tests for L{serversForPool}.
+    """
+
+    def test_socket(self):
+        pool = ConfigDict({
+            "MemcacheSocket": "/tmp/memcache.sock",
+            "BindAddress": "127.0.0.1",
+            "Port": 11311,
+            "Servers": [],
+        })
+        self.assertEquals(serversForPool(pool), [("unix:/tmp/memcache.sock", 1)])
+
+    def test_address(self):
+        pool = ConfigDict({
+            "MemcacheSocket": "",
+            "BindAddress": "127.0.0.1",
+            "Port": 11311,
+        })
+        self.assertEquals(serversForPool(pool), [("127.0.0.1:11311", 1)])
+
+    def test_servers(self):
+        pool = ConfigDict({
+            "MemcacheSocket": "/tmp/memcache.sock",
+            "BindAddress": "127.0.0.1",
+            "Port": 11311,
+            "Servers": ["10.0.0.1:11211", ["10.0.0.2:11211", 2]],
+        })
+        self.assertEquals(
+            serversForPool(pool),
+            [("10.0.0.1:11211", 1), ("10.0.0.2:11211", 2)]
+        )
+
+
+class ClientServerSelectionTests(TestCase):
+    """
+    Tests for server selection in L{Client}.
+    """
+
+    def test_deadServerFallsBack(self):
+        """
+        Keys on an unavailable server move to the next server on the ring,
+        and keys on other servers do not move.
+        """
+        client = Client(["10.0.0.1:11211", "10.0.0.2:11211", "10.0.0.3:11211"])
+        for server in client.servers:
+            server.connect = lambda: True
+
+        before = {}
+        for key in HashRingTests.keys[:300]:
+            before[key] = client._get_server(key)[0].name
+
+        client.buckets["10.0.0.2:11211"].connect = lambda: False
+        for key in HashRingTests.keys[:300]:
+            server = client._get_server(key)[0].name
+            if before[key] == "10.0.0.2:11211":
+                self.assertNotEquals(server, "10.0.0.2:11211")
+            else:
+                self.assertEquals(server, before[key])
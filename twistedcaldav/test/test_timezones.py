@@ -17,13 +17,16 @@
 import twistedcaldav.test.util
 from twistedcaldav.config import config
 from twistedcaldav.ical import Component
-from twistedcaldav.timezones import TimezoneCache, TimezoneException
-from twistedcaldav.timezones import readTZ, listTZs
+from twistedcaldav.timezones import TimezoneCache, TimezoneException, TimezonePack
+from twistedcaldav.timezones import readTZ, readVTZ, hasTZ, listTZs, transitionTable, adjustToUTC, \
+    localSeconds
 from pycalendar.datetime import DateTime
 from pycalendar.timezone import Timezone
 
+from datetime import datetime, timedelta
 import os
 import threading
+from twisted.python.lockfile import FilesystemLock
 from twisted.python.failure import Failure
 
 
@@ -211,6 +214,66 @@ END:VCALENDAR
         self.assertTrue(os.path.isfile(extras))
 
 
+class TransitionTableTest (twistedcaldav.test.util.TestCase):
+    """
+    UTC offset transition table tests
+    """
+
+    def setUp(self):
+        super(TransitionTableTest, self).setUp()
+        TimezoneCache.clear()
+        TimezoneCache.create()
+
+    def test_adjustToUTC(self):
+        """
+        L{adjustToUTC} gives the same result as L{DateTime.adjustToUTC},
+        including at times skipped or repeated by daylight saving changes.
+        """
+
+        year = DateTime.getToday().getYear()
+        for tzid in ("America/New_York", "Europe/London", "Australia/Sydney", "Asia/Tokyo",):
+            self.assertNotEqual(transitionTable(tzid), None)
+            tz = Timezone(tzid=tzid)
+            for month in range(1, 13):
+                for day in (1, 5, 10, 25, 30):
+                    for hours, minutes in ((0, 0), (1, 30), (2, 0), (2, 30), (3, 0), (12, 0), (23, 59),):
+                        if month == 2 and day == 30:
+                            continue
+                        dt = DateTime(year, month, day, hours, minutes, 0, tz)
+                        self.assertEqual(adjustToUTC(dt.duplicate()), dt.duplicate().adjustToUTC(), msg=str(dt))
+
+        # Each transition in the table
+        table = transitionTable("America/New_York")
+        for onset in table.onsets[:10]:
+            for delta in (-3600, -1, 0, 1, 3600,):
+                local = datetime(1970, 1, 1) + timedelta(seconds=onset + delta)
+                dt = DateTime(local.year, local.month, local.day, local.hour, local.minute, local.second, Timezone(tzid="America/New_York"))
+                self.assertEqual(adjustToUTC(dt.duplicate()), dt.duplicate().adjustToUTC(), msg=str(dt))
+
+    def test_outsideTable(self):
+        """
+        L{adjustToUTC} falls back to L{DateTime.adjustToUTC} for unknown
+        time zones and times outside of the table.
+        """
+
+        self.assertEqual(transitionTable("America/Pittsburgh"), None)
+
+        dt = DateTime(1950, 7, 1, 12, 0, 0, Timezone(tzid="America/New_York"))
+        self.assertEqual(transitionTable("America/New_York").localOffset(localSeconds(dt)), None)
+        self.assertEqual(adjustToUTC(dt.duplicate()), DateTime(1950, 7, 1, 16, 0, 0, Timezone.UTCTimezone))
+
+        dt = DateTime(2007, 7, 1, 12, 0, 0, Timezone.UTCTimezone)
+        self.assertEqual(adjustToUTC(dt.duplicate()), dt)
+
+    def test_disabled(self):
+        """
+        No tables are compiled when disabled.
+        """
+
+        self.patch(config.TimezoneTransitions, "Enabled", False)
+        self.assertEqual(transitionTable("Europe/Paris"), None)
+
+
 class TimezonePackageTest (twistedcaldav.test.util.TestCase):
     """
     Timezone support tests
@@ -320,3 +383,146 @@ class TimezonePackageTest (twistedcaldav.test.util.TestCase):
         self.assertTrue(os.path.exists(os.path.join(config.DataRoot, "zoneinfo", "America", "New_York.ics")))
 
     test_copyPackage_Concurrency.skip = "This tests needs to use separate processes rather than threads to work properly as the FilesystemLock object is process-based "
+
+
+class TimezonePackFileTest (twistedcaldav.test.util.TestCase):
+    """
+    Timezone pack file tests
+    """
+
+    def setUp(self):
+        super(TimezonePackFileTest, self).setUp()
+        self.patch(config, "UsePackageTimezones", False)
+        TimezoneCache.clear()
+        TimezoneCache.create()
+
+    def tearDown(self):
+        TimezoneCache.clear()
+        TimezoneCache.create()
+
+    def test_build(self):
+        """
+        Test that the pack is built from the timezone directory and used to read
+        and list timezones.
+        """
+
+        dbpath = TimezoneCache.getDBPath()
+        pack = TimezoneCache.pack
+        self.assertTrue(pack is not None)
+        self.assertTrue(os.path.exists(os.path.join(dbpath, TimezonePack.PACK_NAME)))
+
+        with open(os.path.join(dbpath, "America", "New_York.ics")) as f:
+            self.assertEqual(pack.read("America/New_York"), f.read())
+        self.assertTrue(pack.read("America/Pittsburgh") is None)
+        self.assertEqual(pack.aliases.get("AUS Central Standard Time"), "Australia/Darwin")
+
+        self.assertTrue(readTZ("America/New_York").find("TZID:America/New_York") != -1)
+        self.assertRaises(TimezoneException, readTZ, "America/Pittsburgh")
+        self.assertTrue(hasTZ("Europe/London"))
+        self.assertTrue("GB" in listTZs())
+
+    def test_stale(self):
+        """
+        Test that the pack is rebuilt when the timezone directory is refreshed.
+        """
+
+        dbpath = TimezoneCache.getDBPath()
+        stamp = TimezoneCache.pack.stamp
+        with open(os.path.join(dbpath, "version.txt"), "w") as f:
+            f.write("IANA Timezone Registry: 9999a\n")
+
+        TimezoneCache.create()
+        self.assertNotEqual(TimezoneCache.pack.stamp, stamp)
+        self.assertEqual(TimezoneCache.pack.stamp, TimezonePack.stampFor(dbpath))
+
+    def test_invalid(self):
+        """
+        Test that a damaged pack is rebuilt.
+        """
+
+        path = os.path.join(TimezoneCache.getDBPath(), TimezonePack.PACK_NAME)
+        TimezoneCache.clear()
+        with open(path, "w") as f:
+            f.write("garbage")
+        self.assertRaises(TimezoneException, TimezonePack.load, path)
+
+        TimezoneCache.create()
+        self.assertTrue(TimezoneCache.pack is not None)
+        self.assertTrue(readTZ("America/New_York").find("TZID:America/New_York") != -1)
+
+    def test_alias(self):
+        """
+        Test that an alias from links.txt without a calendar file of its own is
+        read from the pack as the timezone it links to.
+        """
+
+        dbpath = TimezoneCache.getDBPath()
+        with open(os.path.join(dbpath, "links.txt"), "a") as f:
+            f.write("Test/New_York\tAmerica/New_York\n")
+        TimezoneCache.create()
+        self.assertEqual(TimezoneCache.pack.aliases.get("Test/New_York"), "America/New_York")
+
+        self.assertTrue(hasTZ("Test/New_York"))
+        tzdata = readTZ("Test/New_York")
+        self.assertTrue(tzdata.find("TZID:Test/New_York") != -1)
+        self.assertTrue(tzdata.find("TZID:America/New_York") == -1)
+        self.assertEqual(
+            tzdata.replace("Test/New_York", "America/New_York"),
+            readTZ("America/New_York"),
+        )
+
+    def test_locked(self):
+        """
+        Test that a process that found another one building the pack loads it
+        once that has finished.
+        """
+
+        path = os.path.join(TimezoneCache.getDBPath(), TimezonePack.PACK_NAME)
+        TimezoneCache.clear()
+        os.remove(path)
+        lockfile = FilesystemLock(path + ".lock")
+        self.assertTrue(lockfile.lock())
+        try:
+            TimezoneCache.create()
+            self.assertTrue(TimezoneCache.pack is None)
+            self.assertTrue(TimezoneCache.packPending)
+        finally:
+            lockfile.unlock()
+
+        # Not tried again until the retry interval has passed
+        self.assertTrue(readTZ("America/New_York").find("TZID:America/New_York") != -1)
+        self.assertTrue(TimezoneCache.pack is None)
+
+        self.patch(TimezoneCache, "_nextPackRetry", 0)
+        self.assertTrue(readTZ("Europe/London").find("TZID:Europe/London") != -1)
+        self.assertTrue(TimezoneCache.pack is not None)
+        self.assertFalse(TimezoneCache.packPending)
+
+    def test_notPacked(self):
+        """
+        Test that timezones are read from the directory when the pack is disabled.
+        """
+
+        self.patch(config.TimezoneCache, "Packed", False)
+        TimezoneCache.clear()
+        TimezoneCache.create()
+
+        self.assertTrue(TimezoneCache.pack is None)
+        self.assertTrue(readTZ("America/New_York").find("TZID:America/New_York") != -1)
+        self.assertTrue("GB" in listTZs())
+
+    def test_maxEntries(self):
+        """
+        Test that only the most recently used parsed timezones are kept.
+        """
+
+        self.patch(config.TimezoneCache, "MaxEntries", 2)
+        TimezoneCache.clear()
+        TimezoneCache.create()
+
+        first = readVTZ("America/New_York")
+        self.assertTrue(readVTZ("America/New_York") is first)
+        readVTZ("Europe/London")
+        readVTZ("Asia/Tokyo")
+        self.assertFalse(readVTZ("America/New_York") is first)
+        self.assertEqual(str(readVTZ("America/New_York")), str(first))
@@ -16,7 +16,7 @@
 
 from twistedcaldav.timezones import TimezoneCache
 from twistedcaldav.timezonestdservice import TimezoneInfo, \
-    PrimaryTimezoneDatabase
+    PrimaryTimezoneDatabase, TimezoneNameIndex
 from xml.etree.ElementTree import Element
 import hashlib
 import os
@@ -60,6 +60,46 @@ class TestTimezoneInfo (twistedcaldav.test.util.TestCase):
         self.assertEqual(info2.md5, hashed)
 
 
+class TestTimezoneNameIndex (twistedcaldav.test.util.TestCase):
+    """
+    Timezone find pattern tests
+    """
+
+    def setUp(self):
+        super(TestTimezoneNameIndex, self).setUp()
+        self.index = TimezoneNameIndex((
+            TimezoneInfo("America/New_York", ("US/Eastern",), "20110517T120000Z", None),
+            TimezoneInfo("America/Los_Angeles", ("US/Pacific",), "20110517T120000Z", None),
+            TimezoneInfo("Europe/London", ("GB",), "20110517T120000Z", None),
+            TimezoneInfo("Europe/Paris", (), "20110517T120000Z", None),
+        ))
+
+    def test_matchIs(self):
+
+        self.assertEqual(self.index.matchIs("america/new york"), set(("America/New_York",)))
+        self.assertEqual(self.index.matchIs("gb"), set(("Europe/London",)))
+        self.assertEqual(self.index.matchIs("america"), set())
+
+    def test_matchStartswith(self):
+
+        self.assertEqual(self.index.matchStartswith("america/"), set(("America/New_York", "America/Los_Angeles",)))
+        self.assertEqual(self.index.matchStartswith("us/p"), set(("America/Los_Angeles",)))
+        self.assertEqual(self.index.matchStartswith("zulu"), set())
+
+    def test_matchEndswith(self):
+
+        self.assertEqual(self.index.matchEndswith("ern"), set(("America/New_York",)))
+        self.assertEqual(self.index.matchEndswith("s"), set(("America/Los_Angeles", "Europe/Paris",)))
+        self.assertEqual(self.index.matchEndswith("zulu"), set())
+
+    def test_matchContains(self):
+
+        self.assertEqual(self.index.matchContains("o"), set(("America/New_York", "America/Los_Angeles", "Europe/London",)))
+        self.assertEqual(self.index.matchContains("new y"), set(("America/New_York",)))
+        self.assertEqual(self.index.matchContains("pe/"), set(("Europe/London", "Europe/Paris",)))
+        self.assertEqual(self.index.matchContains("k\ne"), set())
+
+
 class TestPrimaryTimezoneDatabase (twistedcaldav.test.util.TestCase):
     """
     Timezone support tests
@@ -149,3 +189,16 @@ class TestPrimaryTimezoneDatabase (twistedcaldav.test.util.TestCase):
         tz1 = db.getTimezone("US/Eastern")
         self.assertTrue(str(tz1).find("VTIMEZONE") != -1)
         self.assertTrue(str(tz1).find("TZID:US/Eastern") != -1)
+
+    def testNameIndex(self):
+
+        xmlfile = self.mktemp()
+        db = PrimaryTimezoneDatabase(TimezoneCache.getDBPath(), xmlfile)
+        db.createNewDatabase()
+        generation = db.generation
+
+        self.assertTrue("America/New_York" in db.nameIndex.matchIs("us/eastern"))
+        self.assertTrue("America/New_York" in db.nameIndex.matchStartswith("america/new"))
+
+        db.updateDatabase()
+        self.assertNotEqual(db.generation, generation)
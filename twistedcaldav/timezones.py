@@ -14,15 +14,26 @@
 # limitations under the License.
 ##
 
+from bisect import bisect_right
+from datetime import date, timedelta
+import hashlib
+import mmap
 import os
+import struct
+import time
 
 from twext.python.log import Logger
 
 from twisted.python.filepath import FilePath
 from twisted.python.lockfile import FilesystemLock
 
+from twistedcaldav.cacheformat import CacheFormatError, dumps, loads
 from twistedcaldav.config import config
+from twistedcaldav.lrucache import LRUCache
 
+from pycalendar.datetime import DateTime
+from pycalendar.icalendar.calendar import Calendar
+from pycalendar.timezone import Timezone
 from pycalendar.timezonedb import TimezoneDatabase
 
 log = Logger()
@@ -43,8 +54,11 @@ calendar data.
 __all__ = [
     "TimezoneException",
     "TimezoneCache",
+    "TimezonePack",
     "readTZ",
     "listTZs",
+    "TransitionTable",
+    "transitionTable",
 ]
 
 
@@ -56,8 +70,15 @@ class TimezoneCache(object):
 
     dirName = None
     version = "Unknown"
+    pack = None
     IANA_VERSION_PREFIX = "IANA Timezone Registry: "
 
+    # Whether another process was building the pack when L{loadPack} ran, and
+    # when to next try to load it
+    packPending = False
+    PACK_RETRY_SECONDS = 10
+    _nextPackRetry = 0
+
     @staticmethod
     def _getPackageDBPath():
         try:
@@ -104,6 +125,9 @@ class TimezoneCache(object):
             TimezoneCache.validatePath()
         TimezoneCache.version = TimezoneCache.getTZVersion(TimezoneCache.getDBPath())
         TimezoneDatabase.createTimezoneDatabase(TimezoneCache.getDBPath())
+        TimezoneCache._resetCaches()
+        if not empty:
+            TimezoneCache.loadPack()
 
     @staticmethod
     def getTZVersion(dbpath):
@@ -174,14 +198,249 @@ class TimezoneCache(object):
             if result:
                 lockfile.unlock()
 
+    @staticmethod
+    def loadPack():
+        """
+        Map the L{TimezonePack} of the database directory, building it first
+        if it is missing or out of date. If it cannot be built, no pack is used
+        and timezones are read from the directory instead. The package
+        directory is never written to, so it is only used without a pack.
+        """
+        dbpath = TimezoneCache.getDBPath()
+        if not config.TimezoneCache.Packed or dbpath == TimezoneCache._getPackageDBPath():
+            return
+
+        path = os.path.join(dbpath, TimezonePack.PACK_NAME)
+        stamp = TimezonePack.stampFor(dbpath)
+        try:
+            pack = TimezonePack.load(path)
+        except (IOError, OSError, TimezoneException):
+            pack = None
+        if pack is not None and pack.stamp != stamp:
+            pack.close()
+            pack = None
+
+        pending = False
+        if pack is None:
+            lockfile = FilesystemLock(path + ".lock")
+            if lockfile.lock():
+                try:
+                    log.info("Building timezone pack {p}", p=path)
+                    TimezonePack.build(dbpath, path, stamp)
+                    pack = TimezonePack.load(path)
+                except (IOError, OSError, TimezoneException) as e:
+                    log.error("Unable to build timezone pack {p}: {ex}", p=path, ex=str(e))
+                finally:
+                    lockfile.unlock()
+            else:
+                # Another process is building it - use the directory for now,
+                # and try again later
+                log.info("Timezone pack {p} is locked", p=path)
+                pending = True
+
+        TimezoneCache.pack = pack
+        TimezoneCache.packPending = pending
+        TimezoneCache._nextPackRetry = time.time() + TimezoneCache.PACK_RETRY_SECONDS
+
+    @staticmethod
+    def retryPack():
+        """
+        Load the pack if another process was building it when L{loadPack} last
+        ran, which it has most likely finished by now. Tried at most once
+        every C{PACK_RETRY_SECONDS}.
+        """
+        if not TimezoneCache.packPending or time.time() < TimezoneCache._nextPackRetry:
+            return
+        TimezoneCache.loadPack()
+        if TimezoneCache.pack is not None:
+            log.info("Loaded timezone pack {p}", p=TimezoneCache.pack.path)
+
+    @staticmethod
+    def _resetCaches():
+        if TimezoneCache.pack is not None:
+            TimezoneCache.pack.close()
+            TimezoneCache.pack = None
+        TimezoneCache.packPending = False
+        for cache in (cachedTZs, cachedVTZs,):
+            cache.clear()
+            cache.maxEntries = config.TimezoneCache.MaxEntries
+        del cachedTZIDs[:]
+        cachedTransitions.clear()
+
     @staticmethod
     def clear():
         TimezoneDatabase.clearTimezoneDatabase()
+        TimezoneCache._resetCaches()
+
+
+class TimezonePack(object):
+    """
+    A single file holding every VTIMEZONE in a zoneinfo directory together
+    with an index of where each one is, so that a process can list and load
+    timezones without walking the directory tree or opening a file per TZID.
+    The file is memory-mapped read-only, so its pages are shared by all the
+    processes using it and only those actually read are loaded.
+
+    The file is a header - a magic string and the length of the index -
+    followed by the index, encoded with L{twistedcaldav.cacheformat}, and
+    then the text of each calendar file.
+
+    @ivar stamp: the L{stampFor} of the directory the pack was built from
+    @ivar zones: map of TZID to a L{tuple} of the offset of its data, the
+        length of its data and the MD5 of its data
+    @type zones: L{dict}
+    @ivar aliases: map of alias to TZID, from the directory's links.txt file,
+        used for the aliases that do not have a calendar file of their own
+    @type aliases: L{dict}
+    @ivar tzids: all the TZIDs, sorted
+    @type tzids: L{list}
+    """
+
+    PACK_NAME = "zoneinfo.pack"
+    MAGIC = "CSTZPAK1"
+
+    _header = struct.Struct(">8sI")
+
+    def __init__(self, path, index, mapped, dataStart):
+        self.path = path
+        self.stamp = index["stamp"]
+        self.zones = index["zones"]
+        self.aliases = index["aliases"]
+        self.tzids = sorted(self.zones)
+        self._map = mapped
+        self._dataStart = dataStart
+
+    def __contains__(self, tzid):
+        return tzid in self.zones or tzid in self.aliases
+
+    @staticmethod
+    def stampFor(dbpath):
+        """
+        Identify the contents of a zoneinfo directory without reading all of
+        it. Refreshing the directory updates its version.txt file, and updating
+        or syncing it rewrites its timezones.xml file.
+
+        @rtype: L{tuple}
+        """
+        stamp = [TimezoneCache.getTZVersion(dbpath)]
+        for name in ("timezones.xml", "links.txt",):
+            try:
+                stamp.append(os.stat(os.path.join(dbpath, name)).st_mtime)
+            except OSError:
+                stamp.append(0)
+        return tuple(stamp)
+
+    @classmethod
+    def build(cls, dbpath, path, stamp):
+        """
+        Write a pack of all the calendar files in a zoneinfo directory. The
+        pack is written to a temporary file and then renamed, so a pack is
+        never seen partially written.
+
+        @param dbpath: the zoneinfo directory
+        @param path: the pack file
+        @param stamp: the L{stampFor} of the directory
+        """
+        zones = {}
+        chunks = []
+        offset = 0
+        for root, dirs, files in os.walk(dbpath):
+            dirs[:] = sorted(item for item in dirs if not item.startswith("."))
+            for item in sorted(files):
+                if item.startswith(".") or not item.endswith(".ics"):
+                    continue
+                with open(os.path.join(root, item)) as f:
+                    data = f.read()
+                tzid = os.path.relpath(os.path.join(root, item[:-4]), dbpath)
+                zones[tzid] = (offset, len(data), hashlib.md5(data).hexdigest(),)
+                chunks.append(data)
+                offset += len(data)
+
+        aliases = {}
+        try:
+            with open(os.path.join(dbpath, "links.txt")) as f:
+                for line in f.read().splitlines():
+                    try:
+                        alias_from, alias_to = line.split("\t")
+                    except ValueError:
+                        continue
+                    if alias_to in zones and alias_from != alias_to:
+                        aliases[alias_from] = alias_to
+        except IOError:
+            pass
+
+        index = dumps({"stamp": stamp, "zones": zones, "aliases": aliases})
+        temppath = path + ".tmp"
+        with open(temppath, "wb") as f:
+            f.write(cls._header.pack(cls.MAGIC, len(index)))
+            f.write(index)
+            for data in chunks:
+                f.write(data)
+        os.rename(temppath, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Map a pack file. Raise if it is not a valid pack.
+
+        @rtype: L{TimezonePack}
+        """
+        with open(path, "rb") as f:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty file
+                raise TimezoneException("Invalid timezone pack: %s" % (path,))
+        try:
+            magic, length = cls._header.unpack_from(mapped)
+            if magic != cls.MAGIC:
+                raise TimezoneException("Invalid timezone pack: %s" % (path,))
+            dataStart = cls._header.size + length
+            index = loads(mapped[cls._header.size:dataStart])
+            return cls(path, index, mapped, dataStart)
+        except (struct.error, CacheFormatError, KeyError, TypeError) as e:
+            mapped.close()
+            raise TimezoneException("Invalid timezone pack: %s: %s" % (path, e,))
+        except TimezoneException:
+            mapped.close()
+            raise
+
+    def read(self, tzid):
+        """
+        Get the calendar text of a TZID. The text for an alias is that of the
+        TZID it links to, with the TZID replaced by the alias.
+
+        @return: the text, or C{None} if the TZID is not in the pack
+        @rtype: L{str}
+        """
+        if tzid not in self.zones and tzid in self.aliases:
+            target = self.aliases[tzid]
+            data = self.read(target)
+            for name in ("TZID", "X-LIC-LOCATION",):
+                data = data.replace(
+                    "\n{}:{}\r\n".format(name, target),
+                    "\n{}:{}\r\n".format(name, tzid),
+                )
+            return data
+
+        try:
+            offset, length, _ignore_md5 = self.zones[tzid]
+        except KeyError:
+            return None
+        start = self._dataStart + offset
+        return self._map[start:start + length]
+
+    def close(self):
+        self._map.close()
 
-# zoneinfo never changes in a running instance so cache all this data as we use it
-cachedTZs = {}
-cachedVTZs = {}
+
+# zoneinfo never changes in a running instance so cache all this data as we use it,
+# with the parsed data limited to the most recently used time zones (the limit is
+# set from the config when the cache is created)
+cachedTZs = LRUCache(500)
+cachedVTZs = LRUCache(500)
 cachedTZIDs = []
+cachedTransitions = {}
 
 
 def hasTZ(tzid):
@@ -192,7 +451,8 @@ def hasTZ(tzid):
 
     if isinstance(tzid, unicode):
         tzid = tzid.encode("utf-8")
-    if tzid not in cachedVTZs:
+    TimezoneCache.retryPack()
+    if tzid not in cachedVTZs and (TimezoneCache.pack is None or tzid not in TimezoneCache.pack):
         readVTZ(tzid)
     return True
 
@@ -204,8 +464,8 @@ def addVTZ(tzid, tzcal):
     if isinstance(tzid, unicode):
         tzid = tzid.encode("utf-8")
     if tzid not in cachedVTZs:
-        cachedVTZs[tzid] = tzcal
-        cachedTZs[tzid] = str(tzcal)
+        cachedVTZs.set(tzid, tzcal)
+        cachedTZs.set(tzid, str(tzcal))
 
 
 def readVTZ(tzid):
@@ -215,15 +475,24 @@ def readVTZ(tzid):
 
     if isinstance(tzid, unicode):
         tzid = tzid.encode("utf-8")
-    if tzid not in cachedVTZs:
+    tzcal = cachedVTZs.get(tzid)
+    if tzcal is None:
 
-        tzcal = TimezoneDatabase.getTimezoneInCalendar(tzid)
+        TimezoneCache.retryPack()
+
+        # Time zones that are not in the pack, such as ones only known from
+        # calendar data, are still looked up in the iCalendar library
+        data = TimezoneCache.pack.read(tzid) if TimezoneCache.pack is not None else None
+        if data is not None:
+            tzcal = Calendar.parseText(data)
+        else:
+            tzcal = TimezoneDatabase.getTimezoneInCalendar(tzid)
         if tzcal:
-            cachedVTZs[tzid] = tzcal
+            cachedVTZs.set(tzid, tzcal)
         else:
             raise TimezoneException("Unknown time zone: %s" % (tzid,))
 
-    return cachedVTZs[tzid]
+    return tzcal
 
 
 def readTZ(tzid):
@@ -233,15 +502,17 @@ def readTZ(tzid):
 
     if isinstance(tzid, unicode):
         tzid = tzid.encode("utf-8")
-    if tzid not in cachedTZs:
+    tzdata = cachedTZs.get(tzid)
+    if tzdata is None:
 
         tzcal = readVTZ(tzid)
         if tzcal:
-            cachedTZs[tzid] = str(tzcal)
+            tzdata = str(tzcal)
+            cachedTZs.set(tzid, tzdata)
         else:
             raise TimezoneException("Unknown time zone: %s" % (tzid,))
 
-    return cachedTZs[tzid]
+    return tzdata
 
 
 def listTZs(path=""):
@@ -249,8 +520,12 @@ def listTZs(path=""):
     List all timezones in the database.
     """
 
-    if not path and cachedTZIDs:
-        return cachedTZIDs
+    if not path:
+        TimezoneCache.retryPack()
+        if TimezoneCache.pack is not None:
+            return TimezoneCache.pack.tzids
+        if cachedTZIDs:
+            return cachedTZIDs
 
     result = []
     for item in os.listdir(os.path.join(TimezoneCache.getDBPath(), path)):
@@ -262,3 +537,149 @@ def listTZs(path=""):
     if not path:
         cachedTZIDs.extend(result)
     return result
+
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def localSeconds(dt):
+    """
+    The date and time of a L{DateTime}, ignoring its timezone, as seconds since
+    the epoch.
+    """
+    return (date(dt.mYear, dt.mMonth, dt.mDay).toordinal() - _EPOCH_ORDINAL) * 86400 + \
+        dt.mHours * 3600 + dt.mMinutes * 60 + dt.mSeconds
+
+
+class TransitionTable(object):
+    """
+    The UTC offsets of one TZID over a range of years, as a sorted array of the
+    local times at which each one takes effect, so that the offset of a local
+    date-time is found with a binary search instead of by walking the
+    VTIMEZONE observances.
+    """
+
+    __slots__ = ("tzid", "start", "end", "onsets", "offsets",)
+
+    def __init__(self, tzid, start, end, onsets, offsets):
+        """
+        @param start: start of the range, as local seconds since the epoch
+        @param end: end of the range, as local seconds since the epoch
+        @param onsets: sorted local times, as seconds since the epoch, at
+            which the UTC offset changes
+        @param offsets: UTC offsets in seconds, the first one in effect before
+            the first onset and each following one from the corresponding onset
+        """
+        self.tzid = tzid
+        self.start = start
+        self.end = end
+        self.onsets = onsets
+        self.offsets = offsets
+
+    @classmethod
+    def compile(cls, tzid, startYear, endYear):
+        """
+        Expand the observances of the specified TZID from the start of
+        C{startYear} to the start of C{endYear}. Raise if the TZID is unknown.
+
+        @return: the L{TransitionTable}, or C{None} if it does not give the same
+            offsets as the iCalendar library does
+        """
+        tzcal = readVTZ(tzid)
+        for vtz in tzcal.getComponents():
+            if vtz.getType() == "VTIMEZONE":
+                break
+        else:
+            raise TimezoneException("No VTIMEZONE for time zone: %s" % (tzid,))
+
+        start = DateTime(startYear, 1, 1)
+        end = DateTime(endYear, 1, 1)
+        transitions = sorted(
+            (localSeconds(tzstart), offsetfrom, offsetto,)
+            for tzstart, _ignore_utcstart, offsetfrom, offsetto in vtz.expandAll(start, end)
+        )
+        if transitions:
+            onsets = [onset for onset, _ignore_from, _ignore_to in transitions]
+            offsets = [transitions[0][1]] + [offsetto for _ignore_onset, _ignore_from, offsetto in transitions]
+        else:
+            start.setDateOnly(False)
+            onsets = []
+            offsets = [vtz.getTimezoneOffsetSeconds(start)]
+        table = cls(tzid, localSeconds(start), localSeconds(end), onsets, offsets)
+
+        # Check the table against the library either side of each transition,
+        # as that is what it must reproduce
+        tz = Timezone(tzid=tzid)
+        checks = [table.start] + [onset + delta for onset in onsets for delta in (-1, 0,)]
+        for check in checks:
+            if table.start <= check < table.end:
+                days, seconds = divmod(check, 86400)
+                day = date.fromordinal(_EPOCH_ORDINAL + days)
+                dt = DateTime(day.year, day.month, day.day, seconds / 3600, (seconds / 60) % 60, seconds % 60, tzid=tz)
+                if table.localOffset(localSeconds(dt)) != dt.timeZoneSecondsOffset():
+                    log.warn("Not using UTC offset transition table for time zone: {tzid}", tzid=tzid)
+                    return None
+
+        return table
+
+    def localOffset(self, seconds):
+        """
+        Get the UTC offset in effect at a local time.
+
+        @param seconds: the local time, as seconds since the epoch
+        @type seconds: L{int}
+        @return: the UTC offset in seconds, or C{None} if the time is outside
+            of the table
+        @rtype: L{int}
+        """
+        if self.start <= seconds < self.end:
+            return self.offsets[bisect_right(self.onsets, seconds)]
+        return None
+
+
+def transitionTable(tzid):
+    """
+    Get the L{TransitionTable} for the specified TZID, compiling it the first
+    time it is used. The table covers the years of the instance index window.
+
+    @return: the L{TransitionTable}, or C{None} if it cannot be used
+    """
+
+    if isinstance(tzid, unicode):
+        tzid = tzid.encode("utf-8")
+    try:
+        return cachedTransitions[tzid]
+    except KeyError:
+        pass
+
+    table = None
+    if config.TimezoneTransitions.Enabled:
+        today = date.today()
+        startYear = (today - timedelta(days=config.FreeBusyIndexLowerLimitDays)).year - 1
+        endYear = (today + timedelta(days=config.FreeBusyIndexExpandMaxDays)).year + 2
+        try:
+            table = TransitionTable.compile(tzid, startYear, endYear)
+        except TimezoneException:
+            pass
+    cachedTransitions[tzid] = table
+    return table
+
+
+def adjustToUTC(dt):
+    """
+    Adjust a L{DateTime} to UTC in place, as L{DateTime.adjustToUTC} does,
+    using the L{TransitionTable} of its TZID when it covers the date-time.
+
+    @return: C{dt}
+    """
+    if not dt.mDateOnly and not dt.mTZUTC and isinstance(dt.mTZID, basestring):
+        table = transitionTable(dt.mTZID)
+        if table is not None:
+            offset = table.localOffset(localSeconds(dt))
+            if offset is not None:
+                dt.offsetSeconds(-offset)
+                dt.setTimezone(Timezone.UTCTimezone)
+                return dt
+
+    dt.adjustToUTC()
+    return dt
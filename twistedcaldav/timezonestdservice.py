@@ -32,8 +32,7 @@ from txweb2.dav.noneprops import NonePropertyStore
 from txweb2.dav.util import joinURL
 from txweb2.http import HTTPError, JSONResponse, StatusResponse
 from txweb2.http import Response
-from txweb2.http_headers import MimeType
-from txweb2.stream import MemoryStream
+from txweb2.http_headers import ETag, MimeType
 from txdav.xml import element as davxml
 
 from twisted.internet.defer import succeed, inlineCallbacks, returnValue, \
@@ -45,6 +44,7 @@ from twistedcaldav.config import config
 from twistedcaldav.extensions import DAVResource, \
     DAVResourceWithoutChildrenMixin
 from twistedcaldav.ical import tzexpandlocal
+from twistedcaldav.lrucache import LRUCache
 from twistedcaldav.resource import ReadOnlyNoCopyResourceMixIn
 from twistedcaldav.timezones import TimezoneException, TimezoneCache, readVTZ, \
     addVTZ
@@ -55,6 +55,7 @@ from pycalendar.icalendar.calendar import Calendar
 from pycalendar.datetime import DateTime
 from pycalendar.exceptions import InvalidData
 
+from bisect import bisect_left, bisect_right
 import hashlib
 import itertools
 import json
@@ -80,7 +81,8 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
         DAVResource.__init__(self, principalCollections=parent.principalCollections())
 
         self.parent = parent
-        self.expandcache = {}
+        self.responses = LRUCache(config.TimezoneService.ResponseCacheSize)
+        self.responsesGeneration = None
         self.primary = True
         self.info_source = None
 
@@ -186,6 +188,54 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
 
     http_PROPFIND = http_PROPFIND
 
+    def cachedResponse(self, key, generate):
+        """
+        Return a response whose body is generated once and then cached until the
+        timezone database changes. Responses carry a strong ETag of their body,
+        so that conditional requests are answered with 304 (Not Modified) by the
+        server's precondition filter.
+
+        @param key: identifies the response among all those of the service
+        @type key: L{tuple}
+        @param generate: a callable returning the L{MimeType} and the L{str}
+            body of the response, or raising L{HTTPError}, in which case nothing
+            is cached
+        @type generate: callable
+
+        @rtype: L{Response}
+        """
+        if self.responsesGeneration != self.timezones.generation:
+            self.responses.clear()
+            self.responsesGeneration = self.timezones.generation
+
+            # Every client starts with the full list, so have it ready
+            self.responses.set(("list", None,), self._generateList(None))
+
+        cached = self.responses.get(key)
+        if cached is None:
+            cached = generate()
+            self.responses.set(key, cached)
+        contentType, body, etag = cached
+
+        response = Response(responsecode.OK, stream=body)
+        response.headers.setHeader("content-type", contentType)
+        response.headers.setHeader("etag", etag)
+        return response
+
+    def jsonBody(self, result):
+        """
+        Generate a cacheable JSON response body.
+
+        @return: the L{MimeType}, body and L{ETag} of the response
+        @rtype: L{tuple}
+        """
+        kwargs = {}
+        if config.TimezoneService.PrettyPrintJSON:
+            kwargs["indent"] = 2
+            kwargs["separators"] = (',', ':')
+        body = json.dumps(result, **kwargs)
+        return (MimeType("application", "json"), body, ETag(hashlib.md5(body).hexdigest()),)
+
     def problemReport(self, code, description, status):
         raise HTTPError(JSONResponse(
             status,
@@ -341,7 +391,12 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
                 self.problemReport("invalid-changedsince", "Invalid changedsince request-URI query parameter value", responsecode.BAD_REQUEST)
             if not dt.utc():
                 self.problemReport("invalid-changedsince", "Invalid changedsince request-URI query parameter value - not UTC", responsecode.BAD_REQUEST)
+        else:
+            changedsince = None
 
+        return self.cachedResponse(("list", changedsince,), lambda: self._generateList(changedsince))
+
+    def _generateList(self, changedsince):
         timezones = []
         for tz in self.timezones.listTimezones(changedsince):
             timezones.append({
@@ -353,7 +408,7 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
             "dtstamp": self.timezones.dtstamp,
             "timezones": timezones,
         }
-        return JSONResponse(responsecode.OK, result, pretty=config.TimezoneService.PrettyPrintJSON)
+        return self.jsonBody(result)
 
     def actionGet(self, request, tzid):
         """
@@ -367,16 +422,19 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
         if accepted_type is None:
             self.problemReport("invalid-format", "Accept header does not match available media types", responsecode.NOT_ACCEPTABLE)
 
-        calendar = self.timezones.getTimezone(tzid)
-        if calendar is None:
-            self.problemReport("tzid-not-found", "Time zone identifier not found", responsecode.NOT_FOUND)
+        def _generate():
+            calendar = self.timezones.getTimezone(tzid)
+            if calendar is None:
+                self.problemReport("tzid-not-found", "Time zone identifier not found", responsecode.NOT_FOUND)
 
-        tzdata = calendar.getText(format=accepted_type if accepted_type != "text/plain" else None)
+            tzdata = calendar.getText(format=accepted_type if accepted_type != "text/plain" else None)
+            return (
+                MimeType.fromString("%s; charset=utf-8" % (accepted_type,)),
+                tzdata,
+                ETag(hashlib.md5(tzdata).hexdigest()),
+            )
 
-        response = Response()
-        response.stream = MemoryStream(tzdata)
-        response.headers.setHeader("content-type", MimeType.fromString("%s; charset=utf-8" % (accepted_type,)))
-        return response
+        return self.cachedResponse(("get", tzid, accepted_type,), _generate)
 
     def actionExpand(self, request, tzid):
         """
@@ -387,6 +445,9 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
             self.problemReport("invalid-action", "Invalid request-URI query parameters", responsecode.BAD_REQUEST)
 
         start = request.args.get("start", ())
+        end = request.args.get("end", ())
+        key = ("expand", tzid, tuple(start), tuple(end),)
+
         if len(start) == 0:
             self.problemReport("invalid-start", "Missing start request-URI query parameter", responsecode.BAD_REQUEST)
         if len(start) > 1:
@@ -399,7 +460,6 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
             except ValueError:
                 self.problemReport("invalid-start", "Invalid start request-URI query parameter value", responsecode.BAD_REQUEST)
 
-        end = request.args.get("end", ())
         if len(end) == 0:
             self.problemReport("invalid-end", "Missing end request-URI query parameter", responsecode.BAD_REQUEST)
         if len(end) > 1:
@@ -414,30 +474,29 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
             if end <= start:
                 self.problemReport("invalid-end", "Invalid end request-URI query parameter value - earlier than start", responsecode.BAD_REQUEST)
 
-        tzdata = self.timezones.getTimezone(tzid)
-        if tzdata is None:
-            self.problemReport("tzid-not-found", "Time zone identifier not found", responsecode.NOT_FOUND)
+        def _generate():
+            tzdata = self.timezones.getTimezone(tzid)
+            if tzdata is None:
+                self.problemReport("tzid-not-found", "Time zone identifier not found", responsecode.NOT_FOUND)
 
-        # Now do the expansion (but use a cache to avoid re-calculating TZs)
-        observances = self.expandcache.get((tzid, start, end), None)
-        if observances is None:
             observances = tzexpandlocal(tzdata, start, end, utc_onset=True)
-            self.expandcache[(tzid, start, end)] = observances
 
-        # Turn into JSON
-        result = {
-            "dtstamp": self.timezones.dtstamp,
-            "tzid": tzid,
-            "observances": [
-                {
-                    "name": name,
-                    "onset": onset.getXMLText(),
-                    "utc-offset-from": utc_offset_from,
-                    "utc-offset-to": utc_offset_to,
-                } for onset, utc_offset_from, utc_offset_to, name in observances
-            ],
-        }
-        return JSONResponse(responsecode.OK, result, pretty=config.TimezoneService.PrettyPrintJSON)
+            # Turn into JSON
+            result = {
+                "dtstamp": self.timezones.dtstamp,
+                "tzid": tzid,
+                "observances": [
+                    {
+                        "name": name,
+                        "onset": onset.getXMLText(),
+                        "utc-offset-from": utc_offset_from,
+                        "utc-offset-to": utc_offset_to,
+                    } for onset, utc_offset_from, utc_offset_to, name in observances
+                ],
+            }
+            return self.jsonBody(result)
+
+        return self.cachedResponse(key, _generate)
 
     def actionFind(self, request):
         """
@@ -454,57 +513,41 @@ class TimezoneStdServiceResource (ReadOnlyNoCopyResourceMixIn, DAVResourceWithou
             self.problemReport("invalid-pattern", "Too many pattern request-URI query parameters", responsecode.BAD_REQUEST)
         pattern = pattern[0]
 
-        def _comp_is(pattern, s):
-            return pattern == s
-
-        def _comp_startswith(pattern, s):
-            return s.startswith(pattern)
-
-        def _comp_endswith(pattern, s):
-            return s.endswith(pattern)
-
-        def _comp_contains(pattern, s):
-            return pattern in s
-
-        def _normalize(s):
-            return s.replace("_", " ").lower()
-
+        index = self.timezones.nameIndex
         if pattern.startswith("*") and pattern.endswith("*"):
-            pattern = pattern[1:-1]
-            comparator = _comp_contains
+            match = index.matchContains
+            name = pattern[1:-1]
         elif pattern.endswith("*"):
-            pattern = pattern[:-1]
-            comparator = _comp_startswith
+            match = index.matchStartswith
+            name = pattern[:-1]
         elif pattern.startswith("*"):
-            pattern = pattern[1:]
-            comparator = _comp_endswith
+            match = index.matchEndswith
+            name = pattern[1:]
         else:
-            comparator = _comp_is
-        pattern = _normalize(pattern)
+            match = index.matchIs
+            name = pattern
+        name = TimezoneNameIndex.normalize(name)
 
-        if not pattern:
+        if not name:
             self.problemReport("invalid-pattern", "Invalid pattern request-URI query parameter value", responsecode.BAD_REQUEST)
 
-        timezones = []
-        for tz in self.timezones.listTimezones(None):
-            matched = comparator(pattern, _normalize(tz.tzid))
-            if not matched:
-                for alias in tz.aliases:
-                    if comparator(pattern, _normalize(alias)):
-                        matched = True
-                        break
-            if matched:
+        def _generate():
+            timezones = []
+            for tzid in sorted(match(name)):
+                tz = self.timezones.timezones[tzid]
                 timezones.append({
                     "tzid": tz.tzid,
                     "last-modified": tz.dtstamp,
                     "aliases": tz.aliases,
                 })
 
-        result = {
-            "dtstamp": self.timezones.dtstamp,
-            "timezones": timezones,
-        }
-        return JSONResponse(responsecode.OK, result, pretty=config.TimezoneService.PrettyPrintJSON)
+            result = {
+                "dtstamp": self.timezones.dtstamp,
+                "timezones": timezones,
+            }
+            return self.jsonBody(result)
+
+        return self.cachedResponse(("find", pattern,), _generate)
 
 
 class TimezoneInfo(object):
@@ -543,9 +586,107 @@ class TimezoneInfo(object):
         xmlutil.addSubElement(node, "md5", self.md5)
 
 
+class TimezoneNameIndex(object):
+    """
+    An index of the normalized TZIDs and aliases of a set of timezones, used to
+    match the patterns of the find action without normalizing and comparing
+    every name on each request.
+    """
+
+    def __init__(self, timezones):
+        """
+        @param timezones: the timezones to index
+        @type timezones: iterable of L{TimezoneInfo}
+        """
+        self.names = {}
+        for tzinfo in timezones:
+            for name in (tzinfo.tzid,) + tuple(tzinfo.aliases):
+                self.names.setdefault(self.normalize(name), set()).add(tzinfo.tzid)
+
+        # Sorted names for prefix matches, sorted reversed names for suffix
+        # matches, and all the names joined together for substring matches
+        self.sortedNames = sorted(self.names)
+        self.reversedNames = sorted((name[::-1], name,) for name in self.names)
+        self.starts = []
+        offset = 0
+        for name in self.sortedNames:
+            self.starts.append(offset)
+            offset += len(name) + 1
+        self.joinedNames = "\n".join(self.sortedNames)
+
+    @staticmethod
+    def normalize(name):
+        return name.replace("_", " ").lower()
+
+    def _tzids(self, names):
+        tzids = set()
+        for name in names:
+            tzids.update(self.names[name])
+        return tzids
+
+    def matchIs(self, name):
+        """
+        @return: the TZIDs of the timezones with the normalized name
+        @rtype: L{set}
+        """
+        return set(self.names.get(name, ()))
+
+    def matchStartswith(self, prefix):
+        """
+        @return: the TZIDs of the timezones with a name starting with the
+            normalized prefix
+        @rtype: L{set}
+        """
+        names = []
+        for name in itertools.islice(self.sortedNames, bisect_left(self.sortedNames, prefix), None):
+            if not name.startswith(prefix):
+                break
+            names.append(name)
+        return self._tzids(names)
+
+    def matchEndswith(self, suffix):
+        """
+        @return: the TZIDs of the timezones with a name ending with the
+            normalized suffix
+        @rtype: L{set}
+        """
+        reversedSuffix = suffix[::-1]
+        names = []
+        for reversedName, name in itertools.islice(self.reversedNames, bisect_left(self.reversedNames, (reversedSuffix,)), None):
+            if not reversedName.startswith(reversedSuffix):
+                break
+            names.append(name)
+        return self._tzids(names)
+
+    def matchContains(self, substring):
+        """
+        @return: the TZIDs of the timezones with a name containing the
+            normalized substring
+        @rtype: L{set}
+        """
+        if "\n" in substring:
+            return set()
+        names = []
+        pos = self.joinedNames.find(substring)
+        while pos != -1:
+            # Record the name the match is in and carry on from the next one
+            index = bisect_right(self.starts, pos) - 1
+            names.append(self.sortedNames[index])
+            if index + 1 == len(self.starts):
+                break
+            pos = self.joinedNames.find(substring, self.starts[index + 1])
+        return self._tzids(names)
+
+
 class CommonTimezoneDatabase(object):
     """
     Maintains the database of timezones read from an XML file.
+
+    @ivar generation: incremented whenever the timezones change, so that
+        responses generated from them can be discarded
+    @type generation: L{int}
+    @ivar nameIndex: the names of the timezones, for the find action
+    @type nameIndex: L{TimezoneNameIndex}
     """
 
     def __init__(self, basepath, xmlfile):
@@ -554,6 +695,8 @@ class CommonTimezoneDatabase(object):
         self.dtstamp = None
         self.timezones = {}
         self.aliases = {}
+        self.generation = 0
+        self.nameIndex = TimezoneNameIndex(())
 
     def onStartup(self):
         return succeed(None)
@@ -571,6 +714,15 @@ class CommonTimezoneDatabase(object):
                     self.timezones[tz.tzid] = tz
                     for alias in tz.aliases:
                         self.aliases[alias] = tz.tzid
+        self._databaseChanged()
+
+    def _databaseChanged(self):
+        """
+        Rebuild the name index and invalidate generated responses after the
+        timezones have changed.
+        """
+        self.nameIndex = TimezoneNameIndex(self.listTimezones(None))
+        self.generation += 1
 
     def listTimezones(self, changedsince):
         """
@@ -652,6 +804,7 @@ class PrimaryTimezoneDatabase(CommonTimezoneDatabase):
         self.dtstamp = DateTime.getNowUTC().getXMLText()
         self._scanTZs("")
         self._dumpTZs()
+        self._databaseChanged()
 
     def _scanTZs(self, path, checkIfChanged=False):
         # Read in all timezone files first
@@ -710,6 +863,7 @@ class PrimaryTimezoneDatabase(CommonTimezoneDatabase):
         self._scanTZs("", checkIfChanged=True)
         if self.changeCount:
             self._dumpTZs()
+        self._databaseChanged()
 
 
 class SecondaryTimezoneDatabase(CommonTimezoneDatabase):
@@ -775,6 +929,7 @@ class SecondaryTimezoneDatabase(CommonTimezoneDatabase):
         self.dtstamp = newdtstamp
         self._dumpTZs()
         self._buildAliases()
+        self._databaseChanged()
 
         log.debug("Sync with secondary server complete")
 
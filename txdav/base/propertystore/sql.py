@@ -24,6 +24,7 @@ __all__ = [
 ]
 
 
+from twistedcaldav import cacheformat
 from twistedcaldav.memcacher import Memcacher
 
 from twext.enterprise.dal.syntax import (
@@ -49,7 +50,7 @@ class PropertyStore(AbstractPropertyStore):
     the tracking entry to completely invalidate all the per-resource/per-user pairs.
     """
 
-    _cacher = Memcacher("SQL.props", pickle=True, key_normalization=False)
+    _cacher = Memcacher("SQL.props", pickle=True, key_normalization=False, serializer=cacheformat)
 
     def __init__(self, *a, **kw):
         raise NotImplementedError(
@@ -62,63 +63,81 @@ class PropertyStore(AbstractPropertyStore):
         Where=prop.RESOURCE_ID == Parameter("resourceID")
     )
 
-    _allWithIDViewer = Select(
-        [prop.NAME, prop.VALUE],
-        From=prop,
-        Where=(prop.RESOURCE_ID == Parameter("resourceID")).And
-              (prop.VIEWER_UID == Parameter("viewerID"))
-    )
+    @classmethod
+    def _allWithIDViewersQuery(cls, viewerIDs):
+        return Select(
+            [prop.NAME, prop.VIEWER_UID, prop.VALUE],
+            From=prop,
+            Where=(prop.RESOURCE_ID == Parameter("resourceID")).And
+                  (prop.VIEWER_UID.In(Parameter("viewerIDs", len(viewerIDs))))
+        )
 
     def _cacheToken(self, userid):
         return "{0!s}/{1}".format(self._resourceID, userid)
 
+    def _viewerUIDs(self):
+        """
+        The distinct users whose properties this store exposes: the owner
+        first, then the sharee and proxy if different.
+
+        @rtype: L{list} of L{str}
+        """
+        uids = [self._defaultUser]
+        for uid in (self._perUser, self._proxyUser,):
+            if uid not in uids:
+                uids.append(uid)
+        return uids
+
     @inlineCallbacks
     def _refresh(self, txn):
         """
         Load, or re-load, this object with the given transaction; first from
         memcache, then pulling from the database again.
+
+        The valid-users entry and the properties of every user are fetched
+        from memcache in a single request, and the properties of any users
+        missing from memcache are loaded with a single query.
         """
-        # Cache existing properties in this object
-        # Look for memcache entry first
+        uids = self._viewerUIDs()
 
-        @inlineCallbacks
-        def _cache_user_props(uid):
+        # Look for memcache entries first
+        userRows = {}
+        if self._cacher is not None:
+            tokens = dict([(self._cacheToken(uid), uid,) for uid in uids])
+            cached = yield self._cacher.getMulti([str(self._resourceID)] + tokens.keys())
+            valid_cached_users = cached.pop(str(self._resourceID))
+            if valid_cached_users is None:
+                valid_cached_users = set()
+
+            # Only use cached user data that is marked as valid
+            for token, rows in cached.iteritems():
+                if rows is not None and tokens[token] in valid_cached_users:
+                    userRows[tokens[token]] = rows
+
+        # Fetch any users with no cached data from the SQL DB and cache them
+        missing = [uid for uid in uids if uid not in userRows]
+        if missing:
+            for uid in missing:
+                userRows[uid] = []
+            rows = yield self._allWithIDViewersQuery(missing).on(
+                txn,
+                resourceID=self._resourceID,
+                viewerIDs=missing,
+            )
+            for name, uid, value in rows:
+                userRows[uid].append((name, value,))
 
-            # First check whether uid already has a valid cached entry
-            rows = None
             if self._cacher is not None:
-                valid_cached_users = yield self._cacher.get(str(self._resourceID))
-                if valid_cached_users is None:
-                    valid_cached_users = set()
-
-                # Fetch cached user data if valid and present
-                if uid in valid_cached_users:
-                    rows = yield self._cacher.get(self._cacheToken(uid))
-
-            # If no cached data, fetch from SQL DB and cache
-            if rows is None:
-                rows = yield self._allWithIDViewer.on(
-                    txn,
-                    resourceID=self._resourceID,
-                    viewerID=uid,
-                )
-                if self._cacher is not None:
-                    yield self._cacher.set(self._cacheToken(uid), rows if rows is not None else ())
-
-                    # Mark this uid as valid
-                    valid_cached_users.add(uid)
-                    yield self._cacher.set(str(self._resourceID), valid_cached_users)
+                # Mark these uids as valid
+                valid_cached_users.update(missing)
+                values = dict([(self._cacheToken(uid), userRows[uid],) for uid in missing])
+                values[str(self._resourceID)] = valid_cached_users
+                yield self._cacher.setMulti(values)
 
+        for uid, rows in userRows.iteritems():
             for name, value in rows:
                 self._cached[(name, uid)] = value
 
-        # Cache for the owner first, then the sharee if different
-        yield _cache_user_props(self._defaultUser)
-        if self._perUser != self._defaultUser:
-            yield _cache_user_props(self._perUser)
-        if self._proxyUser != self._perUser:
-            yield _cache_user_props(self._proxyUser)
-
     @classmethod
     @inlineCallbacks
     def load(cls, defaultuser, shareUser, proxyUser, txn, resourceID, created=False, notifyCallback=None):
@@ -167,17 +186,28 @@ class PropertyStore(AbstractPropertyStore):
         @return: a L{Deferred} that fires with a C{dict} mapping resource ID (a
             value taken from C{childColumn}) to a L{PropertyStore} for that ID.
         """
+        # Only load the properties of the users the stores will expose. The
+        # viewer restriction is part of the join condition so that resources
+        # with no properties for those users still get a store.
+        template = cls.__new__(cls)
+        super(PropertyStore, template).__init__(defaultUser, shareeUser, proxyUser)
+        viewerIDs = template._viewerUIDs()
+
         childTable = TableSyntax(childColumn.model.table)
         query = Select([
             childColumn,
             # XXX is that column necessary?  as per the 'on' clause it has to be
             # the same as prop.RESOURCE_ID anyway.
             prop.RESOURCE_ID, prop.NAME, prop.VIEWER_UID, prop.VALUE],
-            From=prop.join(childTable, prop.RESOURCE_ID == childColumn,
-                           'right'),
+            From=prop.join(
+                childTable,
+                (prop.RESOURCE_ID == childColumn).And(
+                    prop.VIEWER_UID.In(Parameter("viewerIDs", len(viewerIDs)))),
+                'right'
+            ),
             Where=parentColumn == parentID
         )
-        rows = yield query.on(txn)
+        rows = yield query.on(txn, viewerIDs=viewerIDs)
         stores = cls._createMultipleStores(defaultUser, shareeUser, proxyUser, txn, rows)
         returnValue(stores)
 
@@ -325,5 +325,65 @@ class PropertyStoreTest(PropertyStoreTest):
         self.assertEqual(store1_user1[pname1], pvalue1)
 
 
+    @inlineCallbacks
+    def test_refreshBatched(self):
+        """
+        Loading a store for the owner, sharee and proxy gets the cached
+        properties of all three users with a single memcache request, and loads
+        the properties of any users that are not cached with a single query.
+        """
+        pname = propertyName("dummy1")
+        store = yield PropertyStore.load("user01", "user02", "user04", self._txn, 10)
+        for uid, value in (("user01", "a"), ("user02", "b"), ("user04", "c"),):
+            yield store._setitem_uid(pname, propertyValue(value), uid)
+        yield self._txn.commit()
+
+        getMultis = []
+        queries = []
+        cacher = PropertyStore._cacher
+        self.patch(cacher, "get", lambda key: self.fail("Unexpected get of {}".format(key)))
+
+        def getMulti(keys, _getMulti=cacher.getMulti):
+            getMultis.append(sorted(keys))
+            return _getMulti(keys)
+        self.patch(cacher, "getMulti", getMulti)
+
+        def _allWithIDViewersQuery(viewerIDs, _query=PropertyStore._allWithIDViewersQuery):
+            queries.append(list(viewerIDs))
+            return _query(viewerIDs)
+        self.patch(PropertyStore, "_allWithIDViewersQuery", staticmethod(_allWithIDViewersQuery))
+
+        @inlineCallbacks
+        def check():
+            self._txn = self.store.newTransaction()
+            store = yield PropertyStore.load("user01", "user02", "user04", self._txn, 10)
+            self.assertEqual(store._getitem_uid(pname, "user01"), propertyValue("a"))
+            self.assertEqual(store._getitem_uid(pname, "user02"), propertyValue("b"))
+            self.assertEqual(store._getitem_uid(pname, "user04"), propertyValue("c"))
+            yield self._txn.commit()
+
+        # Nothing cached yet
+        cacher.deleteMulti(["10", "10/user01", "10/user02", "10/user04"])
+        yield check()
+        self.assertEqual(getMultis, [["10", "10/user01", "10/user02", "10/user04"]])
+        self.assertEqual(queries, [["user01", "user02", "user04"]])
+
+        # All cached
+        del getMultis[:]
+        del queries[:]
+        yield check()
+        self.assertEqual(len(getMultis), 1)
+        self.assertEqual(queries, [])
+
+        # Only the sharee's properties are not cached
+        del getMultis[:]
+        cacher.delete("10/user02")
+        yield check()
+        self.assertEqual(len(getMultis), 1)
+        self.assertEqual(queries, [["user02"]])
+
+        self._txn = self.store.newTransaction()
+
+
 if PropertyStore is None:
     PropertyStoreTest.skip = importErrorMessage
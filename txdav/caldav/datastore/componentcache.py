@@ -0,0 +1,121 @@
+# -*- test-case-name: txdav.caldav.datastore.test.test_componentcache -*-
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+A per-process cache of parsed and validated calendar object data.
+"""
+
+from twistedcaldav.lrucache import LRUCache
+from twistedcaldav.stdconfig import config
+
+__all__ = [
+    "ComponentCache",
+    "componentCache",
+]
+
+
+class ComponentCache(object):
+    """
+    A cache of the L{Component}s parsed and validated from the stored
+    iCalendar data of calendar objects. Entries are keyed by the resource ID of
+    the calendar object and the MD5 of its data, so an entry never needs to be
+    invalidated - a change to the data changes its MD5, and entries for old
+    data are evicted as they become least recently used.
+
+    Callers of L{get} are free to change the components they are given, as
+    they are copies of the cached components, and L{set} caches a copy of the
+    component so that later changes to it by the caller are not cached.
+    """
+
+    def __init__(self, maxEntries, maxBytes=0):
+        """
+        @param maxEntries: the maximum number of components to hold
+        @type maxEntries: L{int}
+        @param maxBytes: the maximum total size of the iCalendar data of the
+            components to hold, or zero for no limit
+        @type maxBytes: L{int}
+        """
+        self._cache = LRUCache(
+            maxEntries,
+            maxBytes=maxBytes,
+            sizeOf=lambda key, value: value[1],
+        )
+
+    def get(self, resourceID, md5):
+        """
+        Get a copy of the component for a calendar object's data.
+
+        @param resourceID: the resource ID of the calendar object
+        @type resourceID: L{int}
+        @param md5: the MD5 of the calendar object's data
+        @type md5: L{str}
+
+        @return: the component, or C{None} if not cached
+        @rtype: L{Component}
+        """
+        entry = self._cache.get((resourceID, md5,))
+        return entry[0].duplicate() if entry is not None else None
+
+    def set(self, resourceID, md5, component, size):
+        """
+        Cache a copy of the component for a calendar object's data.
+
+        @param resourceID: the resource ID of the calendar object
+        @type resourceID: L{int}
+        @param md5: the MD5 of the calendar object's data
+        @type md5: L{str}
+        @param component: the parsed and validated data
+        @type component: L{Component}
+        @param size: the length of the iCalendar data
+        @type size: L{int}
+        """
+        self._cache.set((resourceID, md5,), (component.duplicate(), size,))
+
+    def clear(self):
+        """
+        Remove all components.
+        """
+        self._cache.clear()
+
+    def stats(self):
+        """
+        Return the cache statistics.
+
+        @rtype: L{dict}
+        """
+        return self._cache.stats()
+
+
+_componentCache = None
+
+
+def componentCache():
+    """
+    Get this process' L{ComponentCache}, creating it on first use.
+
+    @return: the cache, or C{None} if it is disabled
+    @rtype: L{ComponentCache}
+    """
+    global _componentCache
+    if not config.ComponentCache.Enabled:
+        return None
+    if _componentCache is None:
+        _componentCache = ComponentCache(
+            config.ComponentCache.MaxEntries,
+            maxBytes=config.ComponentCache.MaxBytes,
+        )
+    return _componentCache
@@ -0,0 +1,193 @@
+# -*- test-case-name: txdav.caldav.datastore.test.test_expansioncache -*-
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+A memcached cache of the recurrence expansions of calendar object data,
+shared by all the processes using the same memcached.
+"""
+
+from twext.python.log import Logger
+from twisted.internet.defer import inlineCallbacks, returnValue
+
+from twistedcaldav import cacheformat
+from twistedcaldav.memcacher import Memcacher
+from twistedcaldav.stdconfig import config
+from twistedcaldav.timezones import TimezoneCache
+
+__all__ = [
+    "EXPANSION_LOAD_BATCH",
+    "ExpansionCacheEntry",
+    "bindExpansionCache",
+    "loadExpansionCaches",
+]
+
+log = Logger()
+
+# The number of resources whose entries are read with one request when
+# scanning a collection
+EXPANSION_LOAD_BATCH = 50
+
+_cacher = None
+
+
+def _expansionCacher():
+    global _cacher
+    if _cacher is None:
+        _cacher = Memcacher(
+            "ExpansionCache",
+            pickle=True,
+            no_invalidation=True,
+            serializer=cacheformat,
+        )
+    return _cacher
+
+
+class ExpansionCacheEntry(object):
+    """
+    The cached expansions of one calendar object's data, as seen by one user.
+    Entries are keyed by the resource ID of the calendar object, the MD5 of
+    its data, the user and the version of the timezone database, so an entry
+    never needs to be invalidated - a change to the data changes its MD5, and
+    a timezone database update, which can move instances, changes the version.
+
+    Each entry holds the L{twistedcaldav.instance.InstanceList.serialize}
+    data of the most recent C{MaxRanges} expansion ranges. An entry is bound
+    to a component without reading memcached, and is only read by
+    L{loadExpansionCaches} on the paths that expand. Until then it neither
+    returns nor adds expansions. Adding an expansion writes the whole entry
+    back to memcached without waiting for it.
+    """
+
+    def __init__(self, cacher, key):
+        """
+        @param cacher: the memcached client
+        @type cacher: L{Memcacher}
+        @param key: the memcached key of the entry
+        @type key: L{str}
+        """
+        self._cacher = cacher
+        self._key = key
+        self._ranges = None
+
+    def loaded(self):
+        """
+        Whether the entry has been read from memcached.
+
+        @rtype: L{bool}
+        """
+        return self._ranges is not None
+
+    def load(self, ranges):
+        """
+        Set the cached ranges read from memcached.
+
+        @param ranges: the cached C{(rangeKey, data)} pairs, most recent last
+        @type ranges: L{list}
+        """
+        self._ranges = ranges
+
+    def get(self, rangeKey):
+        """
+        Get the expansion data for a range.
+
+        @param rangeKey: the range, as made by L{Component.expandTimeRanges}
+        @type rangeKey: L{str}
+
+        @return: the expansion data, or C{None} if not cached
+        @rtype: L{tuple}
+        """
+        for key, data in self._ranges or ():
+            if key == rangeKey:
+                return data
+        return None
+
+    def set(self, rangeKey, data):
+        """
+        Add the expansion data for a range, replacing the least recently added
+        range if the entry is full. Nothing is added to an entry that was not
+        loaded, as that would drop the ranges already cached.
+
+        @param rangeKey: the range, as made by L{Component.expandTimeRanges}
+        @type rangeKey: L{str}
+        @param data: the expansion data
+        @type data: L{tuple}
+        """
+        if self._ranges is None:
+            return
+
+        self._ranges = [(key, value) for key, value in self._ranges if key != rangeKey]
+        self._ranges.append((rangeKey, data,))
+        del self._ranges[:-config.ExpansionCache.MaxRanges]
+
+        d = self._cacher.set(self._key, tuple(self._ranges))
+        d.addErrback(lambda f: log.error(
+            "Failed to cache expansions for {key}: {ex}", key=self._key, ex=f.value,
+        ))
+
+
+def bindExpansionCache(component, resourceID, md5, user=""):
+    """
+    Share the recurrence expansions of a calendar object's data with other
+    requests, via L{Component.setExpansionCache}. Non-recurring data is not
+    worth caching, so is left alone. Memcached is not read until
+    L{loadExpansionCaches} is called for the component.
+
+    @param component: the calendar object's data, unchanged since it was read
+    @type component: L{Component}
+    @param resourceID: the resource ID of the calendar object
+    @type resourceID: L{int}
+    @param md5: the MD5 of the calendar object's data
+    @type md5: L{str}
+    @param user: the user the data was filtered for, or an empty string for
+        the unfiltered data
+    @type user: L{str}
+    """
+    if not config.ExpansionCache.Enabled or not component.isRecurring():
+        return
+
+    key = "{}:{}:{}:{}".format(resourceID, md5, user, TimezoneCache.version)
+    component.setExpansionCache(ExpansionCacheEntry(_expansionCacher(), key))
+
+
+@inlineCallbacks
+def loadExpansionCaches(components):
+    """
+    Read the cached expansions bound to several components with one memcached
+    request, before expanding them.
+
+    @param components: the components about to be expanded; those without
+        an unloaded L{ExpansionCacheEntry} are ignored
+    @type components: iterable of L{Component}
+    """
+    entries = {}
+    for component in components:
+        entry = component.expansionCache() if component is not None else None
+        if isinstance(entry, ExpansionCacheEntry) and not entry.loaded():
+            entries.setdefault(entry._key, []).append(entry)
+    if not entries:
+        returnValue(None)
+
+    try:
+        results = yield _expansionCacher().getMulti(entries.keys())
+    except Exception as e:
+        log.error("Failed to get cached expansions: {ex}", ex=e)
+        returnValue(None)
+
+    for key, keyEntries in entries.items():
+        ranges = results.get(key)
+        for entry in keyEntries:
+            entry.load(list(ranges) if ranges else [])
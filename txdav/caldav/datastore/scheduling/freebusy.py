@@ -32,7 +32,9 @@ from twistedcaldav.dateops import compareDateTime, normalizeToUTC, \
 from twistedcaldav.ical import Component, Property, iCalendarProductID
 from twistedcaldav.instance import InstanceList
 from twistedcaldav.memcacher import Memcacher
+from twistedcaldav.timezones import adjustToUTC
 
+from txdav.caldav.datastore.expansioncache import loadExpansionCaches
 from txdav.caldav.datastore.query.filter import Filter
 from txdav.caldav.icalendarstore import QueryMaxResources
 from txdav.caldav.datastore.scheduling.cuaddress import LocalCalendarUser
@@ -400,12 +402,24 @@ class FreebusyQuery(object):
         for calid, result in results.items():
             calresource = calidmap[calid]
             aggregated_resources, tzinfo, filter = result
+
+            # Read the data of the resources that have to be matched against
+            # the filter, and then the expansions of it shared by other
+            # requests with a single memcached request
+            children = {}
+            for key in aggregated_resources.iterkeys():
+                if not self._useFreeBusyType(aggregated_resources, key):
+                    child = (yield calresource.calendarObjectWithName(key[0]))
+                    calendar = (yield child.componentForUser())
+                    children[key] = (child, calendar,)
+            yield loadExpansionCaches([calendar for _ignore_child, calendar in children.values()])
+
             for key in aggregated_resources.iterkeys():
 
                 name, uid, comptype, test_organizer = key
 
                 # Short-cut - if an fbtype exists we can use that
-                if comptype == "VEVENT" and aggregated_resources[key][0][3] != '?':
+                if self._useFreeBusyType(aggregated_resources, key):
 
                     matchedResource = False
 
@@ -415,9 +429,13 @@ class FreebusyQuery(object):
                         if fbtype in ('F', '?'):
                             continue
 
-                        # Apply a timezone to any floating times
+                        # Apply a timezone to any floating times, and convert
+                        # them to UTC with its transition table
                         fbstart = tupleToDateTime(start, withTimezone=tzinfo if float == 'Y' else Timezone.UTCTimezone)
                         fbend = tupleToDateTime(end, withTimezone=tzinfo if float == 'Y' else Timezone.UTCTimezone)
+                        if float == 'Y':
+                            adjustToUTC(fbstart)
+                            adjustToUTC(fbend)
 
                         # Clip instance to time range
                         clipped = clipPeriod(Period(fbstart, end=fbend), self.timerange)
@@ -445,8 +463,7 @@ class FreebusyQuery(object):
                                 self._addEventDetails(calendar, self.rich_options, tzinfo)
 
                 else:
-                    child = (yield calresource.calendarObjectWithName(name))
-                    calendar = (yield child.componentForUser())
+                    child, calendar = children[key]
 
                     # The calendar may come back as None if the resource is being changed, or was deleted
                     # between our initial index query and getting here. For now we will ignore this error, but in
@@ -489,6 +506,22 @@ class FreebusyQuery(object):
 
         returnValue(matchtotal)
 
+    def _useFreeBusyType(self, aggregated_resources, key):
+        """
+        Whether the free-busy time of a resource can be taken from the FBTYPE
+        of its indexed instances, rather than by matching its data against the
+        filter.
+
+        @param aggregated_resources: the indexed instances of each resource
+        @type aggregated_resources: L{dict}
+        @param key: the resource
+        @type key: L{tuple}
+
+        @rtype: L{bool}
+        """
+        comptype = key[2]
+        return comptype == "VEVENT" and aggregated_resources[key][0][3] != '?'
+
     @inlineCallbacks
     def _matchResources(self, fbset):
         """
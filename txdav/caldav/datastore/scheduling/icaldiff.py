@@ -853,6 +853,23 @@ class iCalDiff(object):
         else:
             return False
 
+    def recurrenceRuleDifference(self):
+        """
+        Is there a difference between the recurrence rules of the two master
+        components.
+
+        @return: L{True} if there is such a change, L{False} otherwise
+        @rtype: L{bool}
+        """
+
+        def _rules(calendar):
+            master = calendar.masterComponent()
+            if master is None:
+                return None
+            return sorted([str(prop) for prop in master.properties("RRULE")])
+
+        return _rules(self.oldcalendar) != _rules(self.newcalendar)
+
     def attendeeNeedsAction(self, diffs):
         """
         Given a set of results from L{whatIsDifferent}, determine which recurrence-id's
@@ -840,7 +840,7 @@ class ImplicitProcessor(object):
                         if accounting is not None:
                             accounting["tr"].insert(0, (tr.getStart().getText(), tr.getEnd().getText(), instance.free,))
                     except QueryMaxResources:
-                        instance.free[instance] = False
+                        instance.free = False
                         log.info("Exceeded number of matches whilst trying to find free-time.")
                         if accounting is not None:
                             accounting["problem"] = "Exceeded number of matches"
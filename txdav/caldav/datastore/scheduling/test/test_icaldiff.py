@@ -7414,3 +7414,32 @@ END:VCALENDAR
             result[2] = tuple([(DateTime.parseText(dt) if dt else None) for dt in result[2]])
             result = tuple(result)
             self.assertEqual(diffResult, result, msg="%s: actual result: (%s)" % (description, ", ".join([str(i).replace("\r", "") for i in diffResult]),))
+
+    def test_recurrence_rule_difference(self):
+
+        data = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:12345-67890
+DTSTART:20080601T120000Z
+DTEND:20080601T130000Z
+DTSTAMP:20080601T120000Z
+%s
+SUMMARY:%s
+END:VEVENT
+END:VCALENDAR
+"""
+
+        for description, rrule1, summary1, rrule2, summary2, result in (
+            ("No change", "RRULE:FREQ=DAILY", "1", "RRULE:FREQ=DAILY", "1", False),
+            ("Other change", "RRULE:FREQ=DAILY", "1", "RRULE:FREQ=DAILY", "2", False),
+            ("Rule changed", "RRULE:FREQ=DAILY", "1", "RRULE:FREQ=WEEKLY", "1", True),
+            ("Rule added", "RRULE:FREQ=DAILY", "1", "RRULE:FREQ=DAILY\nRRULE:FREQ=WEEKLY", "1", True),
+        ):
+            differ = iCalDiff(
+                Component.fromString(data % (rrule1, summary1,)),
+                Component.fromString(data % (rrule2, summary2,)),
+                False,
+            )
+            self.assertEqual(differ.recurrenceRuleDifference(), result, msg=description)
@@ -14,6 +14,9 @@
 # limitations under the License.
 ##
 
+from pycalendar.datetime import DateTime
+from pycalendar.duration import Duration
+
 from twisted.internet.defer import inlineCallbacks, succeed
 from twisted.trial import unittest
 
@@ -21,8 +24,10 @@ from twistedcaldav import memcacher
 from twistedcaldav.ical import Component
 from twistedcaldav.stdconfig import config
 
+from txdav.caldav.datastore.scheduling.freebusy import FreebusyQuery
 from txdav.caldav.datastore.scheduling.processing import ImplicitProcessor
 from txdav.caldav.datastore.scheduling.cuaddress import LocalCalendarUser
+from txdav.who.idirectory import AutoScheduleMode
 
 
 class FakeImplicitProcessor(ImplicitProcessor):
@@ -65,6 +70,42 @@ class FakeResource(object):
         return 1
 
 
+class FakeRecord(object):
+
+    def __init__(self, cuaddr):
+        self.uid = cuaddr
+        self.calendarUserAddresses = (cuaddr,)
+
+
+class FakeCalendar(object):
+
+    def isUsedForFreeBusy(self):
+        return True
+
+    def getTimezone(self):
+        return None
+
+
+class FakeInbox(object):
+
+    def ownerHome(self):
+        return self
+
+    def loadCalendars(self):
+        return succeed([FakeCalendar()])
+
+
+class FakeRecipient(object):
+
+    def __init__(self, cuaddr):
+        self.cuaddr = cuaddr
+        self.record = FakeRecord(cuaddr)
+        self.inbox = FakeInbox()
+
+    def hosted(self):
+        return True
+
+
 class BatchRefresh (unittest.TestCase):
     """
     iCalendar support tests
@@ -221,3 +262,65 @@ END:VCALENDAR
             processed = yield processor.doImplicitOrganizerUpdate()
             self.assertTrue(processed[3] is not None, msg=msg)
             self.assertEqual(processor.batches, result, msg=msg)
+
+
+class AutoReply (unittest.TestCase):
+    """
+    L{ImplicitProcessor.checkAttendeeAutoReply} tests
+    """
+
+    @inlineCallbacks
+    def test_acceptIfFreeDeclineIfBusy(self):
+        """
+        Free instances of a recurring event are accepted and busy ones
+        declined.
+        """
+
+        start = DateTime.getToday() + Duration(days=10)
+        start.setDateOnly(False)
+        start.setHHMMSS(12, 0, 0)
+        start.setTimezoneUTC(True)
+        busy = start + Duration(days=1)
+
+        def _generateFreeBusyInfo(fbquery, fbset, fbinfo, matchtotal=0):
+            if fbquery.timerange.getStart() == busy:
+                fbinfo.busy.append(fbquery.timerange)
+            return succeed(matchtotal)
+        self.patch(FreebusyQuery, "generateFreeBusyInfo", _generateFreeBusyInfo)
+
+        calendar = Component.fromString("""BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+METHOD:REQUEST
+BEGIN:VEVENT
+UID:12345-67890
+DTSTART:%s
+DURATION:PT1H
+RRULE:FREQ=DAILY;COUNT=3
+ORGANIZER:urn:uuid:user01
+ATTENDEE:urn:uuid:user01
+ATTENDEE;RSVP=TRUE:urn:uuid:mercury
+END:VEVENT
+END:VCALENDAR
+""" % (start.getText(),))
+
+        processor = FakeImplicitProcessor()
+        processor.uid = "12345-67890"
+        processor.recipient = FakeRecipient("urn:uuid:mercury")
+        made_changes, store_inbox, partstat, _ignore_accounting = yield processor.checkAttendeeAutoReply(
+            calendar, AutoScheduleMode.acceptIfFreeDeclineIfBusy
+        )
+
+        self.assertTrue(made_changes)
+        self.assertFalse(store_inbox)
+        self.assertEqual(partstat, "MIXED RESPONSE")
+        self.assertEqual(
+            calendar.masterComponent().getAttendeeProperty(("urn:uuid:mercury",)).parameterValue("PARTSTAT"),
+            "ACCEPTED",
+        )
+        overridden = calendar.overriddenComponent(busy)
+        self.assertTrue(overridden is not None)
+        self.assertEqual(
+            overridden.getAttendeeProperty(("urn:uuid:mercury",)).parameterValue("PARTSTAT"),
+            "DECLINED",
+        )
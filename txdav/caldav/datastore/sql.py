@@ -29,6 +29,7 @@ __all__ = [
 from twext.enterprise.dal.record import fromTable, SerializableRecord
 from twext.enterprise.dal.syntax import Count, ColumnSyntax, Delete, \
     Insert, Len, Max, Parameter, Select, Update, utcNowSQL, Union
+from twext.enterprise.ienterprise import POSTGRES_DIALECT
 from twext.enterprise.locking import NamedLock
 from twext.enterprise.jobs.jobitem import JobItem
 from twext.enterprise.jobs.workitem import WorkItem, AggregatedWorkItem, \
@@ -40,7 +41,8 @@ from twext.who.idirectory import RecordType
 from txweb2.http_headers import MimeType
 from txweb2.stream import readStream
 
-from twisted.internet.defer import inlineCallbacks, returnValue, succeed
+from twisted.internet.defer import inlineCallbacks, returnValue, succeed, \
+    gatherResults, FirstError
 from twisted.python.failure import Failure
 
 from twistedcaldav import customxml, ical
@@ -63,6 +65,9 @@ from txdav.caldav.datastore.scheduling.imip.token import iMIPTokenRecord
 from txdav.caldav.datastore.scheduling.implicit import ImplicitScheduler
 from txdav.caldav.datastore.scheduling.utils import uidFromCalendarUserAddress
 from txdav.caldav.datastore.scheduling.work import allScheduleWork, ScheduleWork
+from txdav.caldav.datastore.componentcache import componentCache
+from txdav.caldav.datastore.expansioncache import bindExpansionCache, \
+    loadExpansionCaches
 from txdav.caldav.datastore.sql_attachment import Attachment, DropBoxAttachment, \
     AttachmentLink, ManagedAttachment
 from txdav.caldav.datastore.sql_directory import GroupAttendeeRecord, \
@@ -122,6 +127,129 @@ import uuid
 log = Logger()
 
 
+def _gatherStatements(deferreds):
+    """
+    Wait for several SQL statements that were all sent together, rather than
+    one after the other, to complete.
+
+    @param deferreds: the L{Deferred}s returned by the statements' C{on}
+    @type deferreds: L{list} of L{Deferred}
+
+    @return: a L{Deferred} that fires with a L{list} of the results of each
+        statement, in order, or fails with the failure of the first statement
+        to fail
+    """
+    d = gatherResults(deferreds, consumeErrors=True)
+    d.addErrback(lambda f: f.trap(FirstError) and f.value.subFailure)
+    return d
+
+
+# The most rows written by one multi-row INSERT, or IDs in one IN list (Oracle
+# allows no more than 1000 expressions in a list)
+_ROWS_PER_STATEMENT = 500
+
+
+def _placeholder(paramstyle, index):
+    """
+    The SQL placeholder for a parameter of a statement run with L{execSQL}.
+
+    @param paramstyle: the DB-API paramstyle of the database connection
+    @type paramstyle: L{str}
+    @param index: the zero-based index of the parameter in the statement
+    @type index: L{int}
+    """
+    if paramstyle == "numeric":
+        return ":%d" % (index + 1,)
+    elif paramstyle == "qmark":
+        return "?"
+    else:
+        return "%s"
+
+
+def _multiRowInsertSQL(table, columns, count, paramstyle, returning=None):
+    """
+    Generate an INSERT statement that writes several rows with one VALUES
+    list, as the DAL's L{Insert} only writes one row.
+
+    @param table: the table to insert into
+    @type table: L{TableSyntax}
+    @param columns: the columns given a value in each row
+    @type columns: L{list} of L{ColumnSyntax}
+    @param count: the number of rows
+    @type count: L{int}
+    @param paramstyle: the DB-API paramstyle of the database connection
+    @type paramstyle: L{str}
+    @param returning: a column to return for each row, or L{None}
+    @type returning: L{ColumnSyntax}
+
+    @rtype: L{str}
+    """
+    values = []
+    for row in range(count):
+        values.append("(%s)" % (", ".join([
+            _placeholder(paramstyle, row * len(columns) + index)
+            for index in range(len(columns))
+        ]),))
+    sql = "insert into %s (%s) values %s" % (
+        table.model.name,
+        ", ".join([column.model.name for column in columns]),
+        ", ".join(values),
+    )
+    if returning is not None:
+        sql += " returning %s" % (returning.model.name,)
+    return sql
+
+
+@inlineCallbacks
+def _insertRows(txn, table, rows, returning=None):
+    """
+    Insert several rows into a table. On PostgreSQL up to
+    L{_ROWS_PER_STATEMENT} rows are written by each statement; other
+    databases get one L{Insert} per row, all sent at once.
+
+    @param txn: transaction to use
+    @type txn: L{Transaction}
+    @param table: the table to insert into
+    @type table: L{TableSyntax}
+    @param rows: the values of each row, all with the same columns
+    @type rows: L{list} of L{dict} mapping L{ColumnSyntax} to values
+    @param returning: a column whose value is returned for each row, which
+        must come from an ascending sequence, or L{None}
+    @type returning: L{ColumnSyntax}
+
+    @return: the value of C{returning} for each row, in order, or L{None}
+    @rtype: L{list}
+    """
+    if not rows:
+        returnValue([] if returning is not None else None)
+
+    if txn.dbtype.dialect != POSTGRES_DIALECT:
+        results = yield _gatherStatements([
+            Insert(row, Return=returning).on(txn) for row in rows
+        ])
+        returnValue([result[0][0] for result in results] if returning is not None else None)
+
+    columns = sorted(rows[0].keys(), key=lambda column: column.model.name)
+    statements = []
+    for i in range(0, len(rows), _ROWS_PER_STATEMENT):
+        chunk = rows[i:i + _ROWS_PER_STATEMENT]
+        statements.append(txn.execSQL(
+            _multiRowInsertSQL(table, columns, len(chunk), txn.dbtype.paramstyle, returning),
+            [row[column] for row in chunk for column in columns],
+        ))
+    results = yield _gatherStatements(statements)
+
+    if returning is None:
+        returnValue(None)
+
+    # The order of the rows returned is not defined, but the sequence
+    # values are handed out in the order of the VALUES list
+    values = []
+    for result in results:
+        values.extend(sorted([row[0] for row in result]))
+    returnValue(values)
+
+
 class CalendarStoreFeatures(object):
     """
     Manages store-wide operations specific to calendars.
@@ -467,6 +595,7 @@ class CalendarHome(CommonHome):
     # structured tables.  (new, preferred)
     _homeSchema = schema.CALENDAR_HOME
     _homeMetaDataSchema = schema.CALENDAR_HOME_METADATA
+    _quotaJournalSchema = schema.CALENDAR_QUOTA_JOURNAL
 
     _bindSchema = schema.CALENDAR_BIND
     _revisionsSchema = schema.CALENDAR_OBJECT_REVISIONS
@@ -1887,6 +2016,10 @@ class Calendar(CommonHomeChild):
         # Find out if the index is expanded far enough
         names = yield self.notExpandedWithin(minDate, maxDate)
 
+        # CalendarIndexExtensionWork should keep this rare, so count it
+        if names:
+            self._txn.logItems["reexpand"] = self._txn.logItems.get("reexpand", 0) + len(names)
+
         # Actually expand recurrence max
         for name in names:
             self.log.info("Search falls outside range of index for {name} {min} to {max}", name=name, min=minDate, max=maxDate)
@@ -2580,7 +2713,12 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
     _objectSchema = schema.CALENDAR_OBJECT
     _componentClass = Component
 
-    _currentDataVersion = 1
+    # Data versions:
+    #   1 - calendar user addresses normalized
+    #   2 - calendar data validated (and fixed) when written, so it does not
+    #       need to be validated when read
+    _currentDataVersion = 2
+    _validatedDataVersion = 2
 
     def __init__(self, calendar, name, uid, resourceID=None, options=None):
 
@@ -3674,6 +3812,10 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
         """
 
         self._componentChanged = False
+
+        # Rebuild the instance index unless the time-range diff below finds
+        # the recurrence rule unchanged
+        self.tr_rebuild = True
         self.schedule_tag_match = (
             not self.calendar().isInbox() and
             internal_state == ComponentUpdateState.NORMAL and
@@ -3681,6 +3823,10 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
         )
         schedule_state = None
 
+        # Client data is validated (and fixed) by fullValidation, data written
+        # internally is fixed by updateDatabase
+        validated = False
+
         if internal_state in (ComponentUpdateState.SPLIT_OWNER, ComponentUpdateState.SPLIT_ATTENDEE,):
             # When splitting, some state from the previous resource needs to be properly
             # preserved in the new one when storing the component. Since we don't do the "full"
@@ -3723,6 +3869,7 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
         elif internal_state != ComponentUpdateState.RAW:
             # Handle all validation operations here.
             yield self.fullValidation(component, inserting, internal_state)
+            validated = internal_state == ComponentUpdateState.NORMAL
 
             # UID lock - this will remain active until the end of the current txn
             yield self._lockAndCheckUID(component, inserting, internal_state)
@@ -3782,7 +3929,11 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
                     self.tr_change = None
                 else:
                     oldcomponent = yield self.componentForUser()
-                    self.tr_change = iCalDiff(oldcomponent, component, False).timeRangeDifference()
+                    differ = iCalDiff(oldcomponent, component, False)
+                    self.tr_change = differ.timeRangeDifference()
+                    if self.tr_change:
+                        # A change to the recurrence rule moves most instances
+                        self.tr_rebuild = differ.recurrenceRuleDifference()
 
             # Always do the per-user data merge right before we store
             component = (yield self.mergePerUserData(component, inserting))
@@ -3792,9 +3943,10 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
         # When migrating we always do validity check to fix issues
         elif self._txn._migrating:
             self.validCalendarDataCheck(component, inserting)
+            validated = True
 
         # If updateSelf is True, we want to turn inserting off within updateDatabase
-        yield self.updateDatabase(component, inserting=inserting if not updateSelf else False)
+        yield self.updateDatabase(component, inserting=inserting if not updateSelf else False, validated=validated)
 
         # update GROUP_ATTENDEE table rows
         if inserting:
@@ -3841,7 +3993,7 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
 
     @inlineCallbacks
     def updateDatabase(self, component, expand_until=None, reCreate=False,
-                       inserting=False, txn=None):
+                       inserting=False, txn=None, validated=False):
         """
         Update the database tables for the new data being written. Occasionally we might need to do an update to
         time-range data via a separate transaction, so we allow that to be passed in. Note that in that case
@@ -3850,11 +4002,19 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
 
         @param component: calendar data to store
         @type component: L{Component}
+        @param validated: whether the data has already been validated and
+            fixed, as it is for a client write
+        @type validated: L{bool}
         """
 
         # Setup appropriate txn
         txn = txn if txn is not None else self._txn
 
+        # Stored data is marked as validated, so fix any bogus data we can now
+        # rather than each time it is read
+        if not reCreate and not validated:
+            self._fixCalendarData(component)
+
         # inbox does things slightly differently
         isInboxItem = self.calendar().isInbox()
 
@@ -3921,7 +4081,9 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
                 truncateLowerLimit = None
 
             # Always do recurrence expansion even if we do not intend to index - we need this to double-check the
-            # validity of the iCalendar recurrence data.
+            # validity of the iCalendar recurrence data. When re-indexing stored data use an expansion of it
+            # shared by other requests.
+            yield loadExpansionCaches((component,))
             try:
                 instances = component.expandTimeRanges(expand, lowerLimit=truncateLowerLimit, ignoreInvalidInstances=reCreate)
                 recurrenceLimit = instances.limit
@@ -3946,6 +4108,18 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
                 recurrenceLowerLimit = None
                 recurrenceLimit = DateTime(1900, 1, 1, 0, 0, 0, tzid=Timezone.UTCTimezone)
 
+        # Only change the index rows that differ when updating the instances
+        # of an existing resource, unless its recurrence rule was changed, as
+        # then few rows are likely to be the same
+        updateInstances = (
+            instanceIndexingRequired and doInstanceIndexing and not inserting and
+            config.FreeBusyIndexIncrementalUpdate and
+            (reCreate or not getattr(self, "tr_rebuild", True))
+        )
+
+        # Do not let this update's diff apply to the next one
+        self.tr_rebuild = True
+
         co = self._objectSchema
         tr = schema.TIME_RANGE
 
@@ -4031,7 +4205,7 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
                 )[0][0])
 
                 # Need to wipe the existing time-range for this and rebuild if required
-                if instanceIndexingRequired:
+                if instanceIndexingRequired and not updateInstances:
                     yield Delete(
                         From=tr,
                         Where=tr.CALENDAR_OBJECT_RESOURCE_ID == self._resourceID
@@ -4050,12 +4224,15 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
             ).on(txn)
 
             # Need to wipe the existing time-range for this and rebuild
-            yield Delete(
-                From=tr,
-                Where=tr.CALENDAR_OBJECT_RESOURCE_ID == self._resourceID
-            ).on(txn)
-
-        if instanceIndexingRequired and doInstanceIndexing:
+            if not updateInstances:
+                yield Delete(
+                    From=tr,
+                    Where=tr.CALENDAR_OBJECT_RESOURCE_ID == self._resourceID
+                ).on(txn)
+
+        if updateInstances:
+            yield self._updateInstances(component, instances, truncateLowerLimit, isInboxItem, txn)
+        elif instanceIndexingRequired and doInstanceIndexing:
             yield self._addInstances(component, instances, truncateLowerLimit, isInboxItem, txn)
 
         yield self.removeOldEventGroupLink(component, instances, inserting, txn)
@@ -4077,7 +4254,27 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
         @type txn: L{Transaction}
         """
 
-        # TIME_RANGE table update
+        # Build the full set of TIME_RANGE rows first, then write them all
+        details = self._instanceDetails(component, instances, truncateLowerLimit)
+        yield self._addInstanceDetails(component, details, isInboxItem, txn)
+
+    def _instanceDetails(self, component, instances, truncateLowerLimit):
+        """
+        Get the TIME_RANGE details for the set of supplied instances.
+
+        @param component: the component whose instances are being added
+        @type component: L{Component}
+        @param instances: the set of instances to add
+        @type instances: L{InstanceList}
+        @param truncateLowerLimit: the lower limit for instances
+        @type truncateLowerLimit: L{DateTime}
+
+        @return: the (rid, start, end, floating, transp, fbtype) details of
+            each TIME_RANGE row
+        @rtype: L{list} of L{tuple}
+        """
+
+        details = []
         lowerLimitApplied = False
         for key in instances:
             instance = instances[key]
@@ -4094,14 +4291,14 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
                 lowerLimitApplied = True
                 continue
 
-            yield self._addInstanceDetails(component, instance.rid, start, end, floating, transp, fbtype, isInboxItem, txn)
+            details.append((instance.rid, start, end, floating, transp, fbtype,))
 
         # For truncated items we insert a tomb stone lower bound so that a time-range
         # query with just an end bound will match
         if lowerLimitApplied or instances.lowerLimit and len(instances.instances) == 0:
             start = DateTime(1901, 1, 1, 0, 0, 0, tzid=Timezone.UTCTimezone)
             end = DateTime(1901, 1, 1, 1, 0, 0, tzid=Timezone.UTCTimezone)
-            yield self._addInstanceDetails(component, None, start, end, False, True, "UNKNOWN", isInboxItem, txn)
+            details.append((None, start, end, False, True, "UNKNOWN",))
 
         # Special - for unbounded recurrence we insert a value for "infinity"
         # that will allow an open-ended time-range to always match it.
@@ -4110,45 +4307,270 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
         if component.isRecurringUnbounded() or instances.limit and len(instances.instances) == 0:
             start = DateTime(2100, 1, 1, 0, 0, 0, tzid=Timezone.UTCTimezone)
             end = DateTime(2100, 1, 1, 1, 0, 0, tzid=Timezone.UTCTimezone)
-            yield self._addInstanceDetails(component, None, start, end, False, True, "UNKNOWN", isInboxItem, txn)
+            details.append((None, start, end, False, True, "UNKNOWN",))
+
+        return details
+
+    @inlineCallbacks
+    def _addInstanceDetails(self, component, details, isInboxItem, txn):
+        """
+        Write TIME_RANGE rows, and any PERUSER rows that go with them.
+
+        @param component: the component whose instances are being added
+        @type component: L{Component}
+        @param details: the (rid, start, end, floating, transp, fbtype) details
+            of each TIME_RANGE row, as returned by L{_instanceDetails}
+        @type details: L{list} of L{tuple}
+        @param isInboxItem: indicates if an inbox item
+        @type isInboxItem: C{bool}
+        @param txn: transaction to use
+        @type txn: L{Transaction}
+        """
+        perUserRows = self._perUserDetails(component, details, isInboxItem)
+        yield self._insertInstanceDetails(details, perUserRows, txn)
+
+    def _perUserDetails(self, component, details, isInboxItem):
+        """
+        Get the PERUSER rows for each TIME_RANGE row.
+
+        @param component: the component whose instances are being added
+        @type component: L{Component}
+        @param details: the (rid, start, end, floating, transp, fbtype) details
+            of each TIME_RANGE row, as returned by L{_instanceDetails}
+        @type details: L{list} of L{tuple}
+        @param isInboxItem: indicates if an inbox item
+        @type isInboxItem: C{bool}
+
+        @return: for each TIME_RANGE row, the values of each of its PERUSER
+            rows, without the TIME_RANGE_INSTANCE_ID
+        @rtype: L{list} of L{list} of L{dict}
+        """
+
+        tpy = schema.PERUSER
+
+        def _adjustDateTime(dt, adjustment, add_duration):
+            if isinstance(adjustment, Duration):
+                return pyCalendarToSQLTimestamp((dt + adjustment) if add_duration else (dt - adjustment))
+            elif isinstance(adjustment, DateTime):
+                return pyCalendarToSQLTimestamp(normalizeForIndex(adjustment))
+            else:
+                return None
+
+        perUserRows = []
+        for rid, start, end, _ignore_floating, transp, _ignore_fbtype in details:
+            rows = []
+
+            # Don't do transparency for inbox items - we never do freebusy on inbox
+            if not isInboxItem:
+                for useruid, (usertransp, adjusted_start, adjusted_end) in component.perUserData(rid):
+                    if usertransp != transp or adjusted_start is not None or adjusted_end is not None:
+                        rows.append({
+                            tpy.USER_ID: useruid if useruid else ".",
+                            tpy.TRANSPARENT: usertransp,
+                            tpy.ADJUSTED_START_DATE: _adjustDateTime(start, adjusted_start, add_duration=False),
+                            tpy.ADJUSTED_END_DATE: _adjustDateTime(end, adjusted_end, add_duration=True),
+                        })
+            perUserRows.append(rows)
+
+        return perUserRows
 
     @inlineCallbacks
-    def _addInstanceDetails(self, component, rid, start, end, floating, transp, fbtype, isInboxItem, txn):
+    def _insertInstanceDetails(self, details, perUserRows, txn):
+        """
+        Insert TIME_RANGE rows and their PERUSER rows, using multi-row
+        INSERTs (see L{_insertRows}): one set for the TIME_RANGE rows, then
+        one for the PERUSER rows.
+
+        @param details: the (rid, start, end, floating, transp, fbtype) details
+            of each TIME_RANGE row, as returned by L{_instanceDetails}
+        @type details: L{list} of L{tuple}
+        @param perUserRows: the PERUSER rows for each TIME_RANGE row, as
+            returned by L{_perUserDetails}
+        @type perUserRows: L{list} of L{list} of L{dict}
+        @param txn: transaction to use
+        @type txn: L{Transaction}
+        """
 
         tr = schema.TIME_RANGE
         tpy = schema.PERUSER
 
-        instanceid = (yield Insert({
-            tr.CALENDAR_RESOURCE_ID: self._calendar._resourceID,
-            tr.CALENDAR_OBJECT_RESOURCE_ID: self._resourceID,
-            tr.FLOATING: floating,
-            tr.START_DATE: pyCalendarToSQLTimestamp(start),
-            tr.END_DATE: pyCalendarToSQLTimestamp(end),
-            tr.FBTYPE: icalfbtype_to_indexfbtype.get(fbtype, icalfbtype_to_indexfbtype["FREE"]),
-            tr.TRANSPARENT: transp,
-        }, Return=tr.INSTANCE_ID).on(txn))[0][0]
-
-        # Don't do transparency for inbox items - we never do freebusy on inbox
-        if not isInboxItem:
-            peruserdata = component.perUserData(rid)
-            for useruid, (usertransp, adjusted_start, adjusted_end) in peruserdata:
-
-                def _adjustDateTime(dt, adjustment, add_duration):
-                    if isinstance(adjustment, Duration):
-                        return pyCalendarToSQLTimestamp((dt + adjustment) if add_duration else (dt - adjustment))
-                    elif isinstance(adjustment, DateTime):
-                        return pyCalendarToSQLTimestamp(normalizeForIndex(adjustment))
-                    else:
-                        return None
+        instanceIDs = yield _insertRows(txn, tr, [
+            {
+                tr.CALENDAR_RESOURCE_ID: self._calendar._resourceID,
+                tr.CALENDAR_OBJECT_RESOURCE_ID: self._resourceID,
+                tr.FLOATING: floating,
+                tr.START_DATE: pyCalendarToSQLTimestamp(start),
+                tr.END_DATE: pyCalendarToSQLTimestamp(end),
+                tr.FBTYPE: icalfbtype_to_indexfbtype.get(fbtype, icalfbtype_to_indexfbtype["FREE"]),
+                tr.TRANSPARENT: transp,
+            }
+            for _ignore_rid, start, end, floating, transp, fbtype in details
+        ], returning=tr.INSTANCE_ID if any(perUserRows) else None)
+
+        perUserInserts = []
+        if instanceIDs:
+            for instanceID, rows in zip(instanceIDs, perUserRows):
+                for row in rows:
+                    row = dict(row)
+                    row[tpy.TIME_RANGE_INSTANCE_ID] = instanceID
+                    perUserInserts.append(row)
+        yield _insertRows(txn, tpy, perUserInserts)
+
+    @classproperty
+    def _instanceDetailsQuery(cls):
+        """
+        DAL query to load the TIME_RANGE rows of an object.
+        """
+        tr = schema.TIME_RANGE
+        return Select(
+            [
+                tr.INSTANCE_ID,
+                tr.START_DATE,
+                tr.END_DATE,
+                tr.FLOATING,
+                tr.TRANSPARENT,
+                tr.FBTYPE,
+            ],
+            From=tr,
+            Where=tr.CALENDAR_OBJECT_RESOURCE_ID == Parameter("resourceID"),
+        )
 
-                if usertransp != transp or adjusted_start is not None or adjusted_end is not None:
-                    (yield Insert({
-                        tpy.TIME_RANGE_INSTANCE_ID: instanceid,
-                        tpy.USER_ID: useruid if useruid else ".",
-                        tpy.TRANSPARENT: usertransp,
-                        tpy.ADJUSTED_START_DATE: _adjustDateTime(start, adjusted_start, add_duration=False),
-                        tpy.ADJUSTED_END_DATE: _adjustDateTime(end, adjusted_end, add_duration=True),
-                    }).on(txn))
+    @classproperty
+    def _perUserDetailsQuery(cls):
+        """
+        DAL query to load the PERUSER rows of an object.
+        """
+        tr = schema.TIME_RANGE
+        tpy = schema.PERUSER
+        return Select(
+            [
+                tpy.TIME_RANGE_INSTANCE_ID,
+                tpy.USER_ID,
+                tpy.TRANSPARENT,
+                tpy.ADJUSTED_START_DATE,
+                tpy.ADJUSTED_END_DATE,
+            ],
+            From=tpy.join(tr, tpy.TIME_RANGE_INSTANCE_ID == tr.INSTANCE_ID),
+            Where=tr.CALENDAR_OBJECT_RESOURCE_ID == Parameter("resourceID"),
+        )
+
+    @inlineCallbacks
+    def _updateInstances(self, component, instances, truncateLowerLimit, isInboxItem, txn):
+        """
+        Change the stored instances to the set of supplied instances, only
+        deleting, updating or inserting the TIME_RANGE and PERUSER rows that
+        differ, rather than replacing all of them.
+
+        TIME_RANGE rows do not record the RECURRENCE-ID of their instance, so
+        existing and new rows are matched on their start, end and floating
+        state, and then compared on their transparency, free-busy type and
+        PERUSER rows.
+
+        @param component: the component whose instances are being stored
+        @type component: L{Component}
+        @param instances: the set of instances to store
+        @type instances: L{InstanceList}
+        @param truncateLowerLimit: the lower limit for instances
+        @type truncateLowerLimit: L{DateTime}
+        @param isInboxItem: indicates if an inbox item
+        @type isInboxItem: C{bool}
+        @param txn: transaction to use
+        @type txn: L{Transaction}
+        """
+
+        tr = schema.TIME_RANGE
+        tpy = schema.PERUSER
+
+        def _timestamp(value):
+            # Compare database values and new values in the same form
+            if value is None:
+                return None
+            elif isinstance(value, basestring):
+                return parseSQLTimestamp(value)
+            elif not isinstance(value, datetime.datetime):
+                return datetime.datetime(value.year, value.month, value.day)
+            else:
+                return value
+
+        # Existing rows, grouped by their times
+        existing = collections.defaultdict(list)
+        perUser = collections.defaultdict(set)
+        for instanceID, userID, transp, adjustedStart, adjustedEnd in (
+            yield self._perUserDetailsQuery.on(txn, resourceID=self._resourceID)
+        ):
+            perUser[instanceID].add((userID, bool(transp), _timestamp(adjustedStart), _timestamp(adjustedEnd),))
+        for instanceID, start, end, floating, transp, fbtype in (
+            yield self._instanceDetailsQuery.on(txn, resourceID=self._resourceID)
+        ):
+            key = (_timestamp(start), _timestamp(end), bool(floating),)
+            existing[key].append((instanceID, (bool(transp), fbtype, frozenset(perUser[instanceID]),),))
+
+        # Match up the new rows
+        details = self._instanceDetails(component, instances, truncateLowerLimit)
+        perUserRows = self._perUserDetails(component, details, isInboxItem)
+        insertDetails = []
+        insertPerUserRows = []
+        statements = []
+        perUserInserts = []
+        for detail, rows in zip(details, perUserRows):
+            _ignore_rid, start, end, floating, transp, fbtype = detail
+            key = (_timestamp(pyCalendarToSQLTimestamp(start)), _timestamp(pyCalendarToSQLTimestamp(end)), bool(floating),)
+            if not existing.get(key):
+                insertDetails.append(detail)
+                insertPerUserRows.append(rows)
+                continue
+
+            fbtype = icalfbtype_to_indexfbtype.get(fbtype, icalfbtype_to_indexfbtype["FREE"])
+            userValues = frozenset([
+                (
+                    row[tpy.USER_ID],
+                    bool(row[tpy.TRANSPARENT]),
+                    _timestamp(row[tpy.ADJUSTED_START_DATE]),
+                    _timestamp(row[tpy.ADJUSTED_END_DATE]),
+                ) for row in rows
+            ])
+            values = (bool(transp), fbtype, userValues,)
+
+            # Prefer an identical existing row
+            candidates = existing[key]
+            for index, (instanceID, oldValues) in enumerate(candidates):
+                if oldValues == values:
+                    break
+            else:
+                index = 0
+            instanceID, oldValues = candidates.pop(index)
+            if oldValues == values:
+                continue
+
+            if oldValues[:2] != values[:2]:
+                statements.append(Update(
+                    {tr.TRANSPARENT: transp, tr.FBTYPE: fbtype},
+                    Where=tr.INSTANCE_ID == instanceID,
+                ).on(txn))
+            if oldValues[2] != values[2]:
+                statements.append(Delete(
+                    From=tpy,
+                    Where=tpy.TIME_RANGE_INSTANCE_ID == instanceID,
+                ).on(txn))
+                for row in rows:
+                    row = dict(row)
+                    row[tpy.TIME_RANGE_INSTANCE_ID] = instanceID
+                    perUserInserts.append(row)
+
+        # Any existing rows not matched are no longer needed
+        removed = []
+        for remaining in existing.itervalues():
+            removed.extend([oldID for oldID, _ignore_values in remaining])
+        for i in range(0, len(removed), _ROWS_PER_STATEMENT):
+            chunk = removed[i:i + _ROWS_PER_STATEMENT]
+            statements.append(Delete(
+                From=tr,
+                Where=tr.INSTANCE_ID.In(Parameter("instanceIDs", len(chunk))),
+            ).on(txn, instanceIDs=chunk))
+
+        yield _gatherStatements(statements)
+        yield _insertRows(txn, tpy, perUserInserts)
+        yield self._insertInstanceDetails(insertDetails, insertPerUserRows, txn)
 
     @inlineCallbacks
     def copyMetadata(self, other):
@@ -4184,6 +4606,19 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
 
         if self._cachedComponent is None:
 
+            # Data that is not due an upgrade may already have been parsed and
+            # validated by an earlier request
+            cache = None
+            if self._md5 and self._dataversion >= self._currentDataVersion:
+                cache = componentCache()
+                if cache is not None:
+                    component = cache.get(self._resourceID, self._md5)
+                    if component is not None:
+                        bindExpansionCache(component, self._resourceID, self._md5)
+                        self._cachedComponent = component
+                        self._cachedCommponentPerUser = {}
+                        returnValue(self._cachedComponent)
+
             text = yield self._text()
 
             try:
@@ -4196,30 +4631,52 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
                     )
                 )
 
-            # Fix any bogus data we can
-            fixed, unfixed = component.validCalendarData(doFix=True, doRaise=False)
-
-            if unfixed:
-                self.log.error(
-                    "Calendar data id={id} had unfixable problems:\n  {problems}",
-                    id=self._resourceID, problems="\n  ".join(unfixed),
-                )
-
-            if fixed:
-                self.log.error(
-                    "Calendar data id={id} had fixable problems:\n  {problems}",
-                    id=self._resourceID, problems="\n  ".join(fixed),
-                )
+            # Data written before it was validated on write needs fixing of
+            # any bogus data we can
+            fixed = False
+            if self._dataversion < self._validatedDataVersion:
+                fixed = self._fixCalendarData(component)
 
             # Check for on-demand data upgrade
             if self._dataversion < self._currentDataVersion:
-                yield self.upgradeData(component, doUpdate)
+                yield self.upgradeData(component, doUpdate, dataChanged=fixed)
+            elif self._md5:
+                if cache is not None:
+                    cache.set(self._resourceID, self._md5, component, len(text))
+                bindExpansionCache(component, self._resourceID, self._md5)
 
             self._cachedComponent = component
             self._cachedCommponentPerUser = {}
 
         returnValue(self._cachedComponent)
 
+    def _fixCalendarData(self, component):
+        """
+        Validate calendar data and fix it. Do not raise a store error here if
+        there are unfixable errors - just log them.
+
+        @param component: the calendar data, which is changed in place
+        @type component: L{Component}
+
+        @return: C{True} if any problems were fixed
+        @rtype: L{bool}
+        """
+        fixed, unfixed = component.validCalendarData(doFix=True, doRaise=False)
+
+        if unfixed:
+            self.log.error(
+                "Calendar data id={id} had unfixable problems:\n  {problems}",
+                id=self._resourceID, problems="\n  ".join(unfixed),
+            )
+
+        if fixed:
+            self.log.error(
+                "Calendar data id={id} had fixable problems:\n  {problems}",
+                id=self._resourceID, problems="\n  ".join(fixed),
+            )
+
+        return bool(fixed)
+
     @inlineCallbacks
     def componentForUser(self, user_uuid=None):
         """
@@ -4238,15 +4695,21 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
         if user_uuid not in self._cachedCommponentPerUser:
             caldata = yield self.component()
             filtered = PerUserDataFilter(user_uuid).filter(caldata.duplicate())
+            if self._md5 and self._dataversion >= self._currentDataVersion:
+                bindExpansionCache(filtered, self._resourceID, self._md5, user_uuid)
             self._cachedCommponentPerUser[user_uuid] = filtered
         returnValue(self._cachedCommponentPerUser[user_uuid])
 
     @inlineCallbacks
-    def upgradeData(self, component, doUpdate=False):
+    def upgradeData(self, component, doUpdate=False, dataChanged=True):
         """
         Implement in sub-classes. If the data version of this item does not match
         the current data version, call this method and implement a data upgrade,
         writing back the new data and updating the data version.
+
+        @param dataChanged: whether the data was changed when it was read, and
+            so must be written back even if the upgrade does not change it
+        @type dataChanged: L{bool}
         """
 
         if self._dataversion < 1:
@@ -4255,11 +4718,22 @@ class CalendarObject(CommonObjectResource, CalendarObjectBase):
                 normalizationLookup,
                 self.directoryService().recordWithCalendarUserAddress
             )
+            dataChanged = True
 
         self._dataversion = self._currentDataVersion
         if doUpdate:
             # Do the update right now
-            yield self.updateDatabase(component)
+            if dataChanged:
+                # component() has already fixed the data it read
+                yield self.updateDatabase(component, validated=True)
+            else:
+                # Only the data version needs to change - leave the data, and
+                # so the ETag and modified time, as they are
+                co = self._objectSchema
+                yield Update(
+                    {co.DATAVERSION: self._currentDataVersion},
+                    Where=co.RESOURCE_ID == self._resourceID,
+                ).on(self._txn)
         else:
             # Do the update later
             notBefore = datetime.datetime.utcnow() + datetime.timedelta(seconds=CalendarObject.CalendarObjectUpgradeWork.delay)
@@ -0,0 +1,95 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+from twistedcaldav.ical import Component
+from twistedcaldav.test.util import TestCase
+
+from txdav.caldav.datastore.componentcache import ComponentCache
+
+event_text = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:12345-67890
+DTSTART:20170101T100000Z
+DURATION:PT1H
+DTSTAMP:20170101T000000Z
+SUMMARY:Test
+END:VEVENT
+END:VCALENDAR
+""".replace("\n", "\r\n")
+
+
+class ComponentCacheTests(TestCase):
+    """
+    Tests for L{ComponentCache}.
+    """
+
+    def test_getSet(self):
+        cache = ComponentCache(10)
+        self.assertEqual(cache.get(1, "abc"), None)
+
+        cache.set(1, "abc", Component.fromString(event_text), len(event_text))
+        self.assertEqual(str(cache.get(1, "abc")), event_text)
+
+        # Keyed on both the resource ID and the MD5
+        self.assertEqual(cache.get(1, "def"), None)
+        self.assertEqual(cache.get(2, "abc"), None)
+
+    def test_copies(self):
+        """
+        Changes to a component passed to L{ComponentCache.set}, or returned by
+        L{ComponentCache.get}, do not change the cached component.
+        """
+        cache = ComponentCache(10)
+        component = Component.fromString(event_text)
+        cache.set(1, "abc", component, len(event_text))
+        component.mainComponent().removeProperty(component.mainComponent().getProperty("SUMMARY"))
+
+        cached = cache.get(1, "abc")
+        self.assertNotEqual(cached.mainComponent().getProperty("SUMMARY"), None)
+        cached.mainComponent().removeProperty(cached.mainComponent().getProperty("SUMMARY"))
+
+        self.assertEqual(str(cache.get(1, "abc")), event_text)
+
+    def test_maxBytes(self):
+        """
+        The least recently used components are evicted to keep the total size
+        of their data within the limit.
+        """
+        size = len(event_text)
+        cache = ComponentCache(10, maxBytes=size * 2)
+        cache.set(1, "abc", Component.fromString(event_text), size)
+        cache.set(2, "abc", Component.fromString(event_text), size)
+        cache.get(1, "abc")
+        cache.set(3, "abc", Component.fromString(event_text), size)
+
+        self.assertNotEqual(cache.get(1, "abc"), None)
+        self.assertEqual(cache.get(2, "abc"), None)
+        self.assertNotEqual(cache.get(3, "abc"), None)
+
+    def test_stats(self):
+        cache = ComponentCache(10)
+        cache.get(1, "abc")
+        cache.set(1, "abc", Component.fromString(event_text), len(event_text))
+        cache.get(1, "abc")
+        cache.get(1, "abc")
+
+        stats = cache.stats()
+        self.assertEqual(stats["entries"], 1)
+        self.assertEqual(stats["bytes"], len(event_text))
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 1)
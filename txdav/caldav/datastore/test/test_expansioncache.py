@@ -0,0 +1,256 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+from pycalendar.datetime import DateTime
+from pycalendar.timezone import Timezone
+
+from twisted.internet.defer import inlineCallbacks
+
+from twistedcaldav.config import config
+from twistedcaldav.ical import Component
+from twistedcaldav.test.util import TestCase
+from twistedcaldav.timezones import TimezoneCache
+
+from txdav.caldav.datastore import expansioncache
+from txdav.caldav.datastore.expansioncache import bindExpansionCache, \
+    loadExpansionCaches
+
+event_text = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:12345-67890
+DTSTART:20170101T100000Z
+DURATION:PT1H
+DTSTAMP:20170101T000000Z
+RRULE:FREQ=DAILY;COUNT=10
+SUMMARY:Test
+END:VEVENT
+BEGIN:VEVENT
+UID:12345-67890
+RECURRENCE-ID:20170103T100000Z
+DTSTART:20170103T120000Z
+DURATION:PT1H
+DTSTAMP:20170101T000000Z
+SUMMARY:Test moved
+END:VEVENT
+BEGIN:VEVENT
+UID:12345-67890
+RECURRENCE-ID:20170105T100000Z
+DTSTART:20170105T100000Z
+DURATION:PT1H
+DTSTAMP:20170101T000000Z
+STATUS:CANCELLED
+SUMMARY:Test cancelled
+END:VEVENT
+END:VCALENDAR
+""".replace("\n", "\r\n")
+
+single_text = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:12345-67890
+DTSTART:20170101T100000Z
+DURATION:PT1H
+DTSTAMP:20170101T000000Z
+SUMMARY:Test
+END:VEVENT
+END:VCALENDAR
+""".replace("\n", "\r\n")
+
+
+def _instances(instances):
+    """
+    The details of each instance that an expansion is used for.
+    """
+    return sorted([
+        (
+            str(instance.rid),
+            str(instance.start),
+            str(instance.end),
+            instance.component.getProperty("SUMMARY").value(),
+            instance.overridden,
+            instance.future,
+        )
+        for instance in instances.instances.itervalues()
+    ])
+
+
+class ExpansionCacheTests(TestCase):
+    """
+    Tests for L{bindExpansionCache} and L{loadExpansionCaches}.
+    """
+
+    limit = DateTime(2018, 1, 1, 0, 0, 0, tzid=Timezone.UTCTimezone)
+
+    @inlineCallbacks
+    def test_shared(self):
+        """
+        An expansion of a component is used for another component bound to the
+        same resource ID, MD5 and user, and gives the same instances.
+        """
+        first = Component.fromString(event_text)
+        bindExpansionCache(first, 1, "abc")
+        yield loadExpansionCaches((first,))
+        expected = first.expandTimeRanges(self.limit)
+
+        second = Component.fromString(event_text)
+        bindExpansionCache(second, 1, "abc")
+        yield loadExpansionCaches((second,))
+        self.assertNotEqual(second._expansionCache.get(second._expansionRangeKey(self.limit, None, False)), None)
+        instances = second.expandTimeRanges(self.limit)
+        self.assertEqual(_instances(instances), _instances(expected))
+        self.assertEqual(str(instances.limit), str(expected.limit))
+
+        # The instances refer to the second component's own subcomponents
+        for instance in instances.instances.itervalues():
+            self.assertTrue(instance.component._parent is second)
+
+        # Not shared with a different user
+        third = Component.fromString(event_text)
+        bindExpansionCache(third, 1, "abc", "user01")
+        yield loadExpansionCaches((third,))
+        self.assertEqual(third._expansionCache.get(third._expansionRangeKey(self.limit, None, False)), None)
+
+    def test_changed(self):
+        """
+        A component stops using the cache once it is changed.
+        """
+        component = Component.fromString(event_text)
+        bindExpansionCache(component, 2, "abc")
+        self.assertNotEqual(component._expansionCache, None)
+
+        component.mainComponent().getProperty("SUMMARY").setValue("Changed")
+        self.assertEqual(component._expansionCache, None)
+
+    def test_notBound(self):
+        """
+        Non-recurring components, and all components when the cache is
+        disabled, are not bound.
+        """
+        component = Component.fromString(single_text)
+        bindExpansionCache(component, 3, "abc")
+        self.assertEqual(component._expansionCache, None)
+
+        self.patch(config.ExpansionCache, "Enabled", False)
+        component = Component.fromString(event_text)
+        bindExpansionCache(component, 3, "abc")
+        self.assertEqual(component._expansionCache, None)
+
+    @inlineCallbacks
+    def test_maxRanges(self):
+        """
+        Only the most recently added ranges are kept.
+        """
+        self.patch(config.ExpansionCache, "MaxRanges", 2)
+        component = Component.fromString(event_text)
+        bindExpansionCache(component, 4, "abc")
+        yield loadExpansionCaches((component,))
+        limits = [DateTime(2017, 1, day, 0, 0, 0, tzid=Timezone.UTCTimezone) for day in (4, 6, 8,)]
+        for limit in limits:
+            component.expandTimeRanges(limit)
+
+        component = Component.fromString(event_text)
+        bindExpansionCache(component, 4, "abc")
+        yield loadExpansionCaches((component,))
+        self.assertEqual(
+            [component._expansionCache.get(component._expansionRangeKey(limit, None, False)) is not None for limit in limits],
+            [False, True, True],
+        )
+
+    @inlineCallbacks
+    def test_lazy(self):
+        """
+        Binding does not read the cache, and an expansion is only shared once
+        the cache has been loaded, with one request for several components.
+        """
+        cacher = expansioncache._expansionCacher()
+        first = Component.fromString(event_text)
+        bindExpansionCache(first, 5, "abc")
+        self.assertFalse(first.expansionCache().loaded())
+
+        # Not loaded - nothing is added
+        first.expandTimeRanges(self.limit)
+        cached = yield cacher.get(first.expansionCache()._key)
+        self.assertEqual(cached, None)
+
+        yield loadExpansionCaches((first,))
+        self.assertTrue(first.expansionCache().loaded())
+        first.expandTimeRanges(self.limit)
+
+        gets = []
+        self.patch(cacher, "get", lambda *args, **kwargs: gets.append(args))
+        getMulti = cacher.getMulti
+        multiGets = []
+
+        def _getMulti(keys):
+            multiGets.append(sorted(keys))
+            return getMulti(keys)
+        self.patch(cacher, "getMulti", _getMulti)
+
+        components = [Component.fromString(event_text) for _ignore in range(3)]
+        for component, resourceID in zip(components, (5, 5, 6,)):
+            bindExpansionCache(component, resourceID, "abc")
+        yield loadExpansionCaches(components + [Component.fromString(single_text), None])
+        self.assertEqual(gets, [])
+        self.assertEqual(multiGets, [sorted(set([component.expansionCache()._key for component in components]))])
+        self.assertEqual(len(multiGets[0]), 2)
+
+        rangeKey = first._expansionRangeKey(self.limit, None, False)
+        self.assertEqual(
+            [component.expansionCache().get(rangeKey) is not None for component in components],
+            [True, True, False],
+        )
+
+    @inlineCallbacks
+    def test_timezoneVersion(self):
+        """
+        Expansions are not shared once the timezone database has been updated.
+        """
+        first = Component.fromString(event_text)
+        bindExpansionCache(first, 7, "abc")
+        yield loadExpansionCaches((first,))
+        first.expandTimeRanges(self.limit)
+        rangeKey = first._expansionRangeKey(self.limit, None, False)
+
+        self.patch(TimezoneCache, "version", TimezoneCache.version + "-updated")
+        second = Component.fromString(event_text)
+        bindExpansionCache(second, 7, "abc")
+        yield loadExpansionCaches((second,))
+        self.assertEqual(second.expansionCache().get(rangeKey), None)
+
+    @inlineCallbacks
+    def test_validInstances(self):
+        """
+        L{Component.validInstances} uses an expansion shared by another
+        request.
+        """
+        rids = [DateTime(2017, 1, day, 10, 0, 0, tzid=Timezone.UTCTimezone) for day in (2, 3, 20,)]
+        first = Component.fromString(event_text)
+        bindExpansionCache(first, 8, "abc")
+        yield loadExpansionCaches((first,))
+        expected = first.validInstances(rids)
+        self.assertEqual(len(expected), 2)
+
+        def _expand(*args, **kwargs):
+            raise AssertionError("Expanded again")
+
+        second = Component.fromString(event_text)
+        bindExpansionCache(second, 8, "abc")
+        yield loadExpansionCaches((second,))
+        self.patch(second, "expandSetTimeRanges", _expand)
+        self.assertEqual(second.validInstances(rids), expected)
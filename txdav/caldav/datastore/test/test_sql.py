@@ -52,6 +52,7 @@ from txdav.caldav.datastore.scheduling.implicit import ImplicitScheduler
 from txdav.caldav.datastore.scheduling.itip import iTIPRequestStatus
 from txdav.caldav.datastore.scheduling.processing import ImplicitProcessor
 from txdav.caldav.datastore.scheduling.scheduler import ScheduleResponseQueue
+from txdav.caldav.datastore import sql as caldav_sql
 from txdav.caldav.datastore.sql import CalendarStoreFeatures, CalendarObject
 from txdav.common.datastore.sql import ECALENDARTYPE, CommonObjectResource, \
     CommonStoreTransactionMonitor
@@ -1468,6 +1469,46 @@ END:VCALENDAR
         result = yield newcalendar.notExpandedWithin(testMin, testMax)
         self.assertEqual(result, ["indexing.ics"])
 
+    @inlineCallbacks
+    def test_testAndUpdateIndexLogged(self):
+        """
+        Test Calendar.testAndUpdateIndex records the number of resources it
+        had to re-expand in the transaction's log items.
+        """
+
+        self.patch(config, "FreeBusyIndexDelayedExpand", False)
+
+        calendar = yield self.calendarUnderTest()
+        nowYear = self.nowYear["now"]
+        caldata = """BEGIN:VCALENDAR
+VERSION:2.0
+CALSCALE:GREGORIAN
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:instance
+DTSTART:%04d0102T140000Z
+DURATION:PT1H
+CREATED:20060102T190000Z
+DTSTAMP:20051222T210507Z
+RRULE:FREQ=WEEKLY
+SUMMARY:instance
+END:VEVENT
+END:VCALENDAR
+""".replace("\n", "\r\n") % (nowYear,)
+        yield calendar.createCalendarObjectWithName("indexing.ics", Component.fromString(caldata))
+        yield self.commit()
+
+        calendar = yield self.calendarUnderTest()
+        yield calendar.testAndUpdateIndex(None, DateTime(nowYear + 1, 1, 1, 0, 0, 0, tzid=Timezone.UTCTimezone))
+        self.assertTrue("reexpand" not in self.transactionUnderTest().logItems)
+
+        yield calendar.testAndUpdateIndex(None, DateTime(nowYear + 3, 1, 1, 0, 0, 0, tzid=Timezone.UTCTimezone))
+        self.assertEqual(self.transactionUnderTest().logItems["reexpand"], 1)
+
+        calendarObject = yield self.calendarObjectUnderTest(name="indexing.ics")
+        _ignore_rmin, rmax = yield calendarObject.recurrenceMinMax()
+        self.assertEqual(rmax.getYear(), nowYear + 3)
+
     @inlineCallbacks
     def test_setComponent_no_instance_indexing(self):
         """
@@ -1531,6 +1572,283 @@ END:VCALENDAR
         yield obj1.remove()
         yield self.commit()
 
+    @inlineCallbacks
+    def test_addInstancesPerUser(self):
+        """
+        Each instance of a recurring event gets a TIME_RANGE row, and each of
+        those rows gets the PERUSER rows for users with different per-user
+        data.
+        """
+
+        caldata = """BEGIN:VCALENDAR
+VERSION:2.0
+CALSCALE:GREGORIAN
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:instance
+DTSTART:%(now)s0102T140000Z
+DURATION:PT1H
+CREATED:20060102T190000Z
+DTSTAMP:20051222T210507Z
+RRULE:FREQ=DAILY;COUNT=10
+SUMMARY:instance
+END:VEVENT
+BEGIN:X-CALENDARSERVER-PERUSER
+UID:instance
+X-CALENDARSERVER-PERUSER-UID:user02
+BEGIN:X-CALENDARSERVER-PERINSTANCE
+TRANSP:TRANSPARENT
+END:X-CALENDARSERVER-PERINSTANCE
+END:X-CALENDARSERVER-PERUSER
+END:VCALENDAR
+""".replace("\n", "\r\n") % self.nowYear
+
+        self.patch(config, "FreeBusyIndexDelayedExpand", False)
+
+        calendar = yield self.calendarUnderTest()
+        calendarObject = yield calendar.createCalendarObjectWithName("indexing.ics", Component.fromString(caldata))
+        instances = yield calendarObject.instances()
+        self.assertEqual(len(instances), 10)
+
+        tr = schema.TIME_RANGE
+        tpy = schema.PERUSER
+        rows = yield Select(
+            [tpy.TIME_RANGE_INSTANCE_ID, tpy.USER_ID, tpy.TRANSPARENT],
+            From=tpy.join(tr, tpy.TIME_RANGE_INSTANCE_ID == tr.INSTANCE_ID),
+            Where=tr.CALENDAR_OBJECT_RESOURCE_ID == Parameter("resourceID"),
+        ).on(self.transactionUnderTest(), resourceID=calendarObject._resourceID)
+        self.assertEqual(
+            sorted([row[0] for row in rows]),
+            sorted([instance[0] for instance in instances]),
+        )
+        self.assertEqual(set([(row[1], bool(row[2]),) for row in rows]), set([("user02", True,)]))
+        yield self.commit()
+
+    def test_multiRowInsertSQL(self):
+        """
+        L{caldav_sql._multiRowInsertSQL} writes one VALUES list per row.
+        """
+        tpy = schema.PERUSER
+        self.assertEqual(
+            caldav_sql._multiRowInsertSQL(tpy, [tpy.USER_ID, tpy.TRANSPARENT], 2, "pyformat"),
+            "insert into PERUSER (USER_ID, TRANSPARENT) values (%s, %s), (%s, %s)",
+        )
+        tr = schema.TIME_RANGE
+        self.assertEqual(
+            caldav_sql._multiRowInsertSQL(tr, [tr.FLOATING], 2, "numeric", returning=tr.INSTANCE_ID),
+            "insert into TIME_RANGE (FLOATING) values (:1), (:2) returning INSTANCE_ID",
+        )
+
+    @inlineCallbacks
+    def test_addInstancesPerUserBatched(self):
+        """
+        When the TIME_RANGE rows are written by several statements, each
+        PERUSER row still goes with the TIME_RANGE row of its own instance.
+        """
+
+        caldata = """BEGIN:VCALENDAR
+VERSION:2.0
+CALSCALE:GREGORIAN
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:instance
+DTSTART:%(now)s0102T140000Z
+DURATION:PT1H
+CREATED:20060102T190000Z
+DTSTAMP:20051222T210507Z
+RRULE:FREQ=DAILY;COUNT=10
+SUMMARY:instance
+END:VEVENT
+BEGIN:X-CALENDARSERVER-PERUSER
+UID:instance
+X-CALENDARSERVER-PERUSER-UID:user02
+BEGIN:X-CALENDARSERVER-PERINSTANCE
+RECURRENCE-ID:%(now)s0108T140000Z
+TRANSP:TRANSPARENT
+END:X-CALENDARSERVER-PERINSTANCE
+END:X-CALENDARSERVER-PERUSER
+END:VCALENDAR
+""".replace("\n", "\r\n") % self.nowYear
+
+        self.patch(config, "FreeBusyIndexDelayedExpand", False)
+        self.patch(caldav_sql, "_ROWS_PER_STATEMENT", 3)
+
+        calendar = yield self.calendarUnderTest()
+        calendarObject = yield calendar.createCalendarObjectWithName("indexing.ics", Component.fromString(caldata))
+        instances = yield calendarObject.instances()
+        self.assertEqual(len(instances), 10)
+
+        tr = schema.TIME_RANGE
+        tpy = schema.PERUSER
+        rows = yield Select(
+            [tr.START_DATE, tpy.USER_ID],
+            From=tpy.join(tr, tpy.TIME_RANGE_INSTANCE_ID == tr.INSTANCE_ID),
+            Where=tr.CALENDAR_OBJECT_RESOURCE_ID == Parameter("resourceID"),
+        ).on(self.transactionUnderTest(), resourceID=calendarObject._resourceID)
+        self.assertEqual(len(rows), 1)
+        start = rows[0][0]
+        if isinstance(start, str):
+            start = parseSQLTimestamp(start)
+        self.assertEqual(start, datetime.datetime(self.nowYear["now"], 1, 8, 14, 0, 0))
+        self.assertEqual(rows[0][1], "user02")
+        yield self.commit()
+
+    @inlineCallbacks
+    def test_updateInstancesIncremental(self):
+        """
+        Changing one instance of a recurring event only changes its own
+        TIME_RANGE row, but changing the recurrence rule replaces them all.
+        """
+
+        caldata = """BEGIN:VCALENDAR
+VERSION:2.0
+CALSCALE:GREGORIAN
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:instance
+DTSTART:%(now)s0102T140000Z
+DURATION:PT1H
+CREATED:20060102T190000Z
+DTSTAMP:20051222T210507Z
+RRULE:FREQ=DAILY;COUNT=%(count)d
+SUMMARY:instance
+END:VEVENT
+%(override)sEND:VCALENDAR
+"""
+
+        override = """BEGIN:VEVENT
+UID:instance
+RECURRENCE-ID:%(now)s0104T140000Z
+DTSTART:%(now)s0104T160000Z
+DURATION:PT1H
+CREATED:20060102T190000Z
+DTSTAMP:20051222T210507Z
+SUMMARY:instance
+END:VEVENT
+"""
+
+        def _data(count=10, withOverride=False):
+            subs = dict(self.nowYear, count=count, override=(override % self.nowYear) if withOverride else "")
+            return Component.fromString((caldata % subs).replace("\n", "\r\n"))
+
+        self.patch(config, "FreeBusyIndexDelayedExpand", False)
+
+        calendar = yield self.calendarUnderTest()
+        yield calendar.createCalendarObjectWithName("indexing.ics", _data())
+        yield self.commit()
+
+        calendarObject = yield self.calendarObjectUnderTest(name="indexing.ics")
+        before = yield calendarObject.instances()
+        self.assertEqual(len(before), 10)
+        yield calendarObject.setComponent(_data(withOverride=True))
+        yield self.commit()
+
+        calendarObject = yield self.calendarObjectUnderTest(name="indexing.ics")
+        after = yield calendarObject.instances()
+        self.assertEqual(len(after), 10)
+        self.assertEqual(len(set(map(tuple, before)) & set(map(tuple, after))), 9)
+        yield calendarObject.setComponent(_data(count=5, withOverride=True))
+        yield self.commit()
+
+        calendarObject = yield self.calendarObjectUnderTest(name="indexing.ics")
+        rebuilt = yield calendarObject.instances()
+        self.assertEqual(len(rebuilt), 5)
+        self.assertEqual(set([row[0] for row in after]) & set([row[0] for row in rebuilt]), set())
+        yield self.commit()
+
+    @inlineCallbacks
+    def test_updateInstancesMoveAll(self):
+        """
+        Moving every instance of a recurring event without changing its
+        recurrence rule removes the old TIME_RANGE rows in batches, and the
+        next update does not reuse this one's recurrence rule comparison.
+        """
+
+        caldata = """BEGIN:VCALENDAR
+VERSION:2.0
+CALSCALE:GREGORIAN
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:instance
+DTSTART:%(now)s0102T%(hour)s0000Z
+DURATION:PT1H
+CREATED:20060102T190000Z
+DTSTAMP:20051222T210507Z
+RRULE:FREQ=DAILY;COUNT=10
+SUMMARY:instance
+END:VEVENT
+END:VCALENDAR
+"""
+
+        def _data(hour):
+            subs = dict(self.nowYear, hour=hour)
+            return Component.fromString((caldata % subs).replace("\n", "\r\n"))
+
+        self.patch(config, "FreeBusyIndexDelayedExpand", False)
+        self.patch(caldav_sql, "_ROWS_PER_STATEMENT", 3)
+
+        calendar = yield self.calendarUnderTest()
+        yield calendar.createCalendarObjectWithName("indexing.ics", _data("14"))
+        yield self.commit()
+
+        calendarObject = yield self.calendarObjectUnderTest(name="indexing.ics")
+        before = yield calendarObject.instances()
+        self.assertEqual(len(before), 10)
+        yield calendarObject.setComponent(_data("16"))
+        self.assertTrue(calendarObject.tr_rebuild)
+        yield self.commit()
+
+        calendarObject = yield self.calendarObjectUnderTest(name="indexing.ics")
+        after = yield calendarObject.instances()
+        self.assertEqual(len(after), 10)
+        self.assertEqual(set([row[0] for row in before]) & set([row[0] for row in after]), set())
+        yield self.commit()
+
+    @inlineCallbacks
+    def test_reindexUsesExpansionCache(self):
+        """
+        Re-indexing stored data uses an expansion of it shared by an earlier
+        re-index, rather than expanding it again.
+        """
+
+        caldata = """BEGIN:VCALENDAR
+VERSION:2.0
+CALSCALE:GREGORIAN
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:reindex
+DTSTART:%(now)s0102T140000Z
+DURATION:PT1H
+CREATED:20060102T190000Z
+DTSTAMP:20051222T210507Z
+RRULE:FREQ=WEEKLY
+SUMMARY:reindex
+END:VEVENT
+END:VCALENDAR
+"""
+
+        calendar = yield self.calendarUnderTest()
+        yield calendar.createCalendarObjectWithName("reindex.ics", Component.fromString((caldata % self.nowYear).replace("\n", "\r\n")))
+        yield self.commit()
+
+        expand = DateTime.getToday()
+        expand.offsetDay(2 * 365)
+
+        calendarObject = yield self.calendarObjectUnderTest(name="reindex.ics")
+        yield calendarObject.updateDatabase((yield calendarObject.component()), expand_until=expand, reCreate=True)
+        before = yield calendarObject.instances()
+        yield self.commit()
+
+        def _expand(*args, **kwargs):
+            raise AssertionError("Expanded again")
+        self.patch(Component, "expandSetTimeRanges", _expand)
+
+        calendarObject = yield self.calendarObjectUnderTest(name="reindex.ics")
+        yield calendarObject.updateDatabase((yield calendarObject.component()), expand_until=expand, reCreate=True)
+        after = yield calendarObject.instances()
+        self.assertEqual(len(after), len(before))
+        yield self.commit()
+
     @inlineCallbacks
     def test_loadObjectResourcesWithName(self):
         """
@@ -1634,6 +1952,31 @@ END:VCALENDAR
         calendarObject = (yield home.objectResourceWithID(obj._resourceID))
         self.assertNotEquals(calendarObject, None)
 
+    @inlineCallbacks
+    def test_componentCache(self):
+        """
+        L{CalendarObject.component} re-uses the data parsed by an earlier
+        transaction instead of loading and parsing it again, and callers get
+        their own copy of the data to change.
+        """
+        obj = yield self.calendarObjectUnderTest()
+        component = yield obj.component()
+        text = str(component)
+        yield self.commit()
+
+        obj = yield self.calendarObjectUnderTest()
+        self.patch(obj, "_text", lambda: self.fail("Data was loaded"))
+        cached = yield obj.component()
+        self.assertEqual(str(cached), text)
+        self.assertTrue(cached is not component)
+        cached.mainComponent().removeProperty(cached.mainComponent().getProperty("SUMMARY"))
+        yield self.commit()
+
+        obj = yield self.calendarObjectUnderTest()
+        cached = yield obj.component()
+        self.assertEqual(str(cached), text)
+        yield self.commit()
+
     @inlineCallbacks
     def test_defaultAlarms(self):
         """
@@ -2161,6 +2504,125 @@ END:VCALENDAR
         self.assertEqual(obj._dataversion, obj._currentDataVersion)
         yield self.commit()
 
+    @inlineCallbacks
+    def test_validatedDataNotRevalidated(self):
+        """
+        Data stored at the current data version is not validated again when
+        it is read.
+        """
+        self.patch(config.ComponentCache, "Enabled", False)
+
+        obj = yield self.calendarObjectUnderTest()
+        self.assertEqual(obj._dataversion, obj._currentDataVersion)
+        yield self.commit()
+
+        self.patch(Component, "validCalendarData", lambda *args, **kwargs: self.fail("Data was validated"))
+        obj = yield self.calendarObjectUnderTest()
+        component = yield obj.component()
+        self.assertTrue(component is not None)
+        yield self.commit()
+
+    @inlineCallbacks
+    def test_validatedOnceOnWrite(self):
+        """
+        Data written by a client is only validated by the full validation of
+        the write, and data written internally is fixed before it is stored.
+        """
+        data = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:12345-67890
+DTSTART:20130806T000000Z
+DURATION:PT1H
+DTSTAMP:20051222T210507Z
+SUMMARY:1
+END:VEVENT
+END:VCALENDAR
+"""
+
+        fixes = []
+        fixCalendarData = CalendarObject._fixCalendarData
+
+        def _fixCalendarData(self, component):
+            fixes.append(True)
+            return fixCalendarData(self, component)
+        self.patch(CalendarObject, "_fixCalendarData", _fixCalendarData)
+
+        yield self.homeUnderTest(name="user01", create=True)
+        calendar = yield self.calendarUnderTest(name="calendar", home="user01")
+        yield calendar.createCalendarObjectWithName("data1.ics", Component.fromString(data))
+        self.assertEqual(fixes, [])
+        yield self.commit()
+
+        obj = yield self.calendarObjectUnderTest(name="data1.ics", calendar_name="calendar", home="user01")
+        component = yield obj.componentForUser()
+        yield obj._setComponentInternal(component.duplicate(), internal_state=ComponentUpdateState.RAW)
+        self.assertEqual(fixes, [True])
+        yield self.commit()
+
+    @inlineCallbacks
+    def test_dataUpgradeValidated(self):
+        """
+        Data stored before it was validated on write is validated when read,
+        and is then marked as validated without changing it if there was
+        nothing to fix.
+        """
+        data = """BEGIN:VCALENDAR
+VERSION:2.0
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:12345-67890
+DTSTART:20130806T000000Z
+DURATION:PT1H
+DTSTAMP:20051222T210507Z
+SUMMARY:1
+END:VEVENT
+END:VCALENDAR
+"""
+
+        self.patch(CalendarObject.CalendarObjectUpgradeWork, "delay", 1)
+
+        yield self.homeUnderTest(name="user01", create=True)
+        calendar = yield self.calendarUnderTest(name="calendar", home="user01")
+        yield calendar.createCalendarObjectWithName("data1.ics", Component.fromString(data))
+        yield self.commit()
+
+        # Make it look like it was not validated on write
+        obj = yield self.calendarObjectUnderTest(name="data1.ics", calendar_name="calendar", home="user01")
+        md5 = obj.md5()
+        modified = obj.modified()
+        co = schema.CALENDAR_OBJECT
+        yield Update(
+            {co.DATAVERSION: 1},
+            Where=co.RESOURCE_ID == obj._resourceID,
+        ).on(self.transactionUnderTest())
+        yield self.commit()
+
+        # Validated on read
+        validated = []
+        validCalendarData = Component.validCalendarData
+
+        def _validCalendarData(self, *args, **kwargs):
+            validated.append(True)
+            return validCalendarData(self, *args, **kwargs)
+        self.patch(Component, "validCalendarData", _validCalendarData)
+
+        obj = yield self.calendarObjectUnderTest(name="data1.ics", calendar_name="calendar", home="user01")
+        self.assertEqual(obj._dataversion, 1)
+        yield obj.component()
+        self.assertEqual(len(validated), 1)
+        yield self.commit()
+
+        # Wait for the upgrade to complete
+        yield JobItem.waitEmpty(self._sqlCalendarStore.newTransaction, reactor, 60)
+
+        obj = yield self.calendarObjectUnderTest(name="data1.ics", calendar_name="calendar", home="user01")
+        self.assertEqual(obj._dataversion, obj._currentDataVersion)
+        self.assertEqual(obj.md5(), md5)
+        self.assertEqual(obj.modified(), modified)
+        yield self.commit()
+
     @inlineCallbacks
     def test_sharedTasksMissingSharer(self):
         """
@@ -2555,6 +3017,57 @@ END:VCALENDAR
         self.assertEquals(deleted, [])
         self.assertEquals(invalid, [])
 
+    @inlineCallbacks
+    def test_calendarSyncLimited(self):
+        """
+        L{ICalendar.resourceNamesSinceRevisionLimited} pages through the
+        changes of a calendar in revision order, resuming from the returned
+        position until all changes have been seen.
+        """
+
+        cal = yield self.calendarUnderTest(home="user01", name="calendar")
+        self.assertTrue(cal.supportsLimitedSync())
+
+        # Initial sync in pages of two
+        seen = []
+        revision, position = 0, 0
+        pages = 0
+        while True:
+            changed, deleted, invalid, resume = yield cal.resourceNamesSinceRevisionLimited(revision, position, 2)
+            self.assertTrue(len(changed) <= 2)
+            self.assertEqual(deleted, [])
+            self.assertEqual(invalid, [])
+            seen.extend(changed)
+            pages += 1
+            if resume is None:
+                break
+            revision, position = resume
+        self.assertEqual(pages, 3)
+        self.assertEqual(sorted(seen), ["1.ics", "2.ics", "3.ics", "4.ics", "5.ics", ])
+
+        # No limit returns the same as an unlimited sync
+        changed, deleted, invalid, resume = yield cal.resourceNamesSinceRevisionLimited(0, 0, None)
+        self.assertEqual(sorted(changed), sorted(seen))
+        self.assertTrue(resume is None)
+
+        # Changes since the last page
+        st = yield cal.syncToken()
+        yield cal.createCalendarObjectWithName("new.ics", Component.fromString(
+            test_event_text
+        ))
+        obj1 = yield cal.calendarObjectWithName("2.ics")
+        yield obj1.remove()
+
+        changed, deleted, invalid, resume = yield cal.resourceNamesSinceRevisionLimited(self.token2revision(st), 0, 1)
+        self.assertEqual(changed, ["new.ics"])
+        self.assertEqual(deleted, [])
+        self.assertTrue(resume is not None)
+
+        changed, deleted, invalid, resume = yield cal.resourceNamesSinceRevisionLimited(resume[0], resume[1], 1)
+        self.assertEqual(changed, [])
+        self.assertEqual(deleted, ["2.ics"])
+        self.assertTrue(resume is None)
+
 
 class SchedulingTests(CommonCommonTests, DateTimeSubstitutionsMixin, unittest.TestCase):
     """
@@ -20,6 +20,7 @@ from twext.python.filepath import CachingFilePath as FilePath
 from twisted.internet.defer import inlineCallbacks, returnValue
 from twisted.trial.unittest import TestCase
 from twistedcaldav import customxml
+from twistedcaldav.ical import Component
 from twistedcaldav.stdconfig import config
 from txdav.base.propertystore.base import PropertyName
 from txdav.common.datastore.sql_tables import _BIND_MODE_DIRECT
@@ -1869,3 +1870,65 @@ class SharingRevisions(BaseSharingTests):
             self.assertEqual(len(changed), 0)
             self.assertEqual(len(deleted), 0)
             self.assertEqual(len(invalid), 0)
+
+    @inlineCallbacks
+    def test_sharedRevisionsMultipleShares(self):
+        """
+        Verify that resourceNamesSinceRevision on a home reports the changes made since the
+        revision in each of several shared calendars.
+        """
+        sharedName1 = yield self._createShare()
+
+        calendar = yield self.calendarUnderTest(home="user03", name="calendar")
+        shareeView = yield calendar.inviteUIDToShare("user02", _BIND_MODE_READ, "summary")
+        inviteUID = shareeView.shareUID()
+        yield self.commit()
+        shareeHome = yield self.homeUnderTest(name="user02")
+        shareeView = yield shareeHome.acceptShare(inviteUID)
+        sharedName2 = shareeView.name()
+        yield self.commit()
+
+        otherHome = yield self.homeUnderTest(name="user02")
+        revision = otherHome.revisionFromToken((yield otherHome.syncToken()))
+        yield self.commit()
+
+        # Remove an event from one shared calendar and add one to the other
+        obj = yield self.calendarObjectUnderTest(home="user01", calendar_name="calendar", name="cal1.ics")
+        yield obj.remove()
+        calendar = yield self.calendarUnderTest(home="user03", name="calendar")
+        yield calendar.createCalendarObjectWithName("cal2.ics", Component.fromString(self.cal1.replace("uid1", "uid2")))
+        yield self.commit()
+
+        otherHome = yield self.homeUnderTest(name="user02")
+        changed, deleted, invalid = yield otherHome.resourceNamesSinceRevision(revision, "1")
+        self.assertEqual(set(changed), set((sharedName1 + "/", sharedName2 + "/",)))
+        self.assertEqual(len(deleted), 0)
+        self.assertEqual(len(invalid), 0)
+
+        changed, deleted, invalid = yield otherHome.resourceNamesSinceRevision(revision, "infinity")
+        self.assertTrue(sharedName1 + "/" in changed)
+        self.assertTrue(sharedName2 + "/cal2.ics" in changed)
+        self.assertEqual(set(deleted), set((sharedName1 + "/cal1.ics",)))
+        self.assertEqual(len(invalid), 0)
+
+    @inlineCallbacks
+    def test_sharedRevisionsZero(self):
+        """
+        Verify that resourceNamesSinceRevision on a home with revision zero lists every resource in
+        the owned and shared calendars, in order.
+        """
+        sharedName = yield self._createShare()
+
+        calendar = yield self.calendarUnderTest(home="user02", name="calendar")
+        yield calendar.createCalendarObjectWithName("cal2.ics", Component.fromString(self.cal1.replace("uid1", "uid2")))
+        yield self.commit()
+
+        otherHome = yield self.homeUnderTest(name="user02")
+        changed, deleted, invalid = yield otherHome.resourceNamesSinceRevision(0, "infinity")
+        self.assertEqual(changed, sorted([
+            sharedName + "/", sharedName + "/cal1.ics",
+            "calendar/", "calendar/cal2.ics",
+            "inbox/",
+        ]))
+        self.assertEqual(deleted, [])
+        self.assertEqual(invalid, [])
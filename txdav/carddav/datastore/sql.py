@@ -326,6 +326,34 @@ class AddressBookHome(CommonHome):
         result = [[row[0] if row[0] else self.addressbook().name()] + row for row in rows]
         returnValue(result)
 
+    @inlineCallbacks
+    def childObjectResourcePaths(self, children):
+        """
+        Address books are listed one at a time, as a shared group only exposes its members.
+        """
+        paths = []
+        for child in children:
+            path = child.name()
+            for name in (yield child.listObjectResources()):
+                paths.append("%s/%s" % (path, name,))
+        returnValue(paths)
+
+    @inlineCallbacks
+    def sharedChildrenResourceNamesSinceRevision(self, shares, revision, depth):
+        """
+        Shared address books are handled one at a time, as the changes to a shared group come
+        from its membership as well as from the revision table.
+        """
+        changed = set()
+        deleted = set()
+        invalid = set()
+        for share in shares:
+            sharedChanged, sharedDeleted, sharedInvalid = yield share.sharedChildResourceNamesSinceRevision(revision, depth)
+            changed |= sharedChanged
+            deleted |= sharedDeleted
+            invalid |= sharedInvalid
+        returnValue((changed, deleted, invalid,))
+
 
 AddressBookHome._register(EADDRESSBOOKTYPE)
 
@@ -610,6 +638,13 @@ class AddressBook(AddressBookSharingMixIn, CommonHomeChild):
     def _deleteRevision(self, name, id=0):
         return self._changeRevision("delete", name, id)
 
+    def supportsLimitedSync(self):
+        """
+        Shared address books merge in group membership changes, which are not
+        revision ordered, so only owned ones can be paged.
+        """
+        return self.owned()
+
     @inlineCallbacks
     def resourceNamesSinceRevision(self, revision):
         """
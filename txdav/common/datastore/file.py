@@ -1173,6 +1173,9 @@ class CommonHomeChild(FileMetaDataMixin, FancyEqMixin, HomeChildBase):
     def resourceNamesSinceToken(self, token):
         return succeed(self.retrieveOldIndex().whatchanged(token))
 
+    def supportsLimitedSync(self):
+        return False
+
     def objectResourcesHaveProperties(self):
         """
         So filestore objects do need to support properties.
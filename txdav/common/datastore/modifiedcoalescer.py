@@ -0,0 +1,129 @@
+# -*- test-case-name: txdav.common.datastore.test.test_modifiedcoalescer -*-
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Per-process coalescing of home and collection MODIFIED bumps.
+"""
+
+__all__ = [
+    "ModifiedCoalescer",
+    "modifiedCoalescer",
+]
+
+from twistedcaldav.lrucache import LRUCache
+from twistedcaldav.config import config
+
+
+class ModifiedCoalescer(object):
+    """
+    Remembers the homes and collections whose MODIFIED value this process
+    bumped recently, so that further bumps of them within a time window can
+    be skipped. Every change to a busy home or collection otherwise locks
+    and updates the same row.
+
+    @ivar bumped: the number of bumps recorded
+    @type bumped: L{int}
+    @ivar saved: the number of bumps skipped
+    @type saved: L{int}
+    """
+
+    def __init__(self, windowSeconds, maxEntries, clock=None):
+        """
+        @param windowSeconds: the time in seconds after a bump during which
+            further bumps of the same row are skipped
+        @type windowSeconds: L{int}
+        @param maxEntries: the maximum number of recently bumped rows to
+            remember
+        @type maxEntries: L{int}
+        @param clock: a callable returning the current time in seconds, used
+            instead of L{time.time} (for tests)
+        @type clock: callable
+        """
+        self._recent = LRUCache(
+            maxEntries,
+            expireSeconds=windowSeconds,
+            clock=clock,
+            sizeOf=lambda key, value: 0,
+        )
+        self.bumped = 0
+        self.saved = 0
+
+    def recentlyBumped(self, resourceID):
+        """
+        Check whether a row was bumped within the time window, counting the
+        bump as saved if so.
+
+        @param resourceID: the resource ID of the home or collection
+        @type resourceID: L{int}
+
+        @return: C{True} if the bump can be skipped
+        @rtype: L{bool}
+        """
+        if self._recent.get(resourceID) is not None:
+            self.saved += 1
+            return True
+        return False
+
+    def recordBumped(self, resourceID):
+        """
+        Record that a row was bumped (and committed).
+
+        @param resourceID: the resource ID of the home or collection
+        @type resourceID: L{int}
+        """
+        self._recent.set(resourceID, True)
+        self.bumped += 1
+
+    def clear(self):
+        """
+        Forget all recent bumps.
+        """
+        self._recent.clear()
+
+    def stats(self):
+        """
+        Return the statistics of the recent bumps, as a cache whose hits are
+        the bumps saved, plus the number of bumps recorded and saved.
+
+        @rtype: L{dict}
+        """
+        stats = self._recent.stats()
+        stats["bumped"] = self.bumped
+        stats["saved"] = self.saved
+        return stats
+
+
+_modifiedCoalescer = None
+
+
+def modifiedCoalescer():
+    """
+    Get this process' L{ModifiedCoalescer}, creating it on first use.
+
+    @return: the coalescer, or C{None} if bumps are not coalesced across
+        transactions
+    @rtype: L{ModifiedCoalescer}
+    """
+    global _modifiedCoalescer
+    if not config.ModifiedCoalescing.WindowSeconds:
+        return None
+    if _modifiedCoalescer is None:
+        _modifiedCoalescer = ModifiedCoalescer(
+            config.ModifiedCoalescing.WindowSeconds,
+            config.ModifiedCoalescing.MaxEntries,
+        )
+    return _modifiedCoalescer
@@ -57,6 +57,7 @@ from txdav.base.propertystore.sql import PropertyStore
 from txdav.caldav.icalendarstore import ICalendarTransaction, ICalendarStore
 from txdav.carddav.iaddressbookstore import IAddressBookTransaction
 from txdav.common.datastore.common import HomeChildBase
+from txdav.common.datastore.modifiedcoalescer import modifiedCoalescer
 from txdav.common.datastore.podding.conduit import PoddingConduit
 from txdav.common.datastore.podding.migration.work import MigratedHomeCleanupWork
 from txdav.common.datastore.sql_apn import APNSubscriptionsMixin
@@ -595,6 +596,9 @@ class CommonStoreTransaction(
         self._notifierFactories = notifierFactories
         self._notifiedAlready = set()
         self._bumpedRevisionAlready = set()
+        self._modifiedBumps = {}
+        self._modifiedBumpsFlushed = False
+        self._modifiedBumpsSaved = 0
         self._label = label
         self._migrating = migrating
         self._allowDisabled = False
@@ -880,6 +884,48 @@ class CommonStoreTransaction(
         """
         self._bumpedRevisionAlready.add(obj.id())
 
+    def bumpModifiedForObject(self, obj):
+        """
+        Arrange for the MODIFIED value of a home or home child to be bumped
+        when this transaction commits, so that the row lock it takes is only
+        held briefly. Repeated bumps of the same object in this transaction,
+        or within C{config.ModifiedCoalescing.WindowSeconds} of this process
+        last bumping it, are coalesced and counted in the log items.
+
+        @param obj: the home or home child to bump
+        @type obj: L{CommonHome} or L{CommonHomeChild}
+        """
+        key = obj.id()
+        coalescer = modifiedCoalescer()
+        if key in self._modifiedBumps or (coalescer is not None and coalescer.recentlyBumped(key)):
+            self._modifiedBumpsSaved += 1
+            self.logItems["modified-saved"] = str(self._modifiedBumpsSaved)
+            return succeed(None)
+
+        self._modifiedBumps[key] = obj
+        if self._modifiedBumpsFlushed:
+            # Changed by a pre-commit hook - too late to defer
+            return self._bumpModifiedForKey(key, obj)
+        return succeed(None)
+
+    @inlineCallbacks
+    def _flushModifiedBumps(self):
+        """
+        Do the MODIFIED bumps deferred by L{bumpModifiedForObject}, in a
+        consistent order to avoid lock ordering conflicts with other
+        transactions.
+        """
+        self._modifiedBumpsFlushed = True
+        for key in sorted(self._modifiedBumps.keys()):
+            yield self._bumpModifiedForKey(key, self._modifiedBumps[key])
+
+    @inlineCallbacks
+    def _bumpModifiedForKey(self, key, obj):
+        bumped = yield obj._bumpModifiedNow()
+        coalescer = modifiedCoalescer()
+        if bumped and coalescer is not None:
+            self.postCommit(lambda: coalescer.recordBumped(key))
+
     _savepointCounter = 0
 
     def _savepoint(self):
@@ -1019,7 +1065,9 @@ class CommonStoreTransaction(
         # Do stats logging as a postCommit because there might be some pending preCommit SQL we want to log
         if self._stats:
             self.postCommit(self.statsReport)
-        return self._sqlTxn.commit()
+        d = self._flushModifiedBumps()
+        d.addCallback(lambda _ignore: self._sqlTxn.commit())
+        return d
 
     def abort(self):
         """
@@ -1482,6 +1530,7 @@ class CommonHome(SharingHomeMixIn):
     _homeType = None
     _homeSchema = None
     _homeMetaDataSchema = None
+    _quotaJournalSchema = None
 
     _externalClass = None
     _childClass = None
@@ -2392,6 +2441,29 @@ class CommonHome(SharingHomeMixIn):
             revision=revision)
         returnValue(result)
 
+    @classproperty
+    def _sharedChangesQuery(cls):
+        """
+        Changes to the child resources of all the shared collections bound into a home.
+        """
+        bind = cls._bindSchema
+        rev = cls._revisionsSchema
+        return Select(
+            [
+                bind.RESOURCE_ID,
+                rev.RESOURCE_NAME,
+                rev.DELETED,
+            ],
+            From=rev.join(
+                bind,
+                rev.RESOURCE_ID == bind.RESOURCE_ID,
+            ),
+            Where=(bind.HOME_RESOURCE_ID == Parameter("resourceID")).And
+                  (bind.BIND_MODE != _BIND_MODE_OWN).And
+                  (rev.REVISION > Parameter("revision")).And
+                  (rev.RESOURCE_NAME != None)
+        )
+
     def resourceNamesSinceToken(self, token, depth):
         """
         Return the changed and deleted resources since a particular sync-token. This simply extracts
@@ -2492,15 +2564,14 @@ class CommonHome(SharingHomeMixIn):
                     changed.add("%s/%s" % (path, name,))
 
         # Now deal with existing shared collections
-        # TODO: think about whether this can be done in one query rather than looping over each share
-        for share in (yield self.children()):
-            if not share.owned():
-                sharedChanged, sharedDeleted, sharedInvalid = yield share.sharedChildResourceNamesSinceRevision(revision, depth)
-                changed |= sharedChanged
-                changed -= sharedInvalid
-                deleted |= sharedDeleted
-                deleted -= sharedInvalid
-                invalid |= sharedInvalid
+        shares = [child for child in (yield self.children()) if not child.owned()]
+        if shares:
+            sharedChanged, sharedDeleted, sharedInvalid = yield self.sharedChildrenResourceNamesSinceRevision(shares, revision, depth)
+            changed |= sharedChanged
+            changed -= sharedInvalid
+            deleted |= sharedDeleted
+            deleted -= sharedInvalid
+            invalid |= sharedInvalid
 
         changed = sorted(changed)
         deleted = sorted(deleted)
@@ -2508,41 +2579,144 @@ class CommonHome(SharingHomeMixIn):
         returnValue((changed, deleted, invalid,))
 
     @inlineCallbacks
-    def resourceNamesSinceRevisionZero(self, depth):
+    def sharedChildrenResourceNamesSinceRevision(self, shares, revision, depth):
         """
-        Revision == 0 specialization of L{resourceNamesSinceRevision} .
+        Determine the child resources that have changed since the specified sync revision in
+        the shared collections bound into this home, as
+        L{CommonHomeChild.sharedChildResourceNamesSinceRevision} does for each one, but reading
+        the revisions of all of them with a single query rather than one per share.
+
+        External shares, and shares bound after the revision (which are either reported in full
+        or invalidate the revision), are still handled one at a time.
 
+        @param shares: the shared collections
+        @type shares: C{list} of L{CommonHomeChild}
+        @param revision: the sync revision to compare to
+        @type revision: C{int}
         @param depth: depth for determine what changed
         @type depth: C{str}
-        """
 
-        # Scan each child
+        @return: the changed, deleted and invalid paths
+        @rtype: C{tuple} of three C{set}
+        """
         changed = set()
         deleted = set()
         invalid = set()
-        for child in (yield self.children()):
-            if child.owned():
-                path = child.name()
+        paths = {}
+        for share in shares:
+            if share.external() or not revision or revision < share._bindRevision:
+                sharedChanged, sharedDeleted, sharedInvalid = yield share.sharedChildResourceNamesSinceRevision(revision, depth)
+                changed |= sharedChanged
+                deleted |= sharedDeleted
+                invalid |= sharedInvalid
+            else:
+                paths[share._resourceID] = share.name()
+
+        if paths:
+            rows = yield self._sharedChangesQuery.on(
+                self._txn,
+                resourceID=self._resourceID,
+                revision=revision,
+            )
+            for resourceID, name, wasdeleted in rows:
+                # Ignore shares that are not visible in this home (e.g., not accepted)
+                path = paths.get(resourceID)
+                if path is None:
+                    continue
+
+                if wasdeleted:
+                    if depth == "1":
+                        changed.add("%s/" % (path,))
+                    else:
+                        deleted.add("%s/%s" % (path, name,))
+
                 # Always report collection as changed
                 changed.add("%s/" % (path,))
 
                 # Resource changed - for depth "infinity" report resource as changed
                 if depth != "1":
-                    for name in (yield child.listObjectResources()):
-                        changed.add("%s/%s" % (path, name,))
-            else:
-                sharedChanged, sharedDeleted, sharedInvalid = yield child.sharedChildResourceNamesSinceRevisionZero(depth)
-                changed |= sharedChanged
-                changed -= sharedInvalid
-                deleted |= sharedDeleted
-                deleted -= sharedInvalid
-                invalid |= sharedInvalid
+                    changed.add("%s/%s" % (path, name,))
 
-        changed = sorted(changed)
-        deleted = sorted(deleted)
-        invalid = sorted(invalid)
         returnValue((changed, deleted, invalid,))
 
+    @inlineCallbacks
+    def resourceNamesSinceRevisionZero(self, depth):
+        """
+        Revision == 0 specialization of L{resourceNamesSinceRevision} . Every existing child
+        collection is reported, and for depth "infinity" every resource in them too, which
+        are listed for all the collections at once by L{childObjectResourcePaths}.
+
+        External shares are reported as invalid for depth "infinity", as in
+        L{CommonHomeChild.sharedChildResourceNamesSinceRevisionZero}.
+
+        @param depth: depth for determine what changed
+        @type depth: C{str}
+        """
+
+        changed = []
+        invalid = []
+        children = []
+        for child in (yield self.children()):
+            path = "%s/" % (child.name(),)
+            if depth != "1" and not child.owned() and child.external():
+                invalid.append(path)
+            else:
+                # Always report collection as changed
+                changed.append(path)
+                if not child.external():
+                    children.append(child)
+
+        # Resource changed - for depth "infinity" report resource as changed
+        if depth != "1" and children:
+            changed.extend((yield self.childObjectResourcePaths(children)))
+
+        # The paths are mostly in order already, so this is cheap
+        changed.sort()
+        invalid.sort()
+        returnValue((changed, [], invalid,))
+
+    @classproperty
+    def _childObjectResourceNamesQuery(cls):
+        """
+        The names of the object resources in all the collections bound into a home, ordered by
+        the collection's name in the home and then by resource name.
+        """
+        bind = cls._bindSchema
+        obj = cls._objectSchema
+        return Select(
+            [
+                bind.RESOURCE_ID,
+                obj.RESOURCE_NAME,
+            ],
+            From=obj.join(
+                bind,
+                obj.PARENT_RESOURCE_ID == bind.RESOURCE_ID,
+            ),
+            Where=(bind.HOME_RESOURCE_ID == Parameter("resourceID")).And
+                  (bind.BIND_STATUS == _BIND_STATUS_ACCEPTED),
+            OrderBy=(bind.RESOURCE_NAME, obj.RESOURCE_NAME,),
+        )
+
+    @inlineCallbacks
+    def childObjectResourcePaths(self, children):
+        """
+        List the paths, relative to this home, of all the object resources in some of its
+        child collections, with one query for all of them rather than one per collection.
+
+        @param children: the child collections
+        @type children: C{list} of L{CommonHomeChild}
+
+        @return: the paths, ordered by collection and then by resource name
+        @rtype: C{list} of C{str}
+        """
+        paths = dict([(child._resourceID, child.name() + "/",) for child in children])
+        rows = yield self._childObjectResourceNamesQuery.on(self._txn, resourceID=self._resourceID)
+        returnValue([
+            paths[resourceID] + name
+            for resourceID, name in rows
+            if resourceID in paths
+        ])
+
     @inlineCallbacks
     def _loadPropertyStore(self):
 
@@ -2663,11 +2837,29 @@ class CommonHome(SharingHomeMixIn):
             Where=meta.RESOURCE_ID == Parameter("resourceID")
         )
 
+    @classproperty
+    def _quotaWithJournalQuery(cls):
+        meta = cls._homeMetaDataSchema
+        qj = cls._quotaJournalSchema
+        return Select(
+            [meta.QUOTA_USED_BYTES, Sum(qj.DELTA)],
+            From=meta.join(qj, meta.RESOURCE_ID == qj.HOME_RESOURCE_ID, "left outer"),
+            Where=meta.RESOURCE_ID == Parameter("resourceID"),
+            GroupBy=meta.QUOTA_USED_BYTES,
+        )
+
     @inlineCallbacks
     def quotaUsedBytes(self):
         if self._quotaUsedBytes is None:
-            self._quotaUsedBytes = (yield self._quotaQuery.on(
-                self._txn, resourceID=self._resourceID))[0][0]
+            if self._quotaJournalSchema is not None:
+                # Deltas not yet folded in count too - read them in the same
+                # statement so a concurrent fold cannot be seen half done
+                used, pending = (yield self._quotaWithJournalQuery.on(
+                    self._txn, resourceID=self._resourceID))[0]
+                self._quotaUsedBytes = max(used + (pending or 0), 0)
+            else:
+                self._quotaUsedBytes = (yield self._quotaQuery.on(
+                    self._txn, resourceID=self._resourceID))[0][0]
         returnValue(self._quotaUsedBytes)
 
     @classproperty
@@ -2691,6 +2883,32 @@ class CommonHome(SharingHomeMixIn):
         return Update({meta.QUOTA_USED_BYTES: 0},
                       Where=meta.RESOURCE_ID == Parameter("resourceID"))
 
+    @classproperty
+    def _addQuotaJournalQuery(cls):
+        qj = cls._quotaJournalSchema
+        return Insert({
+            qj.HOME_RESOURCE_ID: Parameter("resourceID"),
+            qj.DELTA: Parameter("delta"),
+        })
+
+    @classmethod
+    def _quotaJournalForHomeQuery(cls, limit):
+        qj = cls._quotaJournalSchema
+        return Select(
+            [qj.JOURNAL_ID, qj.DELTA],
+            From=qj,
+            Where=qj.HOME_RESOURCE_ID == Parameter("resourceID"),
+            Limit=limit,
+        )
+
+    @classmethod
+    def _removeQuotaJournalQuery(cls, count):
+        qj = cls._quotaJournalSchema
+        return Delete(
+            From=qj,
+            Where=qj.JOURNAL_ID.In(Parameter("journalIDs", count)),
+        )
+
     @inlineCallbacks
     def adjustQuotaUsedBytes(self, delta):
         """
@@ -2698,7 +2916,18 @@ class CommonHome(SharingHomeMixIn):
         adjustment is done atomically. It is import to do the 'select ... for
         update' because a race also exists in the 'update ... x = x + 1' case
         as seen via unit tests.
+
+        When C{config.QuotaJournal.Enabled} is set the delta is instead
+        appended to the quota journal, which L{foldQuotaJournal} later moves
+        into the home, so that concurrent writers never wait on the home row.
         """
+        if config.QuotaJournal.Enabled and self._quotaJournalSchema is not None:
+            yield self._addQuotaJournalQuery.on(
+                self._txn, resourceID=self._resourceID, delta=delta)
+            if self._quotaUsedBytes is not None:
+                self._quotaUsedBytes = max(self._quotaUsedBytes + delta, 0)
+            returnValue(None)
+
         yield self._preLockResourceIDQuery.on(self._txn,
                                               resourceID=self._resourceID)
 
@@ -2716,6 +2945,43 @@ class CommonHome(SharingHomeMixIn):
                                            resourceID=self._resourceID)
             self._quotaUsedBytes = 0
 
+    @classmethod
+    @inlineCallbacks
+    def foldQuotaJournal(cls, txn, resourceID, batchSize):
+        """
+        Move up to C{batchSize} pending quota journal deltas for a home into
+        its quota used. The home row is locked first, so concurrent folds of
+        the same home are serialized and each delta is counted exactly once.
+
+        @param txn: the transaction to use
+        @type txn: L{CommonStoreTransaction}
+        @param resourceID: the resource ID of the home
+        @type resourceID: C{int}
+        @param batchSize: the maximum number of deltas to fold
+        @type batchSize: C{int}
+
+        @return: the number of deltas folded
+        @rtype: L{Deferred} firing C{int}
+        """
+        yield cls._preLockResourceIDQuery.on(txn, resourceID=resourceID)
+        rows = yield cls._quotaJournalForHomeQuery(batchSize).on(txn, resourceID=resourceID)
+        if not rows:
+            returnValue(0)
+
+        journalIDs = [row[0] for row in rows]
+        delta = sum([row[1] for row in rows])
+        if delta:
+            rows = yield cls._increaseQuotaQuery.on(txn, delta=delta, resourceID=resourceID)
+            if rows and rows[0][0] < 0:
+                cls.log.error(
+                    "Fixing quota folded below zero to {used} by change amount "
+                    "{delta}",
+                    used=rows[0][0], delta=delta
+                )
+                yield cls._resetQuotaQuery.on(txn, resourceID=resourceID)
+        yield cls._removeQuotaJournalQuery(len(journalIDs)).on(txn, journalIDs=journalIDs)
+        returnValue(len(journalIDs))
+
     def addNotifier(self, factory_name, notifier):
         if self._notifiers is None:
             self._notifiers = {}
@@ -2771,8 +3037,20 @@ class CommonHome(SharingHomeMixIn):
                       Where=meta.RESOURCE_ID == Parameter("resourceID"),
                       Return=meta.MODIFIED)
 
-    @inlineCallbacks
     def bumpModified(self):
+        """
+        Bump the MODIFIED value when the transaction commits. See
+        L{CommonStoreTransaction.bumpModifiedForObject}.
+        """
+
+        # NB if modified is bumped we know that sync token will have changed
+        # too, so invalidate the cached value
+        self._syncTokenRevision = None
+
+        return self._txn.bumpModifiedForObject(self)
+
+    @inlineCallbacks
+    def _bumpModifiedNow(self):
         """
         Bump the MODIFIED value. A possible deadlock could happen here if two
         or more simultaneous changes are happening. In that case it is OK for
@@ -2780,11 +3058,10 @@ class CommonHome(SharingHomeMixIn):
         SAVEPOINT logic to handle ignoring the deadlock error. We use SELECT
         FOR UPDATE NOWAIT to ensure we do not delay the transaction whilst
         waiting for deadlock detection to kick in.
-        """
 
-        # NB if modified is bumped we know that sync token will have changed
-        # too, so invalidate the cached value
-        self._syncTokenRevision = None
+        @return: C{True} if the value was bumped
+        @rtype: L{Deferred} firing L{bool}
+        """
 
         @inlineCallbacks
         def _bumpModified(subtxn):
@@ -2797,13 +3074,18 @@ class CommonHome(SharingHomeMixIn):
             returnValue(result)
 
         try:
-            self._modified = parseSQLTimestamp((
-                yield self._txn.subtransaction(_bumpModified, retries=0, failureOK=True)
-            )[0][0])
-            yield self.invalidateQueryCache()
-
+            result = yield self._txn.subtransaction(_bumpModified, retries=0, failureOK=True)
         except AllRetriesFailed:
             log.debug("CommonHome.bumpModified failed")
+            returnValue(False)
+
+        # The home may have been removed since the bump was requested
+        if not result:
+            returnValue(False)
+        self._modified = parseSQLTimestamp(result[0][0])
+        yield self.invalidateQueryCache()
+
+        returnValue(True)
 
     @inlineCallbacks
     def removeUnacceptedShares(self):
@@ -4235,8 +4517,15 @@ class CommonHomeChild(FancyEqMixin, Memoizable, _SharedSyncLogic, HomeChildBase,
                       Where=schema.RESOURCE_ID == Parameter("resourceID"),
                       Return=schema.MODIFIED)
 
-    @inlineCallbacks
     def bumpModified(self):
+        """
+        Bump the MODIFIED value when the transaction commits. See
+        L{CommonStoreTransaction.bumpModifiedForObject}.
+        """
+        return self._txn.bumpModifiedForObject(self)
+
+    @inlineCallbacks
+    def _bumpModifiedNow(self):
         """
         Bump the MODIFIED value. A possible deadlock could happen here if two
         or more simultaneous changes are happening. In that case it is OK for
@@ -4244,6 +4533,9 @@ class CommonHomeChild(FancyEqMixin, Memoizable, _SharedSyncLogic, HomeChildBase,
         SAVEPOINT logic to handle ignoring the deadlock error. We use SELECT
         FOR UPDATE NOWAIT to ensure we do not delay the transaction whilst
         waiting for deadlock detection to kick in.
+
+        @return: C{True} if the value was bumped
+        @rtype: L{Deferred} firing L{bool}
         """
 
         @inlineCallbacks
@@ -4257,20 +4549,26 @@ class CommonHomeChild(FancyEqMixin, Memoizable, _SharedSyncLogic, HomeChildBase,
             returnValue(result)
 
         try:
-            self._modified = parseSQLTimestamp((
-                yield self._txn.subtransaction(
-                    _bumpModified, retries=0, failureOK=True
-                )
-            )[0][0])
-
-            queryCacher = self._txn._queryCacher
-            if queryCacher is not None:
-                cacheKey = queryCacher.keyForHomeChildMetaData(
-                    self._resourceID
-                )
-                yield queryCacher.invalidateAfterCommit(self._txn, cacheKey)
+            result = yield self._txn.subtransaction(
+                _bumpModified, retries=0, failureOK=True
+            )
         except AllRetriesFailed:
             log.debug("CommonHomeChild.bumpModified failed")
+            returnValue(False)
+
+        # The collection may have been removed since the bump was requested
+        if not result:
+            returnValue(False)
+        self._modified = parseSQLTimestamp(result[0][0])
+
+        queryCacher = self._txn._queryCacher
+        if queryCacher is not None:
+            cacheKey = queryCacher.keyForHomeChildMetaData(
+                self._resourceID
+            )
+            yield queryCacher.invalidateAfterCommit(self._txn, cacheKey)
+
+        returnValue(True)
 
 
 class CommonObjectResource(FancyEqMixin, object):
@@ -345,6 +345,9 @@ class CommonHomeChildExternal(CommonHomeChild):
                 raise ExternalShareFailed("External share does not exist")
         returnValue(revision)
 
+    def supportsLimitedSync(self):
+        return False
+
     @inlineCallbacks
     def resourceNamesSinceRevision(self, revision):
         try:
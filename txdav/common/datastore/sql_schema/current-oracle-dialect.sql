@@ -4,6 +4,7 @@ create sequence INSTANCE_ID_SEQ;
 create sequence ATTACHMENT_ID_SEQ;
 create sequence REVISION_SEQ;
 create sequence WORKITEM_SEQ;
+create sequence QUOTA_JOURNAL_SEQ;
 
 
 create table NAMED_LOCK (
@@ -68,6 +69,13 @@ create table CALENDAR_HOME_METADATA (
 );
 
 
+create table CALENDAR_QUOTA_JOURNAL (
+    "JOURNAL_ID" integer primary key,
+    "HOME_RESOURCE_ID" integer not null references CALENDAR_HOME on delete cascade,
+    "DELTA" integer not null
+);
+
+
 create table CALENDAR_METADATA (
     "RESOURCE_ID" integer primary key references CALENDAR on delete cascade,
     "SUPPORTED_COMPONENTS" nvarchar2(255) default null,
@@ -612,6 +620,18 @@ create table CALENDAR_OBJECT_UPGRADE_WORK (
 );
 
 
+create table CALENDAR_INDEX_EXTENSION_WORK (
+    "WORK_ID" integer primary key,
+    "JOB_ID" integer not null references JOB
+);
+
+
+create table CALENDAR_QUOTA_JOURNAL_WORK (
+    "WORK_ID" integer primary key,
+    "JOB_ID" integer not null references JOB
+);
+
+
 create table FIND_MIN_VALID_REVISION_WORK (
     "WORK_ID" integer primary key,
     "JOB_ID" integer not null references JOB
@@ -772,7 +792,7 @@ create table CALENDARSERVER (
     "VALUE" nvarchar2(255)
 );
 
-insert into CALENDARSERVER (NAME, VALUE) values ('VERSION', '66');
+insert into CALENDARSERVER (NAME, VALUE) values ('VERSION', '68');
 insert into CALENDARSERVER (NAME, VALUE) values ('CALENDAR-DATAVERSION', '6');
 insert into CALENDARSERVER (NAME, VALUE) values ('ADDRESSBOOK-DATAVERSION', '2');
 insert into CALENDARSERVER (NAME, VALUE) values ('NOTIFICATION-DATAVERSION', '1');
@@ -816,6 +836,10 @@ create index CALENDAR_HOME_METADAT_910264ce on CALENDAR_HOME_METADATA (
     "DEFAULT_POLLS"
 );
 
+create index CALENDAR_QUOTA_JOURNA_ffd8d161 on CALENDAR_QUOTA_JOURNAL (
+    "HOME_RESOURCE_ID"
+);
+
 create index CALENDAR_MIGRATION_LO_0525c72b on CALENDAR_MIGRATION (
     "LOCAL_RESOURCE_ID"
 );
@@ -839,6 +863,10 @@ create index CALENDAR_OBJECT_CALEN_c4dc619c on CALENDAR_OBJECT (
     "RECURRANCE_MIN"
 );
 
+create index CALENDAR_OBJECT_RECUR_6ccd6d3b on CALENDAR_OBJECT (
+    "RECURRANCE_MAX"
+);
+
 create index CALENDAR_OBJECT_ICALE_82e731d5 on CALENDAR_OBJECT (
     "ICALENDAR_UID"
 );
@@ -1078,6 +1106,14 @@ create index CALENDAR_OBJECT_UPGRA_39d6f8f9 on CALENDAR_OBJECT_UPGRADE_WORK (
     "JOB_ID"
 );
 
+create index CALENDAR_INDEX_EXTENS_b3f9722a on CALENDAR_INDEX_EXTENSION_WORK (
+    "JOB_ID"
+);
+
+create index CALENDAR_QUOTA_JOURNA_918b9f6e on CALENDAR_QUOTA_JOURNAL_WORK (
+    "JOB_ID"
+);
+
 create index FIND_MIN_VALID_REVISI_78d17400 on FIND_MIN_VALID_REVISION_WORK (
     "JOB_ID"
 );
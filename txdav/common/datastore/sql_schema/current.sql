@@ -125,6 +125,25 @@ create index CALENDAR_HOME_METADATA_DEFAULT_POLLS on
   CALENDAR_HOME_METADATA(DEFAULT_POLLS);
 
 
+----------------------------
+-- Calendar Quota Journal --
+----------------------------
+
+-- Pending changes to CALENDAR_HOME_METADATA.QUOTA_USED_BYTES, folded in by
+-- CALENDAR_QUOTA_JOURNAL_WORK
+
+create sequence QUOTA_JOURNAL_SEQ;
+
+create table CALENDAR_QUOTA_JOURNAL (
+  JOURNAL_ID                    bigint       primary key default nextval('QUOTA_JOURNAL_SEQ'), -- implicit index
+  HOME_RESOURCE_ID              bigint       not null references CALENDAR_HOME on delete cascade,
+  DELTA                         bigint       not null
+);
+
+create index CALENDAR_QUOTA_JOURNAL_HOME_RESOURCE_ID on
+  CALENDAR_QUOTA_JOURNAL(HOME_RESOURCE_ID);
+
+
 -----------------------
 -- Calendar Metadata --
 -----------------------
@@ -311,6 +330,9 @@ create index CALENDAR_OBJECT_CALENDAR_RESOURCE_ID_AND_ICALENDAR_UID on
 create index CALENDAR_OBJECT_CALENDAR_RESOURCE_ID_RECURRANCE_MAX_MIN on
   CALENDAR_OBJECT(CALENDAR_RESOURCE_ID, RECURRANCE_MAX, RECURRANCE_MIN);
 
+create index CALENDAR_OBJECT_RECURRANCE_MAX on
+  CALENDAR_OBJECT(RECURRANCE_MAX);
+
 create index CALENDAR_OBJECT_ICALENDAR_UID on
   CALENDAR_OBJECT(ICALENDAR_UID);
 
@@ -1030,6 +1052,30 @@ create index CALENDAR_OBJECT_UPGRADE_WORK_RESOURCE_ID on
 create index CALENDAR_OBJECT_UPGRADE_WORK_JOB_ID on
   CALENDAR_OBJECT_UPGRADE_WORK(JOB_ID);
 
+--------------------------
+-- Index Extension Work --
+--------------------------
+
+create table CALENDAR_INDEX_EXTENSION_WORK (
+  WORK_ID                       bigint       primary key default nextval('WORKITEM_SEQ'), -- implicit index
+  JOB_ID                        bigint       references JOB not null
+);
+
+create index CALENDAR_INDEX_EXTENSION_WORK_JOB_ID on
+  CALENDAR_INDEX_EXTENSION_WORK(JOB_ID);
+
+------------------------
+-- Quota Journal Work --
+------------------------
+
+create table CALENDAR_QUOTA_JOURNAL_WORK (
+  WORK_ID                       bigint       primary key default nextval('WORKITEM_SEQ'), -- implicit index
+  JOB_ID                        bigint       references JOB not null
+);
+
+create index CALENDAR_QUOTA_JOURNAL_WORK_JOB_ID on
+  CALENDAR_QUOTA_JOURNAL_WORK(JOB_ID);
+
 ---------------------------
 -- Revision Cleanup Work --
 ---------------------------
@@ -1314,7 +1360,7 @@ create table CALENDARSERVER (
   VALUE                         varchar(255)
 );
 
-insert into CALENDARSERVER values ('VERSION', '66');
+insert into CALENDARSERVER values ('VERSION', '68');
 insert into CALENDARSERVER values ('CALENDAR-DATAVERSION', '6');
 insert into CALENDARSERVER values ('ADDRESSBOOK-DATAVERSION', '2');
 insert into CALENDARSERVER values ('NOTIFICATION-DATAVERSION', '1');
@@ -0,0 +1,37 @@
+----
+-- Copyright (c) 2012-2017 Apple Inc. All rights reserved.
+--
+-- Licensed under the Apache License, Version 2.0 (the "License");
+-- you may not use this file except in compliance with the License.
+-- You may obtain a copy of the License at
+--
+-- http://www.apache.org/licenses/LICENSE-2.0
+--
+-- Unless required by applicable law or agreed to in writing, software
+-- distributed under the License is distributed on an "AS IS" BASIS,
+-- WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+-- See the License for the specific language governing permissions and
+-- limitations under the License.
+----
+
+---------------------------------------------------
+-- Upgrade database schema from VERSION 66 to 67 --
+---------------------------------------------------
+
+-- New tables
+create table CALENDAR_INDEX_EXTENSION_WORK (
+    "WORK_ID" integer primary key,
+    "JOB_ID" integer not null references JOB
+);
+
+create index CALENDAR_INDEX_EXTENS_b3f9722a on CALENDAR_INDEX_EXTENSION_WORK (
+    "JOB_ID"
+);
+
+-- New indexes
+create index CALENDAR_OBJECT_RECUR_6ccd6d3b on CALENDAR_OBJECT (
+    "RECURRANCE_MAX"
+);
+
+-- update the version
+update CALENDARSERVER set VALUE = '67' where NAME = 'VERSION';
@@ -0,0 +1,45 @@
+----
+-- Copyright (c) 2012-2017 Apple Inc. All rights reserved.
+--
+-- Licensed under the Apache License, Version 2.0 (the "License");
+-- you may not use this file except in compliance with the License.
+-- You may obtain a copy of the License at
+--
+-- http://www.apache.org/licenses/LICENSE-2.0
+--
+-- Unless required by applicable law or agreed to in writing, software
+-- distributed under the License is distributed on an "AS IS" BASIS,
+-- WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+-- See the License for the specific language governing permissions and
+-- limitations under the License.
+----
+
+---------------------------------------------------
+-- Upgrade database schema from VERSION 67 to 68 --
+---------------------------------------------------
+
+-- New sequences
+create sequence QUOTA_JOURNAL_SEQ;
+
+-- New tables
+create table CALENDAR_QUOTA_JOURNAL (
+    "JOURNAL_ID" integer primary key,
+    "HOME_RESOURCE_ID" integer not null references CALENDAR_HOME on delete cascade,
+    "DELTA" integer not null
+);
+
+create index CALENDAR_QUOTA_JOURNA_ffd8d161 on CALENDAR_QUOTA_JOURNAL (
+    "HOME_RESOURCE_ID"
+);
+
+create table CALENDAR_QUOTA_JOURNAL_WORK (
+    "WORK_ID" integer primary key,
+    "JOB_ID" integer not null references JOB
+);
+
+create index CALENDAR_QUOTA_JOURNA_918b9f6e on CALENDAR_QUOTA_JOURNAL_WORK (
+    "JOB_ID"
+);
+
+-- update the version
+update CALENDARSERVER set VALUE = '68' where NAME = 'VERSION';
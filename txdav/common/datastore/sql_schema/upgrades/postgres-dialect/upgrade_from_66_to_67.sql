@@ -0,0 +1,35 @@
+----
+-- Copyright (c) 2012-2017 Apple Inc. All rights reserved.
+--
+-- Licensed under the Apache License, Version 2.0 (the "License");
+-- you may not use this file except in compliance with the License.
+-- You may obtain a copy of the License at
+--
+-- http://www.apache.org/licenses/LICENSE-2.0
+--
+-- Unless required by applicable law or agreed to in writing, software
+-- distributed under the License is distributed on an "AS IS" BASIS,
+-- WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+-- See the License for the specific language governing permissions and
+-- limitations under the License.
+----
+
+---------------------------------------------------
+-- Upgrade database schema from VERSION 66 to 67 --
+---------------------------------------------------
+
+-- New tables
+create table CALENDAR_INDEX_EXTENSION_WORK (
+  WORK_ID                       bigint       primary key default nextval('WORKITEM_SEQ'), -- implicit index
+  JOB_ID                        bigint       references JOB not null
+);
+
+create index CALENDAR_INDEX_EXTENSION_WORK_JOB_ID on
+  CALENDAR_INDEX_EXTENSION_WORK(JOB_ID);
+
+-- New indexes
+create index CALENDAR_OBJECT_RECURRANCE_MAX on
+  CALENDAR_OBJECT(RECURRANCE_MAX);
+
+-- update the version
+update CALENDARSERVER set VALUE = '67' where NAME = 'VERSION';
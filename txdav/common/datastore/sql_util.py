@@ -79,7 +79,8 @@ class _SharedSyncLogic(object):
             return 0
         elif isinstance(token, str) or isinstance(token, unicode):
             _ignore_uuid, revision = token.split("_", 1)
-            return int(revision)
+            # Continuation tokens carry a trailing resume position
+            return int(revision.split("_", 1)[0])
         else:
             return token
 
@@ -174,6 +175,95 @@ class _SharedSyncLogic(object):
 
         returnValue((changed, deleted, invalid))
 
+    def supportsLimitedSync(self):
+        """
+        Whether L{resourceNamesSinceRevisionLimited} can page through the
+        changes of this collection.
+        """
+        return True
+
+    @classmethod
+    def _objectNamesSincePositionQuery(cls, limit, deleted=True):
+        """
+        DAL query for (revision, resource, deleted-flag) in revision order,
+        starting at (and including) a revision.
+        """
+        rev = cls._revisionsSchema
+        where = (rev.REVISION >= Parameter("revision")).And(
+            rev.RESOURCE_ID == Parameter("resourceID")).And(
+            rev.RESOURCE_NAME != None)
+        if not deleted:
+            where = where.And(rev.DELETED == False)
+        return Select(
+            [rev.REVISION, rev.RESOURCE_NAME, rev.DELETED],
+            From=rev,
+            Where=where,
+            OrderBy=(rev.REVISION, rev.RESOURCE_NAME,),
+            Limit=limit,
+        )
+
+    @inlineCallbacks
+    def resourceNamesSinceRevisionLimited(self, revision, position, limit):
+        """
+        Return at most C{limit} changed and deleted resources since a
+        particular revision, in revision order. When the results are
+        truncated the position to resume from is also returned, so that a
+        client can page through an arbitrarily large set of changes with
+        bounded work per request.
+
+        @param revision: the revision to determine changes since
+        @type revision: C{int}
+        @param position: the number of resources at C{revision} itself that
+            were already returned by a previous truncated request
+        @type position: C{int}
+        @param limit: maximum number of resources to return, or C{None} for
+            no limit
+        @type limit: C{int}
+
+        @return: a 4-tuple of changed, deleted and invalid names plus either
+            C{None} if all changes were returned, or a C{tuple} of
+            (revision, position) to resume from
+        """
+        if revision:
+            minValidRevision = yield self._txn.calendarserverValue("MIN-VALID-REVISION")
+            if revision < int(minValidRevision):
+                raise SyncTokenValidException
+
+        # A resumed request re-reads the rows at the resume revision so
+        # that the ones already returned can be skipped
+        rows = yield self._objectNamesSincePositionQuery(
+            position + limit + 1 if limit is not None else None,
+            deleted=bool(revision),
+        ).on(
+            self._txn,
+            revision=revision if position else revision + 1,
+            resourceID=self._resourceID,
+        )
+        if position:
+            rows = [
+                row for index, row in enumerate(rows)
+                if index >= position or row[0] != revision
+            ]
+
+        resume = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            lastRevision = rows[-1][0]
+            lastPosition = len([row for row in rows if row[0] == lastRevision])
+            if lastRevision == revision:
+                lastPosition += position
+            resume = (lastRevision, lastPosition,)
+
+        changed = []
+        deleted = []
+        for _ignore_revision, name, wasdeleted in rows:
+            if wasdeleted:
+                deleted.append(name)
+            else:
+                changed.append(name)
+
+        returnValue((changed, deleted, [], resume,))
+
     @classproperty
     def _removeDeletedRevision(cls):
         rev = cls._revisionsSchema
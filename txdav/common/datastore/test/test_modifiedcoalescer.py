@@ -0,0 +1,122 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+from twisted.internet.defer import inlineCallbacks
+from twisted.trial.unittest import TestCase
+
+from twistedcaldav.config import config
+
+from txdav.common.datastore import modifiedcoalescer
+from txdav.common.datastore.modifiedcoalescer import ModifiedCoalescer
+from txdav.common.datastore.test.util import CommonCommonTests, populateCalendarsFrom
+
+
+class ModifiedCoalescerTests(TestCase):
+    """
+    Tests for L{ModifiedCoalescer}.
+    """
+
+    def setUp(self):
+        self.now = 1000.0
+        self.coalescer = ModifiedCoalescer(60, 2, clock=lambda: self.now)
+
+    def test_window(self):
+        """
+        A bump is only skipped within the time window of the last recorded one.
+        """
+        self.assertFalse(self.coalescer.recentlyBumped(1))
+        self.coalescer.recordBumped(1)
+        self.assertTrue(self.coalescer.recentlyBumped(1))
+        self.assertFalse(self.coalescer.recentlyBumped(2))
+
+        self.now += 61
+        self.assertFalse(self.coalescer.recentlyBumped(1))
+
+        stats = self.coalescer.stats()
+        self.assertEqual(stats["bumped"], 1)
+        self.assertEqual(stats["saved"], 1)
+        self.assertEqual(stats["hits"], 1)
+
+    def test_maxEntries(self):
+        """
+        Only the most recent bumps are remembered.
+        """
+        for resourceID in (1, 2, 3,):
+            self.coalescer.recordBumped(resourceID)
+        self.assertFalse(self.coalescer.recentlyBumped(1))
+        self.assertTrue(self.coalescer.recentlyBumped(3))
+        self.assertEqual(self.coalescer.stats()["entries"], 2)
+
+
+class TransactionCoalescingTests(CommonCommonTests, TestCase):
+    """
+    Tests for L{CommonStoreTransaction.bumpModifiedForObject}.
+    """
+
+    requirements = {
+        "user01": {
+            "calendar": {},
+            "inbox": {},
+        },
+    }
+
+    @inlineCallbacks
+    def setUp(self):
+        yield super(TransactionCoalescingTests, self).setUp()
+        yield self.buildStoreAndDirectory()
+        yield populateCalendarsFrom(self.requirements, self.storeUnderTest())
+        self.patch(modifiedcoalescer, "_modifiedCoalescer", None)
+
+    @inlineCallbacks
+    def test_oncePerTransaction(self):
+        """
+        Repeated bumps in one transaction are done once, when it commits.
+        """
+        home = yield self.homeUnderTest(name="user01")
+        modified = home.modified()
+        calendar = yield self.calendarUnderTest(home="user01", name="calendar")
+        yield home.bumpModified()
+        yield home.bumpModified()
+        yield calendar.bumpModified()
+        yield calendar.bumpModified()
+        self.assertEqual(home.modified(), modified)
+        self.assertEqual(self.transactionUnderTest().logItems["modified-saved"], "2")
+        yield self.commit()
+
+        home = yield self.homeUnderTest(name="user01")
+        self.assertNotEqual(home.modified(), modified)
+        yield self.commit()
+
+    @inlineCallbacks
+    def test_window(self):
+        """
+        With a time window, a bump soon after one committed by this process is
+        skipped.
+        """
+        self.patch(config.ModifiedCoalescing, "WindowSeconds", 60)
+
+        home = yield self.homeUnderTest(name="user01")
+        yield home.bumpModified()
+        yield self.commit()
+
+        home = yield self.homeUnderTest(name="user01")
+        yield home.bumpModified()
+        self.assertEqual(self.transactionUnderTest().logItems["modified-saved"], "1")
+        yield self.commit()
+
+        stats = modifiedcoalescer.modifiedCoalescer().stats()
+        self.assertEqual(stats["bumped"], 1)
+        self.assertEqual(stats["saved"], 1)
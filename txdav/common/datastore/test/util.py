@@ -182,6 +182,7 @@ class SQLStoreBuilder(object):
         @return: a L{Deferred} which fires with an L{IDataStore}.
         """
         disableMemcacheForTest(testCase)
+        clearComponentCacheForTest(testCase)
         dbRoot = FilePath(self.sharedDBPath)
         attachmentRoot = dbRoot.child("attachments")
         # The directory will be given to us later via setDirectoryService
@@ -1050,3 +1051,16 @@ def disableMemcacheForTest(aTest):
     aTest.patch(config.Memcached.Pools.Default, "ClientEnabled", False)
     aTest.patch(config.Memcached.Pools.Default, "ServerEnabled", False)
     aTest.patch(Memcacher, "allowTestCache", True)
+
+
+def clearComponentCacheForTest(aTest):
+    """
+    Empty the per-process cache of parsed calendar data, so that a test does
+    not see data cached by an earlier test with a different configuration.
+    """
+
+    from txdav.caldav.datastore.componentcache import componentCache
+
+    cache = componentCache()
+    if cache is not None:
+        cache.clear()
@@ -0,0 +1,168 @@
+# -*- test-case-name: txdav.common.datastore.work.test.test_index_extension -*-
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Keep the instance index of recurring events expanded ahead of today
+"""
+
+from pycalendar.datetime import DateTime
+from pycalendar.duration import Duration
+from twext.enterprise.dal.record import fromTable
+from twext.enterprise.dal.syntax import Select, Parameter
+from twext.enterprise.jobs.workitem import RegeneratingWorkItem
+from twext.python.log import Logger
+from twisted.internet.defer import inlineCallbacks, returnValue, succeed, \
+    DeferredSemaphore, gatherResults
+from twistedcaldav.config import config
+from twistedcaldav.dateops import normalizeForIndex, pyCalendarToSQLTimestamp
+from txdav.caldav.datastore.sql import CalendarStoreFeatures
+from txdav.common.datastore.sql_tables import schema
+
+log = Logger()
+
+# The RECURRANCE_MAX of a recurring event that is not instance indexed
+UNINDEXED_MAX = DateTime(1900, 1, 1)
+
+
+class CalendarIndexExtensionWork(RegeneratingWorkItem, fromTable(schema.CALENDAR_INDEX_EXTENSION_WORK)):
+    """
+    Periodically re-expand the recurring events whose instance index ends
+    less than C{FreeBusyIndexExpandAheadDays} ahead of today, so that a
+    time-range query rarely has to re-expand them while the client waits.
+
+    Events left unindexed on purpose - recurring inbox items and events whose
+    expansion is delayed by C{FreeBusyIndexDelayedExpand} - are recorded as
+    expanded to L{UNINDEXED_MAX} and are skipped.
+
+    Each run re-expands at most C{MaxPerRun} events, those whose index ends
+    soonest first, in transactions of C{BatchSize} events with at most
+    C{Concurrency} transactions in progress at once. If more events are left
+    the next run is scheduled early.
+    """
+
+    group = "calendar_index_extension"
+
+    @classmethod
+    def initialSchedule(cls, store, seconds):
+        def _enqueue(txn):
+            return CalendarIndexExtensionWork.reschedule(txn, seconds)
+
+        if config.FreeBusyIndexExtension.Enabled:
+            return store.inTransaction("CalendarIndexExtensionWork.initialSchedule", _enqueue)
+        else:
+            return succeed(None)
+
+    def regenerateInterval(self):
+        """
+        Return the interval in seconds between regenerating instances.
+        """
+        return float(config.FreeBusyIndexExtension.IntervalHours) * 60 * 60
+
+    @classmethod
+    def _notExpandedQuery(cls, limit):
+        co = schema.CALENDAR_OBJECT
+        return Select(
+            [co.RESOURCE_ID],
+            From=co,
+            Where=(co.RECURRANCE_MAX > Parameter("unindexed")).And(
+                co.RECURRANCE_MAX < Parameter("threshold")),
+            OrderBy=co.RECURRANCE_MAX,
+            Limit=limit,
+        )
+
+    @inlineCallbacks
+    def doWork(self):
+
+        today = DateTime.getToday()
+        threshold = today + Duration(days=config.FreeBusyIndexExpandAheadDays)
+        horizon = today + Duration(days=min(
+            config.FreeBusyIndexExpandAheadDays + config.FreeBusyIndexExtension.ExtendDays,
+            config.FreeBusyIndexExpandMaxDays,
+        ))
+
+        # One more than the limit, to find out whether any are left over
+        maxPerRun = config.FreeBusyIndexExtension.MaxPerRun
+        resourceIDs = [row[0] for row in (yield self._notExpandedQuery(maxPerRun + 1).on(
+            self.transaction,
+            unindexed=pyCalendarToSQLTimestamp(normalizeForIndex(UNINDEXED_MAX)),
+            threshold=pyCalendarToSQLTimestamp(normalizeForIndex(threshold)),
+        ))]
+        if not resourceIDs:
+            returnValue(None)
+        remaining = len(resourceIDs) > maxPerRun
+        resourceIDs = resourceIDs[:maxPerRun]
+
+        log.info(
+            "Calendar index extension: re-expanding {count} resources until {horizon}",
+            count=len(resourceIDs), horizon=horizon,
+        )
+
+        store = self.transaction._store
+        batchSize = config.FreeBusyIndexExtension.BatchSize
+        semaphore = DeferredSemaphore(config.FreeBusyIndexExtension.Concurrency)
+        yield gatherResults([
+            semaphore.run(self._extendBatch, store, resourceIDs[i:i + batchSize], threshold, horizon)
+            for i in range(0, len(resourceIDs), batchSize)
+        ])
+
+        if remaining:
+            yield CalendarIndexExtensionWork.reschedule(
+                self.transaction,
+                config.FreeBusyIndexExtension.ContinueDelaySeconds,
+            )
+
+    @inlineCallbacks
+    def _extendBatch(self, store, resourceIDs, threshold, horizon):
+        """
+        Re-expand a batch of resources in one transaction. If that fails,
+        re-expand each of them in its own transaction so that one bad resource
+        does not stop the others being extended.
+        """
+        try:
+            yield store.inTransaction(
+                "CalendarIndexExtensionWork._extendBatch",
+                lambda txn: self._extend(txn, resourceIDs, threshold, horizon),
+            )
+        except Exception:
+            for resourceID in resourceIDs:
+                try:
+                    yield store.inTransaction(
+                        "CalendarIndexExtensionWork._extendBatch",
+                        lambda txn: self._extend(txn, [resourceID], threshold, horizon),
+                    )
+                except Exception as e:
+                    log.error(
+                        "Calendar index extension: failed to re-expand resource-id {rid}: {ex}",
+                        rid=resourceID, ex=e,
+                    )
+
+    @inlineCallbacks
+    def _extend(self, txn, resourceIDs, threshold, horizon):
+        for resourceID in resourceIDs:
+            cobj = yield CalendarStoreFeatures(txn._store).calendarObjectWithID(txn, resourceID)
+            if cobj is None or cobj.calendar().isInbox():
+                continue
+
+            # Re-check once locked, as a query may have re-expanded it already
+            yield cobj.lock()
+            _ignore_rmin, rmax = yield cobj.recurrenceMinMax()
+            if rmax is not None and UNINDEXED_MAX < rmax < threshold:
+                yield cobj.updateDatabase(
+                    (yield cobj.component()),
+                    expand_until=horizon,
+                    reCreate=True,
+                )
@@ -0,0 +1,102 @@
+# -*- test-case-name: txdav.common.datastore.work.test.test_quota_journal -*-
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Fold journaled quota changes into calendar homes
+"""
+
+from twext.enterprise.dal.record import fromTable
+from twext.enterprise.dal.syntax import Select
+from twext.enterprise.jobs.workitem import RegeneratingWorkItem
+from twext.python.log import Logger
+from twisted.internet.defer import inlineCallbacks, returnValue, succeed
+from twistedcaldav.config import config
+from txdav.caldav.datastore.sql import CalendarHome
+from txdav.common.datastore.sql_tables import schema
+
+log = Logger()
+
+
+class CalendarQuotaJournalWork(RegeneratingWorkItem, fromTable(schema.CALENDAR_QUOTA_JOURNAL_WORK)):
+    """
+    Periodically fold the quota changes journaled by
+    L{CommonHome.adjustQuotaUsedBytes} into each calendar home's quota used.
+
+    Each home is folded in its own transaction, so its row is only locked
+    briefly, and at most C{MaxHomesPerRun} homes are folded per run. A home
+    with more than C{BatchSize} pending changes is folded in several
+    transactions.
+    """
+
+    group = "calendar_quota_journal"
+
+    @classmethod
+    def initialSchedule(cls, store, seconds):
+        def _enqueue(txn):
+            return CalendarQuotaJournalWork.reschedule(txn, seconds)
+
+        if config.QuotaJournal.Enabled:
+            return store.inTransaction("CalendarQuotaJournalWork.initialSchedule", _enqueue)
+        else:
+            return succeed(None)
+
+    def regenerateInterval(self):
+        """
+        Return the interval in seconds between regenerating instances.
+        """
+        return float(config.QuotaJournal.FoldIntervalSeconds)
+
+    @classmethod
+    def _pendingHomesQuery(cls, limit):
+        qj = schema.CALENDAR_QUOTA_JOURNAL
+        return Select(
+            [qj.HOME_RESOURCE_ID],
+            From=qj,
+            Distinct=True,
+            Limit=limit,
+        )
+
+    @inlineCallbacks
+    def doWork(self):
+
+        homeIDs = [row[0] for row in (yield self._pendingHomesQuery(config.QuotaJournal.MaxHomesPerRun).on(self.transaction))]
+        if not homeIDs:
+            returnValue(None)
+
+        store = self.transaction._store
+        batchSize = config.QuotaJournal.BatchSize
+        folded = 0
+        for homeID in homeIDs:
+            try:
+                while True:
+                    count = yield store.inTransaction(
+                        "CalendarQuotaJournalWork.doWork",
+                        lambda txn: CalendarHome.foldQuotaJournal(txn, homeID, batchSize),
+                    )
+                    folded += count
+                    if count < batchSize:
+                        break
+            except Exception as e:
+                log.error(
+                    "Calendar quota journal: failed to fold home resource-id {rid}: {ex}",
+                    rid=homeID, ex=e,
+                )
+
+        log.info(
+            "Calendar quota journal: folded {count} changes into {homes} homes",
+            count=folded, homes=len(homeIDs),
+        )
@@ -0,0 +1,188 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+
+from txdav.common.datastore.sql_tables import schema
+from txdav.common.datastore.work.index_extension import CalendarIndexExtensionWork, \
+    UNINDEXED_MAX
+from txdav.common.datastore.test.util import CommonCommonTests, populateCalendarsFrom
+
+
+from pycalendar.datetime import DateTime
+from pycalendar.duration import Duration
+from twext.enterprise.dal.syntax import Update
+from twext.enterprise.jobs.jobitem import JobItem
+from twext.python.clsprop import classproperty
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.trial.unittest import TestCase
+from twistedcaldav.config import config
+from twistedcaldav.dateops import normalizeForIndex, pyCalendarToSQLTimestamp
+
+
+class CalendarIndexExtensionTests(CommonCommonTests, TestCase):
+    """
+    Test L{CalendarIndexExtensionWork}.
+    """
+
+    @inlineCallbacks
+    def setUp(self):
+        yield super(CalendarIndexExtensionTests, self).setUp()
+        self.patch(config, "FreeBusyIndexDelayedExpand", False)
+        yield self.buildStoreAndDirectory()
+        yield self.populate()
+
+    @inlineCallbacks
+    def populate(self):
+        calendarRequirements = self.requirements["calendar"]
+        yield populateCalendarsFrom(calendarRequirements, self.storeUnderTest())
+
+        self.notifierFactory.reset()
+
+    cal1 = """BEGIN:VCALENDAR
+VERSION:2.0
+CALSCALE:GREGORIAN
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:uid1
+DTSTART:20131122T140000Z
+DURATION:PT1H
+CREATED:20060102T190000Z
+DTSTAMP:20051222T210507Z
+RRULE:FREQ=WEEKLY
+SUMMARY:event 1
+END:VEVENT
+END:VCALENDAR
+"""
+
+    cal2 = """BEGIN:VCALENDAR
+VERSION:2.0
+CALSCALE:GREGORIAN
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:uid2
+DTSTART:20131122T160000Z
+DURATION:PT1H
+CREATED:20060102T190000Z
+DTSTAMP:20051222T210507Z
+RRULE:FREQ=DAILY
+SUMMARY:event 2
+END:VEVENT
+END:VCALENDAR
+"""
+
+    cal3 = """BEGIN:VCALENDAR
+VERSION:2.0
+CALSCALE:GREGORIAN
+PRODID:-//CALENDARSERVER.ORG//NONSGML Version 1//EN
+BEGIN:VEVENT
+UID:uid3
+DTSTART:20131122T180000Z
+DURATION:PT1H
+CREATED:20060102T190000Z
+DTSTAMP:20051222T210507Z
+SUMMARY:event 3
+END:VEVENT
+END:VCALENDAR
+"""
+
+    @classproperty(cache=False)
+    def requirements(cls):  # @NoSelf
+        return {
+            "calendar": {
+                "user01": {
+                    "calendar": {
+                        "cal1.ics": (cls.cal1, None,),
+                        "cal2.ics": (cls.cal2, None,),
+                        "cal3.ics": (cls.cal3, None,),
+                    },
+                    "inbox": {
+                    },
+                },
+            }
+        }
+
+    @inlineCallbacks
+    def _setRecurrenceMax(self, name, days=None):
+        """
+        Make it look like the resource was last expanded some time ago, or
+        was not instance indexed if C{days} is L{None}.
+        """
+        resource = yield self.calendarObjectUnderTest(home="user01", calendar_name="calendar", name=name)
+        rmax = UNINDEXED_MAX if days is None else DateTime.getToday() + Duration(days=days)
+        co = schema.CALENDAR_OBJECT
+        yield Update(
+            {co.RECURRANCE_MAX: pyCalendarToSQLTimestamp(normalizeForIndex(rmax))},
+            Where=co.RESOURCE_ID == resource._resourceID,
+        ).on(self.transactionUnderTest())
+
+    @inlineCallbacks
+    def _recurrenceMax(self, name):
+        resource = yield self.calendarObjectUnderTest(home="user01", calendar_name="calendar", name=name)
+        _ignore_rmin, rmax = yield resource.recurrenceMinMax()
+        yield self.commit()
+        returnValue(rmax)
+
+    @inlineCallbacks
+    def test_extend(self):
+        """
+        Verify that recurring events expanded less than
+        FreeBusyIndexExpandAheadDays ahead are re-expanded, and that events
+        left over by one run are re-expanded by the next.
+        """
+        self.patch(config.FreeBusyIndexExtension, "IntervalHours", -1)
+        self.patch(config.FreeBusyIndexExtension, "MaxPerRun", 1)
+        self.patch(config.FreeBusyIndexExtension, "ContinueDelaySeconds", 0)
+
+        yield self._setRecurrenceMax("cal1.ics", 10)
+        yield self._setRecurrenceMax("cal2.ics", 20)
+        yield self.commit()
+
+        yield CalendarIndexExtensionWork.reschedule(self.transactionUnderTest(), 0)
+        yield self.commit()
+        yield JobItem.waitEmpty(self.storeUnderTest().newTransaction, reactor, 60)
+
+        horizon = DateTime.getToday() + Duration(days=config.FreeBusyIndexExpandAheadDays)
+        for name in ("cal1.ics", "cal2.ics",):
+            rmax = yield self._recurrenceMax(name)
+            self.assertTrue(rmax > horizon)
+
+        # Non-recurring events are fully expanded
+        rmax = yield self._recurrenceMax("cal3.ics")
+        self.assertEqual(rmax, None)
+
+    @inlineCallbacks
+    def test_skipUnindexed(self):
+        """
+        Verify that recurring events left unindexed on purpose are not
+        expanded.
+        """
+        self.patch(config.FreeBusyIndexExtension, "IntervalHours", -1)
+
+        yield self._setRecurrenceMax("cal1.ics")
+        yield self._setRecurrenceMax("cal2.ics", 10)
+        yield self.commit()
+
+        yield CalendarIndexExtensionWork.reschedule(self.transactionUnderTest(), 0)
+        yield self.commit()
+        yield JobItem.waitEmpty(self.storeUnderTest().newTransaction, reactor, 60)
+
+        rmax = yield self._recurrenceMax("cal1.ics")
+        self.assertEqual(rmax, UNINDEXED_MAX)
+
+        horizon = DateTime.getToday() + Duration(days=config.FreeBusyIndexExpandAheadDays)
+        rmax = yield self._recurrenceMax("cal2.ics")
+        self.assertTrue(rmax > horizon)
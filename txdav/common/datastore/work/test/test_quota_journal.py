@@ -0,0 +1,156 @@
+##
+# Copyright (c) 2017 Apple Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+
+from txdav.caldav.datastore.sql import CalendarHome
+from txdav.common.datastore.sql_tables import schema
+from txdav.common.datastore.work.quota_journal import CalendarQuotaJournalWork
+from txdav.common.datastore.test.util import CommonCommonTests, populateCalendarsFrom
+
+
+from twext.enterprise.dal.syntax import Select
+from twext.enterprise.jobs.jobitem import JobItem
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.trial.unittest import TestCase
+from twistedcaldav.config import config
+
+
+class CalendarQuotaJournalTests(CommonCommonTests, TestCase):
+    """
+    Test L{CalendarQuotaJournalWork}.
+    """
+
+    @inlineCallbacks
+    def setUp(self):
+        yield super(CalendarQuotaJournalTests, self).setUp()
+        self.patch(config.QuotaJournal, "Enabled", True)
+        self.patch(config.QuotaJournal, "FoldIntervalSeconds", -1)
+        yield self.buildStoreAndDirectory()
+        yield self.populate()
+
+    requirements = {
+        "user01": {
+            "calendar": {},
+            "inbox": {},
+        },
+    }
+
+    @inlineCallbacks
+    def populate(self):
+        yield populateCalendarsFrom(self.requirements, self.storeUnderTest())
+        self.notifierFactory.reset()
+
+    @inlineCallbacks
+    def _storedQuota(self):
+        """
+        The quota used as stored in the home, and the number of journaled
+        changes not yet folded into it.
+        """
+        home = yield self.homeUnderTest(name="user01")
+        chm = schema.CALENDAR_HOME_METADATA
+        used = (yield Select(
+            [chm.QUOTA_USED_BYTES],
+            From=chm,
+            Where=chm.RESOURCE_ID == home._resourceID,
+        ).on(self.transactionUnderTest()))[0][0]
+        qj = schema.CALENDAR_QUOTA_JOURNAL
+        pending = len((yield Select(
+            [qj.JOURNAL_ID],
+            From=qj,
+            Where=qj.HOME_RESOURCE_ID == home._resourceID,
+        ).on(self.transactionUnderTest())))
+        yield self.commit()
+        returnValue((used, pending,))
+
+    @inlineCallbacks
+    def _quotaUsed(self):
+        home = yield self.homeUnderTest(name="user01")
+        used = yield home.quotaUsedBytes()
+        yield self.commit()
+        returnValue(used)
+
+    @inlineCallbacks
+    def test_journal(self):
+        """
+        Verify that quota changes are journaled rather than applied to the
+        home, that the quota used includes them, and that the work folds them
+        into the home.
+        """
+        home = yield self.homeUnderTest(name="user01")
+        yield home.adjustQuotaUsedBytes(100)
+        yield home.adjustQuotaUsedBytes(-30)
+        used = yield home.quotaUsedBytes()
+        self.assertEqual(used, 70)
+        yield self.commit()
+
+        stored = yield self._storedQuota()
+        self.assertEqual(stored, (0, 2,))
+        used = yield self._quotaUsed()
+        self.assertEqual(used, 70)
+
+        yield CalendarQuotaJournalWork.reschedule(self.transactionUnderTest(), 0)
+        yield self.commit()
+        yield JobItem.waitEmpty(self.storeUnderTest().newTransaction, reactor, 60)
+
+        stored = yield self._storedQuota()
+        self.assertEqual(stored, (70, 0,))
+        used = yield self._quotaUsed()
+        self.assertEqual(used, 70)
+
+    @inlineCallbacks
+    def test_foldBatches(self):
+        """
+        Verify that L{CalendarHome.foldQuotaJournal} folds at most a batch
+        of changes at a time, and never leaves the quota used below zero.
+        """
+        home = yield self.homeUnderTest(name="user01")
+        homeID = home._resourceID
+        for delta in (10, 20, 30, -100, 5,):
+            yield home.adjustQuotaUsedBytes(delta)
+        yield self.commit()
+
+        count = yield CalendarHome.foldQuotaJournal(self.transactionUnderTest(), homeID, 3)
+        self.assertEqual(count, 3)
+        yield self.commit()
+        stored = yield self._storedQuota()
+        self.assertEqual(stored[1], 2)
+
+        count = yield CalendarHome.foldQuotaJournal(self.transactionUnderTest(), homeID, 3)
+        self.assertEqual(count, 2)
+        yield self.commit()
+        count = yield CalendarHome.foldQuotaJournal(self.transactionUnderTest(), homeID, 3)
+        self.assertEqual(count, 0)
+        yield self.commit()
+
+        stored = yield self._storedQuota()
+        self.assertEqual(stored[1], 0)
+        self.assertTrue(stored[0] >= 0)
+
+    @inlineCallbacks
+    def test_disabled(self):
+        """
+        Verify that quota changes go straight to the home when the journal is
+        disabled.
+        """
+        self.patch(config.QuotaJournal, "Enabled", False)
+
+        home = yield self.homeUnderTest(name="user01")
+        yield home.adjustQuotaUsedBytes(100)
+        yield self.commit()
+
+        stored = yield self._storedQuota()
+        self.assertEqual(stored, (100, 0,))
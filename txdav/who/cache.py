@@ -31,6 +31,7 @@ from zope.interface import implementer
 
 from twistedcaldav.memcacheclient import ClientFactory, MemcacheError
 from twistedcaldav.config import config
+from twistedcaldav.memcachering import serversForPool
 
 from twisted.internet.defer import inlineCallbacks, returnValue
 from twext.python.log import Logger
@@ -96,14 +97,10 @@ class DirectoryMemcacher(object):
         """
         if refresh or not hasattr(self, "memcacheClient"):
 
-            if config.Memcached.Pools.Default.MemcacheSocket:
-                client_addr = "unix:{}".format(config.Memcached.Pools.Default.MemcacheSocket)
-            else:
-                client_addr = "{}:{}".format(
-                    config.Memcached.Pools.Default.BindAddress,
-                    config.Memcached.Pools.Default.Port,
-                )
-            self.memcacheClient = ClientFactory.getClient([client_addr], debug=0, pickleProtocol=2)
+            self.memcacheClient = ClientFactory.getClient(
+                serversForPool(config.Memcached.Pools.Default),
+                debug=0, pickleProtocol=2
+            )
         return self.memcacheClient
 
     def pickleRecord(self, record):